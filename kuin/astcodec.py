@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+"""Compact binary encoding of parse trees.
+
+A stream starts with a header (magic, format version and a fingerprint
+of the node layouts) followed by frames, one per top-level item (usually
+a sentence), and ends with a zero-length frame.  Each frame is a varint
+length and the encoded item.  Items are written in postfix order so that
+a frame is decoded by a single loop over a value stack:
+
+- a value starts with a one byte tag; containers and nodes come after
+  their children, with the number of children (or the node kind);
+- integers are zigzag varints, floats 8-byte little endian doubles;
+- strings are references into a string table shared by the whole
+  stream: a new string is written once, later occurrences only store its
+  index.  Interned symbols are a tag and a string reference;
+- the children of a node are its slots in declaration order; the node
+  kinds are indexes in NODE_KINDS.
+
+Frames are decoded one at a time, so a stream can be written and read
+incrementally::
+
+    with open(path, "wb") as f:
+        dump(tree, f)
+    for sentence in Decoder(open(path, "rb")):
+        ...
+"""
+
+import struct
+import zlib
+from collections import OrderedDict
+from cStringIO import StringIO
+
+from kuin.nodes import *
+from kuin.nodes import Node, symbol, type_node, _TypeNode
+
+__all__ = ['Encoder', 'Decoder', 'dump', 'load', 'dumps', 'loads']
+
+MAGIC = "KNAST"
+FORMAT_VERSION = 1
+
+# ノードの種類の番号はこの順番で決まる (末尾にだけ追加すること)
+NODE_KINDS = (
+    SymbolNode, ExprNode, ValueNode, ArrayNode, NewNode,
+    IfNode, SwitchNode, WhileNode, ForNode, ForeachNode, TryNode,
+    IfdefNode, BlockNode, DoNode, ImportNode, BreakNode, ContinueNode,
+    ReturnNode, AssertNode, ThrowNode, FuncNode, FuncDefNode,
+    VarNode, ConstNode, AliasNode,
+    CollectionTypeNode, DictTypeNode, FuncTypeNode, ArrayTypeNode,
+    ClassNode, ClassNode.Member, EnumNode,
+    )
+
+# tags
+NONE = 1
+TRUE = 2
+FALSE = 3
+INT = 4
+FLOAT = 5
+STR = 6
+UNICODE = 7
+TUPLE = 8
+LIST = 9
+DICT = 10
+SYMBOL = 11
+NODE = 12
+UNSET = 13   # a slot left unset (e.g. span_index)
+
+_double = struct.Struct("<d")
+
+
+def _write_uint(out, n):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def schema_fingerprint(kinds=NODE_KINDS):
+    """Checksum of the node kinds and of their slots."""
+    layout = ";".join(["%s:%s" % (cls.__name__, ",".join(cls.slot_names()))
+                       for cls in kinds])
+    return zlib.crc32(layout) & 0xffffffff
+
+
+def header():
+    return MAGIC + chr(FORMAT_VERSION) + struct.pack(
+        "<I", schema_fingerprint())
+
+HEADER_SIZE = len(MAGIC) + 5
+
+
+######################################################################
+# 符号化
+######################################################################
+
+class _Close(object):
+    """The tag written after the children of a container or node."""
+
+    __slots__ = ('tag', 'n')
+
+    def __init__(self, tag, n=None):
+        self.tag = tag
+        self.n = n
+
+# 値の入っていないスロット
+_unset = _Close(UNSET)
+
+
+class Encoder(object):
+    """Write items to the file-like object `f`, one frame per item."""
+
+    def __init__(self, f):
+        self.f = f
+        self.strings = {}
+        self.kinds = dict([(cls, i) for i, cls in enumerate(NODE_KINDS)])
+        self.slots = [cls.slot_names() for cls in NODE_KINDS]
+        self.out = None
+        f.write(header())
+
+    def write(self, item):
+        self.out = bytearray()
+        self.encode(item)
+        frame = bytearray()
+        _write_uint(frame, len(self.out))
+        self.f.write(bytes(frame))
+        self.f.write(bytes(self.out))
+        self.out = None
+
+    def close(self):
+        self.f.write("\0")
+
+    def write_uint(self, n):
+        _write_uint(self.out, n)
+
+    def write_string(self, s):
+        index = self.strings.get(s)
+        if index is None:
+            # 0 は新しい文字列、それ以外は表の番号 + 1
+            self.strings[s] = len(self.strings)
+            self.out.append(0)
+            self.write_uint(len(s))
+            self.out.extend(s)
+        else:
+            self.write_uint(index + 1)
+
+    def encode(self, value):
+        # 深い木 (長い式など) でも再帰しないよう、明示的なスタックで
+        # 子を先に書く。コンテナとノードは閉じるタグを積んでおく
+        dispatch = self.dispatch
+        stack = [value]
+        pop = stack.pop
+        while stack:
+            value = pop()
+            dispatch[type(value)](self, value, stack)
+
+    def encode_none(self, value, stack):
+        self.out.append(NONE)
+
+    def encode_bool(self, value, stack):
+        self.out.append(TRUE if value else FALSE)
+
+    def encode_int(self, value, stack):
+        self.out.append(INT)
+        # zigzag: 0, -1, 1, -2, ... -> 0, 1, 2, 3, ...
+        self.write_uint(value * 2 if value >= 0 else -value * 2 - 1)
+
+    def encode_float(self, value, stack):
+        self.out.append(FLOAT)
+        self.out.extend(_double.pack(value))
+
+    def encode_str(self, value, stack):
+        self.out.append(STR)
+        self.write_string(value)
+
+    def encode_unicode(self, value, stack):
+        self.out.append(UNICODE)
+        self.write_string(value.encode("utf-8"))
+
+    def encode_sequence(self, value, stack):
+        stack.append(_Close(TUPLE if type(value) is tuple else LIST,
+                            len(value)))
+        stack.extend(reversed(value))
+
+    def encode_dict(self, value, stack):
+        stack.append(_Close(DICT, len(value)))
+        for key, item in reversed(value.items()):
+            stack.append(item)
+            stack.append(key)
+
+    def encode_node(self, node, stack):
+        if type(node) is SymbolNode and not hasattr(node, "span_index"):
+            self.out.append(SYMBOL)
+            self.write_string(node.symbol)
+            return
+        kind = self.kinds[type(node)]
+        stack.append(_Close(NODE, kind))
+        for name in reversed(self.slots[kind]):
+            stack.append(getattr(node, name, _unset))
+
+    def encode_close(self, close, stack):
+        self.out.append(close.tag)
+        if close.n is not None:
+            self.write_uint(close.n)
+
+    dispatch = {
+        type(None): encode_none,
+        bool: encode_bool,
+        int: encode_int,
+        long: encode_int,
+        float: encode_float,
+        str: encode_str,
+        unicode: encode_unicode,
+        tuple: encode_sequence,
+        list: encode_sequence,
+        dict: encode_dict,
+        OrderedDict: encode_dict,
+        _Close: encode_close,
+        }
+    for cls in NODE_KINDS:
+        dispatch[cls] = encode_node
+    del cls
+
+
+######################################################################
+# 復号
+######################################################################
+
+class Decoder(object):
+    """Iterate over the items of the stream read from `f`."""
+
+    def __init__(self, f):
+        self.f = f
+        self.strings = []
+        self.kinds = [(cls, cls.slot_names()) for cls in NODE_KINDS]
+        head = f.read(HEADER_SIZE)
+        if head[:len(MAGIC)] != MAGIC:
+            raise ValueError("not an AST stream")
+        if head != header():
+            raise ValueError("unsupported AST format version or node layout")
+
+    def __iter__(self):
+        while True:
+            size = self.read_frame_size()
+            if size == 0:
+                return
+            data = self.f.read(size)
+            if len(data) != size:
+                raise ValueError("truncated AST stream")
+            try:
+                item = self.decode_frame(bytearray(data))
+            except (IndexError, KeyError, struct.error):
+                raise ValueError("malformed AST frame")
+            yield item
+
+    def read_frame_size(self):
+        n = shift = 0
+        while True:
+            c = self.f.read(1)
+            if not c:
+                raise ValueError("truncated AST stream")
+            b = ord(c)
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    def decode_frame(self, data):
+        # 一つのループで後置記法を読む (頻度の高いタグから順に判定)
+        strings = self.strings
+        kinds = self.kinds
+        stack = []
+        push = stack.append
+        pos = 0
+        end = len(data)
+        while pos < end:
+            tag = data[pos]
+            pos += 1
+            if tag == SYMBOL or tag == STR or tag == UNICODE:
+                n = data[pos]
+                pos += 1
+                if n & 0x80:
+                    n, pos = _read_uint(data, pos, n)
+                if n:
+                    s = strings[n - 1]
+                else:
+                    size = data[pos]
+                    pos += 1
+                    if size & 0x80:
+                        size, pos = _read_uint(data, pos, size)
+                    s = intern(str(data[pos:pos + size]))
+                    pos += size
+                    strings.append(s)
+                if tag == SYMBOL:
+                    push(symbol(s))
+                elif tag == STR:
+                    push(s)
+                else:
+                    push(s.decode("utf-8"))
+                continue
+            if tag == UNSET:
+                push(_unset)
+                continue
+            if tag == INT:
+                n = data[pos]
+                pos += 1
+                if n & 0x80:
+                    n, pos = _read_uint(data, pos, n)
+                push(n >> 1 if not n & 1 else -((n + 1) >> 1))
+                continue
+            if tag == NONE:
+                push(None)
+                continue
+            if tag == TRUE or tag == FALSE:
+                push(tag == TRUE)
+                continue
+            if tag == FLOAT:
+                push(_double.unpack(bytes(data[pos:pos + 8]))[0])
+                pos += 8
+                continue
+
+            # 後に続く数: ノードの種類または子の数
+            n = data[pos]
+            pos += 1
+            if n & 0x80:
+                n, pos = _read_uint(data, pos, n)
+            if tag == NODE:
+                cls, slots = kinds[n]
+                node = cls.__new__(cls)
+                count = len(slots)
+                if count:
+                    values = stack[-count:]
+                    del stack[-count:]
+                    for name, value in zip(slots, values):
+                        if value is not _unset:
+                            setattr(node, name, value)
+                if isinstance(node, _TypeNode) and \
+                        not hasattr(node, "span_index"):
+                    # 型は読み込んだものも共有する
+                    node = type_node(cls, *node.type_args())
+                push(node)
+            elif tag == TUPLE or tag == LIST:
+                if n:
+                    values = stack[-n:]
+                    del stack[-n:]
+                else:
+                    values = []
+                push(tuple(values) if tag == TUPLE else values)
+            elif tag == DICT:
+                items = OrderedDict()
+                if n:
+                    values = stack[-2 * n:]
+                    del stack[-2 * n:]
+                    for i in range(0, 2 * n, 2):
+                        items[values[i]] = values[i + 1]
+                push(items)
+            else:
+                raise ValueError("invalid AST tag: %d" % tag)
+        if len(stack) != 1:
+            raise ValueError("malformed AST frame")
+        return stack[0]
+
+
+def _read_uint(data, pos, b):
+    """Finish reading a varint whose first byte `b` is already read."""
+    n = b & 0x7f
+    shift = 7
+    while b & 0x80:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        shift += 7
+    return n, pos
+
+
+######################################################################
+
+def dump(items, f):
+    """Write the sequence `items` (e.g. a list of sentences) to `f`."""
+    encoder = Encoder(f)
+    for item in items:
+        encoder.write(item)
+    encoder.close()
+
+
+def load(f):
+    return list(Decoder(f))
+
+
+def dumps(items):
+    f = StringIO()
+    dump(items, f)
+    return f.getvalue()
+
+
+def loads(data):
+    return load(StringIO(data))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""Start-up time of the parser.
+
+Runs each step in a new Python process and reports the best time over
+the repeats, in seconds::
+
+    python -m kuin.bench_import --repeat 10
+    python -m kuin.bench_import --json results.json
+
+The steps are:
+
+``pyparsing``
+    ``import pyparsing``, which the parser always needs;
+``import``
+    ``import kuin.parser``: the grammar is not built yet;
+``build``
+    the import and building the grammar (kuin.grammar), which is what
+    the import did before the grammar was deferred;
+``snapshot``
+    the import and loading the grammar from a snapshot (kuin.snapshot);
+``fast``
+    the import and a parse with the fast backend, which needs no
+    grammar.
+"""
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from optparse import OptionParser
+
+__all__ = ['STEPS', 'measure', 'run']
+
+# 手順 -> 子プロセスで計る文
+STEPS = {
+    "pyparsing": "import pyparsing",
+    "import": "import kuin.parser",
+    "build": "import kuin.parser; kuin.parser.grammar()",
+    "snapshot": "import kuin.parser; kuin.parser.load_grammar(%(snapshot)r)",
+    "fast": "import kuin.parser; "
+            "kuin.parser.parse_stmt('do 1', backend='fast')",
+    }
+
+STEP_ORDER = ("pyparsing", "import", "build", "snapshot", "fast")
+
+_script = """\
+import time
+start = time.time()
+%s
+print repr(time.time() - start)
+"""
+
+# kuin パッケージを含むディレクトリ
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(statement):
+    """Return the seconds `statement` takes in a new process."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [_root] + filter(None, [env.get("PYTHONPATH")]))
+    output = subprocess.check_output(
+        [sys.executable, "-c", _script % statement], env=env)
+    return float(output.splitlines()[-1])
+
+
+def run(steps=STEP_ORDER, repeat=5):
+    """Return a report of the best time of each step over `repeat` runs."""
+    directory = tempfile.mkdtemp()
+    try:
+        snapshot = os.path.join(directory, "grammar.snapshot")
+        if "snapshot" in steps:
+            # 保存は計らない
+            measure("import kuin.parser; kuin.parser.load_grammar(%r)"
+                    % snapshot)
+        results = []
+        for step in steps:
+            statement = STEPS[step] % {"snapshot": snapshot}
+            times = [measure(statement) for i in range(repeat)]
+            results.append({
+                    "step": step,
+                    "seconds": min(times),
+                    "median": sorted(times)[len(times) // 2],
+                    })
+    finally:
+        shutil.rmtree(directory)
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "repeat": repeat,
+        "results": results,
+        }
+
+
+def format_report(report):
+    lines = ["%-10s %9s %9s" % ("step", "best", "median")]
+    for result in report["results"]:
+        lines.append("%-10s %9.4f %9.4f" % (
+                result["step"], result["seconds"], result["median"]))
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = OptionParser("usage: %prog [options]")
+    parser.add_option("--step", action="append", choices=STEP_ORDER,
+                      help="step to measure (repeatable; default: all)")
+    parser.add_option("--repeat", type="int", default=5,
+                      help="processes per step, the best is kept")
+    parser.add_option("--json", metavar="FILE",
+                      help="write the report as JSON ('-': stdout)")
+    options, args = parser.parse_args(argv[1:])
+    report = run(options.step or STEP_ORDER, options.repeat)
+    if options.json == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True,
+                  separators=(",", ": "))
+        print
+    else:
+        if options.json:
+            with open(options.json, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True,
+                          separators=(",", ": "))
+        print format_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
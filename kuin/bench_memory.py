@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Memory used per node of a parse tree.
+
+Parses a generated corpus and reports the bytes taken by the node objects
+themselves: with equivalent instances keeping their attributes in a
+__dict__ ("before"), with the __slots__ layouts of kuin.nodes, and with the
+interned symbols counted once ("after").
+Containers referenced by the nodes (tuples of children, ...) are the same
+in both layouts and are not counted::
+
+    python -m kuin.bench_memory [blocks]
+"""
+
+import sys
+
+from kuin.nodes import Node, ClassNode
+from kuin.fastparser import parse_stmt
+
+__all__ = ['generate_corpus', 'iter_nodes', 'measure']
+
+_block = """\
+class C%(i)d : P
+  +var count : int :: %(i)d
+  -func f(x : int, y : []char) : int
+    if (x > %(i)d & !done)
+      do count :+ g(x, y[x %% 2]) * 2
+    elif (x = 0)
+      return h(count ?(1, 2))
+    end if
+    while loop(count < 100)
+      do count :: count + 1
+    end while
+    return x
+  end func
+end class
+"""
+
+
+def generate_corpus(blocks):
+    return "".join([_block % {"i": i} for i in range(blocks)])
+
+
+def iter_nodes(tree):
+    """
+    Yield every node (and class member) reachable from `tree`, once per
+    occurrence: an interned symbol is yielded wherever it is used.
+    """
+    stack = [tree]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (Node, ClassNode.Member)):
+            yield obj
+            stack.extend(obj.__getstate__().values())
+
+
+_dict_classes = {}
+
+
+def with_dict(node):
+    """Return a copy of `node` keeping its attributes in a __dict__."""
+    cls = type(node)
+    try:
+        dict_cls = _dict_classes[cls]
+    except KeyError:
+        dict_cls = _dict_classes[cls] = type(cls.__name__, (object,), {})
+    copy = dict_cls()
+    copy.__dict__.update(node.__getstate__())
+    return copy
+
+
+def node_bytes(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def measure(blocks):
+    tree = parse_stmt(generate_corpus(blocks))
+    nodes = list(iter_nodes(tree))
+    objects = dict([(id(node), node) for node in nodes]).values()
+    before = sum([node_bytes(with_dict(node)) for node in nodes])
+    slots = sum([node_bytes(node) for node in nodes])
+    interned = sum([node_bytes(node) for node in objects])
+    return {
+        "nodes": len(nodes),
+        "objects": len(objects),
+        "before_bytes_per_node": float(before) / len(nodes),
+        "slots_bytes_per_node": float(slots) / len(nodes),
+        "after_bytes_per_node": float(interned) / len(nodes),
+        }
+
+
+def main(argv):
+    blocks = int(argv[1]) if len(argv) > 1 else 1000
+    result = measure(blocks)
+    print "%(nodes)d nodes, %(objects)d distinct objects" % result
+    print "before (__dict__): %(before_bytes_per_node).1f bytes/node" % result
+    print "__slots__: %(slots_bytes_per_node).1f bytes/node" % result
+    print "__slots__ + interned symbols: " \
+        "%(after_bytes_per_node).1f bytes/node" % result
+
+
+if __name__ == '__main__':
+    main(sys.argv)
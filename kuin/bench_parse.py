@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+"""Parse speed on generated corpora.
+
+Generates deterministic Kuin sources of a given size and shape, parses
+them with ``parse_stmt`` (or ``parse_expr`` for the expression shapes)
+and reports the tokens and nodes parsed per second, the peak memory of
+the parse and, for the pyparsing backend, the time spent in each named
+grammar rule (see kuin.ruleprofile)::
+
+    python -m kuin.bench_parse --size 200 --shape wide_switch
+    python -m kuin.bench_parse --json results.json
+
+The shapes are:
+
+``program``
+    classes with members, conditions and loops (kuin.bench_memory);
+``deep_expr``
+    an expression nested `size` parentheses deep;
+``wide_switch``
+    a ``switch`` with `size` cases;
+``nested_class``
+    classes nested `size` levels deep;
+``long_enum``
+    an ``enum`` with `size` members;
+``nested_comments``
+    sentences separated by comments nested up to `size` levels.
+"""
+
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+from optparse import OptionParser
+
+from pyparsing import ParseBaseException
+
+from kuin.bench_memory import generate_corpus
+from kuin.lexer import tokenize
+from kuin.parser import parse_stmt, parse_expr, BACKENDS
+from kuin.ruleprofile import RuleProfile
+from kuin.visitor import walk
+
+__all__ = ['SHAPES', 'generate', 'bench', 'run']
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+######################################################################
+# コーパス
+######################################################################
+
+_binary_ops = ["+", "-", "*", "%", "<", "=", "&", "|"]
+
+
+def deep_expr(size, rng):
+    text = "a0"
+    for i in range(1, size + 1):
+        op = rng.choice(_binary_ops)
+        if i % 2:
+            text = "(%s %s f%d(x, %d))" % (text, op, i % 7, i)
+        else:
+            text = "(%d %s %s)" % (i, op, text)
+    return text
+
+
+def wide_switch(size, rng):
+    lines = ["switch (n)"]
+    for i in range(size):
+        if i % 3 == 0:
+            lines.append("case %d, %d @to %d" % (i * 4, i * 4 + 1, i * 4 + 2))
+        else:
+            lines.append("case %d" % (i * 4))
+        lines.append("  do x :: x %s %d" % (rng.choice(_binary_ops), i))
+    lines += ["default", "  do x :: 0", "end switch", ""]
+    return "\n".join(lines)
+
+
+def nested_class(size, rng):
+    lines = []
+    for depth in range(size):
+        indent = "  " * depth
+        lines.append("%sclass C%d" % (indent, depth))
+        lines.append("%s  +var v%d : int :: %d" % (indent, depth,
+                                                   rng.randint(0, 99)))
+        lines.append("%s  -func f%d(x : int) : int" % (indent, depth))
+        lines.append("%s    return x * %d" % (indent, depth))
+        lines.append("%s  end func" % indent)
+    for depth in reversed(range(size)):
+        lines.append("%send class" % ("  " * depth))
+    lines.append("")
+    return "\n".join(lines)
+
+
+def long_enum(size, rng):
+    lines = ["enum E"]
+    for i in range(size):
+        lines.append("  m%d" % i)
+    lines += ["end enum", ""]
+    return "\n".join(lines)
+
+
+def nested_comments(size, rng):
+    lines = []
+    for depth in range(1, size + 1):
+        comment = "note %d" % depth
+        for level in range(depth):
+            comment = "{ %s \"}\" '{' }" % comment
+        lines.append(comment)
+        lines.append("do x :: x + %d" % rng.randint(0, 99))
+    lines.append("")
+    return "\n".join(lines)
+
+
+def program(size, rng):
+    return generate_corpus(size)
+
+
+# shape -> (parse_expr で解析するか, 生成関数)
+SHAPES = {
+    "program": (False, program),
+    "deep_expr": (True, deep_expr),
+    "wide_switch": (False, wide_switch),
+    "nested_class": (False, nested_class),
+    "long_enum": (False, long_enum),
+    "nested_comments": (False, nested_comments),
+    }
+
+
+def generate(shape, size, seed=0):
+    """Return the source of `shape` and `size`; the same for a seed."""
+    return SHAPES[shape][1](size, random.Random(seed))
+
+
+######################################################################
+# 計測
+######################################################################
+
+def count_nodes(tree):
+    if isinstance(tree, (list, tuple)) or hasattr(tree, "asList"):
+        tree = list(tree)
+    return sum(1 for node in walk(tree))
+
+
+def peak_memory(function):
+    """
+    Return the increase of the peak resident size, in kilobytes, while
+    running `function` in a child process, or None without fork().
+    """
+    if resource is None or not hasattr(os, "fork"):
+        return None
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_end)
+            before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            function()
+            after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(write_end, str(after - before))
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return int(data) if data else None
+
+
+def bench(shape, size, backend="fast", repeat=3, seed=0, rules=True):
+    """Return the measures of parsing a corpus, as a dict."""
+    is_expr, generator = SHAPES[shape]
+    text = generate(shape, size, seed)
+    entry = parse_expr if is_expr else parse_stmt
+    parse = lambda: entry(text, backend=backend)
+    result = {
+        "shape": shape,
+        "size": size,
+        "backend": backend,
+        "entry": entry.__name__,
+        "bytes": len(text),
+        "tokens": len(tokenize(text)) - 1,
+        # 繰り返しで確保したメモリが残らないうちに測る
+        "peak_kb": peak_memory(parse),
+        }
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.time()
+        try:
+            tree = parse()
+        except (ParseBaseException, RuntimeError) as e:
+            # pyparsing の文法が読めない形 (class など) や深すぎる入力
+            result["error"] = str(e)
+            return result
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    tokens = result["tokens"]
+    nodes = result["nodes"] = count_nodes(tree)
+    del tree
+    result.update({
+        "seconds": best,
+        "tokens_per_sec": tokens / best if best else None,
+        "nodes_per_sec": nodes / best if best else None,
+        })
+    if rules and backend == "pyparsing":
+        try:
+            with RuleProfile() as profile:
+                parse()
+        except RuntimeError as e:
+            # 規則ごとの計測で再帰が深くなりすぎた
+            result["error"] = str(e)
+            return result
+        result["rule_seconds"] = dict([(stats.name, stats.seconds)
+                                       for stats in profile.results()])
+    return result
+
+
+# 既定の大きさ (pyparsing で数秒以内)
+DEFAULT_SIZES = {
+    "program": 50,
+    "deep_expr": 40,
+    "wide_switch": 200,
+    "nested_class": 20,
+    "long_enum": 1000,
+    "nested_comments": 30,
+    }
+
+
+def run(shapes=None, sizes=None, backends=BACKENDS, repeat=3, seed=0):
+    """Return a report of bench() over `shapes` x `backends`."""
+    sizes = sizes or {}
+    results = []
+    for shape in shapes or sorted(SHAPES):
+        for backend in backends:
+            size = sizes.get(shape, DEFAULT_SIZES[shape])
+            results.append(bench(shape, size, backend, repeat, seed))
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "repeat": repeat,
+        "seed": seed,
+        "results": results,
+        }
+
+
+def format_report(report, rule_count=5):
+    lines = ["%-16s %-9s %8s %8s %9s %11s %10s %9s" % (
+            "shape", "backend", "tokens", "nodes", "seconds", "tokens/s",
+            "nodes/s", "peak KB")]
+    for result in report["results"]:
+        if "error" in result:
+            lines.append("%-16s %-9s %8d  error: %s" % (
+                    result["shape"], result["backend"], result["tokens"],
+                    result["error"]))
+            continue
+        lines.append("%-16s %-9s %8d %8d %9.4f %11.0f %10.0f %9s" % (
+                result["shape"], result["backend"], result["tokens"],
+                result["nodes"], result["seconds"],
+                result["tokens_per_sec"] or 0, result["nodes_per_sec"] or 0,
+                result["peak_kb"]))
+        rule_seconds = result.get("rule_seconds")
+        if rule_seconds:
+            top = sorted(rule_seconds.items(), key=lambda item: -item[1])
+            lines.append("    " + ", ".join([
+                        "%s %.4fs" % item for item in top[:rule_count]]))
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = OptionParser("usage: %prog [options]")
+    parser.add_option("--shape", action="append", choices=sorted(SHAPES),
+                      help="corpus shape (repeatable; default: all)")
+    parser.add_option("--size", type="int",
+                      help="corpus size (default: per shape)")
+    parser.add_option("--backend", action="append", choices=BACKENDS,
+                      help="parser backend (repeatable; default: all)")
+    parser.add_option("--repeat", type="int", default=3,
+                      help="parses per measure, the best is kept")
+    parser.add_option("--seed", type="int", default=0)
+    parser.add_option("--json", metavar="FILE",
+                      help="write the report as JSON ('-': stdout)")
+    options, args = parser.parse_args(argv[1:])
+    shapes = options.shape or sorted(SHAPES)
+    sizes = None
+    if options.size is not None:
+        sizes = dict([(shape, options.size) for shape in shapes])
+    report = run(shapes, sizes, options.backend or BACKENDS,
+                 options.repeat, options.seed)
+    if options.json == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True,
+                  separators=(",", ": "))
+        print
+    else:
+        if options.json:
+            with open(options.json, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True,
+                          separators=(",", ": "))
+        print format_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
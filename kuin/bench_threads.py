@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""Throughput of parsers running in threads.
+
+Each of N threads parses the same generated corpus (kuin.bench_parse)
+`count` times with its own :class:`kuin.parser.Parser`; the report gives
+the parses per second for each N and the speedup over one thread::
+
+    python -m kuin.bench_threads --threads 1 --threads 2 --threads 4
+    python -m kuin.bench_threads --shared --json results.json
+
+With ``--shared`` the threads share one Parser, which parses one text at
+a time.  The trees of every thread are compared with the tree of a
+single parse (``agree`` in the report).
+
+Where a global interpreter lock lets one thread run at a time (CPython
+2.7, the ``gil`` field of the report), the threads take turns and the
+throughput stays about that of one thread; the speedup measures how far
+the parsers run in parallel on an interpreter without one.
+"""
+
+import json
+import platform
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+from kuin.bench_parse import SHAPES, generate
+from kuin.parser import Parser, BACKENDS, ENGINES, DEFAULT_EXPR_ENGINE
+
+__all__ = ['bench', 'run']
+
+DEFAULT_THREADS = (1, 2, 4)
+
+
+def gil_enabled():
+    # sys._is_gil_enabled がない Python には常に GIL がある
+    return getattr(sys, "_is_gil_enabled", lambda: True)()
+
+
+def bench(threads, shape, size, count=5, backend="pyparsing",
+          engine=DEFAULT_EXPR_ENGINE, shared=False, seed=0):
+    """
+    Return the measures of `threads` threads parsing a corpus `count`
+    times each, as a dict.
+    """
+    is_expr = SHAPES[shape][0]
+    text = generate(shape, size, seed)
+    if is_expr:
+        entry, form = "parse_expr", repr
+    else:
+        entry, form = "parse_stmt", lambda tree: repr(list(tree))
+    if shared:
+        parsers = [Parser(engine, backend)] * threads
+    else:
+        parsers = [Parser(engine, backend) for i in range(threads)]
+    # 文法の写しを作るのは計らない
+    expected = form(getattr(parsers[0], entry)(text))
+    for parser in parsers:
+        getattr(parser, entry)(text)
+    trees = [None] * threads
+    errors = []
+    start = threading.Event()
+
+    def work(i):
+        parse = getattr(parsers[i], entry)
+        start.wait()
+        try:
+            for j in range(count):
+                trees[i] = parse(text)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=work, args=(i,))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    started = time.time()
+    start.set()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+    if errors:
+        raise errors[0]
+    parses = threads * count
+    return {
+        "threads": threads,
+        "shared": shared,
+        "parses": parses,
+        "seconds": elapsed,
+        "parses_per_sec": parses / elapsed if elapsed else None,
+        "agree": all([form(tree) == expected for tree in trees]),
+        }
+
+
+def run(threads=DEFAULT_THREADS, shape="wide_switch", size=20, count=5,
+        backend="pyparsing", engine=DEFAULT_EXPR_ENGINE, shared=False,
+        seed=0):
+    """Return a report of bench() for each number of `threads`."""
+    results = [bench(n, shape, size, count, backend, engine, shared, seed)
+               for n in threads]
+    # 1 スレッドの結果 (なければ最初の結果) に対する速さ
+    base = [result for result in results if result["threads"] == 1]
+    base = (base or results)[0]
+    for result in results:
+        result["speedup"] = (result["parses_per_sec"] /
+                             base["parses_per_sec"])
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "gil": gil_enabled(),
+        "shape": shape,
+        "size": size,
+        "count": count,
+        "backend": backend,
+        "engine": engine,
+        "results": results,
+        }
+
+
+def format_report(report):
+    lines = ["%s %s, gil: %s, %s/%s, %s %d" % (
+            report["implementation"], report["python"], report["gil"],
+            report["backend"], report["engine"], report["shape"],
+            report["size"])]
+    lines.append("%7s %6s %7s %9s %10s %8s %6s" % (
+            "threads", "shared", "parses", "seconds", "parses/s", "speedup",
+            "agree"))
+    for result in report["results"]:
+        lines.append("%7d %6s %7d %9.4f %10.2f %8.2f %6s" % (
+                result["threads"], result["shared"], result["parses"],
+                result["seconds"], result["parses_per_sec"] or 0,
+                result["speedup"], result["agree"]))
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = OptionParser("usage: %prog [options]")
+    parser.add_option("--threads", type="int", action="append",
+                      help="number of threads (repeatable; default: %s)"
+                      % ", ".join(map(str, DEFAULT_THREADS)))
+    parser.add_option("--shape", choices=sorted(SHAPES),
+                      default="wide_switch",
+                      help="corpus shape (default: %default)")
+    parser.add_option("--size", type="int", default=20,
+                      help="corpus size (default: %default)")
+    parser.add_option("--count", type="int", default=5,
+                      help="parses per thread (default: %default)")
+    parser.add_option("--backend", choices=BACKENDS, default="pyparsing",
+                      help="parser backend (default: %default)")
+    parser.add_option("--engine", choices=ENGINES,
+                      default=DEFAULT_EXPR_ENGINE,
+                      help="expression engine (default: %default)")
+    parser.add_option("--shared", action="store_true", default=False,
+                      help="share one Parser between the threads")
+    parser.add_option("--seed", type="int", default=0)
+    parser.add_option("--json", metavar="FILE",
+                      help="write the report as JSON ('-': stdout)")
+    options, args = parser.parse_args(argv[1:])
+    report = run(options.threads or DEFAULT_THREADS, options.shape,
+                 options.size, options.count, options.backend,
+                 options.engine, options.shared, options.seed)
+    if options.json == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True,
+                  separators=(",", ": "))
+        print
+    else:
+        if options.json:
+            with open(options.json, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True,
+                          separators=(",", ": "))
+        print format_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
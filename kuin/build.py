@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+"""Parse the sources of a program in parallel.
+
+:func:`build` parses a set of ``.kn`` files, and the files they import,
+in a pool of worker processes::
+
+    result = build(["main.kn"])
+    for path in result.trees:
+        print path, result.times[path]
+
+Each worker makes the grammar once and then parses the files it is
+given; the trees are sent back pickled (see kuin.nodes).  The sources
+named by top-level ``import`` sentences are resolved relative to the
+importing file, ``.kn`` being added when the name has no extension.
+"""
+
+import cPickle
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+from optparse import OptionParser
+from Queue import Queue
+
+from pyparsing import ParseBaseException
+
+__all__ = ['build', 'BuildResult', 'TransferError', 'import_path',
+           'SNAPSHOT_NAME']
+
+SOURCE_EXT = ".kn"
+
+# 深い木 (長い式など) を送り返せるよう、pickle するときだけ上げる
+RECURSION_LIMIT = 20000
+
+
+class TransferError(Exception):
+    """The tree of a file could not be sent back from a worker."""
+
+
+class BuildResult(object):
+    """Trees, parse times and errors of the parsed files, keyed by path."""
+
+    def __init__(self):
+        self.trees = {}
+        self.times = {}
+        self.errors = {}
+        self.elapsed = 0.0
+        self.cache_stats = None
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def add_cache_stats(self, stats):
+        if self.cache_stats is None:
+            self.cache_stats = dict.fromkeys(
+                ["hits", "misses", "evictions", "bytes_read",
+                 "bytes_written"], 0)
+        total = self.cache_stats
+        for name in total:
+            if name != "hit_rate":
+                total[name] += stats[name]
+        lookups = total["hits"] + total["misses"]
+        total["hit_rate"] = float(total["hits"]) / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return "<BuildResult %d files, %d errors, %.3fs>" % (
+            len(self.trees), len(self.errors), self.elapsed)
+
+
+def import_path(importer, source):
+    """Return the path of the source named by ``import source``."""
+    if not os.path.splitext(source)[1]:
+        source += SOURCE_EXT
+    return os.path.normpath(
+        os.path.join(os.path.dirname(importer), source))
+
+
+SNAPSHOT_NAME = "grammar.snapshot"
+
+# ワーカーごとの ParseCache (cache_dir ごと)
+_caches = {}
+
+
+def _init_worker(backend, cache_dir):
+    # pyparsing の文法はワーカーごとに一度だけ作る (cache_dir があれば
+    # 保存したものを読む)
+    if backend == "pyparsing":
+        from kuin.parser import load_grammar
+        if cache_dir is None:
+            load_grammar()
+        else:
+            load_grammar(os.path.join(cache_dir, SNAPSHOT_NAME))
+
+
+def _get_cache(cache_dir):
+    if cache_dir is None:
+        return None
+    cache = _caches.get(cache_dir)
+    if cache is None:
+        from kuin.parsecache import ParseCache
+        cache = _caches[cache_dir] = ParseCache(cache_dir)
+    return cache
+
+
+def _parse_file(args):
+    from kuin.parser import parse_stmt
+    path, backend, cache_dir = args
+    start = time.time()
+    cache = None
+    try:
+        cache = _get_cache(cache_dir)
+        if cache is not None:
+            cache.reset_stats()
+        with open(path) as f:
+            text = f.read()
+        tree = list(parse_stmt(text, backend=backend, cache=cache))
+    except Exception as e:
+        return path, None, time.time() - start, None, e
+    stats = cache.stats() if cache is not None else None
+    return path, tree, time.time() - start, stats, None
+
+
+def _send_file(args):
+    # ワーカーで pickle しておく。結果が pickle できないと Pool は
+    # コールバックを呼ばないので、ファイルごとのエラーにして返す
+    parsed = _parse_file(args)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        return cPickle.dumps(parsed, cPickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        path, tree, elapsed, stats, error = parsed
+        error = TransferError("%s: %s" % (path, e))
+        return cPickle.dumps((path, None, elapsed, stats, error),
+                             cPickle.HIGHEST_PROTOCOL)
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def build(paths, follow_imports=True, processes=None, backend="fast",
+          cache_dir=None):
+    """
+    Parse the files in `paths` and, if `follow_imports` is true, the files
+    they import, recursively.
+
+    `processes` is the number of worker processes (the number of CPUs by
+    default); with ``processes=1`` the files are parsed in this process.
+    `backend` is passed to kuin.parser.parse_stmt.  If `cache_dir` is
+    given, trees are looked up in and stored to a kuin.parsecache there;
+    ``cache_stats`` of the result then sums the hits and bytes read.  The
+    workers of the pyparsing backend also keep a snapshot of the grammar
+    there (see kuin.snapshot).
+
+    Returns a BuildResult; a file that can't be read or parsed, or whose
+    tree a worker can't send back (TransferError), has its exception in
+    ``errors`` instead of a tree.
+    """
+    result = BuildResult()
+    start = time.time()
+    seen = set()
+    pending = []
+    for path in paths:
+        path = os.path.normpath(path)
+        if path not in seen:
+            seen.add(path)
+            pending.append(path)
+
+    if processes is None:
+        processes = cpu_count()
+    if processes > 1:
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        pool = Pool(processes, _init_worker, (backend, cache_dir))
+        done = Queue()
+    else:
+        pool = None
+    try:
+        outstanding = 0
+        while pending or outstanding:
+            # 取り込まれたファイルは見つかり次第ワーカーに渡す
+            if pool is None:
+                parsed = _parse_file((pending.pop(), backend, cache_dir))
+            else:
+                for path in pending:
+                    pool.apply_async(_send_file,
+                                     [(path, backend, cache_dir)],
+                                     callback=done.put)
+                outstanding += len(pending)
+                pending = []
+                parsed = cPickle.loads(done.get())
+                outstanding -= 1
+
+            path, tree, elapsed, stats, error = parsed
+            result.times[path] = elapsed
+            if stats is not None:
+                result.add_cache_stats(stats)
+            if error is not None:
+                if not isinstance(error, (IOError, ParseBaseException,
+                                          TransferError)):
+                    raise error
+                result.errors[path] = error
+                continue
+            result.trees[path] = tree
+            if follow_imports:
+                for sentence in tree:
+                    # import 文は SourceName の文字列になる
+                    if isinstance(sentence, basestring):
+                        imported = import_path(path, sentence)
+                        if imported not in seen:
+                            seen.add(imported)
+                            pending.append(imported)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    result.elapsed = time.time() - start
+    return result
+
+
+def main(argv):
+    parser = OptionParser("usage: %prog [options] FILE...")
+    parser.add_option("-j", "--processes", type="int",
+                      help="number of worker processes")
+    parser.add_option("--cache", metavar="DIR", help="parse cache directory")
+    options, paths = parser.parse_args(argv[1:])
+    result = build(paths, processes=options.processes,
+                   cache_dir=options.cache)
+    for path in sorted(result.times):
+        status = "error: %s" % result.errors[path] \
+            if path in result.errors else "ok"
+        print "%8.3fs  %s  %s" % (result.times[path], path, status)
+    print "%d files in %.3fs" % (len(result.times), result.elapsed)
+    stats = result.cache_stats
+    if stats is not None:
+        print "cache: %.1f%% hits, %d bytes read" % (
+            stats["hit_rate"] * 100, stats["bytes_read"])
+    return 0 if result.ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
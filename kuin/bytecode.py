@@ -0,0 +1,954 @@
+# -*- coding: utf-8 -*-
+
+"""Compiler of Kuin programs to the register bytecode run by kuin.vm.
+
+Each function, and the top level of a program, is compiled to a
+:class:`Code`: an ``array`` of instructions and a constant pool.  An
+instruction is an opcode followed by a fixed number of integer operands
+(see OPERANDS).  Most operands are registers, i.e. indexes in the frame
+of the call: the frame holds the parameters, the local variables and
+the temporaries, followed by the constants in reverse order, so that
+constant ``k`` is register ``-k - 1``.  An operation reads its operands
+and writes its result in place, there is no value stack.
+
+Names are resolved when compiling: parameters and variables declared in
+a function (``var``, ``const``, ``for``/``foreach`` counters, ``try``
+block names) are registers, the others are global slots of the
+:class:`Compiler`, shared by all the code it compiles.  Jumps, including
+named ``break``/``continue``, go to resolved offsets; leaving a ``try``
+block that way runs its ``finally`` body, compiled inline.  The step of
+a ``for`` loop is checked once: a constant step selects the comparison
+of the loop at compile time.
+"""
+
+from array import array
+
+from kuin.nodes import *
+from kuin.runtime import *
+from kuin.runtime import COMPOUND_OPERATORS
+from kuin.visitor import declared_names
+
+__all__ = ['Code', 'Compiler', 'disassemble']
+
+# 命令 (オペランドは OPERANDS)
+MOVE = 1
+LOAD_GLOBAL = 2
+STORE_GLOBAL = 3
+DEFINE_GLOBAL = 4
+LOAD_INDEX = 5
+STORE_INDEX = 6
+ADD = 7
+SUB = 8
+MUL = 9
+EQ = 10
+NE = 11
+LT = 12
+LE = 13
+GT = 14
+GE = 15
+NEG = 16
+NOT = 17
+UNARY = 18
+BINARY = 19
+JUMP = 20
+JUMP_IF_FALSE = 21
+JUMP_IF_TRUE = 22
+JUMP_UNLESS_EQ = 23
+JUMP_UNLESS_NE = 24
+JUMP_UNLESS_LT = 25
+JUMP_UNLESS_LE = 26
+JUMP_UNLESS_GT = 27
+JUMP_UNLESS_GE = 28
+CALL = 29
+CALL_BUILTIN = 30
+RETURN = 31
+FOR_UP = 32
+FOR_DOWN = 33
+FOR_STEP = 34
+STEP_JUMP = 35
+FOREACH_NEXT = 36
+CHECK_STEP = 37
+NEW_ARRAY = 38
+CAST = 39
+THROW = 40
+SETUP_TRY = 41
+POP_TRY = 42
+RERAISE = 43
+EXC_CODE = 44
+ERROR = 45
+DIV = 46
+MOD = 47
+
+OPNAMES = dict([(value, name) for name, value in globals().items()
+                if name.isupper() and type(value) is int and
+                MOVE <= value <= MOD])
+
+# オペランドの種類: r レジスタ、t 飛び先、g グローバル変数、f 関数、n 個数
+OPERANDS = {
+    MOVE: "rr",                 # dst, src
+    LOAD_GLOBAL: "rg",          # dst, global
+    STORE_GLOBAL: "gr",         # global, src
+    DEFINE_GLOBAL: "gr",        # global, src
+    LOAD_INDEX: "rrr",          # dst, array, index
+    STORE_INDEX: "rrr",         # array, index, src
+    UNARY: "rrr",               # dst, function, operand
+    BINARY: "rrrr",             # dst, function, left, right
+    JUMP: "t",
+    JUMP_IF_FALSE: "rt",
+    JUMP_IF_TRUE: "rt",
+    CALL: "rfrn",               # dst, function, first argument, count
+    CALL_BUILTIN: "rrrn",       # dst, name, first argument, count
+    RETURN: "r",
+    FOR_UP: "rrrt",             # counter, end, variable, exit
+    FOR_DOWN: "rrrt",           # counter, end, variable, exit
+    FOR_STEP: "rrrrt",          # counter, end, step, variable, exit
+    STEP_JUMP: "rrt",           # counter, step, loop
+    FOREACH_NEXT: "rrrt",       # array, index, variable, exit
+    CHECK_STEP: "r",
+    NEW_ARRAY: "rrnr",          # dst, first size, count, base type
+    CAST: "rrr",                # dst, operand, type
+    THROW: "rr",                # code, message
+    SETUP_TRY: "tr",            # handler, exception
+    POP_TRY: "",
+    RERAISE: "r",
+    EXC_CODE: "rr",             # dst, exception
+    ERROR: "r",                 # message
+    }
+for _op in (ADD, SUB, MUL, DIV, MOD, EQ, NE, LT, LE, GT, GE):
+    OPERANDS[_op] = "rrr"       # dst, left, right
+for _op in (NEG, NOT):
+    OPERANDS[_op] = "rr"        # dst, operand
+for _op in (JUMP_UNLESS_EQ, JUMP_UNLESS_NE, JUMP_UNLESS_LT, JUMP_UNLESS_LE,
+            JUMP_UNLESS_GT, JUMP_UNLESS_GE):
+    OPERANDS[_op] = "rrt"       # left, right, target
+del _op
+
+# 値を計算する演算子
+INLINE_OPERATORS = {
+    "+": ADD, "-": SUB, "*": MUL, "/": DIV, "%": MOD,
+    "=": EQ, "<>": NE, "<": LT, "<=": LE, ">": GT, ">=": GE,
+    }
+
+INLINE_COMPOUND_OPERATORS = {
+    ":+": ADD, ":-": SUB, ":*": MUL, ":/": DIV, ":%": MOD,
+    }
+
+# 条件が成り立たなければ飛ぶ比較
+JUMP_UNLESS = {
+    "=": JUMP_UNLESS_EQ, "<>": JUMP_UNLESS_NE,
+    "<": JUMP_UNLESS_LT, "<=": JUMP_UNLESS_LE,
+    ">": JUMP_UNLESS_GT, ">=": JUMP_UNLESS_GE,
+    }
+
+
+class Code(object):
+    """The instructions of a function or of the top level of a program."""
+
+    def __init__(self, name, code, consts, nparams, register_names):
+        self.name = name
+        self.code = code
+        # 実行用の写し (list の添字は array より速い)
+        self.words = code.tolist()
+        self.consts = consts
+        self.nparams = nparams
+        self.register_names = register_names
+        self.nregisters = len(register_names)
+        # 引数の後に続くフレームの初期値 (定数は逆順で末尾に置く)
+        self.padding = [None] * (self.nregisters - nparams) + consts[::-1]
+
+    def new_frame(self, args=()):
+        return list(args) + self.padding
+
+    def __repr__(self):
+        return "<Code %s, %d words>" % (self.name, len(self.code))
+
+
+def disassemble(code, global_names=None, function_names=None):
+    """Return a listing of the instructions of `code`."""
+    lines = []
+    pc = 0
+    words = code.code
+    while pc < len(words):
+        op = words[pc]
+        kinds = OPERANDS[op]
+        operands = []
+        for kind, value in zip(kinds, words[pc + 1:pc + 1 + len(kinds)]):
+            if kind == "r":
+                if value < 0:
+                    operands.append(repr(code.consts[-value - 1]))
+                else:
+                    operands.append(code.register_names[value])
+            elif kind == "g" and global_names:
+                operands.append("@" + global_names[value])
+            elif kind == "f" and function_names:
+                operands.append(function_names[value] + "()")
+            elif kind == "t":
+                operands.append("-> %d" % value)
+            else:
+                operands.append(str(value))
+        lines.append(("%4d %-15s %s" % (pc, OPNAMES[op],
+                                        ", ".join(operands))).rstrip())
+        pc += 1 + len(kinds)
+    return "\n".join(lines)
+
+
+######################################################################
+# 文の構造
+######################################################################
+
+def sentence_bodies(node):
+    """Return the bodies of the compound sentence `node`."""
+    cls = type(node)
+    if cls is IfNode:
+        return [body for cond, body in node.clauses]
+    if cls is SwitchNode:
+        return [body for value, body in node.case]
+    if cls is TryNode:
+        return [node.body, node.catch_body, node.finally_body]
+    if cls in (WhileNode, ForNode, ForeachNode, BlockNode, IfdefNode,
+               FuncDefNode):
+        return [node.body]
+    return []
+
+
+def _funcdefs(body):
+    for node in body:
+        if type(node) is FuncDefNode:
+            yield node
+        for child in sentence_bodies(node):
+            for funcdef in _funcdefs(child):
+                yield funcdef
+
+
+ASSIGN_OPERATORS = frozenset(["::"] + list(COMPOUND_OPERATORS))
+
+
+def _assigns(node):
+    # 式の中に代入があるか
+    cls = type(node)
+    if cls is ExprNode:
+        if node.operator.symbol in ASSIGN_OPERATORS:
+            return True
+        for operand in node.operands:
+            if _assigns(operand):
+                return True
+    elif cls is FuncNode:
+        for arg in node.args:
+            if _assigns(arg):
+                return True
+    elif cls is ArrayNode:
+        return _assigns(node.index)
+    return False
+
+
+class _Label(object):
+    __slots__ = ("position",)
+
+    def __init__(self):
+        self.position = None
+
+
+class _Block(object):
+    """A block that can be left by break/continue, or a try body."""
+
+    def __init__(self, name=None, break_label=None, continue_label=None,
+                 loop=False, try_node=None):
+        self.name = name
+        self.break_label = break_label
+        self.continue_label = continue_label
+        self.loop = loop
+        self.try_node = try_node
+
+
+######################################################################
+# コンパイラ
+######################################################################
+
+class Compiler(object):
+    """
+    Compile programs to Code objects.
+
+    The functions and global variables of every program compiled by the
+    same Compiler share one table each (``functions``, ``global_names``),
+    indexed by the CALL and global instructions.  ``ifdef`` and
+    ``assert`` are compiled for the debug or the release mode.
+    """
+
+    def __init__(self, debug=True):
+        self.debug = debug
+        self.global_names = []
+        self.global_index = {}
+        self.functions = []
+        self.function_index = {}
+
+    def global_slot(self, name):
+        slot = self.global_index.get(name)
+        if slot is None:
+            slot = self.global_index[name] = len(self.global_names)
+            self.global_names.append(name)
+        return slot
+
+    def compile_program(self, sentences):
+        """Compile the top level `sentences`; return its Code."""
+        sentences = list(sentences)
+        # 関数は定義より前から呼べるので、先に番号を振る
+        funcdefs = list(_funcdefs(sentences))
+        for funcdef in funcdefs:
+            name = funcdef.name.symbol
+            if name not in self.function_index:
+                self.function_index[name] = len(self.functions)
+                self.functions.append(None)
+        for funcdef in funcdefs:
+            self.functions[self.function_index[funcdef.name.symbol]] = \
+                self.compile_function(funcdef)
+        return _CodeCompiler(self, "<program>", [], 0).compile(sentences)
+
+    def compile_function(self, funcdef):
+        params = [name.symbol for name, typename in funcdef.params]
+        names = list(params)
+        for name in declared_names(funcdef.body):
+            if name not in names:
+                names.append(name)
+        return _CodeCompiler(self, funcdef.name.symbol, names,
+                             len(params)).compile(funcdef.body)
+
+
+class _CodeCompiler(object):
+
+    def __init__(self, compiler, name, local_names, nparams):
+        self.compiler = compiler
+        self.debug = compiler.debug
+        self.name = name
+        self.nparams = nparams
+        # トップレベルの変数はすべてグローバル
+        self.locals = dict([(n, i) for i, n in enumerate(local_names)])
+        self.nlocals = len(local_names)
+        self.register_names = list(local_names)
+        # 一時レジスタは文ごとに解放する
+        self.next_temp = self.nlocals
+        self.code = array("i")
+        self.consts = []
+        self.const_index = {}
+        self.fixups = []
+        self.blocks = []
+
+    def compile(self, body):
+        self.compile_body(body)
+        self.emit(RETURN, self.const(None))
+        code = self.code
+        for position, label in self.fixups:
+            code[position] = label.position
+        for position, label in self.fixups:
+            # JUMP への飛び先はその先に付け替える
+            target = code[position]
+            seen = set()
+            while code[target] == JUMP and target not in seen:
+                seen.add(target)
+                target = code[target + 1]
+            code[position] = target
+        return Code(self.name, self.code, self.consts, self.nparams,
+                    self.register_names)
+
+    ##################################################################
+    # 命令の出力
+    ##################################################################
+
+    def emit(self, op, *operands):
+        code = self.code
+        code.append(op)
+        for operand in operands:
+            if type(operand) is _Label:
+                self.fixups.append((len(code), operand))
+                code.append(-1)
+            else:
+                code.append(operand)
+
+    def mark(self, label):
+        label.position = len(self.code)
+
+    def const(self, value):
+        """Return the register of the constant `value`."""
+        # 1 と 1.0 と True を区別する
+        key = (type(value), repr(value) if type(value) is float else value)
+        index = self.const_index.get(key)
+        if index is None:
+            index = self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return -index - 1
+
+    def temp(self, count=1):
+        """Return the first of `count` new consecutive temporaries."""
+        first = self.next_temp
+        self.next_temp += count
+        while len(self.register_names) < self.next_temp:
+            self.register_names.append("$%d" % len(self.register_names))
+        return first
+
+    def move(self, dst, src):
+        if dst is None:
+            return src
+        if dst != src:
+            self.emit(MOVE, dst, src)
+        return dst
+
+    def error(self, message):
+        self.emit(ERROR, self.const(message))
+
+    ##################################################################
+    # ブロック
+    ##################################################################
+
+    def compile_body(self, body):
+        compilers = self.sentence_compilers
+        for sentence in body:
+            mark = self.next_temp
+            compilers[type(sentence)](self, sentence)
+            self.next_temp = mark
+
+    def compile_named_body(self, body, name):
+        # 名前付きの break で抜けられるブロック
+        if name is None:
+            self.compile_body(body)
+            return
+        end = _Label()
+        self.blocks.append(_Block(name, end))
+        self.compile_body(body)
+        self.blocks.pop()
+        self.mark(end)
+
+    def exit_blocks(self, depth):
+        """Leave the blocks above `depth`: run the finally bodies."""
+        blocks = self.blocks
+        for i in reversed(range(depth, len(blocks))):
+            node = blocks[i].try_node
+            if node is not None:
+                self.emit(POP_TRY)
+                self.blocks = blocks[:i]
+                self.compile_named_body(node.finally_body, node.block_name)
+                self.blocks = blocks
+
+    def compile_jump_out(self, node, continue_):
+        name = node.block_name
+        for i in reversed(range(len(self.blocks))):
+            block = self.blocks[i]
+            if block.try_node is not None:
+                continue
+            if block.loop if name is None else block.name == name:
+                label = block.continue_label if continue_ \
+                    else block.break_label
+                if label is None:
+                    break
+                self.exit_blocks(i + 1)
+                self.emit(JUMP, label)
+                return
+        self.error("no block to break: %r" % name)
+
+    def store_variable(self, name, src):
+        # 宣言: グローバル変数なら値のある印を付ける
+        slot = self.locals.get(name)
+        if slot is None:
+            self.emit(DEFINE_GLOBAL, self.compiler.global_slot(name), src)
+        else:
+            self.move(slot, src)
+
+    def loop_variable(self, block_name, counter):
+        """Return the register the loop stores its variable in."""
+        if block_name is not None:
+            slot = self.locals.get(block_name.symbol)
+            if slot is not None:
+                return slot
+        return counter
+
+    ##################################################################
+    # 文
+    ##################################################################
+
+    def compile_if(self, node):
+        end = _Label()
+        if node.block_name is not None:
+            self.blocks.append(_Block(node.block_name, end))
+        clauses = node.clauses
+        for i, (cond, body) in enumerate(clauses):
+            if cond is None:
+                self.compile_body(body)
+                break
+            next_clause = _Label()
+            self.compile_jump(cond, next_clause, False)
+            self.compile_body(body)
+            if i < len(clauses) - 1:
+                self.emit(JUMP, end)
+            self.mark(next_clause)
+        if node.block_name is not None:
+            self.blocks.pop()
+        self.mark(end)
+
+    def compile_switch(self, node):
+        target = self.compile_value(node.target, self.temp())
+        end = _Label()
+        if node.block_name is not None:
+            self.blocks.append(_Block(node.block_name, end))
+        for value, body in node.case:
+            if value is None:
+                self.compile_body(body)
+                break
+            next_case = _Label()
+            self.compile_match(value, target, next_case)
+            self.compile_body(body)
+            self.emit(JUMP, end)
+            self.mark(next_case)
+        if node.block_name is not None:
+            self.blocks.pop()
+        self.mark(end)
+
+    def compile_match(self, value_node, value, fail):
+        """Fall through if `value` is in the ranges of `value_node`."""
+        ok = _Label()
+        ranges = value_node.range
+        for i, (start, end) in enumerate(ranges):
+            last = i == len(ranges) - 1
+            next_range = fail if last else _Label()
+            start = self.compile_value(start)
+            if end is None:
+                self.emit(JUMP_UNLESS_EQ, value, start, next_range)
+            else:
+                self.emit(JUMP_UNLESS_GE, value, start, next_range)
+                self.emit(JUMP_UNLESS_LE, value, self.compile_value(end),
+                          next_range)
+            if not last:
+                self.emit(JUMP, ok)
+                self.mark(next_range)
+        self.mark(ok)
+
+    def compile_while(self, node):
+        top = _Label()
+        body = _Label()
+        end = _Label()
+        skip = node.skip
+        if type(skip) is bool:
+            if skip:
+                self.emit(JUMP, body)
+        elif skip is not None:
+            self.compile_jump(skip, body, True)
+        self.mark(top)
+        self.compile_jump(node.cond, end, False)
+        self.mark(body)
+        self.blocks.append(_Block(node.block_name, end, top, loop=True))
+        self.compile_body(node.body)
+        self.blocks.pop()
+        self.emit(JUMP, top)
+        self.mark(end)
+
+    def compile_for(self, node):
+        counter = self.temp(3)
+        end_value = counter + 1
+        step_value = counter + 2
+        self.compile_value(node.start, counter)
+        self.compile_value(node.end, end_value)
+        step = 1 if node.step is None else node.step
+        # 定数の刻みなら向きはコンパイル時に決まる
+        constant = type(step) in (int, long, float) and step != 0
+        self.compile_value(step, step_value)
+        if not constant:
+            self.emit(CHECK_STEP, step_value)
+        variable = self.loop_variable(node.block_name, counter)
+        top = _Label()
+        next_step = _Label()
+        end = _Label()
+        self.mark(top)
+        if not constant:
+            self.emit(FOR_STEP, counter, end_value, step_value, variable, end)
+        else:
+            self.emit(FOR_UP if step > 0 else FOR_DOWN,
+                      counter, end_value, variable, end)
+        if variable == counter and node.block_name is not None:
+            self.store_variable(node.block_name.symbol, counter)
+        self.blocks.append(_Block(node.block_name, end, next_step, loop=True))
+        self.compile_body(node.body)
+        self.blocks.pop()
+        self.mark(next_step)
+        self.emit(STEP_JUMP, counter, step_value, top)
+        self.mark(end)
+
+    def compile_foreach(self, node):
+        items = self.temp(3)
+        index = items + 1
+        item = items + 2
+        self.compile_value(node.items, items)
+        self.move(index, self.const(0))
+        variable = self.loop_variable(node.block_name, item)
+        top = _Label()
+        end = _Label()
+        self.mark(top)
+        self.emit(FOREACH_NEXT, items, index, variable, end)
+        if variable == item and node.block_name is not None:
+            self.store_variable(node.block_name.symbol, item)
+        self.blocks.append(_Block(node.block_name, end, top, loop=True))
+        self.compile_body(node.body)
+        self.blocks.pop()
+        self.emit(JUMP, top)
+        self.mark(end)
+
+    def compile_try(self, node):
+        name = node.block_name
+        exc = self.temp(2)
+        code = exc + 1
+        handler = _Label()
+        catch_handler = _Label()
+        done = _Label()
+        reraise = _Label()
+        end = _Label()
+
+        self.emit(SETUP_TRY, handler, exc)
+        self.blocks.append(_Block(try_node=node))
+        self.compile_named_body(node.body, name)
+        self.blocks.pop()
+        self.emit(POP_TRY)
+        self.emit(JUMP, done)
+
+        # 例外のコードで無視、catch、再送出に分ける
+        self.mark(handler)
+        self.emit(EXC_CODE, code, exc)
+        if node.ignore_value is not None:
+            not_ignored = _Label()
+            self.compile_match(node.ignore_value, code, not_ignored)
+            self.emit(JUMP, done)
+            self.mark(not_ignored)
+        if node.catch_value is not None:
+            self.compile_match(node.catch_value, code, reraise)
+        elif not node.catch_body:
+            self.emit(JUMP, reraise)
+        self.emit(SETUP_TRY, catch_handler, exc)
+        self.blocks.append(_Block(try_node=node))
+        if name is not None:
+            self.store_variable(name.symbol, code)
+        self.compile_named_body(node.catch_body, name)
+        self.blocks.pop()
+        self.emit(POP_TRY)
+
+        self.mark(done)
+        self.compile_named_body(node.finally_body, name)
+        self.emit(JUMP, end)
+
+        self.mark(catch_handler)
+        self.mark(reraise)
+        self.compile_named_body(node.finally_body, name)
+        self.emit(RERAISE, exc)
+        self.mark(end)
+
+    def compile_ifdef(self, node):
+        if (node.mode == IfdefNode.debug) == self.debug:
+            self.compile_named_body(node.body, node.block_name)
+
+    def compile_block(self, node):
+        self.compile_named_body(node.body, node.block_name)
+
+    def compile_do(self, node):
+        expr = node.expr
+        if type(expr) is ExprNode and \
+                expr.operator.symbol in ASSIGN_OPERATORS:
+            self.compile_assign(expr)
+        else:
+            self.compile_value(expr)
+
+    def compile_break(self, node):
+        self.compile_jump_out(node, False)
+
+    def compile_continue(self, node):
+        self.compile_jump_out(node, True)
+
+    def compile_return(self, node):
+        value = self.compile_value(node.value)
+        if 0 <= value < self.nlocals and \
+                [block for block in self.blocks if block.try_node]:
+            # finally で書き換えられる前の値を返す
+            value = self.move(self.temp(), value)
+        self.exit_blocks(0)
+        self.emit(RETURN, value)
+
+    def compile_assert(self, node):
+        if self.debug:
+            ok = _Label()
+            self.compile_jump(node.expr, ok, True)
+            self.emit(THROW, self.const(ASSERT_FAILED),
+                      self.const("assertion failed"))
+            self.mark(ok)
+
+    def compile_throw(self, node):
+        self.emit(THROW, *self.compile_operands([node.code, node.message]))
+
+    def compile_var(self, node):
+        name = node.varname.symbol
+        slot = self.locals.get(name)
+        if node.value is None:
+            value = self.const(default_value(node.typename))
+        else:
+            value = self.compile_value(node.value, slot)
+        self.store_variable(name, value)
+
+    def compile_definition(self, node):
+        # 関数は compile_program で、import、alias、enum、class は何もしない
+        pass
+
+    sentence_compilers = {
+        IfNode: compile_if,
+        SwitchNode: compile_switch,
+        WhileNode: compile_while,
+        ForNode: compile_for,
+        ForeachNode: compile_foreach,
+        TryNode: compile_try,
+        IfdefNode: compile_ifdef,
+        BlockNode: compile_block,
+        DoNode: compile_do,
+        BreakNode: compile_break,
+        ContinueNode: compile_continue,
+        ReturnNode: compile_return,
+        AssertNode: compile_assert,
+        ThrowNode: compile_throw,
+        VarNode: compile_var,
+        ConstNode: compile_var,
+        FuncDefNode: compile_definition,
+        AliasNode: compile_definition,
+        EnumNode: compile_definition,
+        ClassNode: compile_definition,
+        str: compile_definition,
+        unicode: compile_definition,
+        }
+
+    ##################################################################
+    # 式
+    ##################################################################
+
+    def compile_value(self, node, dst=None):
+        """
+        Compile the expression `node`; return the register of its value.
+
+        The value is computed in `dst` if it is given, otherwise in a new
+        temporary, or it is the register of the variable or constant.
+        """
+        return self.expression_compilers[type(node)](self, node, dst)
+
+    def compile_operands(self, nodes):
+        registers = []
+        for node in nodes:
+            if registers and _assigns(node):
+                # 後の式が変数を書き換える前の値を使う
+                for i, register in enumerate(registers):
+                    if 0 <= register < self.nlocals:
+                        registers[i] = self.move(self.temp(), register)
+            registers.append(self.compile_value(node))
+        return registers
+
+    def compile_jump(self, node, label, when):
+        """Jump to `label` if the truth of `node` is `when`."""
+        if type(node) is bool:
+            if node == when:
+                self.emit(JUMP, label)
+            return
+        if type(node) is ExprNode:
+            op = node.operator.symbol
+            operands = node.operands
+            if op == "!" and len(operands) == 1:
+                self.compile_jump(operands[0], label, not when)
+                return
+            if op == "&" or op == "|":
+                left, right = operands
+                if (op == "&") != when:
+                    self.compile_jump(left, label, when)
+                    self.compile_jump(right, label, when)
+                else:
+                    skip = _Label()
+                    self.compile_jump(left, skip, not when)
+                    self.compile_jump(right, label, when)
+                    self.mark(skip)
+                return
+            if not when and op in JUMP_UNLESS and len(operands) == 2:
+                left, right = self.compile_operands(operands)
+                self.emit(JUMP_UNLESS[op], left, right, label)
+                return
+        value = self.compile_value(node)
+        self.emit(JUMP_IF_TRUE if when else JUMP_IF_FALSE, value, label)
+
+    def compile_literal(self, node, dst):
+        return self.move(dst, self.const(node))
+
+    def compile_symbol(self, node, dst):
+        name = node.symbol
+        slot = self.locals.get(name)
+        if slot is not None:
+            return self.move(dst, slot)
+        if dst is None:
+            dst = self.temp()
+        self.emit(LOAD_GLOBAL, dst, self.compiler.global_slot(name))
+        return dst
+
+    def compile_expr(self, node, dst):
+        op = node.operator.symbol
+        special = self.special_forms.get(op)
+        if special is not None:
+            return special(self, node, dst)
+        operands = self.compile_operands(node.operands)
+        if dst is None:
+            dst = self.temp()
+        if len(operands) == 1:
+            if op == "-":
+                self.emit(NEG, dst, operands[0])
+            elif op == "!":
+                self.emit(NOT, dst, operands[0])
+            else:
+                self.emit(UNARY, dst, self.const(UNARY_OPERATORS[op]),
+                          operands[0])
+        elif op in INLINE_OPERATORS:
+            self.emit(INLINE_OPERATORS[op], dst, *operands)
+        else:
+            self.emit(BINARY, dst, self.const(BINARY_OPERATORS[op]),
+                      *operands)
+        return dst
+
+    def compile_compound(self, op, dst, left, right):
+        if op in INLINE_COMPOUND_OPERATORS:
+            self.emit(INLINE_COMPOUND_OPERATORS[op], dst, left, right)
+        else:
+            self.emit(BINARY, dst, self.const(COMPOUND_OPERATORS[op]),
+                      left, right)
+
+    def compile_assign(self, node, dst=None):
+        # 代入の値のレジスタを返す
+        op = node.operator.symbol
+        target, value = node.operands
+        if type(target) is SymbolNode:
+            name = target.symbol
+            slot = self.locals.get(name)
+            if slot is not None:
+                if op == "::":
+                    self.compile_value(value, slot)
+                else:
+                    left, right = self.compile_operands([target, value])
+                    self.compile_compound(op, slot, left, right)
+                return self.move(dst, slot)
+            index = self.compiler.global_slot(name)
+            if op == "::":
+                result = self.compile_value(value, dst)
+            else:
+                result = dst if dst is not None else self.temp()
+                self.emit(LOAD_GLOBAL, result, index)
+                self.compile_compound(op, result, result,
+                                      self.compile_value(value))
+            self.emit(STORE_GLOBAL, index, result)
+            return result
+        if type(target) is ArrayNode:
+            if op == "::":
+                array, index, result = self.compile_operands(
+                    [target.array, target.index, value])
+            else:
+                array, index = self.compile_operands(
+                    [target.array, target.index])
+                result = dst if dst is not None else self.temp()
+                self.emit(LOAD_INDEX, result, array, index)
+                self.compile_compound(op, result, result,
+                                      self.compile_value(value))
+            self.emit(STORE_INDEX, array, index, result)
+            return self.move(dst, result)
+        self.error("can't assign to %r" % (target,))
+        return self.const(None)
+
+    def compile_logical(self, node, dst):
+        if dst is None:
+            dst = self.temp()
+        false = _Label()
+        end = _Label()
+        self.compile_jump(node, false, False)
+        self.emit(MOVE, dst, self.const(True))
+        self.emit(JUMP, end)
+        self.mark(false)
+        self.emit(MOVE, dst, self.const(False))
+        self.mark(end)
+        return dst
+
+    def compile_ternary(self, node, dst):
+        cond, true_body, false_body = node.operands
+        if dst is None:
+            dst = self.temp()
+        false = _Label()
+        end = _Label()
+        self.compile_jump(cond, false, False)
+        self.compile_value(true_body, dst)
+        self.emit(JUMP, end)
+        self.mark(false)
+        self.compile_value(false_body, dst)
+        self.mark(end)
+        return dst
+
+    def compile_cast(self, node, dst):
+        value, typename = node.operands
+        value = self.compile_value(value)
+        if dst is None:
+            dst = self.temp()
+        self.emit(CAST, dst, value, self.const(typename))
+        return dst
+
+    def compile_class_check(self, node, dst):
+        self.error("classes are not supported")
+        return self.const(None)
+
+    special_forms = dict([(op, compile_assign) for op in ASSIGN_OPERATORS])
+    special_forms.update({
+        "&": compile_logical,
+        "|": compile_logical,
+        "?()": compile_ternary,
+        "$": compile_cast,
+        "@is": compile_class_check,
+        "@nis": compile_class_check,
+        })
+
+    def compile_call(self, node, dst):
+        # 引数は連続したレジスタに置く
+        args = node.args
+        first = self.temp(len(args))
+        for i, arg in enumerate(args):
+            self.compile_value(arg, first + i)
+        if dst is None:
+            dst = self.temp()
+        name = node.funcname.symbol
+        index = self.compiler.function_index.get(name)
+        if index is None:
+            self.emit(CALL_BUILTIN, dst, self.const(name), first, len(args))
+        else:
+            self.emit(CALL, dst, index, first, len(args))
+        return dst
+
+    def compile_index(self, node, dst):
+        array, index = self.compile_operands([node.array, node.index])
+        if dst is None:
+            dst = self.temp()
+        self.emit(LOAD_INDEX, dst, array, index)
+        return dst
+
+    def compile_new(self, node, dst):
+        typename = node.type
+        if type(typename) is not ArrayTypeNode or None in typename.size:
+            self.error("can't create %r" % (typename,))
+            return self.const(None)
+        sizes = typename.size
+        first = self.temp(len(sizes))
+        for i, size in enumerate(sizes):
+            self.compile_value(size, first + i)
+        if dst is None:
+            dst = self.temp()
+        self.emit(NEW_ARRAY, dst, first, len(sizes),
+                  self.const(typename.base_type))
+        return dst
+
+    expression_compilers = {
+        int: compile_literal,
+        long: compile_literal,
+        float: compile_literal,
+        bool: compile_literal,
+        str: compile_literal,
+        unicode: compile_literal,
+        type(None): compile_literal,
+        SymbolNode: compile_symbol,
+        ExprNode: compile_expr,
+        FuncNode: compile_call,
+        ArrayNode: compile_index,
+        NewNode: compile_new,
+        }
@@ -0,0 +1,675 @@
+# -*- coding: utf-8 -*-
+
+"""Hand written parser over the token table produced by kuin.lexer.
+
+It builds the same node trees as the pyparsing grammar in kuin.parser,
+but never looks at the characters again: every decision is taken on the
+kind and value of the current token.
+"""
+
+from pyparsing import ParseException
+
+from kuin.nodes import *
+from kuin.nodes import Node, symbol, type_node
+from kuin.lexer import *
+from kuin.operators import *
+
+__all__ = ['TokenParser', 'parse_expr', 'parse_stmt']
+
+COLLECTION_TYPES = frozenset(["list", "stack", "queue"])
+PRIMITIVE_TYPES = frozenset([
+    "int", "float", "char", "bool", "byte8", "byte16", "byte32", "byte64",
+    "sbyte8", "sbyte16", "sbyte32", "sbyte64"])
+
+
+def is_class_name(value):
+    """Whether the NAME token `value` is a ClassName (``a.b.C``)."""
+    return "#" not in value
+
+
+def is_constant_name(value):
+    """Whether the NAME token `value` is an enumerator (``a.C#E#X``)."""
+    parts = value.split("#")
+    if len(parts) == 2:
+        return "." not in value
+    return len(parts) == 3 and "." not in parts[1] and "." not in parts[2]
+
+
+def is_type_name(value):
+    """Whether the NAME token `value` names a type (``a.b.C``, ``C#E``)."""
+    if "." not in value and "#" not in value:
+        return True
+    owner, sep, name = value.partition("#")
+    if "." in name or "#" in name:
+        return False
+    # int#E などは PrimitiveType が先に読まれる
+    return owner.split(".", 1)[0] not in PRIMITIVE_TYPES
+
+
+class TokenParser(object):
+
+    def __init__(self, tokens, table=OPERATORS, source_map=None):
+        self.tokens = tokens
+        self.text = tokens.text
+        self.kinds = tokens.kinds
+        self.values = tokens.values
+        self.starts = tokens.starts
+        self.ends = tokens.ends
+        self.pos = 0
+        self.source_map = source_map
+        # 位置を記録するときは出現ごとに別の SymbolNode を作る
+        if source_map is None:
+            self.symbol = symbol
+        else:
+            self.symbol = SymbolNode
+
+        self.prefix = frozenset(prefix_operators(table))
+        self.infix = infix_operators(table)
+        self.ternary_level, delims = ternary_operator(table)
+        if self.ternary_level is not None:
+            self.ternary_open, self.ternary_sep, self.ternary_close = delims
+        self.top_level = max([entry[0] for entry in table])
+
+    ##################################################################
+    # トークン操作
+    ##################################################################
+
+    def error(self, msg, pos=None):
+        if pos is None:
+            pos = self.pos
+        raise ParseException(self.text, self.starts[pos], msg)
+
+    def at_op(self, value):
+        pos = self.pos
+        return self.kinds[pos] == OP and self.values[pos] == value
+
+    def accept_op(self, value):
+        pos = self.pos
+        if self.kinds[pos] == OP and self.values[pos] == value:
+            self.pos = pos + 1
+            return True
+        return False
+
+    def expect_op(self, value):
+        if not self.accept_op(value):
+            self.error("Expected %r" % value)
+
+    def at_keyword(self, value):
+        pos = self.pos
+        return self.kinds[pos] == KEYWORD and self.values[pos] == value
+
+    def accept_keyword(self, value):
+        pos = self.pos
+        if self.kinds[pos] == KEYWORD and self.values[pos] == value:
+            self.pos = pos + 1
+            return True
+        return False
+
+    def expect_keyword(self, value):
+        if not self.accept_keyword(value):
+            self.error("Expected %r" % value)
+
+    def expect_block_end(self, value):
+        if not (self.accept_keyword("end") and self.accept_keyword(value)):
+            self.error("Expected 'end %s'" % value)
+
+    def expect_end(self):
+        if self.kinds[self.pos] != END:
+            self.error("Expected end of text")
+
+    def located(self, node, first):
+        """Record that `node` spans the tokens from `first` to here."""
+        if self.source_map is not None and isinstance(node, Node):
+            self.source_map.add(node, self.starts[first],
+                                self.ends[self.pos - 1])
+        return node
+
+    def optional(self, parse):
+        """Return parse() or None if it fails without consuming input."""
+        pos = self.pos
+        try:
+            return parse()
+        except ParseException:
+            self.pos = pos
+            return None
+
+    ##################################################################
+    # 名前
+    ##################################################################
+
+    def parse_name(self):
+        pos = self.pos
+        value = self.values[pos]
+        # 文法の Name は . も # も含まない
+        if self.kinds[pos] != NAME or "." in value or "#" in value:
+            self.error("Expected Name")
+        self.pos = pos + 1
+        return self.located(self.symbol(value), pos)
+
+    def parse_class_name(self):
+        pos = self.pos
+        if self.kinds[pos] != NAME or not is_class_name(self.values[pos]):
+            self.error("Expected ClassName")
+        self.pos = pos + 1
+        return self.located(self.symbol(self.values[pos]), pos)
+
+    def parse_block_name(self):
+        if self.kinds[self.pos] == NAME:
+            return self.parse_name()
+        return None
+
+    ##################################################################
+    # 型
+    ##################################################################
+
+    def parse_type(self):
+        pos = self.pos
+        kind = self.kinds[pos]
+        value = self.values[pos]
+        if kind == OP and value == "[":
+            return self.located(self.parse_array_type(), pos)
+        if kind == KEYWORD and value == "func":
+            return self.located(self.parse_func_type(), pos)
+        if kind != NAME or not is_type_name(value):
+            self.error("Expected Type")
+        if value in COLLECTION_TYPES or value == "dict":
+            try:
+                return self.located(self.parse_collection_type(), pos)
+            except ParseException:
+                self.pos = pos
+        self.pos = pos + 1
+        return self.located(self.symbol(value), pos)
+
+    def parse_array_type(self):
+        size = []
+        while self.accept_op("["):
+            if self.accept_op("]"):
+                size.append(None)
+            else:
+                size.append(self.parse_expr())
+                self.expect_op("]")
+        return type_node(ArrayTypeNode, self.parse_type(), size)
+
+    def parse_collection_type(self):
+        name = self.values[self.pos]
+        self.pos += 1
+        self.expect_op("<")
+        if name == "dict":
+            keytype = self.parse_type()
+            self.expect_op(",")
+            valtype = self.parse_type()
+            self.expect_op(">")
+            return type_node(DictTypeNode, keytype, valtype)
+        item_type = self.parse_type()
+        self.expect_op(">")
+        return type_node(CollectionTypeNode, name, item_type)
+
+    def parse_func_type(self):
+        self.pos += 1
+        self.expect_op("<")
+        self.expect_op("(")
+        argtype = [self.parse_type()]
+        while self.accept_op(","):
+            argtype.append(self.parse_type())
+        self.expect_op(")")
+        self.expect_op(":")
+        rettype = self.parse_type()
+        self.expect_op(">")
+        return type_node(FuncTypeNode, argtype, rettype)
+
+    ##################################################################
+    # 式
+    ##################################################################
+
+    def parse_expr(self, max_level=None):
+        if max_level is None:
+            max_level = self.top_level
+        kinds = self.kinds
+        values = self.values
+        infix = self.infix
+        first = self.pos
+        left = self.parse_unary()
+        # 条件演算は結合しない: その後には条件演算より弱い演算子だけが続く
+        min_level = None
+        while True:
+            pos = self.pos
+            if kinds[pos] != OP:
+                break
+            op = values[pos]
+            if op == self.ternary_open:
+                if self.ternary_level > max_level or min_level is not None:
+                    break
+                try:
+                    left = self.located(self.parse_ternary(left), first)
+                except ParseException:
+                    self.pos = pos
+                    break
+                min_level = self.ternary_level
+                continue
+            info = infix.get(op)
+            if info is None or info[0] > max_level or (
+                    min_level is not None and info[0] <= min_level):
+                break
+            level, kind, assoc = info
+            self.pos = pos + 1
+            # 右辺が解析できなければ演算子を読まずに戻る
+            try:
+                if kind == CLASS_CHECK:
+                    right = self.parse_class_name()
+                elif kind == CAST:
+                    right = self.parse_type()
+                elif assoc == RIGHT:
+                    right = self.parse_expr(level)
+                else:
+                    right = self.parse_expr(level - 1)
+            except ParseException:
+                self.pos = pos
+                break
+            op = self.symbol(op)
+            if self.source_map is not None:
+                self.source_map.add(op, self.starts[pos], self.ends[pos])
+            left = self.located(ExprNode(op, left, right), first)
+        return left
+
+    def parse_ternary(self, cond):
+        operand_level = self.ternary_level - 1
+        self.pos += 1
+        true_body = self.parse_expr(operand_level)
+        self.expect_op(self.ternary_sep)
+        false_body = self.parse_expr(operand_level)
+        self.expect_op(self.ternary_close)
+        return ExprNode(ExprNode.ternary_op, cond, true_body, false_body)
+
+    def parse_unary(self, allow_number=True):
+        pos = self.pos
+        kind = self.kinds[pos]
+        value = self.values[pos]
+        if allow_number:
+            # 符号付きの数値リテラルは単項演算より優先されます
+            if kind == NUMBER:
+                self.pos = pos + 1
+                return value
+            if kind == OP and value in ("+", "-") and \
+                    self.kinds[pos + 1] == NUMBER:
+                self.pos = pos + 2
+                if value == "-":
+                    return -self.values[pos + 1]
+                return self.values[pos + 1]
+        if kind == OP and value in self.prefix:
+            self.pos = pos + 1
+            try:
+                operand = self.parse_unary(allow_number=False)
+            except ParseException:
+                self.pos = pos
+                return self.parse_primary()
+            op = self.symbol(value)
+            if self.source_map is not None:
+                self.source_map.add(op, self.starts[pos], self.ends[pos])
+            return self.located(ExprNode(op, operand), pos)
+        return self.parse_primary()
+
+    def parse_primary(self):
+        pos = self.pos
+        kind = self.kinds[pos]
+        value = self.values[pos]
+        if kind == NAME and is_class_name(value):
+            self.pos = pos + 1
+            name = self.located(self.symbol(value), pos)
+            if self.accept_op("("):
+                return self.located(FuncNode(name, self.parse_args()), pos)
+            if self.accept_op("["):
+                index = self.parse_expr()
+                self.expect_op("]")
+                return self.located(ArrayNode(name, index), pos)
+            return name
+        if kind == NAME and is_constant_name(value):
+            self.pos = pos + 1
+            return self.located(self.symbol(value), pos)
+        if kind == STRING or kind == CHAR:
+            self.pos = pos + 1
+            return value
+        if kind == KEYWORD and (value == "true" or value == "false"):
+            self.pos = pos + 1
+            return value == "true"
+        if kind == OP:
+            if value == "(":
+                self.pos = pos + 1
+                expr = self.parse_expr()
+                self.expect_op(")")
+                return expr
+            if value == "@new":
+                self.pos = pos + 1
+                return self.located(NewNode(self.parse_type()), pos)
+        self.error("Expected expression")
+
+    def parse_args(self):
+        args = []
+        if not self.accept_op(")"):
+            args.append(self.parse_expr())
+            while self.accept_op(","):
+                args.append(self.parse_expr())
+            self.expect_op(")")
+        return args
+
+    def parse_value(self):
+        first = self.pos
+        items = []
+        while True:
+            start = self.parse_expr()
+            end = None
+            if self.accept_op("@to"):
+                end = self.parse_expr()
+            items.append((start, end))
+            if not self.accept_op(","):
+                return self.located(ValueNode(items), first)
+
+    ##################################################################
+    # 文
+    ##################################################################
+
+    def parse_sentences(self):
+        """Parse sentences until a token that cannot start one."""
+        kinds = self.kinds
+        values = self.values
+        dispatch = self.sentence_dispatch
+        sentences = []
+        while kinds[self.pos] == KEYWORD:
+            method = dispatch.get(values[self.pos])
+            if method is None:
+                break
+            first = self.pos
+            sentences.append(self.located(method(self), first))
+        return sentences
+
+    def parse_sentence(self):
+        method = None
+        if self.kinds[self.pos] == KEYWORD:
+            method = self.sentence_dispatch.get(self.values[self.pos])
+        if method is None:
+            self.error("Expected Sentence")
+        first = self.pos
+        return self.located(method(self), first)
+
+    # ブロック文
+
+    def parse_if(self):
+        self.pos += 1
+        block_name = self.parse_block_name()
+        self.expect_op("(")
+        then_cond = self.parse_expr()
+        self.expect_op(")")
+        then_body = self.parse_sentences()
+        elif_cond = []
+        elif_body = []
+        while self.accept_keyword("elif"):
+            self.expect_op("(")
+            elif_cond.append(self.parse_expr())
+            self.expect_op(")")
+            elif_body.append(self.parse_sentences())
+        else_body = None
+        if self.accept_keyword("else"):
+            else_body = self.parse_sentences()
+        self.expect_block_end("if")
+        return IfNode(then_cond, then_body,
+                      elif_cond or None, elif_body or None,
+                      else_body, block_name)
+
+    def parse_switch(self):
+        self.pos += 1
+        block_name = self.parse_block_name()
+        self.expect_op("(")
+        target = self.parse_expr()
+        self.expect_op(")")
+        case = []
+        while self.accept_keyword("case"):
+            value = self.parse_value()
+            case.append([(value, self.parse_sentences())])
+        if self.accept_keyword("default"):
+            case.append([(None, self.parse_sentences())])
+        self.expect_block_end("switch")
+        return SwitchNode(target, case, block_name)
+
+    def parse_while(self):
+        self.pos += 1
+        block_name = self.parse_block_name()
+        self.expect_op("(")
+        cond = self.parse_expr()
+        skip = None
+        if self.accept_op(","):
+            skip = self.parse_expr()
+        self.expect_op(")")
+        body = self.parse_sentences()
+        self.expect_block_end("while")
+        return WhileNode(cond, skip, body, block_name)
+
+    def parse_for(self):
+        self.pos += 1
+        block_name = self.parse_block_name()
+        self.expect_op("(")
+        start = self.parse_expr()
+        self.expect_op(",")
+        end = self.parse_expr()
+        step = None
+        if self.accept_op(","):
+            step = self.parse_expr()
+        self.expect_op(")")
+        body = self.parse_sentences()
+        self.expect_block_end("for")
+        return ForNode(start, end, step, block_name, body)
+
+    def parse_foreach(self):
+        self.pos += 1
+        block_name = self.parse_block_name()
+        self.expect_op("(")
+        items = self.parse_expr()
+        self.expect_op(")")
+        body = self.parse_sentences()
+        self.expect_block_end("foreach")
+        return ForeachNode(items, block_name, body)
+
+    def parse_try(self):
+        self.pos += 1
+        block_name = self.parse_block_name()
+        self.expect_op("(")
+        ignore_value = None
+        if not self.at_op(")"):
+            ignore_value = self.parse_value()
+        self.expect_op(")")
+        body = self.parse_sentences()
+        catch_value = catch_body = finally_body = None
+        if self.accept_keyword("catch"):
+            catch_value = self.optional(self.parse_value)
+            catch_body = self.parse_sentences()
+        if self.accept_keyword("finally"):
+            finally_body = self.parse_sentences()
+        self.expect_block_end("try")
+        return TryNode(block_name, ignore_value, body,
+                       catch_value, catch_body, finally_body)
+
+    def parse_ifdef(self):
+        self.pos += 1
+        block_name = self.parse_block_name()
+        self.expect_op("(")
+        if self.accept_keyword("release"):
+            mode = IfdefNode.release
+        elif self.accept_keyword("debug"):
+            mode = IfdefNode.debug
+        else:
+            self.error("Expected 'release' or 'debug'")
+        self.expect_op(")")
+        body = self.parse_sentences()
+        self.expect_block_end("ifdef")
+        return IfdefNode(mode, block_name, body)
+
+    def parse_block(self):
+        self.pos += 1
+        block_name = self.parse_block_name()
+        body = self.parse_sentences()
+        self.expect_block_end("block")
+        return BlockNode(block_name, body)
+
+    # 単文
+
+    def parse_do(self):
+        self.pos += 1
+        return DoNode(self.parse_expr())
+
+    def parse_import(self):
+        self.pos += 1
+        pos = self.pos
+        if self.kinds[pos] != SOURCE:
+            self.error("Expected SourceName")
+        self.pos = pos + 1
+        return self.values[pos]
+
+    def parse_break(self):
+        self.pos += 1
+        return BreakNode(self.parse_block_name())
+
+    def parse_continue(self):
+        self.pos += 1
+        return ContinueNode(self.parse_block_name())
+
+    def parse_return(self):
+        self.pos += 1
+        return ReturnNode(self.optional(self.parse_expr))
+
+    def parse_assert(self):
+        self.pos += 1
+        return AssertNode(self.parse_expr())
+
+    def parse_throw(self):
+        self.pos += 1
+        code = self.parse_expr()
+        self.expect_op(",")
+        return ThrowNode(code, self.parse_expr())
+
+    # 定義文
+
+    def parse_func(self):
+        self.pos += 1
+        name = self.parse_name()
+        self.expect_op("(")
+        params = []
+        if not self.at_op(")"):
+            while True:
+                param = self.parse_name()
+                self.expect_op(":")
+                params.append((param, self.parse_type()))
+                if not self.accept_op(","):
+                    break
+        self.expect_op(")")
+        rettype = None
+        if self.accept_op(":"):
+            rettype = self.parse_type()
+        body = self.parse_sentences()
+        self.expect_block_end("func")
+        return FuncDefNode(name, params, rettype, body)
+
+    def parse_var(self):
+        self.pos += 1
+        varname = self.parse_name()
+        self.expect_op(":")
+        typename = self.parse_type()
+        value = None
+        if self.accept_op("::"):
+            value = self.parse_expr()
+        return VarNode(varname, typename, value)
+
+    def parse_const(self):
+        self.pos += 1
+        varname = self.parse_name()
+        self.expect_op(":")
+        typename = self.parse_type()
+        self.expect_op("::")
+        return ConstNode(varname, typename, self.parse_expr())
+
+    def parse_alias(self):
+        self.pos += 1
+        alias = self.parse_name()
+        self.expect_op(":")
+        return AliasNode(alias, self.parse_type())
+
+    def parse_enum(self):
+        self.pos += 1
+        name = self.parse_name()
+        member = []
+        while True:
+            key = self.parse_name()
+            value = None
+            if self.accept_op("::"):
+                value = self.parse_expr()
+            member.append((key, value))
+            if self.kinds[self.pos] != NAME:
+                break
+        self.expect_block_end("enum")
+        return EnumNode(name, member)
+
+    def parse_class(self):
+        self.pos += 1
+        name = self.parse_name()
+        parent = None
+        if self.accept_op(":"):
+            parent = self.parse_class_name()
+        members = []
+        member_dispatch = self.member_dispatch
+        while True:
+            visibility = override = None
+            if self.at_op("+") or self.at_op("-"):
+                visibility = self.values[self.pos]
+                self.pos += 1
+            if self.accept_op("*"):
+                override = "*"
+            method = None
+            if self.kinds[self.pos] == KEYWORD:
+                method = member_dispatch.get(self.values[self.pos])
+            if method is None:
+                if visibility or override:
+                    self.error("Expected class member")
+                break
+            first = self.pos
+            members.append(ClassNode.Member(self.located(method(self), first),
+                                            visibility, override))
+        self.expect_block_end("class")
+        return ClassNode(name, parent, members)
+
+    member_dispatch = {
+        "func": parse_func,
+        "var": parse_var,
+        "const": parse_const,
+        "alias": parse_alias,
+        "class": parse_class,
+        "enum": parse_enum,
+        }
+
+    sentence_dispatch = dict(member_dispatch, **{
+        "if": parse_if,
+        "switch": parse_switch,
+        "while": parse_while,
+        "for": parse_for,
+        "foreach": parse_foreach,
+        "try": parse_try,
+        "ifdef": parse_ifdef,
+        "block": parse_block,
+        "do": parse_do,
+        "import": parse_import,
+        "break": parse_break,
+        "continue": parse_continue,
+        "return": parse_return,
+        "assert": parse_assert,
+        "throw": parse_throw,
+        })
+
+
+def parse_stmt(text, source_map=None):
+    parser = TokenParser(tokenize(text), source_map=source_map)
+    sentences = parser.parse_sentences()
+    parser.expect_end()
+    return sentences
+
+
+def parse_expr(text, source_map=None):
+    parser = TokenParser(tokenize(text), source_map=source_map)
+    expr = parser.parse_expr()
+    parser.expect_end()
+    return expr
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""Incremental reparsing of an edited source.
+
+A :class:`ParseSession` keeps the top-level sentences of a source together
+with their character spans.  An edit ``(offset, removed, inserted)`` only
+reparses the top-level sentences it touches, so the parsing cost depends
+on the size of the edited blocks rather than on the size of the file.
+
+Sentences are parsed with the token backend (kuin.fastparser); the trees
+are the same as the ones ``parse_stmt`` builds.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from pyparsing import ParseBaseException
+
+from kuin.lexer import tokenize, END
+from kuin.fastparser import TokenParser
+
+__all__ = ['ParseSession', 'parse_spans']
+
+
+def parse_spans(text, start=0, end=None):
+    """
+    Parse the sentences of ``text[start:end]``.
+
+    Returns ``(sentences, starts, ends)`` where sentence ``i`` spans
+    ``text[starts[i]:ends[i]]``, comments and blanks around it excluded.
+    """
+    tokens = tokenize(text, start, end)
+    parser = TokenParser(tokens)
+    kinds = tokens.kinds
+    sentences = []
+    starts = []
+    ends = []
+    while kinds[parser.pos] != END:
+        first = parser.pos
+        sentences.append(parser.parse_sentence())
+        starts.append(tokens.starts[first])
+        ends.append(tokens.ends[parser.pos - 1])
+    return sentences, starts, ends
+
+
+class ParseSession(object):
+    """
+    The parse tree of a source that is edited in place.
+
+    ``sentences`` holds the top-level sentences; :meth:`spans` returns
+    their spans.  If an edit leaves the source unparsable the error is
+    raised, the edit is kept and the next one reparses the whole source.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.sentences = None
+        # 直前の再解析で解析し直した最上位の文の数
+        self.reparsed = 0
+        self.reparse()
+
+    def reparse(self):
+        """Parse the whole source again."""
+        self.sentences = None
+        self.sentences, starts, ends = parse_spans(self.text)
+        self._starts = array('l', starts)
+        self._ends = array('l', ends)
+        # 添字 _shift 以降の位置には _delta を足していない (遅延評価)
+        self._shift = len(starts)
+        self._delta = 0
+        self.reparsed = len(self.sentences)
+        return self.sentences
+
+    ##################################################################
+    # 位置
+    ##################################################################
+
+    def _position(self, values, i):
+        if i >= self._shift:
+            return values[i] + self._delta
+        return values[i]
+
+    def _bisect(self, bisect, values, x):
+        k = self._shift
+        if k > 0 and bisect(values, x, k - 1, k) == k - 1:
+            return bisect(values, x, 0, k)
+        return bisect(values, x - self._delta, k, len(values))
+
+    def _move_shift(self, k):
+        """Move the boundary of the pending shift to index `k`."""
+        old = self._shift
+        delta = self._delta
+        starts = self._starts
+        ends = self._ends
+        if old < k:
+            for i in range(old, k):
+                starts[i] += delta
+                ends[i] += delta
+        else:
+            for i in range(k, old):
+                starts[i] -= delta
+                ends[i] -= delta
+        self._shift = k
+
+    def spans(self):
+        self._move_shift(len(self._starts))
+        return list(zip(self._starts, self._ends))
+
+    ##################################################################
+    # 編集
+    ##################################################################
+
+    def edit(self, offset, removed, inserted):
+        """
+        Replace ``removed`` characters at ``offset`` with ``inserted`` and
+        update the tree.  Returns the top-level sentences.
+
+        Only the sentences around the edit are parsed again, but the text
+        is still rebuilt as one string, a copy in O(len(text)); it is
+        cheap next to parsing, even for large sources.
+        """
+        old_end = offset + removed
+        if not (0 <= offset <= old_end <= len(self.text)):
+            raise ValueError("edit out of range: %d+%d" % (offset, removed))
+        text = self.text[:offset] + inserted + self.text[old_end:]
+        self.text = text
+        if self.sentences is None:
+            return self.reparse()
+
+        delta = len(inserted) - removed
+        starts = self._starts
+        ends = self._ends
+        count = len(starts)
+        # 編集範囲に接する文 [first, last) を解析し直す。編集位置が文の間に
+        # あれば、その前で終わる文も含める ("do a\n" の後への "+ b" の
+        # 挿入は a を延ばす)
+        first = self._bisect(bisect_left, ends, offset)
+        if first and (first == count or
+                      offset <= self._position(starts, first)):
+            first -= 1
+        last = self._bisect(bisect_right, starts, old_end)
+        step = 1
+        while True:
+            # 前と次の編集されていない文の間を解析する。ブロックの
+            # 終わりが消された場合などは失敗するので、範囲を広げて再試行
+            lo = self._position(ends, first - 1) if first else 0
+            if last < count:
+                hi = self._position(starts, last) + delta
+            else:
+                hi = len(text)
+            try:
+                sentences, new_starts, new_ends = parse_spans(text, lo, hi)
+                break
+            except ParseBaseException:
+                if first == 0 and last >= count:
+                    self.sentences = None
+                    raise
+                first = max(first - step, 0)
+                last = min(last + step, count)
+                step *= 2
+
+        # 編集位置より後ろの位置はずらさずに、ずれを _delta にためておく。
+        # 同じあたりを続けて編集する限り、手間はファイルの大きさによらない
+        self._move_shift(last)
+        self.sentences[first:last] = sentences
+        starts[first:last] = array('l', new_starts)
+        ends[first:last] = array('l', new_ends)
+        self._shift = first + len(sentences)
+        self._delta += delta
+        self.reparsed = len(sentences)
+        return self.sentences
+
+    def __repr__(self):
+        if self.sentences is None:
+            return "<ParseSession (unparsable)>"
+        return "<ParseSession %d sentences>" % len(self.sentences)
@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+
+"""Tree-walking interpreter of parsed Kuin programs.
+
+:class:`Interpreter` runs the sentences produced by kuin.parser::
+
+    interpreter = Interpreter()
+    interpreter.run(parse_stmt(text, backend="fast"))
+    print interpreter.call("main")
+
+Sentences and expressions are dispatched on the type of the node through
+tables built once per class (see ``executors`` and ``evaluators``), and
+operators through the tables of kuin.runtime.
+
+Variables live in a dict per function call; names not found there are
+looked up in the globals of the program.  ``break``/``continue`` without
+a block name apply to the innermost loop; with one, to the block (loop,
+``if``, ``switch``, ``block``, ``try``, ``ifdef``) of that name.  In a
+``catch`` body the block name of the ``try`` is bound to the exception
+code.  Classes are not supported.
+"""
+
+import sys
+
+from kuin.nodes import *
+from kuin.runtime import *
+from kuin.runtime import COMPOUND_OPERATORS, check_index
+
+__all__ = ['Interpreter', 'KuinError', 'InterpreterError', 'run']
+
+
+class _Break(Exception):
+
+    def __init__(self, block_name):
+        self.block_name = block_name
+
+
+class _Continue(_Break):
+    pass
+
+
+class _Return(Exception):
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _is_target(jump, block_name):
+    # 名前のない break/continue は一番内側のループが受け取る
+    return jump.block_name is None or jump.block_name == block_name
+
+
+class Interpreter(object):
+    """
+    Run Kuin sentences.
+
+    `builtins` maps names to Python callables that can be called from the
+    program (``print`` writes to `out`).  ``ifdef(debug)`` bodies and
+    ``assert`` are executed when `debug` is true, ``ifdef(release)``
+    bodies otherwise.
+    """
+
+    def __init__(self, builtins=None, debug=True, out=None):
+        self.debug = debug
+        self.out = out or sys.stdout
+        self.globals = {}
+        self.functions = {}
+        self.builtins = {"print": self.print_value, "len": len}
+        if builtins:
+            self.builtins.update(builtins)
+
+    def print_value(self, value):
+        self.out.write(to_str(value))
+
+    def run(self, sentences):
+        """Execute the top-level `sentences`; return the value returned."""
+        sentences = list(sentences)
+        # 関数は定義より前から呼べる
+        for sentence in sentences:
+            if type(sentence) is FuncDefNode:
+                self.functions[sentence.name.symbol] = sentence
+        try:
+            self.execute_body(sentences, self.globals)
+        except _Return as e:
+            return e.value
+        except _Break as e:
+            raise InterpreterError("no block to break: %r" % e.block_name)
+
+    def call(self, name, *args):
+        """Call the function `name` of the program."""
+        func = self.functions.get(name)
+        if func is None:
+            raise InterpreterError("undefined function: %s" % name)
+        return self.call_function(func, args)
+
+    def call_function(self, func, args):
+        params = func.params
+        if len(args) != len(params):
+            raise InterpreterError("%s() takes %d arguments (%d given)" % (
+                    func.name.symbol, len(params), len(args)))
+        env = {}
+        for (name, typename), value in zip(params, args):
+            env[name.symbol] = value
+        try:
+            self.execute_body(func.body, env)
+        except _Return as e:
+            return e.value
+        except _Break as e:
+            raise InterpreterError("no block to break: %r" % e.block_name)
+        return None
+
+    ##################################################################
+    # 変数
+    ##################################################################
+
+    def lookup(self, name, env):
+        try:
+            return env[name]
+        except KeyError:
+            pass
+        try:
+            return self.globals[name]
+        except KeyError:
+            raise InterpreterError("undefined variable: %s" % name)
+
+    def store(self, name, value, env):
+        if name in env:
+            env[name] = value
+        elif name in self.globals:
+            self.globals[name] = value
+        else:
+            raise InterpreterError("undefined variable: %s" % name)
+
+    ##################################################################
+    # 文
+    ##################################################################
+
+    def execute_body(self, body, env):
+        executors = self.executors
+        for sentence in body:
+            executors[type(sentence)](self, sentence, env)
+
+    def execute_block(self, body, block_name, env):
+        # 名前付きの break で抜けられるブロック
+        if block_name is None:
+            self.execute_body(body, env)
+            return
+        try:
+            self.execute_body(body, env)
+        except _Continue:
+            raise
+        except _Break as e:
+            if e.block_name != block_name:
+                raise
+
+    def execute_if(self, node, env):
+        evaluators = self.evaluators
+        for cond, body in node.clauses:
+            if cond is None or evaluators[type(cond)](self, cond, env):
+                self.execute_block(body, node.block_name, env)
+                return
+
+    def execute_switch(self, node, env):
+        target = node.target
+        value = self.evaluators[type(target)](self, target, env)
+        for case, body in node.case:
+            if case is None or self.matches(case, value, env):
+                self.execute_block(body, node.block_name, env)
+                return
+
+    def execute_while(self, node, env):
+        evaluators = self.evaluators
+        cond = node.cond
+        evaluate_cond = evaluators[type(cond)]
+        skip = node.skip is not None and \
+            evaluators[type(node.skip)](self, node.skip, env)
+        while skip or evaluate_cond(self, cond, env):
+            skip = False
+            try:
+                self.execute_body(node.body, env)
+            except _Continue as e:
+                if not _is_target(e, node.block_name):
+                    raise
+            except _Break as e:
+                if not _is_target(e, node.block_name):
+                    raise
+                break
+
+    def execute_for(self, node, env):
+        evaluators = self.evaluators
+        start = evaluators[type(node.start)](self, node.start, env)
+        end = evaluators[type(node.end)](self, node.end, env)
+        step = 1
+        if node.step is not None:
+            step = evaluators[type(node.step)](self, node.step, env)
+        if step == 0:
+            raise InterpreterError("step of for is 0")
+        name = node.block_name and node.block_name.symbol
+        i = start
+        # 終わりの値も含む
+        while (i <= end) if step > 0 else (i >= end):
+            if name:
+                env[name] = i
+            try:
+                self.execute_body(node.body, env)
+            except _Continue as e:
+                if not _is_target(e, node.block_name):
+                    raise
+            except _Break as e:
+                if not _is_target(e, node.block_name):
+                    raise
+                break
+            i += step
+
+    def execute_foreach(self, node, env):
+        items = self.evaluators[type(node.items)](self, node.items, env)
+        name = node.block_name and node.block_name.symbol
+        for item in items:
+            if name:
+                env[name] = item
+            try:
+                self.execute_body(node.body, env)
+            except _Continue as e:
+                if not _is_target(e, node.block_name):
+                    raise
+            except _Break as e:
+                if not _is_target(e, node.block_name):
+                    raise
+                break
+
+    def execute_try(self, node, env):
+        try:
+            try:
+                self.execute_block(node.body, node.block_name, env)
+            except KuinError as e:
+                if node.ignore_value is not None and \
+                        self.matches(node.ignore_value, e.code, env):
+                    return
+                if node.catch_value is None:
+                    if not node.catch_body:
+                        raise
+                elif not self.matches(node.catch_value, e.code, env):
+                    raise
+                if node.block_name is not None:
+                    env[node.block_name.symbol] = e.code
+                self.execute_block(node.catch_body, node.block_name, env)
+        finally:
+            self.execute_block(node.finally_body, node.block_name, env)
+
+    def execute_ifdef(self, node, env):
+        if (node.mode == IfdefNode.debug) == self.debug:
+            self.execute_block(node.body, node.block_name, env)
+
+    def execute_block_node(self, node, env):
+        self.execute_block(node.body, node.block_name, env)
+
+    def execute_do(self, node, env):
+        expr = node.expr
+        self.evaluators[type(expr)](self, expr, env)
+
+    def execute_break(self, node, env):
+        raise _Break(node.block_name)
+
+    def execute_continue(self, node, env):
+        raise _Continue(node.block_name)
+
+    def execute_return(self, node, env):
+        value = node.value
+        if value is not None:
+            value = self.evaluators[type(value)](self, value, env)
+        raise _Return(value)
+
+    def execute_assert(self, node, env):
+        if self.debug:
+            expr = node.expr
+            if not self.evaluators[type(expr)](self, expr, env):
+                raise KuinError(ASSERT_FAILED, "assertion failed")
+
+    def execute_throw(self, node, env):
+        evaluators = self.evaluators
+        code = evaluators[type(node.code)](self, node.code, env)
+        message = node.message
+        if message is not None:
+            message = evaluators[type(message)](self, message, env)
+        raise KuinError(code, message)
+
+    def execute_var(self, node, env):
+        value = node.value
+        if value is None:
+            value = default_value(node.typename)
+        else:
+            value = self.evaluators[type(value)](self, value, env)
+        env[node.varname.symbol] = value
+
+    def execute_funcdef(self, node, env):
+        self.functions[node.name.symbol] = node
+
+    def execute_definition(self, node, env):
+        # import、alias、enum、class は実行時には何もしない
+        pass
+
+    executors = {
+        IfNode: execute_if,
+        SwitchNode: execute_switch,
+        WhileNode: execute_while,
+        ForNode: execute_for,
+        ForeachNode: execute_foreach,
+        TryNode: execute_try,
+        IfdefNode: execute_ifdef,
+        BlockNode: execute_block_node,
+        DoNode: execute_do,
+        BreakNode: execute_break,
+        ContinueNode: execute_continue,
+        ReturnNode: execute_return,
+        AssertNode: execute_assert,
+        ThrowNode: execute_throw,
+        VarNode: execute_var,
+        ConstNode: execute_var,
+        FuncDefNode: execute_funcdef,
+        AliasNode: execute_definition,
+        EnumNode: execute_definition,
+        ClassNode: execute_definition,
+        # import 文は SourceName の文字列になる
+        str: execute_definition,
+        unicode: execute_definition,
+        }
+
+    ##################################################################
+    # 式
+    ##################################################################
+
+    def evaluate(self, node, env):
+        return self.evaluators[type(node)](self, node, env)
+
+    def matches(self, value_node, value, env):
+        """Return whether `value` is in the ranges of `value_node`."""
+        evaluators = self.evaluators
+        for start, end in value_node.range:
+            start = evaluators[type(start)](self, start, env)
+            if end is None:
+                if value == start:
+                    return True
+            elif start <= value <= evaluators[type(end)](self, end, env):
+                return True
+        return False
+
+    def evaluate_literal(self, node, env):
+        return node
+
+    def evaluate_symbol(self, node, env):
+        return self.lookup(node.symbol, env)
+
+    def evaluate_expr(self, node, env):
+        op = node.operator.symbol
+        special = self.special_forms.get(op)
+        if special is not None:
+            return special(self, node, env)
+        evaluators = self.evaluators
+        operands = node.operands
+        left = operands[0]
+        left = evaluators[type(left)](self, left, env)
+        if len(operands) == 1:
+            return UNARY_OPERATORS[op](left)
+        right = operands[1]
+        return BINARY_OPERATORS[op](
+            left, evaluators[type(right)](self, right, env))
+
+    def evaluate_assign(self, node, env):
+        # 代入先を値より先に評価する
+        op = node.operator.symbol
+        target, value = node.operands
+        evaluate_value = self.evaluators[type(value)]
+        if type(target) is SymbolNode:
+            name = target.symbol
+            if op == "::":
+                value = evaluate_value(self, value, env)
+            else:
+                current = self.lookup(name, env)
+                value = COMPOUND_OPERATORS[op](
+                    current, evaluate_value(self, value, env))
+            self.store(name, value, env)
+        elif type(target) is ArrayNode:
+            array = self.lookup(target.array.symbol, env)
+            index = target.index
+            index = self.evaluators[type(index)](self, index, env)
+            if op == "::":
+                value = evaluate_value(self, value, env)
+            else:
+                current = array[check_index(array, index)]
+                value = COMPOUND_OPERATORS[op](
+                    current, evaluate_value(self, value, env))
+            array[check_index(array, index)] = value
+        else:
+            raise InterpreterError("can't assign to %r" % (target,))
+        return value
+
+    def evaluate_and(self, node, env):
+        left, right = node.operands
+        return bool(self.evaluators[type(left)](self, left, env) and
+                    self.evaluators[type(right)](self, right, env))
+
+    def evaluate_or(self, node, env):
+        left, right = node.operands
+        return bool(self.evaluators[type(left)](self, left, env) or
+                    self.evaluators[type(right)](self, right, env))
+
+    def evaluate_ternary(self, node, env):
+        cond, true_body, false_body = node.operands
+        body = true_body if self.evaluators[type(cond)](self, cond, env) \
+            else false_body
+        return self.evaluators[type(body)](self, body, env)
+
+    def evaluate_cast(self, node, env):
+        value, typename = node.operands
+        return cast(self.evaluators[type(value)](self, value, env), typename)
+
+    def evaluate_class_check(self, node, env):
+        raise InterpreterError("classes are not supported")
+
+    special_forms = dict([(op, evaluate_assign) for op in COMPOUND_OPERATORS])
+    special_forms.update({
+        "::": evaluate_assign,
+        "&": evaluate_and,
+        "|": evaluate_or,
+        "?()": evaluate_ternary,
+        "$": evaluate_cast,
+        "@is": evaluate_class_check,
+        "@nis": evaluate_class_check,
+        })
+
+    def evaluate_call(self, node, env):
+        evaluators = self.evaluators
+        args = [evaluators[type(arg)](self, arg, env) for arg in node.args]
+        name = node.funcname.symbol
+        func = self.functions.get(name)
+        if func is not None:
+            return self.call_function(func, args)
+        builtin = self.builtins.get(name)
+        if builtin is None:
+            raise InterpreterError("undefined function: %s" % name)
+        return builtin(*args)
+
+    def evaluate_index(self, node, env):
+        array = self.lookup(node.array.symbol, env)
+        index = node.index
+        index = self.evaluators[type(index)](self, index, env)
+        return array[check_index(array, index)]
+
+    def evaluate_new(self, node, env):
+        typename = node.type
+        if type(typename) is not ArrayTypeNode or None in typename.size:
+            raise InterpreterError("can't create %r" % (typename,))
+        evaluators = self.evaluators
+        sizes = [evaluators[type(size)](self, size, env)
+                 for size in typename.size]
+        return new_array(sizes, typename.base_type)
+
+    evaluators = {
+        int: evaluate_literal,
+        long: evaluate_literal,
+        float: evaluate_literal,
+        bool: evaluate_literal,
+        str: evaluate_literal,
+        unicode: evaluate_literal,
+        SymbolNode: evaluate_symbol,
+        ExprNode: evaluate_expr,
+        FuncNode: evaluate_call,
+        ArrayNode: evaluate_index,
+        NewNode: evaluate_new,
+        }
+
+
+def run(text, backend="fast", **options):
+    """Parse and run `text`; return the Interpreter (see its options)."""
+    from kuin.parser import parse_stmt
+    interpreter = Interpreter(**options)
+    interpreter.run(parse_stmt(text, backend=backend))
+    return interpreter
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+"""Tokenizer for Kuin sources.
+
+`tokenize` turns a source text into a `Tokens` table in a single pass:
+whitespace and (nested) comments are dropped, keywords are told apart from
+names once, and literals are decoded to their Python values.  The table is
+stored as parallel arrays so that parsers can walk it by index.
+"""
+
+import math
+import re
+from array import array
+
+from pyparsing import ParseException, ParseFatalException
+
+__all__ = [
+    'tokenize', 'Tokens',
+    'NAME', 'KEYWORD', 'NUMBER', 'STRING', 'CHAR', 'OP', 'SOURCE', 'END',
+    'KEYWORDS',
+]
+
+# token kinds
+NAME = 0
+KEYWORD = 1
+NUMBER = 2
+STRING = 3
+CHAR = 4
+OP = 5
+SOURCE = 6   # the source name following "import"
+END = 7
+
+KIND_NAMES = ["NAME", "KEYWORD", "NUMBER", "STRING", "CHAR", "OP", "SOURCE",
+              "END"]
+
+KEYWORDS = frozenset([
+        "if", "elif", "else",
+        "switch", "case", "default",
+        "while", "for", "foreach",
+        "try", "catch", "finally",
+        "ifdef", "release", "debug",
+        "block", "end",
+        "break", "continue",
+        "return", "do", "throw",
+        "func", "class", "enum",
+        "var", "const", "alias",
+        "import", "assert",
+        "true", "false",
+        ])
+
+######################################################################
+# リテラルの値
+######################################################################
+
+_escapes = {
+    "n": "\n", "r": "\r", "\\": "\\",
+    "'": "'", '"': '"',
+    }
+
+def unescape(literal):
+    """Decode a quoted string or char literal."""
+    return re.sub(r'\\(.)', lambda m: _escapes.get(m.group(1), m.group(1)),
+                  literal[1:-1])
+
+def radix_number(body):
+    """
+    Return ``(value, radix)`` of an unsigned number body such as "10",
+    "#FF" or "2#0101.11".  Raises ValueError if the body is invalid.
+    """
+    if "#" in body:
+        radix, body = body.split("#", 1)
+        if radix == "":
+            radix = 16
+        else:
+            radix = int(radix)
+            if not (2 <= radix <= 36) or radix in (10, 16):
+                raise ValueError("invalid radix: %d" % radix)
+    else:
+        radix = 10
+
+    if "." in body:
+        parts = body.split(".", 1)
+        i, f = (int(part, radix) for part in parts)
+        num = i + float(f) / math.pow(radix, len(parts[1]))
+    else:
+        num = int(body, radix)
+    return num, radix
+
+def number_value(text):
+    """Return the value of an unsigned NUMBER token (with exponents)."""
+    body, _, precision = text.partition("e")
+    num, radix = radix_number(body)
+    if precision:
+        sign = ""
+        if precision[0] in "+-":
+            sign, precision = precision[0], precision[1:]
+        precision = number_value(precision)
+        if sign == "-":
+            precision = -precision
+        num *= math.pow(radix, int(precision))
+    return num
+
+######################################################################
+# 字句解析
+######################################################################
+
+_body = (r"[1-9][0-9]?\#[0-9A-Z]+(?:\.[0-9A-Z]+)?|"
+         r"[0-9]+(?:\.[0-9]+)?|"
+         r"\#[0-9A-F]+(?:\.[0-9A-F]+)?")
+
+_operators = [
+    "@new", "@nis", "@is", "@to",
+    "?(", "::", ":+", ":-", ":*", ":/", ":%", ":^", ":~", "<>", "<=", ">=",
+    "+", "-", "*", "/", "%", "^", "~", "=", "<", ">", "&", "|", "!", "$",
+    ":", ",", "(", ")", "[", "]", ".", "#", "@", "?",
+    ]
+
+_token_re = re.compile(r"""
+    (?P<ws>[ \t\n\v\f\r]+)
+  | (?P<number>(?:%(body)s)(?:e[+-]?(?:%(body)s))*)
+  | (?P<name>[A-Za-z_][0-9A-Za-z_]*(?:[.\#][A-Za-z_][0-9A-Za-z_]*)*)
+  | (?P<string>"(?:\\.|[^"])*")
+  | (?P<char>'(?:\\.|[^'])')
+  | (?P<comment>\{)
+  | (?P<op>%(ops)s)
+""" % {
+        "body": _body,
+        "ops": "|".join([re.escape(op) + ("(?![0-9A-Za-z_])" if op[0] == "@"
+                                          and len(op) > 1 else "")
+                         for op in _operators]),
+        }, re.X)
+
+# コメント内部: 文字列、文字、入れ子のコメント、その他
+_comment_re = re.compile(r"""[^"'{}]+|"(?:\\.|[^"])*"|'(?:\\.|[^'])'|[{}]|["']""")
+
+_source_re = re.compile(u'[\x20\x09-\x0D]*([^\x20\x09-\x0D]+)')
+
+
+class Tokens(object):
+    """
+    A tokenized source.
+
+    Token ``i`` has kind ``kinds[i]``, value ``values[i]`` and spans
+    ``text[starts[i]:ends[i]]``.  The table always ends with an END token
+    located at ``len(text)``.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.kinds = array('B')
+        self.values = []
+        self.starts = array('l')
+        self.ends = array('l')
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        return (self.kinds[i], self.values[i], self.starts[i], self.ends[i])
+
+    def append(self, kind, value, start, end):
+        self.kinds.append(kind)
+        self.values.append(value)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __repr__(self):
+        return "<Tokens %s>" % " ".join([
+                "%s:%r" % (KIND_NAMES[kind], value)
+                for kind, value, start, end in self])
+
+
+def skip_comment(text, loc):
+    """Return the location just after the comment starting at `loc`."""
+    depth = 0
+    match = _comment_re.match
+    start = loc
+    while True:
+        m = match(text, loc)
+        if m is None:
+            raise ParseException(text, start, "unterminated comment")
+        s = m.group()
+        if s == "{":
+            depth += 1
+        elif s == "}":
+            depth -= 1
+            if depth == 0:
+                return m.end()
+        loc = m.end()
+
+
+def tokenize(text, start=0, end=None):
+    """Tokenize ``text[start:end]``, keeping offsets relative to `text`."""
+    if end is None:
+        end = len(text)
+    tokens = Tokens(text)
+    append = tokens.append
+    match = _token_re.match
+    loc = start
+    while loc < end:
+        m = match(text, loc, end)
+        if m is None:
+            raise ParseException(text, loc, "unexpected character")
+        kind = m.lastgroup
+        value = m.group(kind)
+        next_loc = m.end()
+        if kind == "name":
+            if value in KEYWORDS:
+                append(KEYWORD, value, loc, next_loc)
+                if value == "import":
+                    m = _source_re.match(text, next_loc, end)
+                    if m is not None:
+                        append(SOURCE, m.group(1), m.start(1), m.end(1))
+                        next_loc = m.end(1)
+            else:
+                append(NAME, value, loc, next_loc)
+        elif kind == "op":
+            append(OP, value, loc, next_loc)
+        elif kind == "number":
+            try:
+                append(NUMBER, number_value(value), loc, next_loc)
+            except ValueError:
+                raise ParseFatalException(text, loc, "invalid number")
+        elif kind == "string":
+            append(STRING, unescape(value), loc, next_loc)
+        elif kind == "char":
+            append(CHAR, unescape(value), loc, next_loc)
+        elif kind == "comment":
+            next_loc = skip_comment(text, loc)
+        loc = next_loc
+    append(END, None, end, end)
+    return tokens
@@ -1,10 +1,14 @@
 import re
+import threading
 from collections import OrderedDict
+from contextlib import contextmanager
+from weakref import WeakValueDictionary
 
 __all__ = [
     "IfNode", "SwitchNode", "WhileNode", "ForNode", "ForeachNode", "TryNode",
     "IfdefNode", "BlockNode", "DoNode", "ImportNode", "BreakNode",
     "ContinueNode", "ReturnNode", "AssertNode", "ThrowNode", "FuncNode",
+    "FuncDefNode",
     "VarNode", "ConstNode", "AliasNode", "CollectionTypeNode",
     "DictTypeNode", "FuncTypeNode", "ArrayTypeNode", "ClassNode", "EnumNode",
     "ExprNode", "SymbolNode", "ValueNode", "ArrayNode", "NewNode",
@@ -13,13 +17,104 @@ __all__ = [
 def _to_string(nodes):
     return "{ " + ", ".join([repr(node) for node in nodes]) + " }"
 
+# name -> SymbolNode; an entry lives as long as some tree uses it
+_symbols = WeakValueDictionary()
+# taken to add a symbol or a type node, so that threads intern the same one
+_symbols_lock = threading.Lock()
+# per thread: depth > 0 while node locations are recorded (see fresh_symbols)
+_local = threading.local()
+
 def symbol(name):
-    return SymbolNode(name)
+    """
+    Return the SymbolNode of `name`.
+
+    Symbols are interned, so the same name is always the same object and
+    symbols can be compared by identity.
+    """
+    if getattr(_local, "fresh_symbols", 0):
+        return SymbolNode(name)
+    node = _symbols.get(name)
+    if node is None:
+        with _symbols_lock:
+            node = _symbols.get(name)
+            if node is None:
+                node = _symbols[name] = SymbolNode(intern(name))
+    return node
+
+@contextmanager
+def fresh_symbols():
+    """
+    Make symbol() allocate a SymbolNode per call inside the ``with`` block,
+    so that every occurrence of a name can have its own source span.
+    Only the calls of the current thread are affected.
+    """
+    depth = getattr(_local, "fresh_symbols", 0)
+    _local.fresh_symbols = depth + 1
+    try:
+        yield
+    finally:
+        _local.fresh_symbols = depth
+
+def interned(node):
+    """
+    Whether `node` is an interned symbol: it is shared by every tree (as
+    IfdefNode.debug is), so it must not get a source span.
+    """
+    return (isinstance(node, SymbolNode) and
+            _symbols.get(node.symbol) is node)
+
+def _located_symbol(name, span_index):
+    node = SymbolNode(name)
+    node.span_index = span_index
+    return node
 
 def assert_symbol(obj):
     assert (obj is None or isinstance(obj, SymbolNode))
 
-class Node(object):
+_unset = object()
+
+class _Slots(object):
+    # Nodes are stored in __slots__ layouts to keep large trees small;
+    # these make them picklable with every protocol.
+    __slots__ = ()
+
+    # class -> names of its slots and of those of its bases
+    _slot_names = {}
+
+    @classmethod
+    def slot_names(cls):
+        names = _Slots._slot_names.get(cls)
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                for name in klass.__dict__.get("__slots__", ()):
+                    if name != "__weakref__":
+                        names.append(name)
+            names = _Slots._slot_names[cls] = tuple(names)
+        return names
+
+    def __getstate__(self):
+        state = {}
+        for name in self.slot_names():
+            value = getattr(self, name, _unset)
+            if value is not _unset:
+                state[name] = value
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+class Node(_Slots):
+    # span_index: index of the span in the SourceMap of the parsed file
+    # (kuin.source); left unset for nodes that were not located
+    __slots__ = ("span_index",)
+
+    # (name, shape) of the attributes holding child nodes, in source
+    # order (see kuin.visitor); block names and declared names are not
+    # children
+    child_fields = ()
+
     @classmethod
     def parse(cls, instring, loc, r):
         try:
@@ -40,12 +135,14 @@ class Node(object):
         return "".join(s)
 
 class SymbolNode(Node):
+    __slots__ = ("symbol", "__weakref__")
+
     @classmethod
     def parse(cls, instring, loc, r):
         if isinstance(r[0], cls):
             return r[0]
         try:
-            return cls(r[0])
+            return symbol(r[0])
         except TypeError:
             assert False
 
@@ -53,10 +150,35 @@ class SymbolNode(Node):
         assert isinstance(symbol, str)
         self.symbol = symbol
 
+    # Interned symbols are equal when identical; located ones (see
+    # fresh_symbols) still compare and hash by name.
+    def __eq__(self, other):
+        return self is other or (isinstance(other, SymbolNode) and
+                                 self.symbol == other.symbol)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.symbol)
+
+    def __reduce__(self):
+        # unpickled symbols are interned again unless they were located
+        if hasattr(self, "span_index"):
+            return (_located_symbol, (self.symbol, self.span_index))
+        return (symbol, (self.symbol,))
+
+    def __str__(self):
+        # Combine joins the str() of its tokens
+        return self.symbol
+
     def __repr__(self):
         return "`%s`" % self.symbol
 
 class ExprNode(Node):
+    __slots__ = ("operator", "operands")
+    child_fields = (("operands", "nodes"),)
+
     ternary_op = symbol('?()')
 
     @classmethod
@@ -69,9 +191,13 @@ class ExprNode(Node):
 
     @classmethod
     def parse_as_binary(cls, instring, loc, r):
+        # a chain "a + b + c" is folded to the left
         try:
-            left, op, right = r[0]
-            return cls(op, left, right)
+            tokens = r[0]
+            left = tokens[0]
+            for i in range(1, len(tokens), 2):
+                left = cls(tokens[i], left, tokens[i + 1])
+            return left
         except TypeError:
             assert False
 
@@ -93,6 +219,9 @@ class ExprNode(Node):
             ", ".join([repr(op) for op in self.operands]))
 
 class ValueNode(Node):
+    __slots__ = ("range",)
+    child_fields = (("range", ("node", "node")),)
+
     @classmethod
     def parse(cls, instring, loc, r):
         try:
@@ -113,6 +242,9 @@ class ValueNode(Node):
         return "[" + ", ".join(buf) + "]"
 
 class ArrayNode(Node):
+    __slots__ = ("array", "index")
+    child_fields = (("array", "node"), ("index", "node"))
+
     def __init__(self, array, index):
         self.array = array
         self.index = index
@@ -121,6 +253,9 @@ class ArrayNode(Node):
         return "%r[%r]" % (self.array, self.index)
 
 class NewNode(Node):
+    __slots__ = ("type",)
+    child_fields = (("type", "node"),)
+
     def __init__(self, type):
         self.type = type
 
@@ -128,6 +263,9 @@ class NewNode(Node):
         return "@new %r" % self.type
 
 class IfNode(Node):
+    __slots__ = ("clauses", "block_name")
+    child_fields = (("clauses", ("node", "body")),)
+
     def __init__(self, then_cond, then_body=None, elif_cond=None,
                  elif_body=None, else_body=None, block_name=None):
         assert_symbol(block_name)
@@ -155,6 +293,9 @@ class IfNode(Node):
         return block_name + " ".join(args)
 
 class SwitchNode(Node):
+    __slots__ = ("target", "case", "block_name")
+    child_fields = (("target", "node"), ("case", ("node", "body")))
+
     def __init__(self, target, case=None, block_name=None):
         assert_symbol(block_name)
         self.target = target
@@ -179,17 +320,30 @@ class SwitchNode(Node):
         return "".join(args)
 
 class WhileNode(Node):
-    def __init__(self, cond, skip=None, body=None):
+    __slots__ = ("cond", "skip", "body", "block_name")
+    child_fields = (("cond", "node"), ("skip", "node"), ("body", "body"))
+
+    def __init__(self, cond, skip=None, body=None, block_name=None):
+        assert_symbol(block_name)
         self.cond = cond
         self.skip = skip
         self.body = tuple(body or [])
+        self.block_name = block_name
 
     def get_node_args(self):
-        return " ".join([
+        if self.block_name:
+            block_name = repr(self.block_name)
+        else:
+            block_name = ""
+        return block_name + " ".join([
                 "(%r %r)" % (self.cond, self.skip),
                 _to_string(self.body)])
 
 class ForNode(Node):
+    __slots__ = ("start", "end", "step", "block_name", "body")
+    child_fields = (("start", "node"), ("end", "node"), ("step", "node"),
+                    ("body", "body"))
+
     def __init__(self, start, end, step=None, block_name=None, body=None):
         assert_symbol(block_name)
         self.start = start
@@ -212,6 +366,9 @@ class ForNode(Node):
         return args
 
 class ForeachNode(Node):
+    __slots__ = ("items", "block_name", "body")
+    child_fields = (("items", "node"), ("body", "body"))
+
     def __init__(self, items, block_name=None, body=None):
         assert_symbol(block_name)
         self.items = items
@@ -228,6 +385,13 @@ class ForeachNode(Node):
         return args
 
 class TryNode(Node):
+    __slots__ = (
+        "block_name", "ignore_value", "body",
+        "catch_value", "catch_body", "finally_body")
+    child_fields = (("ignore_value", "node"), ("body", "body"),
+                    ("catch_value", "node"), ("catch_body", "body"),
+                    ("finally_body", "body"))
+
     def __init__(self, block_name=None, ignore_value=None, body=None,
                  catch_value=None, catch_body=None, finally_body=None):
         assert_symbol(block_name)
@@ -251,6 +415,9 @@ class TryNode(Node):
         return " ".join(args)
 
 class IfdefNode(Node):
+    __slots__ = ("mode", "block_name", "body")
+    child_fields = (("body", "body"),)
+
     release = symbol('release')
     debug = symbol('debug')
 
@@ -271,6 +438,9 @@ class IfdefNode(Node):
         return args
 
 class BlockNode(Node):
+    __slots__ = ("block_name", "body")
+    child_fields = (("body", "body"),)
+
     def __init__(self, block_name=None, body=None):
         assert_symbol(block_name)
         self.block_name = block_name
@@ -286,6 +456,9 @@ class BlockNode(Node):
         return args
 
 class DoNode(Node):
+    __slots__ = ("expr",)
+    child_fields = (("expr", "node"),)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -293,9 +466,11 @@ class DoNode(Node):
         return repr(self.expr)
 
 class ImportNode(Node):
-    pass
+    __slots__ = ()
 
 class BreakNode(Node):
+    __slots__ = ("block_name",)
+
     def __init__(self, block_name=None):
         assert_symbol(block_name)
         self.block_name = block_name
@@ -307,6 +482,8 @@ class BreakNode(Node):
             return ""
 
 class ContinueNode(Node):
+    __slots__ = ("block_name",)
+
     def __init__(self, block_name=None):
         assert_symbol(block_name)
         self.block_name = block_name
@@ -318,6 +495,9 @@ class ContinueNode(Node):
             return ""
 
 class ReturnNode(Node):
+    __slots__ = ("value",)
+    child_fields = (("value", "node"),)
+
     def __init__(self, value=None):
         self.value = value
 
@@ -328,6 +508,9 @@ class ReturnNode(Node):
             return ""
 
 class AssertNode(Node):
+    __slots__ = ("expr",)
+    child_fields = (("expr", "node"),)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -335,6 +518,9 @@ class AssertNode(Node):
         return repr(self.expr)
 
 class ThrowNode(Node):
+    __slots__ = ("code", "message")
+    child_fields = (("code", "node"), ("message", "node"))
+
     def __init__(self, code, message=None):
         self.code = code
         self.message = message
@@ -346,6 +532,9 @@ class ThrowNode(Node):
             return "%r, %r" % (self.code, self.message)
 
 class FuncNode(Node):
+    __slots__ = ("funcname", "args")
+    child_fields = (("args", "nodes"),)
+
     def __init__(self, funcname, args=None):
         self.funcname = funcname
         self.args = tuple(args or [])
@@ -355,7 +544,30 @@ class FuncNode(Node):
             self.funcname,
             ", ".join([repr(arg) for arg in self.args]))
 
+class FuncDefNode(Node):
+    __slots__ = ("name", "params", "rettype", "body")
+    child_fields = (("params", (None, "node")), ("rettype", "node"),
+                    ("body", "body"))
+
+    def __init__(self, name, params=None, rettype=None, body=None):
+        assert_symbol(name)
+        self.name = name
+        self.params = tuple([tuple(param) for param in params or []])
+        self.rettype = rettype
+        self.body = tuple(body or [])
+
+    def get_node_args(self):
+        args = "%r(%s)" % (self.name, ", ".join([
+                    "%r : %r" % (name, type) for name, type in self.params]))
+        if self.rettype is not None:
+            args += " : %r" % self.rettype
+        args += " " + _to_string(self.body)
+        return args
+
 class VarNode(Node):
+    __slots__ = ("varname", "typename", "value")
+    child_fields = (("typename", "node"), ("value", "node"))
+
     def __init__(self, varname, typename, value=None):
         assert_symbol(varname)
         self.varname = varname
@@ -366,6 +578,9 @@ class VarNode(Node):
         return "(%s, %s, %r)" % (self.varname, self.typename, self.value)
 
 class ConstNode(Node):
+    __slots__ = ("varname", "typename", "value")
+    child_fields = (("typename", "node"), ("value", "node"))
+
     def __init__(self, varname, typename, value):
         self.varname = varname
         self.typename = typename
@@ -375,6 +590,9 @@ class ConstNode(Node):
         return "(%s, %s, %r)" % (self.varname, self.typename, self.value)
 
 class AliasNode(Node):
+    __slots__ = ("alias", "typename")
+    child_fields = (("typename", "node"),)
+
     def __init__(self, alias, typename):
         self.alias = alias
         self.typename = typename
@@ -382,52 +600,156 @@ class AliasNode(Node):
     def get_node_args(self):
         return "(%s, %s)" % (self.alias, self.typename)
 
-class CollectionTypeNode(Node):
-    def __init__(self, **kw):
-        pass
+class _TypeNode(object):
+    # mixin of the type nodes (see type_node); located nodes are pickled
+    # with their span, the others are interned again
+    __slots__ = ()
+
+    def __reduce_ex__(self, protocol):
+        if hasattr(self, "span_index"):
+            return Node.__reduce_ex__(self, protocol)
+        return (type_node, (type(self),) + self.type_args())
+
+class CollectionTypeNode(_TypeNode, Node):
+    # kind: "list", "stack" or "queue"
+    __slots__ = ("kind", "item_type", "__weakref__")
+    child_fields = (("item_type", "node"),)
+
+    def __init__(self, kind, item_type):
+        self.kind = kind
+        self.item_type = item_type
+
+    def type_args(self):
+        return (self.kind, self.item_type)
+
+    def __repr__(self):
+        return "%s<%r>" % (self.kind, self.item_type)
 
-class DictTypeNode(Node):
-    def __init__(self, **kw):
-        pass
+class DictTypeNode(_TypeNode, Node):
+    __slots__ = ("keytype", "valtype", "__weakref__")
+    child_fields = (("keytype", "node"), ("valtype", "node"))
 
-class FuncTypeNode(Node):
-    def __init__(self, **kw):
-        pass
+    def __init__(self, keytype, valtype):
+        self.keytype = keytype
+        self.valtype = valtype
+
+    def type_args(self):
+        return (self.keytype, self.valtype)
+
+    def __repr__(self):
+        return "dict<%r, %r>" % (self.keytype, self.valtype)
+
+class FuncTypeNode(_TypeNode, Node):
+    __slots__ = ("argtype", "rettype", "__weakref__")
+    child_fields = (("argtype", "nodes"), ("rettype", "node"))
+
+    def __init__(self, argtype, rettype):
+        self.argtype = tuple(argtype)
+        self.rettype = rettype
+
+    def type_args(self):
+        return (self.argtype, self.rettype)
+
+    def __repr__(self):
+        return "func<(%s):%r>" % (
+            ", ".join([repr(argtype) for argtype in self.argtype]),
+            self.rettype)
+
+class ArrayTypeNode(_TypeNode, Node):
+    __slots__ = ("base_type", "size", "__weakref__")
+    child_fields = (("size", "nodes"), ("base_type", "node"))
 
-class ArrayTypeNode(Node):
     def __init__(self, base_type, size):
         self.base_type = base_type
         self.size = tuple(size)
 
+    def type_args(self):
+        return (self.base_type, self.size)
+
     def __repr__(self):
         return "".join(["[%s]" % (size and str(size) or "")
                         for size in self.size]) + repr(self.base_type)
 
+# (class, parts) -> type node; an entry lives as long as some tree uses it
+_type_nodes = WeakValueDictionary()
+
+def _part_key(part):
+    # nodes are compared by identity (located symbols are equal by name)
+    if isinstance(part, _Slots):
+        return id(part)
+    if type(part) in (tuple, list):
+        return tuple([_part_key(item) for item in part])
+    return part
+
+# names of types that mean the same type in every scope
+_primitive_names = frozenset([
+    "int", "float", "char", "bool", "byte8", "byte16", "byte32", "byte64",
+    "sbyte8", "sbyte16", "sbyte32", "sbyte64"])
+
+def _context_free(part):
+    # whether the part names the same type in every scope
+    if type(part) in (tuple, list):
+        for item in part:
+            if not _context_free(item):
+                return False
+        return True
+    if isinstance(part, SymbolNode):
+        return part.symbol in _primitive_names
+    if isinstance(part, _TypeNode):
+        return _context_free(part.type_args())
+    return True
+
+def type_node(cls, *args):
+    """
+    Return the type node ``cls(*args)``.
+
+    Type nodes are hash-consed like the symbols: the same type written
+    with the same parts is always the same object, so that types can be
+    compared by identity.  Arrays with a size (``@new [n]int``) are not
+    shared, nor are types that name a user type (``[]T``): each one is
+    resolved in the scope where it is written.
+    """
+    if getattr(_local, "fresh_symbols", 0) or (
+            cls is ArrayTypeNode and
+            [size for size in args[1] if size is not None]) or \
+            not _context_free(args):
+        return cls(*args)
+    key = (cls,) + _part_key(args)
+    node = _type_nodes.get(key)
+    if node is None:
+        with _symbols_lock:
+            node = _type_nodes.get(key)
+            if node is None:
+                node = _type_nodes[key] = cls(*args)
+    return node
+
 class ClassNode(Node):
-    class Member(object):
+    __slots__ = ("name", "parent", "members")
+    child_fields = (("members", "nodes"),)
+
+    class Member(_Slots):
+        __slots__ = ("member", "visibility", "override")
+        child_fields = (("member", "node"),)
+
         def __init__(self, member, visibility, override):
             self.member = member
             self.visibility = visibility or ""
             self.override = override is not None
 
+        def __reduce__(self):
+            # a nested class can't be pickled by name in Python 2
+            return (_class_member, (self.member, self.visibility,
+                                    self.override))
+
         def __repr__(self):
             return "".join([self.visibility,
                             "*" if self.override else "",
                             repr(self.member)])
 
-    def __init__(self, name, parent=None, member=None, visibility=None, override=None):
+    def __init__(self, name, parent=None, members=None):
         self.name = name
         self.parent = parent
-        if member:
-            if visibility is None:
-                visibility = [None] * len(member)
-            if override is None:
-                override = [None] * len(member)
-            members = [ClassNode.Member(m, v, o)
-                       for m, v, o in zip(member, visibility, override)]
-        else:
-            members = []
-        self.members = members
+        self.members = list(members or [])
 
     def get_node_args(self):
         attrs = [repr(self.name)]
@@ -437,7 +759,12 @@ class ClassNode(Node):
         attrs += [" { ", ", ".join(members), " }"]
         return "".join(attrs)
 
+def _class_member(member, visibility, override):
+    return ClassNode.Member(member, visibility, "*" if override else None)
+
 class EnumNode(Node):
+    __slots__ = ("name", "member")
+
     def __init__(self, name, member):
         self.name = name
         self.member = OrderedDict()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""Operator precedence table of Kuin expressions.
+
+Each entry is ``(level, kind, operators, assoc)``.  Levels follow the
+numbering of the language reference (a smaller level binds tighter); the
+expression engines only compare them, so gaps are harmless.
+"""
+
+__all__ = [
+    'LEFT', 'RIGHT',
+    'PREFIX', 'BINARY', 'CLASS_CHECK', 'CAST', 'TERNARY',
+    'OPERATORS', 'prefix_operators', 'infix_operators', 'ternary_operator',
+]
+
+LEFT = 'left'
+RIGHT = 'right'
+
+# 前置演算子
+PREFIX = 'prefix'
+# 二項演算子
+BINARY = 'binary'
+# 右辺がクラス名の二項演算子 (@is, @nis)
+CLASS_CHECK = 'class_check'
+# 右辺が型の二項演算子 ($)
+CAST = 'cast'
+# 条件演算子 (cond ?(a, b))
+TERNARY = 'ternary'
+
+OPERATORS = (
+    # 3: 単項演算
+    (3, PREFIX, ("+", "-", "!"), RIGHT),
+    # 4: クラスチェック(@is、@nis)
+    (4, CLASS_CHECK, ("@is", "@nis"), LEFT),
+    # 5: キャスト演算($)
+    (5, CAST, ("$",), LEFT),
+    # 7: 乗算、除算、剰余
+    (7, BINARY, ("*", "/", "%"), LEFT),
+    # 8: 加算、減算
+    (8, BINARY, ("+", "-"), LEFT),
+    # 9: 配列連結
+    (9, BINARY, ("~",), LEFT),
+    # 10: 等価、不等価、比較
+    (10, BINARY, ("=", "<>", "<", ">", "<=", ">="), LEFT),
+    # 11: 論理積
+    # 12: 論理和
+    (12, BINARY, ("&", "|"), LEFT),
+    # 13: 条件演算 (開き、区切り、閉じ)
+    (13, TERNARY, ("?(", ",", ")"), LEFT),
+    # 14: 代入演算子
+    (14, BINARY, (":: :+ :- :* :/ :% :^ :~".split()), RIGHT),
+    )
+
+
+def prefix_operators(table=OPERATORS):
+    """Return the operators usable in prefix position."""
+    ops = []
+    for level, kind, operators, assoc in table:
+        if kind == PREFIX:
+            ops.extend(operators)
+    return ops
+
+
+def infix_operators(table=OPERATORS):
+    """Map each infix operator to its ``(level, kind, assoc)``."""
+    ops = {}
+    for level, kind, operators, assoc in table:
+        if kind in (BINARY, CLASS_CHECK, CAST):
+            for op in operators:
+                ops[op] = (level, kind, assoc)
+    return ops
+
+
+def ternary_operator(table=OPERATORS):
+    """Return ``(level, (open, separator, close))`` of the ternary operator."""
+    for level, kind, operators, assoc in table:
+        if kind == TERNARY:
+            return level, tuple(operators)
+    return None, None
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+
+"""Optimization pass over parsed Kuin programs.
+
+:func:`optimize` returns the sentences of a program with:
+
+* the operators applied to literal operands folded to their value
+  (``2 * 3`` is ``6``, ``#FF + 1`` is ``256``);
+* the names of ``const`` declarations whose value is a literal, and the
+  members of ``enum`` declarations (``Color#red``), replaced by their
+  value in their scope, unless a variable or block name of the same
+  name is declared in the same function;
+* the ``ifdef`` bodies of the other mode, the ``assert`` sentences of
+  the release mode and the ``if``/``while`` bodies under a literal false
+  condition removed::
+
+    tree = optimize(parse_stmt(text, backend="fast"), debug=False)
+
+The nodes that change are copied, the others are shared with the given
+tree.  Operations that fail on their literal operands (``1 / 0``) are
+kept, so that they fail when the program is run.
+"""
+
+from kuin.nodes import *
+from kuin.runtime import *
+from kuin.runtime import KuinError
+from kuin.visitor import copy_node, declared_names
+
+__all__ = ['Optimizer', 'optimize']
+
+LITERAL_TYPES = (int, long, float, bool, str, unicode)
+NUMBER_TYPES = (int, long, float)
+
+# 数値にだけ適用する演算子
+ARITHMETIC_OPERATORS = frozenset(["+", "-", "*", "/", "%"])
+
+ASSIGN_OPERATORS = frozenset(["::"] + list(COMPOUND_OPERATORS))
+
+# 囲むスコープに名前を宣言する文
+DECLARATION_TYPES = (VarNode, ConstNode, FuncDefNode, AliasNode, EnumNode,
+                     ClassNode)
+
+
+def _is_literal(node):
+    return node is None or type(node) in LITERAL_TYPES
+
+
+def _splice(body):
+    # 名前のないブロックの中身は、何も宣言しなければ外の本体に展開できる
+    for node in body:
+        if isinstance(node, DECLARATION_TYPES):
+            return BlockNode(None, body)
+    return list(body)
+
+
+def _redeclared(names):
+    # 二度以上宣言される名前。実行器の変数は関数ごとに一つなので、
+    # 入れ子の本体の宣言やブロック名も同じ変数を書き換える
+    seen = set()
+    twice = set()
+    for name in names:
+        if name in seen:
+            twice.add(name)
+        seen.add(name)
+    return twice
+
+
+class Optimizer(object):
+    """
+    Fold the constants of a program.
+
+    The ``ifdef`` bodies and ``assert`` sentences are kept or removed
+    for the debug or the release mode, as the executors do.
+    """
+
+    def __init__(self, debug=True):
+        self.debug = debug
+
+    def optimize(self, sentences):
+        """Return the optimized top-level `sentences` (a list)."""
+        sentences = list(sentences)
+        self.redeclared = _redeclared(declared_names(sentences))
+        # 関数からは最上位の本体の const と enum が見える
+        self.constants_in_scope = {}
+        self.declare_enums(sentences)
+        for sentence in sentences:
+            if type(sentence) is ConstNode:
+                self.declare_const(sentence)
+        self.global_constants = self.constants_in_scope
+        self.constants_in_scope = {}
+        return self.optimize_body(sentences)
+
+    def declare_enums(self, body):
+        # enum の要素は本体全体で見える
+        constants = self.constants_in_scope
+        for node in body:
+            if type(node) is EnumNode:
+                for key, value in node.member.items():
+                    value = self.fold(value)
+                    if _is_literal(value) and value is not None:
+                        constants["%s#%s" % (node.name, key)] = value
+
+    def declare_const(self, node):
+        """
+        Fold the value of the const `node` and return it; from there, the
+        name is replaced by a literal value, unless it is declared again.
+        """
+        value = self.fold(node.value)
+        name = node.varname.symbol
+        if _is_literal(value) and value is not None and \
+                name not in self.redeclared:
+            self.constants_in_scope[name] = value
+        else:
+            self.constants_in_scope.pop(name, None)
+        return value
+
+    ##################################################################
+    # 文
+    ##################################################################
+
+    def optimize_body(self, body, hidden=None):
+        # 本体ごとの定数の表で畳み込む。hidden はブロック名で、
+        # 本体の中で外の定数を隠す
+        outer = self.constants_in_scope
+        self.constants_in_scope = dict(outer)
+        if hidden is not None:
+            self.constants_in_scope.pop(hidden.symbol, None)
+        self.declare_enums(body)
+        result = []
+        optimizers = self.sentence_optimizers
+        for sentence in body:
+            optimized = optimizers[type(sentence)](self, sentence)
+            if type(optimized) is list:
+                result.extend(optimized)
+            elif optimized is not None:
+                result.append(optimized)
+        self.constants_in_scope = outer
+        return result
+
+    def optimize_if(self, node):
+        clauses = []
+        for cond, body in node.clauses:
+            if cond is not None:
+                cond = self.fold(cond)
+                if _is_literal(cond):
+                    if not cond:
+                        continue
+                    # 常に成り立つ節は else になる
+                    cond = None
+            clauses.append((cond, tuple(self.optimize_body(body))))
+            if cond is None:
+                break
+        if not clauses:
+            return None
+        if clauses[0][0] is None and node.block_name is None:
+            return _splice(clauses[0][1])
+        return copy_node(node, clauses=clauses)
+
+    def optimize_switch(self, node):
+        return copy_node(node, target=self.fold(node.target), case=tuple([
+                    (self.fold_value(value), tuple(self.optimize_body(body)))
+                    for value, body in node.case]))
+
+    def optimize_while(self, node):
+        cond = self.fold(node.cond)
+        skip = node.skip
+        if skip is not None:
+            skip = self.fold(skip)
+        if _is_literal(cond) and not cond and \
+                (skip is None or (_is_literal(skip) and not skip)):
+            return None
+        return copy_node(node, cond=cond, skip=skip,
+                     body=tuple(self.optimize_body(node.body)))
+
+    def optimize_for(self, node):
+        step = node.step
+        if step is not None:
+            step = self.fold(step)
+        return copy_node(node, start=self.fold(node.start),
+                     end=self.fold(node.end), step=step,
+                     body=tuple(self.optimize_body(node.body,
+                                                   node.block_name)))
+
+    def optimize_foreach(self, node):
+        return copy_node(node, items=self.fold(node.items),
+                     body=tuple(self.optimize_body(node.body,
+                                                   node.block_name)))
+
+    def optimize_try(self, node):
+        name = node.block_name
+        return copy_node(
+            node, ignore_value=self.fold_value(node.ignore_value),
+            body=tuple(self.optimize_body(node.body, name)),
+            catch_value=self.fold_value(node.catch_value),
+            catch_body=tuple(self.optimize_body(node.catch_body, name)),
+            finally_body=tuple(self.optimize_body(node.finally_body, name)))
+
+    def optimize_ifdef(self, node):
+        if (node.mode == IfdefNode.debug) != self.debug:
+            return None
+        body = self.optimize_body(node.body)
+        if node.block_name is None:
+            return _splice(body)
+        return copy_node(node, body=tuple(body))
+
+    def optimize_block(self, node):
+        return copy_node(node, body=tuple(self.optimize_body(node.body)))
+
+    def optimize_do(self, node):
+        return copy_node(node, expr=self.fold(node.expr))
+
+    def optimize_return(self, node):
+        return copy_node(node, value=self.fold(node.value))
+
+    def optimize_assert(self, node):
+        if not self.debug:
+            return None
+        return copy_node(node, expr=self.fold(node.expr))
+
+    def optimize_throw(self, node):
+        return copy_node(node, code=self.fold(node.code),
+                     message=self.fold(node.message))
+
+    def optimize_var(self, node):
+        value = self.fold(node.value)
+        # 変数は外の定数を隠す
+        self.constants_in_scope.pop(node.varname.symbol, None)
+        return copy_node(node, value=value)
+
+    def optimize_const(self, node):
+        return copy_node(node, value=self.declare_const(node))
+
+    def optimize_funcdef(self, node):
+        outer = self.constants_in_scope, self.redeclared
+        # 引数と変数は外の定数を隠す
+        names = [name.symbol for name, typename in node.params]
+        names.extend(declared_names(node.body))
+        self.redeclared = _redeclared(names)
+        self.constants_in_scope = dict(self.global_constants)
+        for name in names:
+            self.constants_in_scope.pop(name, None)
+        body = self.optimize_body(node.body)
+        self.constants_in_scope, self.redeclared = outer
+        return copy_node(node, body=tuple(body))
+
+    def keep(self, node):
+        return node
+
+    sentence_optimizers = {
+        IfNode: optimize_if,
+        SwitchNode: optimize_switch,
+        WhileNode: optimize_while,
+        ForNode: optimize_for,
+        ForeachNode: optimize_foreach,
+        TryNode: optimize_try,
+        IfdefNode: optimize_ifdef,
+        BlockNode: optimize_block,
+        DoNode: optimize_do,
+        BreakNode: keep,
+        ContinueNode: keep,
+        ReturnNode: optimize_return,
+        AssertNode: optimize_assert,
+        ThrowNode: optimize_throw,
+        VarNode: optimize_var,
+        ConstNode: optimize_const,
+        FuncDefNode: optimize_funcdef,
+        AliasNode: keep,
+        EnumNode: keep,
+        ClassNode: keep,
+        str: keep,
+        unicode: keep,
+        }
+
+    ##################################################################
+    # 式
+    ##################################################################
+
+    def fold(self, node):
+        """Return `node` with its constant parts folded."""
+        if node is None:
+            return None
+        # 長い式 (深い木) でも再帰しないよう、明示的なスタックで子から畳む。
+        # 子を畳み終えた節は (節, 子の数) として積み直す
+        folders = self.folders
+        results = []
+        stack = [(node, None)]
+        pop = stack.pop
+        while stack:
+            node, count = pop()
+            if count is not None:
+                children = results[len(results) - count:]
+                del results[len(results) - count:]
+                results.append(folders[type(node)][1](self, node, children))
+            elif node is None:
+                results.append(None)
+            else:
+                children_of, fold = folders[type(node)]
+                children = children_of(node)
+                if children:
+                    stack.append((node, len(children)))
+                    stack.extend([(child, None)
+                                  for child in reversed(children)])
+                else:
+                    results.append(fold(self, node, ()))
+        return results[0]
+
+    def fold_value(self, value_node):
+        if value_node is None:
+            return None
+        return copy_node(value_node, range=tuple([
+                    (self.fold(start), self.fold(end))
+                    for start, end in value_node.range]))
+
+    # 節ごとに、畳み込む子を返す関数と、畳んだ子から結果を作る関数がある
+
+    def fold_symbol(self, node, children):
+        value = self.constants_in_scope.get(node.symbol)
+        return node if value is None else value
+
+    def expr_children(node):
+        op = node.operator.symbol
+        operands = node.operands
+        if op in ASSIGN_OPERATORS:
+            # 代入先は畳み込まない
+            target, value = operands
+            if type(target) is ArrayNode:
+                return [target.index, value]
+            return [value]
+        if op == "$":
+            return [operands[0]]
+        return operands
+
+    def fold_expr(self, node, children):
+        op = node.operator.symbol
+        if op in ASSIGN_OPERATORS:
+            target = node.operands[0]
+            if type(target) is ArrayNode:
+                index, value = children
+                target = copy_node(target, index=index)
+            else:
+                value, = children
+            return copy_node(node, operands=(target, value))
+        if op == "$":
+            value, = children
+            typename = node.operands[1]
+            if _is_literal(value):
+                try:
+                    result = cast(value, typename)
+                except (InterpreterError, ValueError, TypeError):
+                    pass
+                else:
+                    if type(result) in LITERAL_TYPES:
+                        return result
+            return copy_node(node, operands=(value, typename))
+        operands = tuple(children)
+        if op == "?()":
+            cond, true_body, false_body = operands
+            if _is_literal(cond):
+                return true_body if cond else false_body
+        elif op == "&" or op == "|":
+            left, right = operands
+            if _is_literal(left):
+                if bool(left) == (op == "|"):
+                    return bool(left)
+                if _is_literal(right):
+                    return bool(right)
+        elif all(map(_is_literal, operands)) and None not in operands:
+            result = self.apply(op, operands)
+            if result is not None:
+                return result
+        return copy_node(node, operands=operands)
+
+    def apply(self, op, operands):
+        """Return the value of `op` on literal operands, or None."""
+        if op in ARITHMETIC_OPERATORS:
+            for operand in operands:
+                if type(operand) not in NUMBER_TYPES:
+                    return None
+        try:
+            if len(operands) == 1:
+                result = UNARY_OPERATORS[op](operands[0])
+            else:
+                result = BINARY_OPERATORS[op](*operands)
+        except (KeyError, KuinError, TypeError, ValueError, OverflowError):
+            # 実行時に同じ例外を送出させる
+            return None
+        if type(result) not in LITERAL_TYPES:
+            return None
+        return result
+
+    def call_children(node):
+        return node.args
+
+    def fold_call(self, node, children):
+        return copy_node(node, args=tuple(children))
+
+    def index_children(node):
+        return [node.index]
+
+    def fold_index(self, node, children):
+        return copy_node(node, index=children[0])
+
+    def new_children(node):
+        if type(node.type) is ArrayTypeNode:
+            return node.type.size
+        return ()
+
+    def fold_new(self, node, children):
+        typename = node.type
+        if type(typename) is ArrayTypeNode:
+            typename = copy_node(typename, size=tuple(children))
+        return copy_node(node, type=typename)
+
+    def no_children(node):
+        return ()
+
+    def fold_literal(self, node, children):
+        return node
+
+    folders = {
+        int: (no_children, fold_literal),
+        long: (no_children, fold_literal),
+        float: (no_children, fold_literal),
+        bool: (no_children, fold_literal),
+        str: (no_children, fold_literal),
+        unicode: (no_children, fold_literal),
+        SymbolNode: (no_children, fold_symbol),
+        ExprNode: (expr_children, fold_expr),
+        FuncNode: (call_children, fold_call),
+        ArrayNode: (index_children, fold_index),
+        NewNode: (new_children, fold_new),
+        }
+    del no_children, expr_children, call_children, index_children
+    del new_children
+
+
+def optimize(sentences, debug=True):
+    """Return the optimized `sentences` for the debug or release mode."""
+    return Optimizer(debug).optimize(sentences)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""Per-call packrat memoization for the pyparsing grammar.
+
+pyparsing only offers a process wide switch
+(``ParserElement.enablePackrat()``) backed by a FIFO cache.  The helpers in
+this module memoize ``(rule, location)`` results for the duration of a
+single ``parse_stmt``/``parse_expr`` call instead, using a bounded LRU cache
+whose hit/miss counters can be inspected afterwards::
+
+    cache = PackratCache(4096)
+    parse_stmt(text, packrat=cache)
+    print cache.stats()
+
+The memoizing parse method is given to the elements of the grammar being
+parsed, not to ``ParserElement``, so that other grammars and the parses
+made outside the call are not affected.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from pyparsing import ParserElement, ParseBaseException
+
+__all__ = ['PackratCache', 'memoize', 'grammar_elements', 'install_parse']
+
+DEFAULT_CACHE_SIZE = 8192
+
+_not_in_cache = object()
+
+
+class PackratCache(object):
+    """Bounded LRU cache of parse results keyed by (rule, location)."""
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        if size is not None and size < 0:
+            raise ValueError("cache size must be non-negative: %r" % size)
+        self.size = size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entries = self._entries
+        value = entries.pop(key, _not_in_cache)
+        if value is _not_in_cache:
+            self.misses += 1
+        else:
+            # re-insert to mark the entry as most recently used
+            entries[key] = value
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        entries = self._entries
+        if self.size == 0:
+            return
+        entries[key] = value
+        if self.size is not None:
+            while len(entries) > self.size:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all memoized results but keep the statistics."""
+        self._entries.clear()
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+            }
+
+    def __repr__(self):
+        return "<PackratCache size=%r hits=%d misses=%d evictions=%d>" % (
+            self.size, self.hits, self.misses, self.evictions)
+
+
+def grammar_elements(*roots):
+    """Return the pyparsing elements reachable from `roots`, each once."""
+    seen = {}
+    stack = list(roots)
+    while stack:
+        element = stack.pop()
+        if id(element) in seen:
+            continue
+        seen[id(element)] = element
+        # expr, exprs, ignoreExprs and the elements of custom elements
+        for value in element.__dict__.values():
+            if isinstance(value, dict):
+                value = value.values()
+            elif not isinstance(value, (list, tuple)):
+                value = [value]
+            stack.extend([item for item in value
+                          if isinstance(item, ParserElement)])
+    return seen.values()
+
+
+@contextmanager
+def install_parse(elements, make_parse):
+    """Give each of `elements` its own parse method for the ``with`` block.
+
+    ``make_parse(element, parse)`` returns the method of `element`, given
+    the one it replaces: both are called as
+    ``parse(instring, loc, doActions, callPreParse)``.  The previous
+    methods are restored on exit.
+    """
+    saved = []
+    try:
+        for element in elements:
+            saved.append((element, element.__dict__.get('_parse')))
+            element._parse = make_parse(element, element._parse)
+        yield
+    finally:
+        for element, parse in saved:
+            if parse is None:
+                del element._parse
+            else:
+                element._parse = parse
+
+
+def _make_parse_method(cache, element):
+    parse_no_cache = element._parseNoCache
+
+    def _parse(instring, loc, doActions=True, callPreParse=True):
+        key = (element, instring, loc, callPreParse, doActions)
+        value = cache.get(key)
+        if value is _not_in_cache:
+            try:
+                value = parse_no_cache(instring, loc, doActions, callPreParse)
+            except ParseBaseException as pe:
+                # store a copy without the traceback attached
+                cache.set(key, pe.__class__(*pe.args))
+                raise
+            cache.set(key, (value[0], value[1].copy()))
+            return value
+        if isinstance(value, Exception):
+            raise value
+        return value[0], value[1].copy()
+
+    return _parse
+
+
+def to_cache(packrat):
+    """Normalize the ``packrat`` argument of the parse entry points.
+
+    ``None``/``False`` disables memoization, ``True`` allocates a cache of
+    the default size, an integer allocates a cache of that size and a
+    :class:`PackratCache` instance is used as is.
+    """
+    if packrat is None or packrat is False:
+        return None
+    if packrat is True:
+        return PackratCache()
+    if isinstance(packrat, PackratCache):
+        return packrat
+    return PackratCache(int(packrat))
+
+
+@contextmanager
+def memoize(packrat, elements):
+    """Memoize the invocations of `elements` made inside the ``with`` block.
+
+    The memoizing parse method is installed on each of the elements (see
+    grammar_elements) for the duration of the block and the previous one
+    is restored on exit, so ``ParserElement`` and the global pyparsing
+    configuration are left untouched.  The cached entries are dropped on
+    exit since they are only valid for a single input.
+    """
+    cache = to_cache(packrat)
+    if cache is None:
+        yield None
+        return
+    try:
+        with install_parse(elements, lambda element, parse:
+                           _make_parse_method(cache, element)):
+            yield cache
+    finally:
+        cache.clear()
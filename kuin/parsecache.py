@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""Persistent cache of parse trees.
+
+Trees are stored in a directory, one file per source (a compressed
+kuin.astcodec stream), keyed by the hash of the source text and of the
+grammar version, so a warm build only has to load them::
+
+    cache = ParseCache(".kuincache")
+    tree = parse_stmt(text, cache=cache)
+    print cache.stats()
+
+The directory is bounded: when it grows over `max_bytes` the least
+recently used entries are removed.  Several processes may share it.
+"""
+
+import hashlib
+import os
+import tempfile
+import zlib
+
+from kuin import astcodec
+from kuin.parser import GRAMMAR_VERSION
+
+__all__ = ['ParseCache']
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# 先頭に置く形式の識別子; 形式を変えたら番号を上げる
+MAGIC = "KNPC2\n"
+
+ENTRY_EXT = ".ast"
+
+
+def source_key(text):
+    if isinstance(text, unicode):
+        text = text.encode("utf-8")
+    h = hashlib.sha1(GRAMMAR_VERSION)
+    h.update("\0")
+    h.update(text)
+    return h.hexdigest()
+
+
+def dumps(tree):
+    return MAGIC + zlib.compress(astcodec.dumps(tree))
+
+
+def loads(data):
+    if not data.startswith(MAGIC):
+        raise ValueError("not a parse cache entry")
+    return astcodec.loads(zlib.decompress(data[len(MAGIC):]))
+
+
+class ParseCache(object):
+    """Parse trees stored in `directory`, keyed by source text."""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.total_bytes = sum([size for path, size, mtime in self.entries()])
+        self.reset_stats()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_EXT)
+
+    def entries(self):
+        """Return ``(path, size, mtime)`` of the stored entries."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_EXT):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def get(self, text):
+        """Return the cached tree of `text`, or None."""
+        path = self.path(source_key(text))
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            tree = loads(data)
+        except Exception:
+            # 壊れたエントリ (途中で切れたものなど) は外れとして消しておく
+            self.misses += 1
+            self.remove(path)
+            return None
+        try:
+            # 最近使ったものとして残す
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        self.bytes_read += len(data)
+        return tree
+
+    def set(self, text, tree):
+        """Store the tree of `text`; trees that can't be encoded are
+        not cached."""
+        try:
+            data = dumps(tree)
+        except Exception:
+            return
+        path = self.path(source_key(text))
+        old = self.size(path)
+        fd, tmp = tempfile.mkstemp(ENTRY_EXT + ".tmp", "", self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.rename(tmp, path)
+        except:
+            os.unlink(tmp)
+            raise
+        self.bytes_written += len(data)
+        self.total_bytes += len(data) - old
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def size(self, path):
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return 0
+
+    def remove(self, path):
+        size = self.size(path)
+        try:
+            os.unlink(path)
+        except OSError:
+            return
+        self.total_bytes = max(self.total_bytes - size, 0)
+
+    def evict(self):
+        """Remove the least recently used entries until under the bound."""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum([size for path, size, mtime in entries])
+        while entries and total > self.max_bytes:
+            path, size, mtime = entries.pop(0)
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except OSError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+    def clear(self):
+        for path, size, mtime in self.entries():
+            os.unlink(path)
+        self.total_bytes = 0
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+        self.bytes_read = self.bytes_written = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "max_bytes": self.max_bytes,
+            "total_bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            }
+
+    def __repr__(self):
+        return "<ParseCache %r hits=%d misses=%d bytes_read=%d>" % (
+            self.directory, self.hits, self.misses, self.bytes_read)
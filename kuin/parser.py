@@ -1,139 +1,39 @@
 # -*- coding: utf-8 -*-
 
+import math
 import re
+import threading
+from contextlib import contextmanager
 from pyparsing import *
 
 from kuin.nodes import *
+from kuin.nodes import symbol, type_node
+from kuin.lexer import unescape, radix_number
+from kuin import fastparser
+from kuin.operators import *
+from kuin.packrat import memoize, to_cache, grammar_elements
+from kuin.source import locate, current_locator
+from kuin.stream import iter_stmts, mapped_source
+
+__all__ = ['parse_stmt', 'parse_expr', 'iter_stmts', 'grammar',
+           'load_grammar', 'copy_grammar', 'Parser']
 
-__all__ = ['parse_stmt', 'parse_expr']
-
-
-# bnf punctuation
-LPAREN  = Suppress("(")
-RPAREN  = Suppress(")")
-LBRACK  = Suppress("[")
-RBRACK  = Suppress("]")
-LABRACK = Suppress("<")
-RABRACK = Suppress(">")
-COMMA   = Suppress(",")
-COLON   = Suppress(":")
-DCOLON  = Suppress("::")
-
-KEYWORDS = oneOf([
-        "if", "elif", "else",
-        "switch", "case", "default",
-        "while", "for", "foreach",
-        "try", "catch", "finally",
-        "ifdef", "release", "debug",
-        "block", "end",
-        "break", "continue",
-        "return", "do", "throw",
-        "func", "class", "enum",
-        "var", "const", "alias",
-        "import", "assert",
-        "true", "false",
-        ])
-
-# Forward definitions
-Sentences = Forward()
-Expr = Forward()
 
 ######################################################################
-# 識別子
+# 解析動作 (kuin.grammar の規則が呼ぶ)
 ######################################################################
 
-Name = (
-    NotAny(KEYWORDS) + Regex(r'[A-Za-z_][0-9A-Za-z_]*')
-    ).setName('Name').setParseAction(SymbolNode.parse)
-SourceName = Regex(u'[^\x20\x09-\x0D]+') # ソースコード名
-# 標準空白類文字([ \t\n\v\f\r])以外の文字の連続
-
-# ブロック名
-BlockName = Name.setName('BlockName')
-
-# 定義時のクラス名
-CName = Name.setName('CName')
-
-# 定義時の関数名
-FName = Name.setName('FName')
-
-# 定義時の変数名
-VName = Name.setName('VName')
-
-# 定義時の列挙体名
-EName = Name.setName('EName')
-
-# 定義時の定数名
-ConstName = Name.setName('ConstName')
-
-# アクセス時のクラス名
-ClassName = (
-    Combine(Optional(SourceName + Literal("@")) +
-            ZeroOrMore(CName + ".") + CName)
-    ).setName('ClassName').setParseAction(SymbolNode.parse)
-
-# アクセス時の関数名
-FunctionName = (
-    Combine(Optional(ClassName + Literal(".")) + FName)
-    ).setName('FunctionName').setParseAction(SymbolNode.parse)
-
-# アクセス時の変数名
-VariableName = (
-    Combine(Optional(ClassName + Literal(".")) + VName)
-    ).setName('VariableName').setParseAction(SymbolNode.parse)
+# kuin.grammar ではなくここに置くので、文法の snapshot
+# (kuin.snapshot) は文法を作らずに読み込めます。
 
-# アクセス時の列挙体名
-EnumName = (
-    Combine(Optional(ClassName + Literal("#")) + EName)
-    ).setName('EnumName').setParseAction(SymbolNode.parse)
+def collection_type_action(r):
+    return type_node(CollectionTypeNode, r[0], r['item_type'])
 
-ConstantName = (
-    Combine(Optional(ClassName + Literal(".")) + ConstName) |
-    Combine(EnumName + Literal("#") + ConstName)
-    ).setName('ConstantName').setParseAction(SymbolNode.parse)
+def dict_type_action(r):
+    return type_node(DictTypeNode, r['keytype'], r['valtype'])
 
-######################################################################
-# 型
-######################################################################
-
-PrimitiveType = (
-    # 符号付整数型・浮動小数点型・文字型・論理型
-    oneOf(["int", "float", "char", "bool"]) |
-    # 符号なし整数型
-    oneOf(["byte8", "byte16", "byte32", "byte64"]) |
-    # 符号付整数型
-    oneOf(["sbyte8", "sbyte16", "sbyte32", "sbyte64"])
-    ).setParseAction(SymbolNode.parse)
-
-Type = Forward()
-
-# リスト構造
-ListType = (
-    Keyword("list") + LABRACK + Type.setResultsName('item_type') + RABRACK
-    ).setParseAction(CollectionTypeNode.parse)
-
-# スタック構造
-StackType = (
-    Keyword("stack") + LABRACK + Type.setResultsName('item_type') + RABRACK
-    ).setParseAction(CollectionTypeNode.parse)
-
-# キュー構造
-QueueType = (
-    Keyword("queue") + LABRACK + Type.setResultsName('item_type') + RABRACK
-    ).setParseAction(CollectionTypeNode.parse)
-
-# 辞書型
-DictType = (
-    Keyword("dict") + LABRACK + Type.setResultsName('keytype') + COMMA +
-    Type.setResultsName('valtype') + RABRACK
-    ).setParseAction(DictTypeNode.parse)
-
-# 関数型
-FuncType = (
-    Keyword("func") + LABRACK + LPAREN +
-    delimitedList(Type).setResultsName('argtype*') + RPAREN +
-    COLON + Type.setResultsName('rettype') + RABRACK
-    ).setParseAction(FuncTypeNode.parse)
+def func_type_action(r):
+    return type_node(FuncTypeNode, tuple(r['argtype'][0]), r['rettype'])
 
 def array_size_action(r):
     if len(r) == 0:
@@ -142,90 +42,30 @@ def array_size_action(r):
         assert len(r) == 1
         return [r[0]]
 
-# 動的配列
-ArrayType = (
-    OneOrMore((LBRACK + Optional(Expr) + RBRACK) \
-                  .setParseAction(array_size_action)) \
-        .setResultsName('size') +
-    Type.setResultsName('base_type')
-    ).setParseAction(ArrayTypeNode.parse)
-
-Type << (
-    PrimitiveType | EnumName | ClassName | # Alias |
-    ListType | StackType | QueueType | DictType |
-    FuncType | ArrayType
-    ).setName('Type')
-
-# しばらく complex/money/ratio型 を仕様から外そうと思います。とのこと。
-# Kuinでは型が厳密に扱われます。暗黙の型変換はできません。
-
-######################################################################
-# リテラル
-######################################################################
+def array_type_action(r):
+    return type_node(ArrayTypeNode, r['base_type'], tuple(r['size']))
 
 def string_action(r):
-    def repl(m):
-        esc = m.group(1)
-        return {
-            "n": "\n", "r": "\r", "\\": "\\",
-            "'": "'", '"': '"',
-            }.get(esc, esc)
-    return re.sub(r'\\(.)', repl, r[0][1:-1])
+    return unescape(r[0])
 
 def char_action(r):
     return string_action(r)
 
-# 文字列リテラル
-String = Regex(r'"(\\.|[^"])*"').setParseAction(string_action)
-
-# 文字リテラル
-Char = Regex(r"'(\\.|[^'])'").setParseAction(char_action)
-
-# EscapedCh = Regex(r"\\[0nr]")
-# EscapedCh は \0 \n \' などのエスケープ文字を表す文字列
-# Ch << ( "'" + (Regex(r"[^']") | EscapedCh) + "'" )
+def true_action(r):
+    return True
 
-# Booleanリテラル
-Boolean = (
-    Keyword("true").setParseAction(lambda r: True) |
-    Keyword("false").setParseAction(lambda r: False)
-    )
-
-# 数値リテラル
-
-# Kuinでは、16進数はもちろん、2～36進数の浮動小数点まで記述できます。
-# 2進数の表記は例えば、2#00101111.1101 のようになります。#の前が基数です。
+def false_action(r):
+    return False
 
 def number_action(instring, loc, r):
-    import math
-
     sign = r.get('sign', '')
     body = r['body']
     precision = r.get('precision', '')
 
-    if "#" in body:
-        radix, body = body.split("#", 1)
-        if radix == "":
-            radix = 16
-        else:
-            radix = int(radix)
-            if not (2 <= radix <= 36) or radix in (10, 16):
-                raise ParseFatalException(instring, loc)
-    else:
-        radix = 10
-
-    if "." in body:
-        parts = body.split(".", 1)
-        try:
-            i, f = (int(part, radix) for part in parts)
-        except ValueError:
-            raise ParseFatalException(instring, loc)
-        num = i + float(f) / math.pow(radix, len(parts[1]))
-    else:
-        try:
-            num = int(body, radix)
-        except ValueError:
-            raise ParseFatalException(instring, loc)
+    try:
+        num, radix = radix_number(body)
+    except ValueError:
+        raise ParseFatalException(instring, loc)
 
     if precision:
         num *= math.pow(radix, int(precision))
@@ -235,568 +75,357 @@ def number_action(instring, loc, r):
 
     return num
 
-# 2進数～36進数
-BaseX = Regex(r"([1-9][0-9]?)#([0-9A-Z]+)(?:\.([0-9A-Z]+))?")
-
-# 10進数
-Base10 = Regex(r"([0-9]+)(?:\.([0-9]+))?")
-# 10#99はコンパイルエラー？
+def value_item_action(r):
+    return (r[0]["start"], r[0].get("end"))
 
-# 16進数
-Base16 = Regex(r"#([0-9A-F]+)(?:\.([0-9A-F]+))?")
-# 16#FFはコンパイルエラー
-# 16進数の基数は省略しなければなりません(誰が書いても同じになるように)。
+def switch_case_action(r):
+    return (r["value"], r.get("body"))
 
-NonNegativeNumber = ( BaseX | Base10 | Base16 )
+def switch_default_action(r):
+    return (None, r.get('body'))
 
-Number = Forward()
-Number << (
-    Optional(Regex(r'[+-]').setResultsName('sign')) +
-    NonNegativeNumber.setResultsName('body') +
-    Optional("e" + Number.setResultsName('precision'))
-    ).setParseAction(number_action)
+def release_action(r):
+    return IfdefNode.release
 
-# 値指定
+def debug_action(r):
+    return IfdefNode.debug
 
-def value_item_action(r):
-    return (r[0]["start"], r[0].get("end"))
+def func_param_action(r):
+    return (r[0], r[1])
 
-# switch文やtry文で用いる値の指定方法です。
-Value = delimitedList(
-    Group(Expr.setResultsName('start') +
-          Optional(Keyword("@to").suppress() +
-                   Expr.setResultsName('end'))) \
-        .setParseAction(value_item_action)) \
-        .setParseAction(ValueNode.parse)
+def enum_member_action(r):
+    return (r["key"], r.get("value"))
 
-# Exprの型はそれぞれの文で制限されています。
+def class_member_action(r):
+    return ClassNode.Member(r[-1], r.get("visibility"), r.get("override"))
 
 ######################################################################
 # 式
 ######################################################################
 
-def make_unary_expr(lastExpr, opExpr, rightLeftAssoc):
-    thisExpr = Forward()
-
-    if rightLeftAssoc == opAssoc.LEFT:
-        matchExpr = (
-            FollowedBy(lastExpr + opExpr) +
-            Group(lastExpr + OneOrMore(opExpr))
-            )
-
-    if rightLeftAssoc == opAssoc.RIGHT:
-        # try to avoid LR with this extra test
-        if not isinstance(opExpr, Optional):
-            opExpr = Optional(opExpr)
-        matchExpr = (
-            FollowedBy(opExpr.expr + thisExpr) +
-            Group(opExpr + thisExpr)
-            )
-    matchExpr.setParseAction(ExprNode.parse_as_unary)
-    thisExpr << ( matchExpr | lastExpr )
-    return thisExpr
-
-
-def make_binary_expr(lastExpr, opExpr, rightLeftAssoc):
-    thisExpr = Forward()
-
-    if rightLeftAssoc == opAssoc.LEFT and opExpr is not None:
-        matchExpr = (
-            FollowedBy(lastExpr + opExpr + lastExpr) +
-            Group(lastExpr + OneOrMore(opExpr + lastExpr))
-            )
-
-    if rightLeftAssoc == opAssoc.RIGHT and opExpr is not None:
-        matchExpr = (
-            FollowedBy(lastExpr + opExpr + thisExpr) +
-            Group(lastExpr + OneOrMore(opExpr + thisExpr))
-            )
-
-    if rightLeftAssoc == opAssoc.LEFT and opExpr is None:
-        matchExpr = (
-            FollowedBy(lastExpr + lastExpr) +
-            Group(lastExpr + OneOrMore(lastExpr))
-            )
-
-    if rightLeftAssoc == opAssoc.RIGHT and opExpr is None:
-        matchExpr = (
-            FollowedBy(lastExpr + thisExpr) +
-            Group(lastExpr + OneOrMore(thisExpr))
-            )
-
-    matchExpr.setParseAction(ExprNode.parse_as_binary)
-    thisExpr << ( matchExpr | lastExpr )
-    return thisExpr
-
-def make_ternary_expr(lastExpr, opExpr1, opExpr2, rightLeftAssoc):
-    thisExpr = Forward()
-
-    if rightLeftAssoc == opAssoc.LEFT:
-        matchExpr = (
-            FollowedBy(lastExpr + opExpr1 + lastExpr + opExpr2 + lastExpr) +
-            Group(lastExpr + opExpr1 + lastExpr + opExpr2 + lastExpr)
-            )
-
-    if rightLeftAssoc == opAssoc.RIGHT:
-        matchExpr = (
-            FollowedBy(lastExpr + opExpr1 + thisExpr + opExpr2 + thisExpr) +
-            Group(lastExpr + opExpr1 + thisExpr + opExpr2 + thisExpr)
-            )
-
-    thisExpr << ( matchExpr | lastExpr )
-    return thisExpr
-
-BaseExpr = (
-    # リテラル
-    String | Char | Boolean | # Number |
-    # 変数・定数
-    VariableName | ConstantName |
-    # (Forなどの)ブロック名
-    BlockName
-    )
-
-NestedExpr = (LPAREN + Expr + RPAREN)
-tmp_expr = ( BaseExpr | NestedExpr )
-
-# 2: 関数呼び出し
-tmp_expr = (
-    ( FollowedBy(FunctionName + LPAREN) +
-      FunctionName.setResultsName('funcname') + LPAREN +
-      Optional(delimitedList(Expr).setResultsName('args')) + RPAREN
-      ).setParseAction(FuncNode.parse) |
-    tmp_expr)
-
-# 2: 配列アクセス
-tmp_expr = (
-    ( FollowedBy(VariableName + LBRACK) +
-      VariableName.setResultsName('array') +
-      LBRACK + Expr.setResultsName('index') + RBRACK
-      ).setParseAction(ArrayNode.parse) |
-    tmp_expr)
-
-# 3: インスタンスの作成(@new)
-tmp_expr = (
-    ( FollowedBy(Literal("@new") + Type) +
-      (Literal("@new").suppress() + Type.setResultsName('type'))
-      ).setParseAction(NewNode.parse) |
-    tmp_expr)
-
-# 3: 単項演算
-tmp_expr = Number | make_unary_expr(
-    tmp_expr,
-    oneOf("+ - !").setParseAction(SymbolNode.parse),
-    opAssoc.RIGHT)
-
-# 4: クラスチェック(@is、@nis)
-class_check_op = oneOf("@is @nis").setParseAction(SymbolNode.parse)
-tmp_expr = (
-    ( FollowedBy(tmp_expr + class_check_op + ClassName) +
-      Group(tmp_expr + OneOrMore(class_check_op + ClassName)) \
-          .setParseAction(ExprNode.parse_as_binary) ) |
-    tmp_expr)
-
-# 4: アットマーク演算子
-# tmp_expr = make_binary_expr(
-#     tmp_expr,
-#     oneOf("@in @nin").setParseAction(SymbolNode.parse),
-#     opAssoc.LEFT)
-
-# 5: キャスト演算($)
-cast_op = Literal("$").setParseAction(SymbolNode.parse)
-tmp_expr = (
-    ( FollowedBy(tmp_expr + cast_op + Type) +
-      Group(tmp_expr + cast_op + Type) \
-          .setParseAction(ExprNode.parse_as_binary) ) |
-    tmp_expr)
-
-# 6: 累乗
-# tmp_expr = make_binary_expr(
-#     tmp_expr,
-#     Literal("^").setParseAction(SymbolNode.parse),
-#     opAssoc.RIGHT)
-
-# 7: 乗算、除算、剰余
-tmp_expr = make_binary_expr(
-    tmp_expr,
-    oneOf("* / %").setParseAction(SymbolNode.parse),
-    opAssoc.LEFT)
-
-# 8: 加算、減算
-tmp_expr = make_binary_expr(
-    tmp_expr,
-    oneOf("+ -").setParseAction(SymbolNode.parse),
-    opAssoc.LEFT)
-
-# 9: 配列連結
-tmp_expr = make_binary_expr(
-    tmp_expr,
-    Literal("~").setParseAction(SymbolNode.parse),
-    opAssoc.LEFT)
-
-# 10: 等価、不等価、比較
-tmp_expr = make_binary_expr(
-    tmp_expr,
-    oneOf("= <> < > <= >=").setParseAction(SymbolNode.parse),
-    opAssoc.LEFT)
-
-# 11: 論理積
-# 12: 論理和
-tmp_expr = make_binary_expr(
-    tmp_expr,
-    oneOf("& |").setParseAction(SymbolNode.parse),
-    opAssoc.LEFT)
-
-# 13: 条件演算
-tmp_expr = (
-    ( FollowedBy(tmp_expr + Combine(Literal("?") + LPAREN) +
-                 tmp_expr + COMMA + tmp_expr + RPAREN) +
-      Group(tmp_expr + Combine(Literal("?") + LPAREN).suppress() +
-            tmp_expr + COMMA + tmp_expr + RPAREN) \
-          .setParseAction(ExprNode.parse_as_ternary) ) |
-    tmp_expr)
-# 条件演算の ? と ( の間にスペースを入れてはいけません。
-
-# 14: 代入演算子
-tmp_expr = make_binary_expr(
-    tmp_expr,
-    oneOf(":: :+ :- :* :/ :% :^ :~").setParseAction(SymbolNode.parse),
-    opAssoc.RIGHT)
-
-Expr << tmp_expr
-Expr.setName('Expr')
-
-# 代入演算子が = ではなく、::なのが特徴的です。
-# C言語の ==, !=, &&, || は、Kuinではそれぞれ、=, <>, &, | に対応します。
-# インクリメント演算子はありません。i :+ 1 で代用してください。
-
-######################################################################
-# ブロック文
-######################################################################
+# 式の解析器 (kuin.grammar.EXPR_ENGINES)
+ENGINES = ("climbing", "tower")
+DEFAULT_EXPR_ENGINE = "climbing"
 
-# 全てのブロック文が breakできます。
-# ブロック内で定義したローカル変数は、そのブロック内でのみ参照できます。
-
-# if文
-If = (
-    Keyword("if").suppress() +
-    Optional(BlockName.setResultsName('block_name')) +
-    LPAREN + Expr.setResultsName('then_cond') + RPAREN +
-    Optional(Group(Sentences).setResultsName('then_body')) +
-    ZeroOrMore(Keyword("elif").suppress() +
-               LPAREN + Expr.setResultsName('elif_cond*') + RPAREN +
-               Optional(Group(Sentences).setResultsName('elif_body*'))) +
-    Optional(Keyword("else").suppress() +
-             Optional(Group(Sentences).setResultsName('else_body'))) +
-    (Keyword("end") + Keyword("if")).suppress()
-    ).setName('If').setParseAction(IfNode.parse)
-
-# 条件式 (()の中身)は、bool型でなければなりません。
-# C言語のように int型にすると、コンパイルエラーとなります。
-
-# switch文
-SwitchCase = (
-    Keyword("case").suppress() + Value.setResultsName('value') +
-    Optional(Group(Sentences).setResultsName('body'))
-    ).setParseAction(lambda r: (r["value"], r.get("body")))
-SwitchDefault = (
-    Keyword("default").suppress() +
-    Optional(Group(Sentences).setResultsName('body'))
-    ).setParseAction(lambda r: (None, r.get('body')))
-
-Switch = (
-    Keyword("switch").suppress() +
-    Optional(BlockName.setResultsName('block_name')) +
-    LPAREN + Expr.setResultsName('target') + RPAREN +
-    ZeroOrMore(Group(SwitchCase).setResultsName('case*')) +
-    Optional(Group(SwitchDefault).setResultsName('case*')) +
-    (Keyword("end") + Keyword("switch")).suppress()
-    ).setName('Switch').setParseAction(SwitchNode.parse)
-
-# フォールスルーできません。case の最後に達した段階で自動でブロックを抜けます。
-# case の値は、カンマ区切りで複数指定できます。また、@to 演算子により、範囲指定もできます。
-# 上記のExprの型とValueの定義中のExprの型は一致しなければなりません。
-# Exprに指定できる型： int、byte、char、enum、[]char
-# case の値は、コンパイル時に定数とならなくても構いません。
-# 複数の case条件に合致するとき、最初(最も上)に書かれた caseに捕捉されます。
-
-# while文
-While = (
-    Keyword("while").suppress() +
-    Optional(BlockName.setResultsName('block_name')) +
-    LPAREN + Expr.setResultsName('cond') +
-    Optional(COMMA + Expr.setResultsName('skip')) + RPAREN +
-    Optional(Group(Sentences).setResultsName('body')) +
-    (Keyword("end") + Keyword("while")).suppress()
-    ).setName('While').setParseAction(WhileNode.parse)
-
-# 条件式は bool型でなくてはなりません。
-# skipを指定すると、初回の条件比較をスキップします (C言語のdo-whileの代替)。
-
-# for文
-For = (
-    Keyword("for").suppress() +
-    Optional(BlockName.setResultsName('block_name')) +
-    LPAREN + Expr.setResultsName('start') + COMMA + Expr.setResultsName('end') +
-    Optional(COMMA + Expr.setResultsName('step')) + RPAREN +
-    Optional(Group(Sentences).setResultsName('body')) +
-    (Keyword("end") + Keyword("for")).suppress()
-    ).setName('For').setParseAction(ForNode.parse)
-
-# 括弧内は順に、初期値、終値、増減値です。
-# 省略すると増減値は 1 となります。
-# 増減値が正の数ならば i <= 終値 がループ続行の条件となります。
-# 増減値が負の数ならば i >= 終値 がループ続行の条件となります。
-# 増減値が0の場合はコンパイルエラーになります。
-# 増減値はコンパイル時に定数になる値でなければなりません。
-
-# foreach文
-Foreach = (
-    Keyword("foreach").suppress() +
-    Optional(BlockName.setResultsName('block_name')) +
-    LPAREN + Expr.setResultsName('items') + RPAREN +
-    Optional(Group(Sentences).setResultsName('body')) +
-    (Keyword("end") + Keyword("foreach")).suppress()
-    ).setName('Foreach').setParseAction(ForeachNode.parse)
-
-# foreach で使えるのは、配列(文字列含む)、list、stack、queue、dict型だけです。
-# dict型からforeachで要素を取り出すと、KeyとValueのペアを持ったdictpair型になります。
-# enumも使えるようになるかも？ [出典: 10000favs]
-
-# try文
-Try = (
-    Keyword("try").suppress() +
-    Optional(BlockName.setResultsName('block_name')) +
-    LPAREN + Optional(Value.setResultsName('ignore_value')) + RPAREN +
-    Optional(Group(Sentences).setResultsName('body')) +
-    Optional(Keyword("catch").suppress() +
-             Optional(Value.setResultsName('catch_value')) +
-             Optional(Group(Sentences).setResultsName('catch_body'))) +
-    Optional(Keyword("finally").suppress() +
-             Optional(Group(Sentences).setResultsName('finally_body'))) +
-    (Keyword("end") + Keyword("try")).suppress()
-    ).setName('Try').setParseAction(TryNode.parse)
-
-# tryの括弧内に値を記述すると、その例外コードの例外の発生を抑制します。
-# 上記のValueで例外コードを指定します（複数指定可能）。
-# 例外コードに指定できる値の型：int型 のみ
-
-IfdefMode = (
-    Keyword("release").setParseAction(lambda r: IfdefNode.release) |
-    Keyword("debug").setParseAction(lambda r: IfdefNode.debug)
-    )
-
-# ifdef文
-Ifdef = (
-    Keyword("ifdef").suppress() +
-    Optional(BlockName.setResultsName('block_name')) +
-    LPAREN + IfdefMode.setResultsName('mode') + RPAREN +
-    Optional(Group(Sentences).setResultsName('body')) +
-    (Keyword("end") + Keyword("ifdef")).suppress()
-    ).setName('Ifdef').setParseAction(IfdefNode.parse)
-
-# debug を指定するとデバッグコンパイル時のみ中身がコンパイルされます。
-
-# block文
-Block = (
-    Keyword("block").suppress() +
-    Optional(BlockName.setResultsName('block_name')) +
-    Optional(Group(Sentences).setResultsName('body')) +
-    (Keyword("end") + Keyword("block")).suppress()
-    ).setName('Block').setParseAction(BlockNode.parse)
-
-# 単純に、ブロック構造を作りたいときに有効です。
-# 他のブロック文と同様、breakできます。
+class PrecedenceExpr(ParserElement):
+    """
+    Precedence climbing expression parser driven by an operator table
+    (see kuin.operators).
 
-######################################################################
-# 単文
-######################################################################
+    Operands are parsed with the given pyparsing elements; operators are
+    matched once and dispatched on their level, so each operand is parsed
+    exactly once whatever the depth of the table.
+    """
 
-# do文
-Do = (
-    Keyword("do").suppress() + Expr.setResultsName('expr')
-    ).setName('Do').setParseAction(DoNode.parse)
-
-# :: 演算子は、演算子の左側の変数に、右側の値を代入します。
-# 代入文では、両辺が参照型の場合、値ではなくアドレスが代入されます。
-
-# import構文
-Import = ( Keyword("import").suppress() + SourceName )
-
-# break文
-Break = (
-    Keyword("break").suppress() +
-    Optional(BlockName.setResultsName('block_name'))
-    ).setName('Break').setParseAction(BreakNode.parse)
-
-# BlockNameで指定したブロックを抜けます。
-# BlockNameを省略した場合は一番内側のブロックを抜けます。
-
-# continue文
-Continue = (
-    Keyword("continue").suppress() +
-    Optional(BlockName.setResultsName('block_name'))
-    ).setName('Continue').setParseAction(ContinueNode.parse)
-
-# BlockNameという名前を持つブロックの終端(end)直前にジャンプします。
-# ブロック名は省略可能。省略した場合は一番内側のブロックと解釈されます。
-# continue可能なブロックは、while、for、foreachです。
-
-# return文
-Return = (
-    Keyword("return").suppress() +
-    Optional(Expr.setResultsName('value'))
-    ).setName('Return').setParseAction(ReturnNode.parse)
-
-# assert文
-Assert = (
-    Keyword("assert").suppress() +
-    Expr.setResultsName('expr')
-    ).setName('Assert').setParseAction(AssertNode.parse)
-
-# 上記のExprはbool型でなければなりません。[要出典]
-
-# throw文
-Throw = (
-    Keyword("throw").suppress() +
-    Expr.setResultsName('code') +
-    COMMA + Expr.setResultsName('message')
-    ).setName('Throw').setParseAction(ThrowNode.parse)
-
-# 1つ目のExprは例外コード( int型 )
-# 2つ目のExprは例外メッセージ( []char型 )
-# 例外メッセージを省略すると、例外メッセージに null が入ります。
+    def __init__(self, table, number, primary, typed_operands):
+        super(PrecedenceExpr, self).__init__()
+        self.table = table
+        self.number = number
+        self.primary = primary
+        self.typed_operands = dict(typed_operands)
+
+        self.infix = infix_operators(table)
+        self.prefix_op = oneOf(prefix_operators(table))
+        self.infix_op = oneOf(list(self.infix))
+        self.ternary_level, delims = ternary_operator(table)
+        self.top_level = max([entry[0] for entry in table])
+        if self.ternary_level is not None:
+            self.ternary_open, self.ternary_sep, self.ternary_close = [
+                Literal(delim) for delim in delims]
+
+        self.name = "PrecedenceExpr"
+        self.mayReturnEmpty = False
+        self.mayIndexError = False
+
+    def children(self):
+        exprs = [self.number, self.primary, self.prefix_op, self.infix_op]
+        exprs += list(self.typed_operands.values())
+        if self.ternary_level is not None:
+            exprs += [self.ternary_open, self.ternary_sep, self.ternary_close]
+        return exprs
+
+    def ignore(self, other):
+        if isinstance(other, Suppress) and other in self.ignoreExprs:
+            return self
+        super(PrecedenceExpr, self).ignore(other)
+        for expr in self.children():
+            expr.ignore(self.ignoreExprs[-1])
+        return self
+
+    def streamline(self):
+        if not self.streamlined:
+            super(PrecedenceExpr, self).streamline()
+            for expr in self.children():
+                expr.streamline()
+        return self
+
+    def __str__(self):
+        return self.name
+
+    def parseImpl(self, instring, loc, doActions=True):
+        loc, node = self.parse_level(instring, loc, doActions, self.top_level)
+        return loc, [node]
+
+    def parse_one(self, expr, instring, loc, doActions):
+        loc, tokens = expr._parse(instring, loc, doActions)
+        return loc, tokens[0]
+
+    def parse_unary(self, instring, loc, doActions, allow_number=True):
+        # Number が単項演算より先に試される (符号付きの数値リテラル)
+        if allow_number:
+            try:
+                return self.parse_one(self.number, instring, loc, doActions)
+            except ParseException:
+                pass
+        try:
+            op_loc, op = self.parse_one(self.prefix_op, instring, loc, False)
+            end, operand = self.parse_unary(
+                instring, op_loc, doActions, allow_number=False)
+        except ParseException:
+            return self.parse_one(self.primary, instring, loc, doActions)
+        node = ExprNode(symbol(op), operand)
+        locator = current_locator()
+        if locator is not None:
+            start = self.preParse(instring, loc)
+            locator.add(node.operator, start, start + len(op))
+            locator.add(node, start, end)
+        return end, node
+
+    def parse_level(self, instring, loc, doActions, max_level):
+        locator = current_locator()
+        if locator is not None:
+            start = self.preParse(instring, loc)
+        loc, left = self.parse_unary(instring, loc, doActions)
+        # 条件演算は結合しない: その後には条件演算より弱い演算子だけが続く
+        min_level = None
+        while True:
+            if self.ternary_level is not None and min_level is None and \
+                    self.ternary_level <= max_level:
+                try:
+                    loc, left = self.parse_ternary(
+                        instring, loc, doActions, left)
+                    if locator is not None:
+                        locator.add(left, start, loc)
+                    min_level = self.ternary_level
+                    continue
+                except ParseException:
+                    pass
+            try:
+                op_loc, op = self.parse_one(self.infix_op, instring, loc, False)
+            except ParseException:
+                break
+            level, kind, assoc = self.infix[op]
+            if level > max_level or (min_level is not None and
+                                     level <= min_level):
+                break
+            try:
+                if kind in self.typed_operands:
+                    op_loc, right = self.parse_one(
+                        self.typed_operands[kind], instring, op_loc, doActions)
+                else:
+                    if assoc == RIGHT:
+                        right_level = level
+                    else:
+                        right_level = level - 1
+                    op_loc, right = self.parse_level(
+                        instring, op_loc, doActions, right_level)
+            except ParseException:
+                break
+            node = ExprNode(symbol(op), left, right)
+            if locator is not None:
+                op_start = self.infix_op.preParse(instring, loc)
+                locator.add(node.operator, op_start, op_start + len(op))
+                locator.add(node, start, op_loc)
+            loc, left = op_loc, node
+        return loc, left
+
+    def parse_ternary(self, instring, loc, doActions, cond):
+        operand_level = self.ternary_level - 1
+        loc, _ = self.ternary_open._parse(instring, loc, False)
+        loc, true_body = self.parse_level(
+            instring, loc, doActions, operand_level)
+        loc, _ = self.ternary_sep._parse(instring, loc, False)
+        loc, false_body = self.parse_level(
+            instring, loc, doActions, operand_level)
+        loc, _ = self.ternary_close._parse(instring, loc, False)
+        return loc, ExprNode(ExprNode.ternary_op, cond, true_body, false_body)
 
 ######################################################################
-# 定義文
+# 文法
 ######################################################################
 
-# func構文 (関数定義)
-Func = (
-    Keyword("func").suppress() + FName +
-    LPAREN + Optional(VName + COLON + Type +
-                      ZeroOrMore(COMMA + VName + COLON + Type)) + RPAREN +
-    Optional(COLON + Type) +
-    Optional(Group(Sentences)) +
-    (Keyword("end") + Keyword("func")).suppress() )
-
-# var構文 (変数定義)
-Var = (
-    Keyword("var").suppress() + VName.setResultsName('varname') +
-    COLON + Type.setResultsName('typename') +
-    Optional(DCOLON + Expr.setResultsName('value'))
-    ).setName('Var').setParseAction(VarNode.parse)
-
-# :: Exprを省略した場合、すべて0で初期化されます。
-# グローバル変数・メンバ変数では、定義時には値を代入できません。
-# 定義と同時に値を代入できるのは、ローカル変数のみです。
-
-# const構文 (定数定義)
-Const = (
-    Keyword("const").suppress() + VName.setResultsName('varname') +
-    COLON + Type.setResultsName('typename') +
-    DCOLON + Expr.setResultsName('value')
-    ).setName('Const').setParseAction(ConstNode.parse)
-
-# 定数の代入式の右辺(Expr)は、コンパイル時に決定できる値でなくてはなりません。
-
-# alias構文 (別名定義)
-Alias = (
-    Keyword("alias").suppress() + Name.setResultsName('alias') +
-    COLON + Type.setResultsName('typename')
-    ).setName('Alias').setParseAction(AliasNode.parse)
-
-# []char を string などの別名にするのは推奨されません。
-# ( Kuin の文字列型が []char であることに慣れるのが望ましい )
-
-# enum構文 (列挙体定義)
-EnumMember = (
-    ConstName.setResultsName('key') +
-    Optional(DCOLON + Expr.setResultsName('value'))
-    ).setParseAction(lambda r: (r["key"], r.get("value")))
-
-Enum = (
-    Keyword("enum").suppress() + EName.setResultsName('name') +
-    OneOrMore(EnumMember).setResultsName('member') +
-    (Keyword("end") + Keyword("enum")).suppress()
-    ).setName('Enum').setParseAction(EnumNode.parse)
-
-# :: Exprを指定しなかったときのデフォルト値は 0 から始まります。
-# 値は自動的に 1 ずつ足されて設定されます。
-# 下記の例では、Red は 0、Blue は 1、Yellow は 6に設定されます。
-# enum EColor
-#     Red
-#     Blue
-#     Green :: 5
-#     Yellow
-# end enum
-# 他の要素と値が重複した場合は、コンパイルエラーとなります。
-# 値の指定は、コンパイル時に int に決定される定数でなくてはなりません。
-
-# class構文 (クラス定義)
-
-Class = Forward()
-
-ClassMember = ( Func | Var | Const | Alias | Class | Enum )
-
-Class << (
-    Keyword("class").suppress() + CName.setResultsName('name') +
-    Optional(COLON + ClassName.setResultsName('parent')) +
-    ZeroOrMore(Optional(oneOf("+ -").setResultsName('visibility*')) +
-               Optional(Literal("*").setResultsName('override*')) +
-               ClassMember.setResultsName('member*')) +
-    (Keyword("end") + Keyword("class")).suppress()
-    ).setName('Class').setParseAction(ClassNode.parse)
-
-# 継承元( : ClassName )を省略すると、Kuin@CClass が継承されます。
-# 全てのクラスは、ルートクラスである Kuin@CClass が継承されていると言えます。
-# 例： class CCat : CAnimalとすると、Kuin@CClass → CAnimal → CCat
-#
-# - ⇒ private なメンバ。
-# + ⇒ protected なメンバ。
-# * ⇒ 親クラスのメンバのオーバーライドを許可。
-# * は、- や + の後に記述しなければエラーとなります。
-# (誰が書いても同じようなコードにするため)
+class Grammar(object):
+    """
+    The root elements of a pyparsing grammar of Kuin (kuin.grammar):
+    ``sentences`` parses a program and ``expr`` an expression, with the
+    engine in ``expr_engine``, one of ``engines``.
+    """
 
-######################################################################
-# コメント
-######################################################################
+    def __init__(self, sentences, expr, expr_engine, engines, tower_levels,
+                 primary, profiled_rules):
+        self.sentences = sentences
+        self.expr = expr
+        self.expr_engine = expr_engine
+        self.engines = engines
+        # kuin.ruleprofile が数える段と規則
+        self.tower_levels = tower_levels
+        self.primary = primary
+        self.profiled_rules = profiled_rules
+        # kuin.packrat と kuin.source が解析方法を入れる要素
+        self._elements = None
+
+    def elements(self):
+        """
+        Return the pyparsing elements of the grammar, with every engine.
+        """
+        if self._elements is None:
+            self._elements = grammar_elements(self.sentences, self.expr,
+                                              *self.engines.values())
+        return self._elements
+
+    @contextmanager
+    def use_engine(self, name):
+        """
+        Temporarily make expr (and thus every sentence) use the named
+        expression engine.
+        """
+        try:
+            engine = self.engines[name]
+        except KeyError:
+            raise ValueError("unknown expression engine: %r" % name)
+        saved = self.expr_engine.expr
+        self.expr_engine.expr = engine
+        try:
+            yield engine
+        finally:
+            self.expr_engine.expr = saved
+
+# parse_stmt と parse_expr が使う文法 (最初に使うときに作る)
+_grammar = None
+# 文法の snapshot (copy_grammar が読む)
+_grammar_data = None
+# 上の二つを作るとき
+_grammar_lock = threading.RLock()
+
+def grammar():
+    """Return the grammar of the pyparsing backend, made on first use."""
+    if _grammar is None:
+        with _grammar_lock:
+            if _grammar is None:
+                load_grammar()
+    return _grammar
+
+def load_grammar(snapshot=None):
+    """
+    Make the grammar of the pyparsing backend and return it.
 
-Comment = Forward()
-Comment << (
-    Literal("{") +
-    ZeroOrMore(String | Char | Comment | Regex(r"[^\"'{}]+")) +
-    Literal("}")
-    ).setName('Comment')
+    The grammar is built by importing kuin.grammar, or loaded from the
+    file `snapshot` if its path is given (see kuin.snapshot); the file
+    is written when it is missing or was made from another grammar.
+    """
+    global _grammar
+    if snapshot is None:
+        from kuin.grammar import GRAMMAR
+        _grammar = GRAMMAR
+        return _grammar
+    from kuin.snapshot import load_snapshot, save_snapshot
+    loaded = load_snapshot(snapshot)
+    if loaded is None:
+        from kuin.grammar import GRAMMAR
+        loaded = GRAMMAR
+        save_snapshot(loaded, snapshot)
+    _grammar = loaded
+    return _grammar
+
+def copy_grammar():
+    """
+    Return a new grammar of the pyparsing backend, sharing no element
+    with grammar() or another copy.
 
-# 複数行コメント可能です。一行コメントに特化したコメント記法はありません。
-# Kuinでは、コメントがネストできます。
-# また、コメント内部に文字列リテラル、文字リテラルを含み得ます。
-# 例えば、{ " }" {  } }は全体がコメント扱いされます。
+    The copies are loaded from a snapshot of grammar() kept in memory
+    (see kuin.snapshot), made by the first call.
+    """
+    global _grammar_data
+    from kuin.snapshot import dumps, loads
+    if _grammar_data is None:
+        with _grammar_lock:
+            if _grammar_data is None:
+                _grammar_data = dumps(grammar())
+    return loads(_grammar_data)
+
+def expr_engine(name):
+    """
+    Temporarily make every sentence use the named expression engine.
+    """
+    return grammar().use_engine(name)
 
 ######################################################################
-# 文
-######################################################################
-
-# ブロック文、単文、定義文
 
-BlockStatement = ( If | Switch |
-                   While | For | Foreach |
-                   Try | Ifdef | Block )
+BACKENDS = ("pyparsing", "fast")
 
-SimpleSentence = ( Do | Import |
-                   Break | Continue | Return |
-                   Assert | Throw )
+# 構文木の形が変わったら上げる (kuin.parsecache のキーに使われる)
+GRAMMAR_VERSION = "2"
 
-Definition = ( Func | Var | Const | Alias | Class | Enum )
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError("unknown backend: %r" % backend)
 
-Sentence = ( BlockStatement | SimpleSentence | Definition )
+@contextmanager
+def keep_tabs(element, source_map):
+    """
+    parseString expands tabs before parsing; keep them while locating so
+    that the recorded offsets refer to the original text.
+    """
+    if source_map is None:
+        yield
+        return
+    saved = element.keepTabs
+    element.keepTabs = True
+    try:
+        yield
+    finally:
+        element.keepTabs = saved
+
+def parse_string(g, element, text, debug, packrat, engine, source_map):
+    """
+    Parse `text` with `element`, a rule of the grammar `g` (see
+    parse_stmt for the other arguments).
+    """
+    elements = g.elements()
+    with memoize(packrat, elements), g.use_engine(engine), \
+            locate(source_map, elements), keep_tabs(element, source_map):
+        return element.setDebug(debug).parseString(text, parseAll=True)
 
-Sentences << ZeroOrMore(Sentence).ignore(Comment)
+@contextmanager
+def source_text(text, path, backend):
+    """
+    Give the `text` to parse, or the contents of the file `path` mapped in
+    memory (see kuin.stream.mapped_source), for the ``with`` block.
+    """
+    if path is None:
+        yield text
+        return
+    if text is not None:
+        raise ValueError("both a text and a path are given")
+    with mapped_source(path) as data:
+        try:
+            # pyparsing は str しか読めない
+            yield data if backend == "fast" else data[:]
+        except ParseBaseException as e:
+            # 例外は割り当てを閉じた後も読めるように
+            raise e.__class__(data[:], e.loc, e.msg)
+
+def parse_expr(text=None, debug=False, packrat=None,
+               engine=DEFAULT_EXPR_ENGINE, backend="pyparsing",
+               source_map=None, path=None):
+    """
+    Parse a single expression (see parse_stmt for `packrat`, `engine`,
+    `source_map` and `path`).
 
-######################################################################
+    With backend="fast" the text is tokenized by kuin.lexer and the tokens
+    are parsed by kuin.fastparser; `debug`, `packrat` and `engine` only
+    apply to the pyparsing backend.
 
-def parse_expr(text, debug=False):
-    """
     booleans:
 
     >>> parse_expr("true")
@@ -824,7 +453,7 @@ def parse_expr(text, debug=False):
     >>> parse_expr("#FFF")
     4095
     >>> parse_expr("6.02e+23")
-    6.019999999999999e+23
+    6.02e+23
     >>> parse_expr("36#Z")
     35
 
@@ -896,10 +525,150 @@ def parse_expr(text, debug=False):
     >> b ?(2, 3)
 
     """
-    return Expr.setDebug(debug).parseString(text, parseAll=True)[0]
+    check_backend(backend)
+    if path is not None:
+        with source_text(text, path, backend) as text:
+            return parse_expr(text, debug, packrat, engine, backend,
+                              source_map)
+    if backend == "fast":
+        return fastparser.parse_expr(text, source_map)
+    g = grammar()
+    return parse_string(g, g.expr, text, debug, packrat, engine,
+                        source_map)[0]
+
+def parse_stmt(text=None, debug=False, packrat=None,
+               engine=DEFAULT_EXPR_ENGINE, backend="pyparsing",
+               source_map=None, cache=None, path=None):
+    """
+    Parse a sequence of sentences.
+
+    If `packrat` is given, every rule invocation is memoized during this
+    call (see kuin.packrat). Pass a PackratCache to inspect its hit/miss
+    statistics afterwards.
+
+    `engine` selects how expressions are parsed: "climbing" (precedence
+    climbing over kuin.operators.OPERATORS) or "tower" (the original
+    level-by-level lookahead grammar, kept for comparison).
+
+    `backend` selects the parser itself: "pyparsing" (the grammar in this
+    module) or "fast" (kuin.lexer + kuin.fastparser, a hand written
+    recursive descent parser dispatching on the leading keyword). Both
+    produce the same trees; the fast backend returns a plain list.
+
+    If a kuin.source.SourceMap is given as `source_map`, the start/end
+    offsets of every node are recorded in it. (The "tower" engine only
+    locates the outermost node of an operator chain.)
+
+    If a kuin.parsecache.ParseCache is given as `cache`, the tree is
+    loaded from it when the same text was parsed before, and stored in it
+    otherwise; the result is then a plain list. The cache is not used when
+    a `source_map` is given, since spans are not stored.
+
+    If a `path` is given instead of the `text`, the file is mapped in
+    memory rather than read; the fast backend tokenizes the mapping
+    without copying the whole text.
+    """
+    check_backend(backend)
+    if path is not None:
+        with source_text(text, path, backend) as text:
+            return parse_stmt(text, debug, packrat, engine, backend,
+                              source_map, cache)
+    if cache is not None and source_map is None:
+        tree = cache.get(text)
+        if tree is None:
+            tree = list(parse_stmt(text, debug, packrat, engine, backend))
+            cache.set(text, tree)
+        return tree
+    if backend == "fast":
+        return fastparser.parse_stmt(text, source_map)
+    g = grammar()
+    return parse_string(g, g.sentences, text, debug, packrat, engine,
+                        source_map)
+
+######################################################################
+# 解析器
+######################################################################
+
+class Parser(object):
+    """
+    A parser owning its grammar and caches, for use from threads.
+
+    parse_stmt and parse_expr share one grammar and change it while they
+    parse (the debug flag, the expression engine, the tabs).  A Parser
+    parses with its own copy of the grammar (see copy_grammar) and its
+    own packrat cache, one text at a time; the parsers of different
+    threads share no element, so that they parse in parallel wherever
+    the interpreter lets threads run at once.  Give each thread its own
+    Parser (a thread shares the one it is given)::
+
+        local = threading.local()
+
+        def parse(text):
+            if not hasattr(local, "parser"):
+                local.parser = Parser(packrat=True)
+            return local.parser.parse_stmt(text)
+
+    `engine`, `backend` and `packrat` are those of parse_stmt; `cache`
+    (a kuin.parsecache.ParseCache) may be shared, its entries are
+    written atomically.
+    """
 
-def parse_stmt(text, debug=False):
-    return Sentences.setDebug(debug).parseString(text, parseAll=True)
+    def __init__(self, engine=DEFAULT_EXPR_ENGINE, backend="pyparsing",
+                 packrat=None, cache=None):
+        check_backend(backend)
+        if engine not in ENGINES:
+            raise ValueError("unknown expression engine: %r" % engine)
+        self.engine = engine
+        self.backend = backend
+        self.packrat = to_cache(packrat)
+        self.cache = cache
+        # 解析中に持つ (同じスレッドからは入れ子にできる)
+        self.lock = threading.RLock()
+        self._grammar = None
+
+    @property
+    def grammar(self):
+        """The grammar of this parser, copied on first use."""
+        with self.lock:
+            if self._grammar is None:
+                self._grammar = copy_grammar()
+            return self._grammar
+
+    def parse_expr(self, text=None, debug=False, source_map=None,
+                   path=None):
+        """Parse a single expression (see kuin.parser.parse_expr)."""
+        if path is not None:
+            with source_text(text, path, self.backend) as text:
+                return self.parse_expr(text, debug, source_map)
+        if self.backend == "fast":
+            return fastparser.parse_expr(text, source_map)
+        with self.lock:
+            g = self.grammar
+            return parse_string(g, g.expr, text, debug, self.packrat,
+                                self.engine, source_map)[0]
+
+    def parse_stmt(self, text=None, debug=False, source_map=None,
+                   path=None):
+        """Parse a sequence of sentences (see kuin.parser.parse_stmt)."""
+        if path is not None:
+            with source_text(text, path, self.backend) as text:
+                return self.parse_stmt(text, debug, source_map)
+        cache = self.cache
+        if cache is not None and source_map is None:
+            tree = cache.get(text)
+            if tree is None:
+                tree = list(self.parse_stmt(text, debug))
+                cache.set(text, tree)
+            return tree
+        if self.backend == "fast":
+            return fastparser.parse_stmt(text, source_map)
+        with self.lock:
+            g = self.grammar
+            return parse_string(g, g.sentences, text, debug, self.packrat,
+                                self.engine, source_map)
+
+    def __repr__(self):
+        return "<Parser %s %s>" % (self.backend, self.engine)
 
 if __name__ == '__main__':
     import doctest
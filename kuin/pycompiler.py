@@ -0,0 +1,996 @@
+# -*- coding: utf-8 -*-
+
+"""Translation of Kuin programs to Python code objects.
+
+:class:`Translator` turns parsed sentences into a Python ``ast.Module``
+that CPython compiles, so that the program runs as Python bytecode;
+:class:`Runner` executes it with the interface of
+kuin.interpreter.Interpreter::
+
+    runner = run(text)
+    print runner.call("main")
+
+Kuin names are prefixed in the generated code (``v_`` for variables,
+``f_`` for functions), the other names being the helpers the Runner puts
+in the namespace of the program.  Each Kuin function becomes a Python
+function, and the top level the function ``_main``.  ``break`` and
+``continue`` to an enclosing loop that is not the innermost Python loop
+set the variable ``_jump`` and leave the loops in between; named blocks
+that are left by ``break`` are compiled as one-shot loops.
+
+:func:`compile_text` keeps the code objects in a :class:`CodeCache`,
+keyed by the hash of the source, so a text is translated once; the
+cache is a bounded LRU, the least recently used codes being dropped.
+"""
+
+import ast
+import imp
+import marshal
+import os
+import re
+import sys
+import tempfile
+from collections import OrderedDict
+
+from kuin.bytecode import sentence_bodies, _funcdefs
+from kuin.nodes import *
+from kuin.nodes import symbol
+from kuin.parsecache import source_key
+from kuin.runtime import *
+from kuin.runtime import check_index, concat, divide, modulo
+from kuin.visitor import declared_names
+
+__all__ = ['Translator', 'Runner', 'CodeCache', 'compile_sentences',
+           'compile_text', 'run']
+
+# 生成するコードを変えたら番号を上げる
+TRANSLATOR_VERSION = "1"
+
+BINARY_OPERATORS_AST = {"+": ast.Add, "-": ast.Sub, "*": ast.Mult}
+COMPARE_OPERATORS_AST = {
+    "=": ast.Eq, "<>": ast.NotEq,
+    "<": ast.Lt, "<=": ast.LtE, ">": ast.Gt, ">=": ast.GtE,
+    }
+UNARY_OPERATORS_AST = {"-": ast.USub, "+": ast.UAdd, "!": ast.Not}
+# 関数で実装する演算子
+BINARY_HELPERS = {"/": "_divide", "%": "_modulo", "~": "_concat"}
+
+COMPOUND_OPERATORS_AST = {
+    ":+": ast.Add, ":-": ast.Sub, ":*": ast.Mult, ":^": ast.Pow,
+    }
+COMPOUND_HELPERS = {":/": "_divide", ":%": "_modulo", ":~": "_concat"}
+
+ASSIGN_OPERATORS = frozenset(["::"] + list(COMPOUND_OPERATORS))
+
+
+######################################################################
+# Python の構文木
+######################################################################
+
+def _load(name):
+    return ast.Name(name, ast.Load())
+
+
+def _store(name):
+    return ast.Name(name, ast.Store())
+
+
+def _call(name, *args):
+    return ast.Call(_load(name), list(args), [], None, None)
+
+
+def _assign(target, value):
+    if isinstance(target, str):
+        target = _store(target)
+    return ast.Assign([target], value)
+
+
+def _literal(value):
+    if isinstance(value, (int, long, float)) and type(value) is not bool:
+        return ast.Num(value)
+    if isinstance(value, basestring):
+        return ast.Str(value)
+    return _load(repr(value))
+
+
+def _simple(expr):
+    # 何度評価しても同じ式
+    return type(expr) in (ast.Name, ast.Num, ast.Str)
+
+
+def _has_effects(node):
+    # 関数呼び出しか代入を含む式
+    cls = type(node)
+    if cls is FuncNode:
+        return True
+    if cls is ExprNode:
+        if node.operator.symbol in ASSIGN_OPERATORS:
+            return True
+        for operand in node.operands:
+            if _has_effects(operand):
+                return True
+    elif cls is ArrayNode:
+        return _has_effects(node.index)
+    return False
+
+
+def _breaks_to(body, name):
+    # body の中に name への break があるか (入れ子の関数は除く)
+    for node in body:
+        cls = type(node)
+        if cls is BreakNode and node.block_name == name:
+            return True
+        if cls is not FuncDefNode:
+            for child in sentence_bodies(node):
+                if _breaks_to(child, name):
+                    return True
+    return False
+
+
+def _is_assign(node):
+    return type(node) is ExprNode and node.operator.symbol in ASSIGN_OPERATORS
+
+
+class _Block(object):
+    """A Kuin block of the function being translated."""
+
+    def __init__(self, name, loop, python_loop, finally_level):
+        self.name = name
+        self.loop = loop
+        # Python のループにしたブロック
+        self.python_loop = python_loop
+        self.finally_level = finally_level
+        # このループを抜けて外に向かう (_jump の値, 飛び先, 種類)
+        self.pending = []
+        self.codes = {}
+
+
+######################################################################
+# 変換
+######################################################################
+
+class Translator(object):
+    """
+    Translate Kuin sentences to a Python module.
+
+    ``ifdef`` and ``assert`` are translated for the debug or the release
+    mode.  Constructs that can't be translated (classes, a ``continue``
+    leaving a ``finally`` body, an assignment to a local variable inside
+    an expression) raise InterpreterError when they are executed.
+    """
+
+    def __init__(self, debug=True):
+        self.debug = debug
+
+    def translate(self, sentences):
+        """Return the ``ast.Module`` of the top-level `sentences`."""
+        sentences = list(sentences)
+        funcdefs = list(_funcdefs(sentences))
+        self.arities = dict([(funcdef.name.symbol, len(funcdef.params))
+                             for funcdef in funcdefs])
+        self.global_names = set(declared_names(sentences))
+        body = []
+        for funcdef in funcdefs:
+            params = [name.symbol for name, typename in funcdef.params]
+            body.append(self.translate_function(
+                    "f_" + funcdef.name.symbol, params, funcdef.body))
+        body.append(self.translate_function("_main", [], sentences))
+        return ast.fix_missing_locations(ast.Module(body))
+
+    def translate_function(self, name, params, body):
+        if name == "_main":
+            self.locals = set()
+        else:
+            self.locals = set(params) | set(declared_names(body))
+        self.blocks = []
+        self.finally_level = 0
+        self.jump_codes = 0
+        self.temps = 0
+        self.global_stores = set()
+        statements = self.translate_body(body)
+        prologue = []
+        if self.global_stores:
+            prologue.append(ast.Global(
+                    sorted(["v_" + n for n in self.global_stores])))
+        if self.jump_codes:
+            prologue.append(_assign("_jump", ast.Num(0)))
+        args = ast.arguments([ast.Name("v_" + param, ast.Param())
+                              for param in params], None, None, [])
+        return ast.FunctionDef(name, args,
+                               prologue + statements or [ast.Pass()], [])
+
+    def temp(self, kind):
+        self.temps += 1
+        return "_%s%d" % (kind, self.temps)
+
+    def error(self, message):
+        return _call("_error", ast.Str(message))
+
+    ##################################################################
+    # 変数
+    ##################################################################
+
+    def store_target(self, name):
+        """Return the Name to assign `name` to, or None for a helper."""
+        if name in self.locals:
+            return _store("v_" + name)
+        if name in self.global_names:
+            self.global_stores.add(name)
+            return _store("v_" + name)
+        # このプログラムで宣言されていない変数は実行時に調べる
+        return None
+
+    ##################################################################
+    # ブロック
+    ##################################################################
+
+    def translate_body(self, body):
+        statements = []
+        translators = self.sentence_translators
+        for sentence in body:
+            translators[type(sentence)](self, sentence, statements)
+        return statements
+
+    def translate_named_body(self, body, name):
+        """Translate a body that ``break name`` leaves."""
+        if name is None or not _breaks_to(body, name):
+            block = _Block(name, False, False, self.finally_level)
+            self.blocks.append(block)
+            statements = self.translate_body(body)
+            self.blocks.pop()
+            return statements
+        # 一度だけ回るループにする
+        block = _Block(name, False, True, self.finally_level)
+        self.blocks.append(block)
+        statements = self.translate_body(body)
+        self.blocks.pop()
+        result = [ast.While(_load("True"), statements + [ast.Break()], [])]
+        self.dispatch(block, result)
+        return result
+
+    def translate_loop_body(self, name, body):
+        block = _Block(name, True, True, self.finally_level)
+        self.blocks.append(block)
+        statements = self.translate_body(body)
+        self.blocks.pop()
+        return block, statements or [ast.Pass()]
+
+    def translate_jump(self, node, kind, out):
+        name = node.block_name
+        target = None
+        for block in reversed(self.blocks):
+            if block.loop if name is None else block.name == name:
+                target = block
+                break
+        if target is None or (kind is ast.Continue and not target.loop):
+            out.append(ast.Expr(self.error("no block to break: %r" % name)))
+            return
+        if kind is ast.Continue and \
+                self.finally_level > target.finally_level:
+            out.append(ast.Expr(self.error(
+                        "continue out of finally is not supported")))
+            return
+        inner = [block for block in
+                 self.blocks[self.blocks.index(target) + 1:]
+                 if block.python_loop]
+        if not inner:
+            out.append(kind())
+            return
+        # 間のループを抜けてから飛ぶ
+        code = target.codes.get(kind)
+        if code is None:
+            self.jump_codes += 1
+            code = target.codes[kind] = self.jump_codes
+        for block in inner:
+            if (code, target, kind) not in block.pending:
+                block.pending.append((code, target, kind))
+        out.append(_assign("_jump", ast.Num(code)))
+        out.append(ast.Break())
+
+    def dispatch(self, block, out):
+        """Continue the jumps leaving the Python loop of `block`."""
+        if not block.pending:
+            return
+        loops = [b for b in self.blocks if b.python_loop]
+        statements = []
+        further = False
+        for code, target, kind in block.pending:
+            if target is loops[-1]:
+                statements.append(ast.If(
+                        ast.Compare(_load("_jump"), [ast.Eq()],
+                                    [ast.Num(code)]),
+                        [_assign("_jump", ast.Num(0)), kind()], []))
+            else:
+                further = True
+        if further:
+            statements.append(ast.Break())
+        out.append(ast.If(_load("_jump"), statements, []))
+
+    ##################################################################
+    # 文
+    ##################################################################
+
+    def translate_if(self, node, out):
+        orelse = []
+        for cond, body in reversed(node.clauses):
+            body = self.translate_named_body(body, node.block_name) or \
+                [ast.Pass()]
+            if cond is None:
+                orelse = body
+            else:
+                orelse = [ast.If(self.test(cond), body, orelse)]
+        out.extend(orelse)
+
+    def translate_switch(self, node, out):
+        subject = self.temp("switch")
+        out.append(_assign(subject, self.value(node.target)))
+        orelse = []
+        for value, body in reversed(node.case):
+            body = self.translate_named_body(body, node.block_name) or \
+                [ast.Pass()]
+            if value is None:
+                orelse = body
+            else:
+                orelse = [ast.If(self.match(value, _load(subject)),
+                                 body, orelse)]
+        out.extend(orelse)
+
+    def match(self, value_node, subject):
+        """Return the test of `subject` being in the ranges."""
+        tests = []
+        for start, end in value_node.range:
+            if end is None:
+                tests.append(ast.Compare(subject, [ast.Eq()],
+                                         [self.value(start)]))
+            else:
+                tests.append(ast.Compare(self.value(start),
+                                         [ast.LtE(), ast.LtE()],
+                                         [subject, self.value(end)]))
+        if len(tests) == 1:
+            return tests[0]
+        return ast.BoolOp(ast.Or(), tests)
+
+    def translate_while(self, node, out):
+        test = self.test(node.cond)
+        skip = node.skip
+        prologue = []
+        if skip is not None and skip is not False:
+            # 初回は条件を調べない
+            flag = self.temp("skip")
+            out.append(_assign(flag, self.test(skip)))
+            test = ast.BoolOp(ast.Or(), [_load(flag), test])
+            prologue.append(_assign(flag, _load("False")))
+        block, body = self.translate_loop_body(node.block_name, node.body)
+        out.append(ast.While(test, prologue + body, []))
+        self.dispatch(block, out)
+
+    def loop_target(self, block_name):
+        if block_name is None:
+            return _store("_")
+        target = self.store_target(block_name.symbol)
+        return target if target is not None else _store("_")
+
+    def translate_for(self, node, out):
+        step = 1 if node.step is None else node.step
+        items = _call("_range", self.value(node.start),
+                      self.value(node.end), self.value(step))
+        target = self.loop_target(node.block_name)
+        block, body = self.translate_loop_body(node.block_name, node.body)
+        out.append(ast.For(target, items, body, []))
+        self.dispatch(block, out)
+
+    def translate_foreach(self, node, out):
+        items = self.value(node.items)
+        target = self.loop_target(node.block_name)
+        block, body = self.translate_loop_body(node.block_name, node.body)
+        out.append(ast.For(target, items, body, []))
+        self.dispatch(block, out)
+
+    def translate_try(self, node, out):
+        name = node.block_name
+        statements = self.translate_named_body(node.body, name) or \
+            [ast.Pass()]
+        catches = node.catch_value is not None or bool(node.catch_body)
+        if catches or node.ignore_value is not None:
+            exception = self.temp("e")
+            code = _load(self.temp("code"))
+            if catches:
+                handler = []
+                if name is not None:
+                    target = self.store_target(name.symbol)
+                    if target is not None:
+                        handler.append(_assign(target, code))
+                handler.extend(self.translate_named_body(node.catch_body,
+                                                         name))
+                handler = handler or [ast.Pass()]
+                if node.catch_value is not None:
+                    handler = [ast.If(self.match(node.catch_value, code),
+                                      handler, [ast.Raise(None, None, None)])]
+            else:
+                handler = [ast.Raise(None, None, None)]
+            if node.ignore_value is not None:
+                handler = [ast.If(self.match(node.ignore_value, code),
+                                  [ast.Pass()], handler)]
+            handler.insert(0, _assign(code.id, ast.Attribute(
+                        _load(exception), "code", ast.Load())))
+            statements = [ast.TryExcept(statements, [ast.ExceptHandler(
+                            _load("_KuinError"), _store(exception), handler)],
+                                        [])]
+        self.finally_level += 1
+        finally_body = self.translate_named_body(node.finally_body, name)
+        self.finally_level -= 1
+        if finally_body:
+            statements = [ast.TryFinally(statements, finally_body)]
+        out.extend(statements)
+
+    def translate_ifdef(self, node, out):
+        if (node.mode == IfdefNode.debug) == self.debug:
+            out.extend(self.translate_named_body(node.body, node.block_name))
+
+    def translate_block(self, node, out):
+        out.extend(self.translate_named_body(node.body, node.block_name))
+
+    def translate_do(self, node, out):
+        expr = node.expr
+        if _is_assign(expr):
+            self.translate_assign(expr, out)
+        else:
+            out.append(ast.Expr(self.value(expr)))
+
+    def translate_break(self, node, out):
+        self.translate_jump(node, ast.Break, out)
+
+    def translate_continue(self, node, out):
+        self.translate_jump(node, ast.Continue, out)
+
+    def translate_return(self, node, out):
+        out.append(ast.Return(self.chained_value(node.value, out)))
+
+    def translate_assert(self, node, out):
+        if self.debug:
+            out.append(ast.If(ast.UnaryOp(ast.Not(), self.test(node.expr)),
+                              [ast.Expr(_call("_assert_failed"))], []))
+
+    def translate_throw(self, node, out):
+        out.append(ast.Raise(_call("_KuinError", self.value(node.code),
+                                   self.value(node.message)), None, None))
+
+    def translate_var(self, node, out):
+        name = node.varname.symbol
+        if node.value is None:
+            value = _literal(default_value(node.typename))
+        else:
+            value = self.chained_value(node.value, out)
+        target = self.store_target(name)
+        if target is None:
+            out.append(ast.Expr(_call("_define_global", ast.Str(name),
+                                      value)))
+        else:
+            out.append(_assign(target, value))
+
+    def translate_definition(self, node, out):
+        # 関数は translate で、import、alias、enum、class は何もしない
+        pass
+
+    sentence_translators = {
+        IfNode: translate_if,
+        SwitchNode: translate_switch,
+        WhileNode: translate_while,
+        ForNode: translate_for,
+        ForeachNode: translate_foreach,
+        TryNode: translate_try,
+        IfdefNode: translate_ifdef,
+        BlockNode: translate_block,
+        DoNode: translate_do,
+        BreakNode: translate_break,
+        ContinueNode: translate_continue,
+        ReturnNode: translate_return,
+        AssertNode: translate_assert,
+        ThrowNode: translate_throw,
+        VarNode: translate_var,
+        ConstNode: translate_var,
+        FuncDefNode: translate_definition,
+        AliasNode: translate_definition,
+        EnumNode: translate_definition,
+        ClassNode: translate_definition,
+        str: translate_definition,
+        unicode: translate_definition,
+        }
+
+    ##################################################################
+    # 代入
+    ##################################################################
+
+    def chained_value(self, node, out):
+        """
+        Return the value of `node`, an assignment being done first.
+
+        Python has no assignment expression: the value of an assignment
+        to a local variable is read from it after the assignment.
+        """
+        if _is_assign(node) and type(node.operands[0]) is SymbolNode and \
+                self.store_target(node.operands[0].symbol) is not None:
+            self.translate_assign(node, out)
+            return _load("v_" + node.operands[0].symbol)
+        return self.value(node)
+
+    def compound(self, op, current, value):
+        if op in COMPOUND_OPERATORS_AST:
+            return ast.BinOp(current, COMPOUND_OPERATORS_AST[op](), value)
+        return _call(COMPOUND_HELPERS[op], current, value)
+
+    def translate_assign(self, node, out):
+        op = node.operator.symbol
+        target, value = node.operands
+        if type(target) is SymbolNode:
+            name = target.symbol
+            store = self.store_target(name)
+            if store is None:
+                out.append(ast.Expr(self.assign_value(node)))
+                return
+            if op == "::":
+                value = self.chained_value(value, out)
+            else:
+                value = self.compound(op, _load("v_" + name),
+                                      self.value(value))
+            out.append(_assign(store, value))
+        elif type(target) is ArrayNode:
+            array = _load("v_" + target.array.symbol)
+            index = self.value(target.index)
+            if not _simple(index) or _has_effects(value):
+                # 添字を値より先に評価する
+                temp = self.temp("index")
+                out.append(_assign(temp, index))
+                index = _load(temp)
+            index = self.checked_index(array, index)
+            if op == "::":
+                value = self.value(value)
+            else:
+                value = self.compound(op, ast.Subscript(
+                        array, ast.Index(index), ast.Load()),
+                                      self.value(value))
+            out.append(_assign(ast.Subscript(array, ast.Index(index),
+                                             ast.Store()), value))
+        else:
+            out.append(ast.Expr(self.error("can't assign to %r" % (target,))))
+
+    def assign_value(self, node):
+        # 式の中の代入
+        op = node.operator.symbol
+        target, value = node.operands
+        if type(target) is SymbolNode:
+            name = target.symbol
+            if self.store_target(name) is not None and name in self.locals:
+                return self.error("assignment to a local variable in an "
+                                  "expression is not supported")
+            if op != "::":
+                value = self.compound(op, _load("v_" + name),
+                                      self.value(value))
+            else:
+                value = self.value(value)
+            return _call("_set_global", ast.Str(name), value)
+        if type(target) is ArrayNode:
+            array = _load("v_" + target.array.symbol)
+            if op == "::":
+                return _call("_set_item", array, self.value(target.index),
+                             self.value(value))
+            return _call("_update_item", array, self.value(target.index),
+                         ast.Str(op), self.value(value))
+        return self.error("can't assign to %r" % (target,))
+
+    ##################################################################
+    # 式
+    ##################################################################
+
+    def value(self, node):
+        """Return the Python expression of the Kuin expression `node`."""
+        return self.expression_translators[type(node)](self, node)
+
+    def test(self, node):
+        """Return the expression of `node` used as a condition."""
+        if type(node) is ExprNode:
+            op = node.operator.symbol
+            if op == "&" or op == "|":
+                return ast.BoolOp(ast.And() if op == "&" else ast.Or(),
+                                  [self.test(operand)
+                                   for operand in node.operands])
+            if op == "!" and len(node.operands) == 1:
+                return ast.UnaryOp(ast.Not(), self.test(node.operands[0]))
+        return self.value(node)
+
+    def checked_index(self, array, index):
+        if not _simple(index):
+            return _call("_check_index", array, index)
+        if type(index) is ast.Num and index.n >= 0:
+            test = ast.Compare(index, [ast.Lt()], [_call("len", array)])
+        else:
+            test = ast.Compare(ast.Num(0), [ast.LtE(), ast.Lt()],
+                               [index, _call("len", array)])
+        return ast.IfExp(test, index, _call("_check_index", array, index))
+
+    def translate_literal(self, node):
+        return _literal(node)
+
+    def translate_symbol(self, node):
+        return _load("v_" + node.symbol)
+
+    def translate_expr(self, node):
+        op = node.operator.symbol
+        special = self.special_forms.get(op)
+        if special is not None:
+            return special(self, node)
+        operands = [self.value(operand) for operand in node.operands]
+        if len(operands) == 1:
+            return ast.UnaryOp(UNARY_OPERATORS_AST[op](), operands[0])
+        left, right = operands
+        if op in BINARY_OPERATORS_AST:
+            return ast.BinOp(left, BINARY_OPERATORS_AST[op](), right)
+        if op in COMPARE_OPERATORS_AST:
+            return ast.Compare(left, [COMPARE_OPERATORS_AST[op]()], [right])
+        if op == "%" and type(right) is ast.Num and right.n > 0 and \
+                _simple(left):
+            # 負でない数の剰余は Python と同じ
+            return ast.IfExp(
+                ast.Compare(left, [ast.GtE()], [ast.Num(0)]),
+                ast.BinOp(left, ast.Mod(), right),
+                _call("_modulo", left, right))
+        return _call(BINARY_HELPERS[op], left, right)
+
+    def translate_assign_expr(self, node):
+        return self.assign_value(node)
+
+    def translate_logical(self, node):
+        return _call("bool", self.test(node))
+
+    def translate_ternary(self, node):
+        cond, true_body, false_body = node.operands
+        return ast.IfExp(self.test(cond), self.value(true_body),
+                         self.value(false_body))
+
+    def translate_cast(self, node):
+        value, typename = node.operands
+        if type(typename) is SymbolNode:
+            name = typename.symbol
+        elif type(typename) is ArrayTypeNode and len(typename.size) == 1 \
+                and getattr(typename.base_type, "symbol", None) == "char":
+            name = "[]char"
+        else:
+            return self.error("unsupported cast to %r" % (typename,))
+        return _call("_cast", self.value(value), ast.Str(name))
+
+    def translate_class_check(self, node):
+        return self.error("classes are not supported")
+
+    special_forms = dict([(op, translate_assign_expr)
+                          for op in ASSIGN_OPERATORS])
+    special_forms.update({
+        "&": translate_logical,
+        "|": translate_logical,
+        "?()": translate_ternary,
+        "$": translate_cast,
+        "@is": translate_class_check,
+        "@nis": translate_class_check,
+        })
+
+    def translate_call(self, node):
+        args = [self.value(arg) for arg in node.args]
+        name = node.funcname.symbol
+        arity = self.arities.get(name)
+        if arity is None:
+            # 組み込み関数か前に実行したプログラムの関数
+            func = _call("_function", ast.Str(name))
+        elif arity != len(args):
+            return self.error("%s() takes %d arguments (%d given)" % (
+                    name, arity, len(args)))
+        else:
+            func = _load("f_" + name)
+        return ast.Call(func, args, [], None, None)
+
+    def translate_index(self, node):
+        array = _load("v_" + node.array.symbol)
+        index = self.checked_index(array, self.value(node.index))
+        return ast.Subscript(array, ast.Index(index), ast.Load())
+
+    def translate_new(self, node):
+        typename = node.type
+        if type(typename) is not ArrayTypeNode or None in typename.size:
+            return self.error("can't create %r" % (typename,))
+        base_type = getattr(typename.base_type, "symbol", None)
+        return _call("_new_array",
+                     ast.List([self.value(size) for size in typename.size],
+                              ast.Load()),
+                     _literal(base_type))
+
+    expression_translators = {
+        int: translate_literal,
+        long: translate_literal,
+        float: translate_literal,
+        bool: translate_literal,
+        str: translate_literal,
+        unicode: translate_literal,
+        type(None): translate_literal,
+        SymbolNode: translate_symbol,
+        ExprNode: translate_expr,
+        FuncNode: translate_call,
+        ArrayNode: translate_index,
+        NewNode: translate_new,
+        }
+
+
+######################################################################
+# コードのキャッシュ
+######################################################################
+
+def compile_sentences(sentences, debug=True, filename="<kuin>"):
+    """Return the Python code object of the program `sentences`."""
+    module = Translator(debug).translate(sentences)
+    return compile(module, filename, "exec")
+
+
+# メモリに置くコードの数の既定値
+DEFAULT_CODE_CACHE_SIZE = 128
+
+
+class CodeCache(object):
+    """
+    Code objects of translated programs, keyed by the hash of the source.
+
+    At most `size` code objects are kept in memory (all of them if
+    `size` is None), the least recently used being dropped first.  If
+    `directory` is given they are also marshalled to it so that other
+    processes can load them.
+    """
+
+    MAGIC = "KNPY1\n" + imp.get_magic()
+    ENTRY_EXT = ".kpyc"
+
+    def __init__(self, directory=None, size=DEFAULT_CODE_CACHE_SIZE):
+        if size is not None and size < 0:
+            raise ValueError("cache size must be non-negative: %r" % size)
+        self.directory = directory
+        self.size = size
+        self.codes = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, text, debug):
+        return "%s-%s-%s" % (source_key(text), TRANSLATOR_VERSION,
+                             "debug" if debug else "release")
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.ENTRY_EXT)
+
+    def get(self, text, debug=True):
+        """Return the cached code of `text`, or None."""
+        key = self.key(text, debug)
+        code = self.codes.pop(key, None)
+        if code is None and self.directory is not None:
+            try:
+                with open(self.path(key), "rb") as f:
+                    data = f.read()
+                if data.startswith(self.MAGIC):
+                    code = marshal.loads(data[len(self.MAGIC):])
+            except (IOError, ValueError, EOFError, TypeError):
+                code = None
+        if code is not None:
+            # 最近使ったものとして入れ直す
+            self.keep(key, code)
+        if code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return code
+
+    def set(self, text, debug, code):
+        key = self.key(text, debug)
+        self.codes.pop(key, None)
+        self.keep(key, code)
+        if self.directory is None:
+            return
+        fd, tmp = tempfile.mkstemp(self.ENTRY_EXT + ".tmp", "",
+                                   self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.MAGIC + marshal.dumps(code))
+            os.rename(tmp, self.path(key))
+        except:
+            os.unlink(tmp)
+            raise
+
+    def keep(self, key, code):
+        if self.size == 0:
+            return
+        codes = self.codes
+        codes[key] = code
+        if self.size is not None:
+            while len(codes) > self.size:
+                codes.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        self.codes.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(self.ENTRY_EXT):
+                    os.unlink(os.path.join(self.directory, name))
+
+    def __repr__(self):
+        return "<CodeCache %d codes hits=%d misses=%d>" % (
+            len(self.codes), self.hits, self.misses)
+
+
+# compile_text が既定で使うキャッシュ
+default_cache = CodeCache()
+
+
+def compile_text(text, debug=True, backend="fast", cache=None):
+    """Return the code object of the program `text`, cached by its hash."""
+    from kuin.parser import parse_stmt
+    if cache is None:
+        cache = default_cache
+    code = cache.get(text, debug)
+    if code is None:
+        code = compile_sentences(parse_stmt(text, backend=backend), debug)
+        cache.set(text, debug, code)
+    return code
+
+
+######################################################################
+# 実行
+######################################################################
+
+def _inclusive_range(start, end, step):
+    # 終わりの値も含む
+    if step == 0:
+        raise InterpreterError("step of for is 0")
+    stop = end + 1 if step > 0 else end - 1
+    try:
+        return xrange(start, stop, step)
+    except (TypeError, OverflowError):
+        return _range_values(start, end, step)
+
+
+def _range_values(i, end, step):
+    while (i <= end) if step > 0 else (i >= end):
+        yield i
+        i += step
+
+
+def _error(message):
+    raise InterpreterError(message)
+
+
+def _assert_failed():
+    raise KuinError(ASSERT_FAILED, "assertion failed")
+
+
+def _set_item(array, index, value):
+    array[check_index(array, index)] = value
+    return value
+
+
+def _update_item(array, index, op, value):
+    index = check_index(array, index)
+    value = array[index] = COMPOUND_OPERATORS[op](array[index], value)
+    return value
+
+
+def _cast(value, name):
+    if name == "[]char":
+        return to_str(value)
+    return cast(value, symbol(name))
+
+
+def _new_array(sizes, base_type):
+    return new_array(sizes, base_type and symbol(base_type))
+
+
+# NameError のメッセージの中の名前
+_name_error = re.compile(r"'(v_[^']+)'")
+
+
+class Runner(object):
+    """
+    Translate and run Kuin sentences as Python code.
+
+    The options are those of kuin.interpreter.Interpreter; `debug` is
+    applied when translating.
+    """
+
+    def __init__(self, builtins=None, debug=True, out=None):
+        self.debug = debug
+        self.out = out or sys.stdout
+        self.builtins = {"print": self.print_value, "len": len}
+        if builtins:
+            self.builtins.update(builtins)
+        self.namespace = {
+            "_KuinError": KuinError,
+            "_range": _inclusive_range,
+            "_divide": divide,
+            "_modulo": modulo,
+            "_concat": concat,
+            "_check_index": check_index,
+            "_error": _error,
+            "_assert_failed": _assert_failed,
+            "_set_item": _set_item,
+            "_update_item": _update_item,
+            "_cast": _cast,
+            "_new_array": _new_array,
+            "_function": self.function,
+            "_set_global": self.set_global,
+            "_define_global": self.define_global,
+            }
+
+    def print_value(self, value):
+        self.out.write(to_str(value))
+
+    @property
+    def globals(self):
+        """The global variables, by name."""
+        return dict([(name[2:], value)
+                     for name, value in self.namespace.items()
+                     if name.startswith("v_")])
+
+    @property
+    def functions(self):
+        """The Python functions of the program, by name."""
+        return dict([(name[2:], value)
+                     for name, value in self.namespace.items()
+                     if name.startswith("f_")])
+
+    def function(self, name):
+        func = self.namespace.get("f_" + name)
+        if func is None:
+            func = self.builtins.get(name)
+            if func is None:
+                raise InterpreterError("undefined function: %s" % name)
+        return func
+
+    def set_global(self, name, value):
+        if "v_" + name not in self.namespace:
+            raise InterpreterError("undefined variable: %s" % name)
+        self.namespace["v_" + name] = value
+        return value
+
+    def define_global(self, name, value):
+        self.namespace["v_" + name] = value
+
+    def run(self, sentences):
+        """Execute the top-level `sentences`; return the value returned."""
+        return self.execute(compile_sentences(sentences, self.debug))
+
+    def execute(self, code):
+        """Execute a code object made by compile_sentences."""
+        exec code in self.namespace
+        return self.call_function(self.namespace["_main"], [])
+
+    def call(self, name, *args):
+        """Call the function `name` of the program."""
+        func = self.namespace.get("f_" + name)
+        if func is None:
+            raise InterpreterError("undefined function: %s" % name)
+        nparams = func.func_code.co_argcount
+        if len(args) != nparams:
+            raise InterpreterError("%s() takes %d arguments (%d given)" % (
+                    name, nparams, len(args)))
+        return self.call_function(func, args)
+
+    def call_function(self, func, args):
+        try:
+            return func(*args)
+        except NameError as e:
+            # 宣言より前に使われた変数 (v_ の付いた名前) だけを変換し、
+            # それ以外 (組み込み関数の中のバグなど) はそのまま送出する
+            match = _name_error.search(str(e))
+            if match is None:
+                raise
+            raise InterpreterError("undefined variable: %s" %
+                                   match.group(1)[2:])
+
+
+def run(text, backend="fast", cache=None, **options):
+    """Translate and run `text`; return the Runner (see its options)."""
+    runner = Runner(**options)
+    runner.execute(compile_text(text, runner.debug, backend, cache))
+    return runner
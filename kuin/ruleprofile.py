@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""Per-rule profile of the pyparsing grammar.
+
+:class:`RuleProfile` counts, for each named rule of kuin.parser
+(``If``, ``Switch``, ``Expr``, ``Type``, ``ClassName``, ``Comment``...)
+and each precedence level of the expression engines, the attempts to
+parse it, their successes and failures, the attempts repeated at a
+location already tried (backtracks) and the time spent in it, while the
+``with`` block runs::
+
+    with RuleProfile() as profile:
+        parse_stmt(text)
+    print profile.table()
+    json.dump(profile.as_dict(), f)
+
+The parse method is only replaced inside the block, so that parsing
+without a profile costs nothing; the parses of every thread are counted
+while it is replaced.  The replacement adds a frame to each parse
+call, so the block also raises the recursion limit.  The time of a rule includes the rules
+it calls; a recursive rule is timed in its outermost attempt only.
+
+The expression levels are named ``Expr level N``, N being the level of
+kuin.operators: for the "tower" engine the rule matching the operators
+of levels up to N, for the "climbing" engine an operand parsed with the
+operators up to N.  With a packrat cache (``parse_stmt(packrat=...)``)
+only the attempts that are not found in the cache are counted.
+
+From the command line::
+
+    python -m kuin.ruleprofile --engine tower --json - source.kn
+"""
+
+import json
+import sys
+import time
+from optparse import OptionParser
+
+from pyparsing import ParserElement, ParseBaseException
+
+from kuin.parser import (parse_stmt, grammar, PrecedenceExpr, ENGINES,
+                         DEFAULT_EXPR_ENGINE)
+
+__all__ = ['RuleStats', 'RuleProfile', 'LEVEL_NAME']
+
+LEVEL_NAME = "Expr level %d"
+
+# 置き換えた解析で深くなる分、ブロックの中では再帰の上限を上げる
+RECURSION_FACTOR = 2
+
+# table() の列
+COLUMNS = ("attempts", "successes", "failures", "backtracks", "seconds")
+
+
+class RuleStats(object):
+    """The counters of one rule."""
+
+    __slots__ = ("name", "attempts", "successes", "failures", "backtracks",
+                 "seconds", "active", "tried")
+
+    def __init__(self, name):
+        self.name = name
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.backtracks = 0
+        self.seconds = 0.0
+        # 実行中の呼び出しの深さ
+        self.active = 0
+        # 試した位置
+        self.tried = set()
+
+    def as_dict(self):
+        return dict([(column, getattr(self, column)) for column in COLUMNS])
+
+    def __repr__(self):
+        return "<RuleStats %s %d/%d %.4fs>" % (
+            self.name, self.successes, self.attempts, self.seconds)
+
+
+class RuleProfile(object):
+    """
+    Profile rules of the grammar while installed.
+
+    `names` are the names given with setName() to the rules to profile
+    (kuin.grammar.PROFILED_RULES by default); `elements` maps names to
+    other pyparsing elements, matched by identity (the operands and the
+    levels of the tower engine by default).
+    """
+
+    def __init__(self, names=None, elements=None):
+        if names is None:
+            names = grammar().profiled_rules
+        if elements is None:
+            elements = {"Primary": grammar().primary}
+            for level, element in grammar().tower_levels.items():
+                elements[LEVEL_NAME % level] = element
+        self.stats = {}
+        self.by_name = dict([(name, self.rule(name)) for name in names])
+        self.by_element = dict([(id(element), self.rule(name))
+                                for name, element in elements.items()])
+        self.instring = None
+
+    def rule(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = RuleStats(name)
+        return stats
+
+    def enter(self, stats, instring, loc):
+        # 一つの規則の試行を数え始め、始めた時刻を返す
+        if instring is not self.instring:
+            # 別の入力: 試した位置を忘れる
+            self.instring = instring
+            for other in self.stats.values():
+                other.tried.clear()
+        stats.attempts += 1
+        if loc in stats.tried:
+            stats.backtracks += 1
+        else:
+            stats.tried.add(loc)
+        stats.active += 1
+        return time.time()
+
+    def leave(self, stats, start):
+        stats.active -= 1
+        if not stats.active:
+            stats.seconds += time.time() - start
+
+    def record(self, stats, instring, loc, call, *args):
+        # 一つの規則の試行を数えて call(*args) を返す
+        start = self.enter(stats, instring, loc)
+        try:
+            result = call(*args)
+        except ParseBaseException:
+            stats.failures += 1
+            raise
+        else:
+            stats.successes += 1
+            return result
+        finally:
+            self.leave(stats, start)
+
+    def wrap_parse(self, saved):
+        by_name = self.by_name
+        by_element = self.by_element
+        enter = self.enter
+        leave = self.leave
+
+        # 深い入力でも再帰が深くなりすぎないよう、要素ごとに足す
+        # フレームはこの関数の一つだけにする (record を通さない)
+        def _parse(element, instring, loc, doActions=True,
+                   callPreParse=True):
+            stats = by_element.get(id(element))
+            if stats is None:
+                stats = by_name.get(element.__dict__.get("name"))
+                if stats is None:
+                    return saved(element, instring, loc, doActions,
+                                 callPreParse)
+            start = enter(stats, instring, loc)
+            try:
+                result = saved(element, instring, loc, doActions,
+                               callPreParse)
+            except ParseBaseException:
+                stats.failures += 1
+                raise
+            else:
+                stats.successes += 1
+                return result
+            finally:
+                leave(stats, start)
+
+        return _parse
+
+    def wrap_level(self, saved):
+        rule = self.rule
+        record = self.record
+
+        def parse_level(engine, instring, loc, doActions, max_level):
+            return record(rule(LEVEL_NAME % max_level), instring, loc,
+                          saved, engine, instring, loc, doActions, max_level)
+
+        return parse_level
+
+    def __enter__(self):
+        self.saved = (ParserElement.__dict__['_parse'],
+                      ParserElement.__dict__['_parseNoCache'],
+                      PrecedenceExpr.__dict__['parse_level'])
+        parse, parse_no_cache, parse_level = self.saved
+        ParserElement._parse = self.wrap_parse(parse)
+        if parse is parse_no_cache:
+            # 中で入れた kuin.packrat.memoize も _parseNoCache を呼ぶ
+            ParserElement._parseNoCache = ParserElement.__dict__['_parse']
+        PrecedenceExpr.parse_level = self.wrap_level(parse_level)
+        self.limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(self.limit * RECURSION_FACTOR)
+        return self
+
+    def __exit__(self, *exc_info):
+        (ParserElement._parse, ParserElement._parseNoCache,
+         PrecedenceExpr.parse_level) = self.saved
+        sys.setrecursionlimit(self.limit)
+
+    ##################################################################
+    # 結果
+    ##################################################################
+
+    def results(self, key="seconds"):
+        """Return the RuleStats of the rules tried, sorted by `key`."""
+        if key not in COLUMNS and key != "name":
+            raise ValueError("unknown column: %r" % key)
+        results = [stats for stats in self.stats.values() if stats.attempts]
+        if key == "name":
+            return sorted(results, key=lambda stats: stats.name)
+        return sorted(results,
+                      key=lambda stats: (-getattr(stats, key), stats.name))
+
+    def as_dict(self):
+        """Return the counters as a dict of dicts, for JSON."""
+        return dict([(stats.name, stats.as_dict())
+                     for stats in self.results()])
+
+    def table(self, key="seconds", limit=None):
+        """Return the counters as a text table sorted by `key`."""
+        lines = ["%-16s %9s %9s %9s %10s %9s" % (("rule",) + COLUMNS)]
+        for stats in self.results(key)[:limit]:
+            lines.append("%-16s %9d %9d %9d %10d %9.4f" % (
+                    stats.name, stats.attempts, stats.successes,
+                    stats.failures, stats.backtracks, stats.seconds))
+        return "\n".join(lines)
+
+
+def main(argv):
+    parser = OptionParser("usage: %prog [options] FILE...")
+    parser.add_option("--engine", choices=ENGINES,
+                      default=DEFAULT_EXPR_ENGINE,
+                      help="expression engine (default: %default)")
+    parser.add_option("--sort", default="seconds",
+                      choices=("name",) + COLUMNS,
+                      help="column to sort the table by (default: %default)")
+    parser.add_option("--json", metavar="FILE",
+                      help="write the counters as JSON ('-': stdout)")
+    options, args = parser.parse_args(argv[1:])
+    if not args:
+        parser.error("no source file")
+    with RuleProfile() as profile:
+        for path in args:
+            parse_stmt(path=path, engine=options.engine)
+    if options.json == "-":
+        json.dump(profile.as_dict(), sys.stdout, indent=2, sort_keys=True,
+                  separators=(",", ": "))
+        print
+    else:
+        if options.json:
+            with open(options.json, "w") as f:
+                json.dump(profile.as_dict(), f, indent=2, sort_keys=True,
+                          separators=(",", ": "))
+        print profile.table(options.sort)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
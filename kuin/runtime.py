@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""Values and operations shared by the executors of Kuin programs.
+
+Kuin values are represented by Python values: ``int`` and ``float``,
+``bool``, a one character ``str`` for ``char``, ``str`` for ``[]char``
+literals and lists for the arrays made by ``@new``.  The tables map the
+operators of kuin.operators to the functions implementing them.
+"""
+
+import operator
+
+from kuin.nodes import SymbolNode, ArrayTypeNode
+
+__all__ = [
+    'KuinError', 'InterpreterError',
+    'ASSERT_FAILED', 'INDEX_OUT_OF_RANGE', 'DIVISION_BY_ZERO',
+    'UNARY_OPERATORS', 'BINARY_OPERATORS', 'COMPOUND_OPERATORS',
+    'default_value', 'new_array', 'cast', 'to_str',
+]
+
+# 実行時に送出される例外のコード
+ASSERT_FAILED = 0xE9170000
+INDEX_OUT_OF_RANGE = 0xE9170002
+DIVISION_BY_ZERO = 0xE917000A
+
+
+class KuinError(Exception):
+    """An exception thrown by a Kuin program (``throw code, message``)."""
+
+    def __init__(self, code, message=None):
+        Exception.__init__(self, code, message)
+        self.code = code
+        self.message = message
+
+    def __str__(self):
+        if self.message is None:
+            return "exception 0x%08X" % self.code
+        return "exception 0x%08X: %s" % (self.code, self.message)
+
+
+class InterpreterError(Exception):
+    """A program that can't be run: undefined name, unsupported node..."""
+
+
+######################################################################
+# 演算
+######################################################################
+
+def divide(a, b):
+    # 整数の除算は 0 方向に切り捨てる
+    if b == 0:
+        raise KuinError(DIVISION_BY_ZERO, "division by zero")
+    if isinstance(a, float) or isinstance(b, float):
+        return a / b
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def modulo(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        if b == 0:
+            raise KuinError(DIVISION_BY_ZERO, "division by zero")
+        return a - b * int(a / b)
+    return a - b * divide(a, b)
+
+
+def concat(a, b):
+    if type(a) is not type(b):
+        return list(a) + list(b)
+    return a + b
+
+
+def check_index(array, index):
+    if not 0 <= index < len(array):
+        raise KuinError(INDEX_OUT_OF_RANGE, "index out of range: %d" % index)
+    return index
+
+
+UNARY_OPERATORS = {
+    "+": operator.pos,
+    "-": operator.neg,
+    "!": operator.not_,
+    }
+
+BINARY_OPERATORS = {
+    "*": operator.mul,
+    "/": divide,
+    "%": modulo,
+    "+": operator.add,
+    "-": operator.sub,
+    "~": concat,
+    "=": operator.eq,
+    "<>": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    }
+
+# 複合代入 (a :+ b は a :: a + b)
+COMPOUND_OPERATORS = {
+    ":+": operator.add,
+    ":-": operator.sub,
+    ":*": operator.mul,
+    ":/": divide,
+    ":%": modulo,
+    ":^": operator.pow,
+    ":~": concat,
+    }
+
+
+######################################################################
+# 型
+######################################################################
+
+# 初期値を省略した変数の値
+DEFAULT_VALUES = {
+    "int": 0,
+    "byte": 0,
+    "float": 0.0,
+    "bool": False,
+    "char": "\0",
+    }
+
+
+def default_value(typename):
+    """Return the value of a variable of `typename` declared without one."""
+    if type(typename) is SymbolNode:
+        return DEFAULT_VALUES.get(typename.symbol)
+    return None
+
+
+def new_array(sizes, base_type):
+    """Return the array ``@new [sizes[0]][sizes[1]]...base_type``."""
+    if not sizes:
+        return default_value(base_type)
+    return [new_array(sizes[1:], base_type) for i in range(sizes[0])]
+
+
+def to_str(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, list):
+        return "".join([to_str(item) for item in value])
+    return str(value)
+
+
+def cast(value, typename):
+    """Return `value` converted by ``value $ typename``."""
+    if type(typename) is SymbolNode:
+        name = typename.symbol
+        if name in ("int", "byte"):
+            if isinstance(value, str):
+                return ord(value) if len(value) == 1 else int(value)
+            return int(value)
+        if name == "float":
+            return float(value)
+        if name == "char":
+            return chr(value) if isinstance(value, (int, long)) else value
+        if name == "bool":
+            return bool(value)
+    elif type(typename) is ArrayTypeNode and len(typename.size) == 1 and \
+            getattr(typename.base_type, "symbol", None) == "char":
+        return to_str(value)
+    raise InterpreterError("unsupported cast to %r" % typename)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""Snapshots of the pyparsing grammar.
+
+Building the grammar (importing kuin.grammar) creates thousands of
+pyparsing elements.  A snapshot stores them pickled, so that another
+process loads them instead of building them again::
+
+    load_grammar(".kuin-grammar")   # kuin.parser; written when missing
+
+A snapshot is only loaded by the Python and pyparsing versions, and
+from the grammar sources, it was made with (see :func:`grammar_key`).
+It is a pickle: only load the snapshots you wrote.
+"""
+
+import cPickle
+import hashlib
+import os
+import sys
+import types
+from cStringIO import StringIO
+
+import pyparsing
+
+from kuin.parser import GRAMMAR_VERSION
+
+__all__ = ['dumps', 'loads', 'load_snapshot', 'save_snapshot',
+           'grammar_key']
+
+# 先頭に置く形式の識別子; 形式を変えたら番号を上げる
+MAGIC = "KNGS1\n"
+
+# 文法の形を決めるソース
+GRAMMAR_SOURCES = ("grammar.py", "parser.py", "operators.py")
+
+# 文法は深く入れ子になっているので、保存するときだけ再帰の上限を上げる
+RECURSION_LIMIT = 20000
+
+_key = None
+
+
+def grammar_key():
+    """Return the hash of the versions and sources a snapshot needs."""
+    global _key
+    if _key is None:
+        h = hashlib.sha1(GRAMMAR_VERSION)
+        for part in (sys.version, pyparsing.__version__):
+            h.update("\0" + part)
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in GRAMMAR_SOURCES:
+            with open(os.path.join(directory, name), "rb") as f:
+                h.update("\0" + f.read())
+        _key = h.hexdigest()
+    return _key
+
+
+def _header():
+    return MAGIC + grammar_key() + "\n"
+
+
+######################################################################
+# 保存
+######################################################################
+
+def _pyparsing_value(value):
+    return type(value).__module__ == pyparsing.__name__
+
+
+def _singletons():
+    # pyparsing が同一性で比べる値 (Optional の既定値など)
+    for name, value in vars(pyparsing).items():
+        if _pyparsing_value(value):
+            yield name, value
+    for name, cls in vars(pyparsing).items():
+        if isinstance(cls, type) and cls.__module__ == pyparsing.__name__:
+            for attr, value in vars(cls).items():
+                if _pyparsing_value(value):
+                    yield "%s.%s" % (name, attr), value
+
+
+def _parse_action(func):
+    return pyparsing._trim_arity(func)
+
+
+def _action_probe():
+    pass
+
+# setParseAction が解析動作を包む関数のコード
+_WRAPPER_CODE = pyparsing._trim_arity(_action_probe).func_code
+
+
+def _pickler(file):
+    # 保存するときだけ pickle (Python で書かれた Pickler) を読み込む
+    import pickle
+
+    class Pickler(pickle.Pickler):
+        # 文法の要素が持つ関数とメソッドを名前で保存する
+
+        dispatch = pickle.Pickler.dispatch.copy()
+        dispatch[types.FunctionType] = _save_function
+        dispatch[types.MethodType] = _save_method
+        dispatch[types.BuiltinMethodType] = _save_builtin
+
+        def __init__(self, file):
+            pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+            self.singletons = dict([(id(value), name)
+                                    for name, value in _singletons()])
+
+        def persistent_id(self, obj):
+            return self.singletons.get(id(obj))
+
+    return Pickler(file)
+
+
+def _save_function(self, obj):
+    if obj.func_code is _WRAPPER_CODE:
+        # 包まれた解析動作を保存し、読むときに包み直す
+        cell = obj.func_closure[_WRAPPER_CODE.co_freevars.index("func")]
+        return self.save_reduce(_parse_action, (cell.cell_contents,),
+                                obj=obj)
+    return self.save_global(obj)
+
+
+def _save_method(self, obj):
+    # IfNode.parse などのクラスメソッド
+    return self.save_reduce(getattr, (obj.im_self, obj.__name__), obj=obj)
+
+
+def _save_builtin(self, obj):
+    # Regex の re_match など
+    owner = obj.__self__
+    if owner is None or isinstance(owner, types.ModuleType):
+        return self.save_global(obj)
+    return self.save_reduce(getattr, (owner, obj.__name__), obj=obj)
+
+
+def dumps(grammar):
+    """Return the snapshot of a kuin.parser.Grammar, as a str."""
+    f = StringIO()
+    f.write(_header())
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        _pickler(f).dump(grammar)
+    finally:
+        sys.setrecursionlimit(limit)
+    return f.getvalue()
+
+
+def save_snapshot(grammar, path):
+    """Write the snapshot of `grammar` to the file `path`."""
+    import tempfile
+    data = dumps(grammar)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(".tmp", "", directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # 同時に書くプロセスがあっても壊れたファイルは見えない
+        os.rename(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+
+######################################################################
+# 読み込み
+######################################################################
+
+def _singleton(name):
+    value = pyparsing
+    for attr in name.split("."):
+        value = getattr(value, attr)
+    return value
+
+
+def loads(data):
+    """
+    Return the grammar of a snapshot; raise ValueError if it was made
+    from another grammar, Python or pyparsing.
+
+    Each call returns new elements, shared with no other grammar.
+    """
+    header = _header()
+    if not data.startswith(header):
+        raise ValueError("not a snapshot of this grammar")
+    unpickler = cPickle.Unpickler(StringIO(data[len(header):]))
+    unpickler.persistent_load = _singleton
+    return unpickler.load()
+
+
+def load_snapshot(path):
+    """Return the grammar of the snapshot `path`, or None if unusable."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        return loads(data)
+    except (IOError, ValueError, EOFError, AttributeError, ImportError,
+            cPickle.UnpicklingError):
+        return None
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""Source locations of parsed nodes.
+
+A :class:`SourceMap` is filled while a text is parsed: every node gets the
+index of its span in the per-file ``starts``/``ends`` offset arrays, so a
+node only carries a single integer.  Line/column lookups use a table of
+line start offsets built once per file::
+
+    source_map = SourceMap(text)
+    tree = parse_stmt(text, source_map=source_map)
+    print source_map.span(tree[0]), source_map.location(tree[0])
+"""
+
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+
+from kuin.nodes import Node, fresh_symbols, interned
+from kuin.packrat import install_parse
+
+__all__ = ['SourceMap', 'locate']
+
+_newline_re = re.compile(r'\n')
+
+_blanks = " \t\n\v\f\r"
+
+
+class SourceMap(object):
+    """Start/end offsets of the nodes parsed from one text."""
+
+    def __init__(self, text):
+        self.text = text
+        self.starts = array('l')
+        self.ends = array('l')
+        self._line_starts = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, node, start, end):
+        """Record that `node` spans ``text[start:end]``."""
+        node.span_index = len(self.starts)
+        self.starts.append(start)
+        self.ends.append(end)
+        return node
+
+    def span(self, node):
+        """Return ``(start, end)`` of `node`, or None if it has no span."""
+        i = getattr(node, "span_index", -1)
+        if i < 0:
+            return None
+        return self.starts[i], self.ends[i]
+
+    @property
+    def line_starts(self):
+        if self._line_starts is None:
+            line_starts = array('l', [0])
+            line_starts.extend(
+                [m.end() for m in _newline_re.finditer(self.text)])
+            self._line_starts = line_starts
+        return self._line_starts
+
+    def position(self, offset):
+        """Return the 1-based ``(line, column)`` of a text offset."""
+        line_starts = self.line_starts
+        line = bisect_right(line_starts, offset)
+        return line, offset - line_starts[line - 1] + 1
+
+    def location(self, node):
+        """Return the ``(line, column)`` where `node` starts, or None."""
+        span = self.span(node)
+        if span is None:
+            return None
+        return self.position(span[0])
+
+    def __repr__(self):
+        return "<SourceMap %d spans>" % len(self.starts)
+
+
+######################################################################
+# pyparsing
+######################################################################
+
+class _Locator(object):
+    # 一番内側の要素が返したノードの位置を記録する。外側の要素は同じ
+    # ノードをそのまま返すだけなので、記録済みのものは上書きしない。
+    # (id が再利用されないよう、記録したノードは解析中保持する)
+    def __init__(self, source_map):
+        self.source_map = source_map
+        self.seen = {}
+
+    def add(self, node, start, end):
+        if id(node) not in self.seen:
+            self.seen[id(node)] = node
+            # 全ての木が共有する記号 (IfdefNode.debug など) には記録しない
+            if not interned(node):
+                self.source_map.add(node, start, end)
+
+
+# スレッドごとの locate の入れ子 (locators)
+_local = threading.local()
+
+
+def current_locator():
+    """
+    Return the locator of the innermost `locate` block of the current
+    thread, if any.
+    """
+    locators = getattr(_local, "locators", None)
+    if locators:
+        return locators[-1]
+    return None
+
+
+def _make_parse_method(element, parse, locator):
+    def _parse(instring, loc, doActions=True, callPreParse=True):
+        start = loc
+        loc, tokens = parse(instring, loc, doActions, callPreParse)
+        if doActions:
+            preloc = None
+            for token in tokens:
+                if isinstance(token, Node) and id(token) not in locator.seen:
+                    if preloc is None:
+                        if callPreParse and element.callPreparse:
+                            preloc = element.preParse(instring, start)
+                        else:
+                            preloc = start
+                        # Combine の内側などは空白を読み飛ばさない
+                        while preloc < loc and instring[preloc] in _blanks:
+                            preloc += 1
+                    locator.add(token, preloc, loc)
+        return loc, tokens
+
+    return _parse
+
+
+@contextmanager
+def locate(source_map, elements):
+    """Record the spans of the nodes built inside the ``with`` block.
+
+    Like kuin.packrat.memoize this temporarily gives `elements` (the
+    elements of the grammar being parsed) their own parse method; it does
+    nothing if `source_map` is None.
+    Symbols are not interned inside the block (see kuin.nodes.symbol).
+    """
+    if source_map is None:
+        yield None
+        return
+    locator = _Locator(source_map)
+    locators = getattr(_local, "locators", None)
+    if locators is None:
+        locators = _local.locators = []
+    locators.append(locator)
+    try:
+        with install_parse(elements, lambda element, parse:
+                           _make_parse_method(element, parse, locator)), \
+                fresh_symbols():
+            yield locator
+    finally:
+        locators.pop()
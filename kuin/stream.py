@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""Reading large sources.
+
+:func:`iter_stmts` reads a source from a file object by chunks and
+yields each top-level sentence as soon as it is complete, so that a
+large source is processed without holding its text or its whole tree::
+
+    with open("generated.kn", "rb") as f:
+        for sentence in iter_stmts(f):
+            ...
+
+Sentences are parsed with the token backend (kuin.fastparser); the trees
+are the same as the ones ``parse_stmt`` builds.
+
+:func:`mapped_source` maps a file in memory instead of reading it; the
+tokenizer matches its patterns on the mapping directly, so that only the
+names, literals and operators it extracts are copied (this is what
+``parse_stmt(path=...)`` uses).
+"""
+
+import mmap
+from contextlib import contextmanager
+
+from pyparsing import ParseBaseException
+
+from kuin.lexer import tokenize, END, KEYWORD
+from kuin.fastparser import TokenParser
+
+__all__ = ['iter_stmts', 'mapped_source']
+
+CHUNK_SIZE = 64 * 1024
+
+# 最上位の文を始めるキーワード
+SENTENCE_KEYWORDS = frozenset(TokenParser.sentence_dispatch)
+
+
+def iter_stmts(source, chunk_size=CHUNK_SIZE):
+    """
+    Yield the top-level sentences of `source`, a text or an object with
+    a ``read(size)`` method (a file, an mmap...).
+
+    Only the text of the sentence being parsed is kept: a sentence is
+    yielded once the next one has started, or at the end of the source.
+    A syntax error is raised when the rest of the source has been read,
+    with the offsets and line numbers of the whole source; the text of
+    the sentences already yielded is blanked in its ``pstr`` (the
+    newlines are kept, the other characters are spaces).
+    """
+    if isinstance(source, basestring):
+        buffer = source
+        read = None
+    else:
+        buffer = ""
+        read = source.read
+    # buffer の前にある文字と行の数、最後の行で buffer の前にある文字の数
+    dropped = 0
+    line = 0
+    column = 0
+    size = chunk_size
+    while True:
+        if read is not None:
+            chunk = read(size)
+            if chunk:
+                buffer += chunk
+            else:
+                read = None
+        eof = read is None
+        # 最後の行は途中で切れているかもしれない
+        end = len(buffer) if eof else buffer.rfind("\n") + 1
+        cut = 0
+        try:
+            tokens = tokenize(buffer, 0, end)
+            parser = TokenParser(tokens)
+            kinds = tokens.kinds
+            values = tokens.values
+            while kinds[parser.pos] != END:
+                sentence = parser.parse_sentence()
+                pos = parser.pos
+                if not eof and (kinds[pos] != KEYWORD or
+                                values[pos] not in SENTENCE_KEYWORDS):
+                    # 続く行がこの文の続きかもしれない
+                    break
+                cut = tokens.starts[pos]
+                yield sentence
+        except ParseBaseException as e:
+            if eof:
+                # 読み捨てた文字の分だけ位置をずらす
+                padding = " " * (dropped - line - column) + "\n" * line + \
+                    " " * column
+                raise e.__class__(padding + buffer, e.loc + dropped, e.msg)
+            # 切れた注釈や文字列: 続きを読む
+        if eof:
+            return
+        if cut:
+            # 次の文がある行の先頭から残す
+            start = buffer.rfind("\n", 0, cut) + 1
+            if not buffer[start:cut].strip():
+                cut = start
+            newline = buffer.rfind("\n", 0, cut)
+            if newline < 0:
+                column += cut
+            else:
+                column = cut - newline - 1
+            line += buffer.count("\n", 0, cut)
+            dropped += cut
+            buffer = buffer[cut:]
+            size = chunk_size
+        else:
+            # 文が読み終わらなかった: 読む量を倍にして解析し直しを抑える
+            size *= 2
+
+
+@contextmanager
+def mapped_source(path):
+    """
+    Map the file `path` in memory, read-only, for the ``with`` block.
+
+    The mapping supports the operations of a str the tokenizer needs
+    (``len``, slicing, regular expressions); an empty file gives "".
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空のファイルは割り当てられない
+            yield ""
+            return
+        try:
+            yield data
+        finally:
+            data.close()
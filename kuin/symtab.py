@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+"""Symbol tables and name resolution of parsed Kuin programs.
+
+:func:`resolve` declares the names of a program in nested scopes and
+resolves every name used in it to its declaration::
+
+    table = resolve(parse_stmt(text, backend="fast"))
+    for declaration in table.definitions("count"):
+        print declaration, table.references_to(declaration)
+    print table.unresolved()
+
+Scopes are dicts chained to their parent, so a name is found with one
+hash lookup per enclosing scope.  Functions, classes, enums, aliases
+and constants are visible in their whole scope; variables from their
+declaration on, except in the global and class scopes.  A qualified
+name (``A.member``, ``Color#red``, ``A#E#a``) is resolved part by part
+through the members of the classes and enums; a name of another source
+(``src@A``) is not resolved.
+"""
+
+import re
+
+from kuin.nodes import *
+from kuin.visitor import iter_children
+
+__all__ = ['Declaration', 'Reference', 'Scope', 'SymbolTable', 'resolve',
+           'PRIMITIVE_TYPES']
+
+PRIMITIVE_TYPES = (
+    "int", "float", "char", "bool",
+    "byte8", "byte16", "byte32", "byte64",
+    "sbyte8", "sbyte16", "sbyte32", "sbyte64",
+    )
+
+# 定義より前から使える宣言
+HOISTED_KINDS = frozenset(["func", "class", "enum", "alias", "const"])
+
+_qualifier = re.compile(r"([.#])")
+
+
+class Declaration(object):
+    """A declared name: its kind, declaring node and scope."""
+
+    __slots__ = ("kind", "name", "node", "scope", "position", "members")
+
+    def __init__(self, kind, name, node, scope, position, members=None):
+        self.kind = kind
+        self.name = name
+        self.node = node
+        self.scope = scope
+        self.position = position
+        # class と enum の要素の Scope
+        self.members = members
+
+    def __repr__(self):
+        return "<Declaration %s %s>" % (self.kind, self.name)
+
+
+class Reference(object):
+    """A use of `name` in the node `context`, resolved or not."""
+
+    __slots__ = ("name", "symbol", "context", "scope", "position",
+                 "declaration")
+
+    def __init__(self, symbol, context, scope, position):
+        self.name = symbol.symbol
+        self.symbol = symbol
+        self.context = context
+        self.scope = scope
+        self.position = position
+        self.declaration = None
+
+    def __repr__(self):
+        return "<Reference %s -> %r>" % (self.name, self.declaration)
+
+
+class Scope(object):
+    """The names declared in a global, class, enum, function or block."""
+
+    __slots__ = ("kind", "node", "parent", "names", "base")
+
+    def __init__(self, kind, node=None, parent=None):
+        self.kind = kind
+        self.node = node
+        self.parent = parent
+        self.names = {}
+        # 親クラスの要素
+        self.base = None
+
+    def get(self, name):
+        """Return the declaration of `name` in this scope, or None."""
+        scope = self
+        while scope is not None:
+            declaration = scope.names.get(name)
+            if declaration is not None:
+                return declaration
+            scope = scope.base
+        return None
+
+    def lookup(self, name, position=None):
+        """
+        Return the declaration `name` refers to from this scope, or None.
+
+        If `position` is given, the local variables declared after it
+        are skipped.
+        """
+        scope = self
+        while scope is not None:
+            declaration = scope.get(name)
+            if declaration is not None and (
+                    position is None or
+                    declaration.position < position or
+                    declaration.kind in HOISTED_KINDS or
+                    declaration.scope.kind in ("global", "class")):
+                return declaration
+            scope = scope.parent
+        return None
+
+    def __repr__(self):
+        return "<Scope %s %d names>" % (self.kind, len(self.names))
+
+
+class SymbolTable(object):
+    """
+    The declarations and references of a program.
+
+    ``declarations`` and ``references`` list them in source order;
+    ``duplicates`` the declarations of a name already declared in the
+    same scope; ``cycles`` the classes whose parent inherits from them,
+    which do not inherit the members of that parent.
+    """
+
+    def __init__(self):
+        self.builtins = Scope("builtin")
+        for name in PRIMITIVE_TYPES:
+            self.builtins.names[name] = Declaration(
+                "type", name, None, self.builtins, -1)
+        self.globals = Scope("global", None, self.builtins)
+        self.declarations = []
+        self.references = []
+        self.duplicates = []
+        self.cycles = []
+        self.position = 0
+        self.by_name = {}
+        self.by_declaration = {}
+        self.by_symbol = {}
+        self.by_context = {}
+        # id(ClassNode) -> 宣言 (同じ名前の宣言があっても自分の宣言を引く)
+        self.by_class = {}
+
+    ##################################################################
+    # 問い合わせ
+    ##################################################################
+
+    def definitions(self, name):
+        """Return the declarations of the (unqualified) `name`."""
+        return list(self.by_name.get(name, ()))
+
+    def references_to(self, declaration):
+        """Return the references resolved to `declaration`."""
+        return list(self.by_declaration.get(id(declaration), ()))
+
+    def declaration_of(self, symbol):
+        """
+        Return the declaration a located SymbolNode (see
+        kuin.nodes.fresh_symbols) refers to, or None.
+        """
+        reference = self.by_symbol.get(id(symbol))
+        return reference and reference.declaration
+
+    def reference_in(self, context, symbol):
+        """
+        Return the Reference of `symbol` used in the node `context` (the
+        parent of the symbol, or the sentence using it), or None.
+        """
+        return self.by_context.get((id(context), id(symbol)))
+
+    def unresolved(self):
+        """Return the references that were not resolved."""
+        return [reference for reference in self.references
+                if reference.declaration is None]
+
+    def lookup(self, name, scope=None, position=None):
+        """
+        Return the declaration of the qualified `name` in `scope` (the
+        global scope by default), or None.
+        """
+        if "@" in name:
+            # 別のソースの名前
+            return None
+        parts = _qualifier.split(name)
+        declaration = (scope or self.globals).lookup(parts[0], position)
+        for i in range(2, len(parts), 2):
+            if declaration is None or declaration.members is None:
+                return None
+            declaration = declaration.members.get(parts[i])
+        return declaration
+
+    ##################################################################
+    # 宣言
+    ##################################################################
+
+    def next_position(self):
+        self.position += 1
+        return self.position
+
+    def declare(self, kind, name, node, scope, members=None):
+        if type(name) is SymbolNode:
+            name = name.symbol
+        declaration = Declaration(kind, name, node, scope,
+                                  self.next_position(), members)
+        if name in scope.names:
+            self.duplicates.append(declaration)
+        else:
+            scope.names[name] = declaration
+        self.declarations.append(declaration)
+        self.by_name.setdefault(name, []).append(declaration)
+        return declaration
+
+    def refer(self, symbol, context, scope):
+        reference = Reference(symbol, context, scope, self.next_position())
+        self.references.append(reference)
+        return reference
+
+    def resolve(self, sentences):
+        """Declare and resolve the names of the top-level `sentences`."""
+        sentences = list(sentences)
+        self.hoist(sentences, self.globals)
+        self.declare_body(sentences, self.globals)
+        # 親クラスの要素を継ぐ
+        for declaration in self.declarations:
+            if declaration.kind == "class" and declaration.node.parent:
+                parent = self.lookup(declaration.node.parent.symbol,
+                                     declaration.scope)
+                if parent is not None and parent.members is not None:
+                    self.inherit(declaration, parent)
+        for reference in self.references:
+            declaration = self.lookup(reference.name, reference.scope,
+                                      reference.position)
+            if declaration is not None:
+                reference.declaration = declaration
+                self.by_declaration.setdefault(
+                    id(declaration), []).append(reference)
+            self.by_symbol[id(reference.symbol)] = reference
+            self.by_context[id(reference.context),
+                            id(reference.symbol)] = reference
+        return self
+
+    def inherit(self, declaration, parent):
+        # 継承が循環するなら親の要素を継がない
+        scope = parent.members
+        while scope is not None:
+            if scope is declaration.members:
+                self.cycles.append(declaration)
+                return
+            scope = scope.base
+        declaration.members.base = parent.members
+
+    def hoist(self, body, scope):
+        # 定義より前から使える名前を先に宣言する
+        for node in body:
+            cls = type(node)
+            if cls is FuncDefNode:
+                self.declare("func", node.name, node, scope)
+            elif cls is ClassNode:
+                self.by_class[id(node)] = self.declare(
+                    "class", node.name, node, scope,
+                    Scope("class", node, scope))
+            elif cls is EnumNode:
+                members = Scope("enum", node)
+                self.declare("enum", node.name, node, scope, members)
+                for key, value in node.member.items():
+                    self.declare("enum_member", key, node, members)
+            elif cls is AliasNode:
+                self.declare("alias", node.alias, node, scope)
+            elif cls is ConstNode:
+                self.declare("const", node.varname, node, scope)
+
+    def declare_body(self, body, scope):
+        declarers = self.declarers
+        for node in body:
+            declarers[type(node)](self, node, scope)
+
+    def block_scope(self, body, scope, node, block_name=None):
+        inner = Scope("block", node, scope)
+        if block_name is not None:
+            self.declare("block", block_name, node, inner)
+        self.hoist(body, inner)
+        self.declare_body(body, inner)
+        return inner
+
+    def refer_expr(self, expr, context, scope):
+        # 式の中の名前 (深い式でも再帰しない)
+        stack = [(expr, context)]
+        while stack:
+            node, context = stack.pop()
+            cls = type(node)
+            if cls is SymbolNode:
+                self.refer(node, context, scope)
+                continue
+            if cls is FuncNode:
+                self.refer(node.funcname, node, scope)
+            for child in reversed(iter_children(node)):
+                stack.append((child, node))
+
+    ##################################################################
+    # 文
+    ##################################################################
+
+    def declare_if(self, node, scope):
+        for cond, body in node.clauses:
+            if cond is not None:
+                self.refer_expr(cond, node, scope)
+            self.block_scope(body, scope, node, node.block_name)
+
+    def declare_switch(self, node, scope):
+        self.refer_expr(node.target, node, scope)
+        for value, body in node.case:
+            if value is not None:
+                self.refer_expr(value, node, scope)
+            self.block_scope(body, scope, node, node.block_name)
+
+    def declare_while(self, node, scope):
+        self.refer_expr(node.cond, node, scope)
+        if node.skip is not None:
+            self.refer_expr(node.skip, node, scope)
+        self.block_scope(node.body, scope, node, node.block_name)
+
+    def declare_loop(self, node, scope):
+        # for と foreach の名前はループの変数
+        if type(node) is ForNode:
+            for expr in (node.start, node.end, node.step):
+                if expr is not None:
+                    self.refer_expr(expr, node, scope)
+        else:
+            self.refer_expr(node.items, node, scope)
+        inner = Scope("block", node, scope)
+        if node.block_name is not None:
+            self.declare("var", node.block_name, node, inner)
+        self.hoist(node.body, inner)
+        self.declare_body(node.body, inner)
+
+    def declare_try(self, node, scope):
+        inner = Scope("block", node, scope)
+        if node.block_name is not None:
+            self.declare("var", node.block_name, node, inner)
+        for value in (node.ignore_value, node.catch_value):
+            if value is not None:
+                self.refer_expr(value, node, scope)
+        for body in (node.body, node.catch_body, node.finally_body):
+            self.block_scope(body, inner, node)
+
+    def declare_block(self, node, scope):
+        self.block_scope(node.body, scope, node, node.block_name)
+
+    def declare_expr_sentence(self, node, scope):
+        for child in iter_children(node):
+            self.refer_expr(child, node, scope)
+
+    def declare_jump(self, node, scope):
+        if node.block_name is not None:
+            self.refer(node.block_name, node, scope)
+
+    def declare_func(self, node, scope):
+        inner = Scope("function", node, scope)
+        for name, typename in node.params:
+            self.refer_expr(typename, node, scope)
+            self.declare("param", name, node, inner)
+        if node.rettype is not None:
+            self.refer_expr(node.rettype, node, scope)
+        self.hoist(node.body, inner)
+        self.declare_body(node.body, inner)
+
+    def declare_var(self, node, scope):
+        # 初期値は宣言より前に評価される
+        for child in iter_children(node):
+            self.refer_expr(child, node, scope)
+        if type(node) is VarNode:
+            self.declare("var", node.varname, node, scope)
+
+    def declare_alias(self, node, scope):
+        self.refer_expr(node.typename, node, scope)
+
+    def declare_class(self, node, scope):
+        members = self.by_class[id(node)].members
+        if node.parent is not None:
+            self.refer(node.parent, node, scope)
+        body = [member.member for member in node.members]
+        self.hoist(body, members)
+        self.declare_body(body, members)
+
+    def declare_nothing(self, node, scope):
+        pass
+
+    declarers = {
+        IfNode: declare_if,
+        SwitchNode: declare_switch,
+        WhileNode: declare_while,
+        ForNode: declare_loop,
+        ForeachNode: declare_loop,
+        TryNode: declare_try,
+        IfdefNode: declare_block,
+        BlockNode: declare_block,
+        DoNode: declare_expr_sentence,
+        ReturnNode: declare_expr_sentence,
+        AssertNode: declare_expr_sentence,
+        ThrowNode: declare_expr_sentence,
+        BreakNode: declare_jump,
+        ContinueNode: declare_jump,
+        FuncDefNode: declare_func,
+        VarNode: declare_var,
+        ConstNode: declare_var,
+        AliasNode: declare_alias,
+        ClassNode: declare_class,
+        EnumNode: declare_nothing,
+        str: declare_nothing,
+        unicode: declare_nothing,
+        }
+
+
+def resolve(sentences):
+    """Return the SymbolTable of the program `sentences`."""
+    return SymbolTable().resolve(sentences)
@@ -0,0 +1,102 @@
+import pickle
+from cStringIO import StringIO
+from unittest import TestCase, main
+
+from kuin import nodes
+from kuin.astcodec import *
+from kuin.astcodec import NODE_KINDS
+from kuin.nodes import Node, SymbolNode, symbol
+from kuin.parser import parse_stmt, parse_expr
+from kuin.source import SourceMap
+
+
+TEXT = """\
+import lib/util
+class C : P
+  +*func f(x : int, y : []char) : int
+    if (x > 0)
+      return x ?(1, -2)
+    end if
+    throw 3, "error"
+  end func
+  -var a : float :: -2.5e3
+end class
+enum E
+  A
+  B :: 5
+end enum
+var s : []char :: "abc" ~ "d"
+var c : char :: 'x'
+while loop (true & false)
+  do x :+ 1
+end while
+"""
+
+
+class TestCodec(TestCase):
+
+    def check(self, tree):
+        copy = loads(dumps(tree))
+        self.assertEquals(repr(copy), repr(tree))
+        self.assertEquals(repr(copy), repr(pickle.loads(pickle.dumps(tree))))
+        return copy
+
+    def test_round_trip(self):
+        self.check(parse_stmt(TEXT, backend="fast"))
+        self.check(list(parse_stmt(TEXT)))
+
+    def test_values(self):
+        items = [None, True, False, 0, -1, 300, -(2 ** 70), 1.5, "",
+                 "abc", u"\u3042", (1, "abc"), [], [symbol("a")]]
+        self.assertEquals(loads(dumps(items)), items)
+        self.assertEquals(type(loads(dumps([(1,)]))[0]), tuple)
+
+    def test_interned(self):
+        copy = loads(dumps([parse_expr("a + f(a)", backend="fast")]))[0]
+        self.assertTrue(copy.operands[0] is symbol("a"))
+        self.assertTrue(copy.operands[1].args[0] is symbol("a"))
+
+    def test_located(self):
+        source_map = SourceMap("a + a")
+        expr = parse_expr(source_map.text, backend="fast",
+                          source_map=source_map)
+        copy = loads(dumps([expr]))[0]
+        left, right = copy.operands
+        self.assertFalse(left is right)
+        self.assertEquals(source_map.span(right), (4, 5))
+        self.assertEquals(copy.span_index, expr.span_index)
+
+    def test_smaller_than_pickle(self):
+        tree = parse_stmt(TEXT * 10, backend="fast")
+        self.assertTrue(len(dumps(tree)) * 2 < len(pickle.dumps(tree, 2)))
+
+    def test_stream(self):
+        tree = parse_stmt(TEXT, backend="fast")
+        f = StringIO(dumps(tree))
+        decoder = Decoder(f)
+        self.assertEquals(repr(next(iter(decoder))), repr(tree[0]))
+        self.assertEquals(len(list(decoder)), len(tree) - 1)
+
+    def test_errors(self):
+        data = dumps([1])
+        self.assertRaises(ValueError, loads, "garbage")
+        self.assertRaises(ValueError, loads, data[:5] + "\xff" + data[6:])
+        self.assertRaises(ValueError, loads, data[:-2])
+
+    def test_deep(self):
+        # a long sum is a deep tree; neither side may recurse on it
+        tree = parse_stmt("do %s\n" % " + ".join(["a"] * 3000),
+                          backend="fast")
+        data = dumps(tree)
+        self.assertEquals(dumps(loads(data)), data)
+
+    def test_all_kinds(self):
+        kinds = set(NODE_KINDS)
+        for name in dir(nodes):
+            cls = getattr(nodes, name)
+            if isinstance(cls, type) and issubclass(cls, Node):
+                self.assertTrue(cls is Node or cls in kinds, cls)
+
+
+if __name__ == '__main__':
+    main()
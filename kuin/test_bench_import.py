@@ -0,0 +1,20 @@
+from unittest import TestCase, main
+
+from kuin.bench_import import run, format_report
+
+
+class TestBenchImport(TestCase):
+
+    def test_run(self):
+        report = run(["import", "snapshot"], repeat=1)
+        self.assertEquals([result["step"] for result in report["results"]],
+                          ["import", "snapshot"])
+        for result in report["results"]:
+            self.assertTrue(0 < result["seconds"] <= result["median"])
+        lines = format_report(report).splitlines()
+        self.assertEquals(len(lines), 3)
+        self.assertTrue(lines[1].startswith("import"))
+
+
+if __name__ == '__main__':
+    main()
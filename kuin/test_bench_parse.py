@@ -0,0 +1,50 @@
+from unittest import TestCase, main
+
+from kuin.bench_parse import *
+from kuin.bench_parse import count_nodes
+from kuin.parser import parse_stmt, parse_expr
+
+
+class TestCorpus(TestCase):
+
+    def test_deterministic(self):
+        for shape in SHAPES:
+            self.assertEquals(generate(shape, 5), generate(shape, 5))
+        self.assertNotEqual(generate("deep_expr", 5, seed=1),
+                            generate("deep_expr", 5, seed=2))
+
+    def test_backends_agree(self):
+        for shape, (is_expr, generator) in SHAPES.items():
+            text = generate(shape, 4)
+            entry = parse_expr if is_expr else parse_stmt
+            fast = entry(text, backend="fast")
+            slow = entry(text, backend="pyparsing")
+            self.assertEquals(repr(list(slow) if not is_expr else slow),
+                              repr(fast), shape)
+            self.assertTrue(count_nodes(fast) > 0, shape)
+
+
+class TestBench(TestCase):
+
+    def test_bench(self):
+        result = bench("wide_switch", 5, backend="pyparsing", repeat=1)
+        self.assertEquals(result["entry"], "parse_stmt")
+        self.assertTrue(result["tokens"] > 0 and result["nodes"] > 0)
+        self.assertTrue("Switch" in result["rule_seconds"])
+
+    def test_run(self):
+        report = run(["long_enum"], {"long_enum": 3}, ["fast"], repeat=1)
+        result, = report["results"]
+        self.assertEquals((result["shape"], result["nodes"]),
+                          ("long_enum", 1))
+
+    def test_default_sizes(self):
+        # every shape parses at its default size, with the rules profiled
+        report = run(backends=["pyparsing"], repeat=1)
+        for result in report["results"]:
+            self.assertFalse("error" in result, result)
+            self.assertTrue(result["rule_seconds"], result["shape"])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+from unittest import TestCase, main
+
+from kuin.bench_threads import bench, run, format_report
+
+
+class TestBenchThreads(TestCase):
+
+    def test_bench(self):
+        for shared in (False, True):
+            result = bench(2, "long_enum", 3, count=2, shared=shared)
+            self.assertEquals((result["threads"], result["parses"]), (2, 4))
+            self.assertTrue(result["agree"])
+
+    def test_run(self):
+        report = run((1, 3), "deep_expr", 3, count=1, backend="fast")
+        self.assertEquals([result["threads"] for result in report["results"]],
+                          [1, 3])
+        self.assertEquals(report["results"][0]["speedup"], 1.0)
+        self.assertTrue(all([result["agree"]
+                             for result in report["results"]]))
+        self.assertEquals(len(format_report(report).splitlines()), 4)
+
+
+if __name__ == '__main__':
+    main()
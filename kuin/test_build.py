@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, main
+
+from pyparsing import ParseException
+
+from kuin.build import *
+
+
+FILES = {
+    "main.kn": "import lib/util\nimport other.kn\ndo f(1)\n",
+    "lib/util.kn": "import ../other\nfunc f(x : int)\nend func\n",
+    "other.kn": "var a : int :: 1\n",
+    "broken.kn": "if (a)\n",
+    }
+
+
+class TestBuild(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, "lib"))
+        for name, text in FILES.items():
+            with open(self.path(name), "w") as f:
+                f.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.normpath(os.path.join(self.dir, name))
+
+    def test_import_path(self):
+        self.assertEquals(import_path("a/b.kn", "c"), os.path.join("a", "c.kn"))
+        self.assertEquals(import_path("a/b.kn", "../c.kn"), "c.kn")
+
+    def check(self, processes):
+        result = build([self.path("main.kn")], processes=processes)
+        self.assertTrue(result.ok)
+        self.assertEquals(sorted(result.trees), sorted([
+                    self.path("main.kn"), self.path("lib/util.kn"),
+                    self.path("other.kn")]))
+        self.assertEquals(sorted(result.trees), sorted(result.times))
+        self.assertEquals(repr(result.trees[self.path("other.kn")]),
+                          "[<Var (a, int, 1)>]")
+
+    def test_serial(self):
+        self.check(1)
+
+    def test_parallel(self):
+        self.check(2)
+
+    def test_cache(self):
+        cache_dir = self.path("cache")
+        for hits in (0, 3):
+            result = build([self.path("main.kn")], processes=2,
+                           cache_dir=cache_dir)
+            self.assertEquals(result.cache_stats["hits"], hits)
+            self.assertEquals(result.cache_stats["hits"] +
+                              result.cache_stats["misses"], 3)
+        self.assertTrue(result.cache_stats["bytes_read"] > 0)
+        self.assertEquals(repr(result.trees[self.path("other.kn")]),
+                          "[<Var (a, int, 1)>]")
+
+    def test_grammar_snapshot(self):
+        cache_dir = self.path("cache")
+        result = build([self.path("main.kn")], processes=2,
+                       backend="pyparsing", cache_dir=cache_dir)
+        self.assertTrue(result.ok)
+        self.assertTrue(os.path.exists(os.path.join(cache_dir,
+                                                    SNAPSHOT_NAME)))
+        self.assertEquals(repr(result.trees[self.path("other.kn")]),
+                          "[<Var (a, int, 1)>]")
+
+    def test_errors(self):
+        result = build([self.path("broken.kn"), self.path("missing.kn"),
+                        self.path("other.kn")],
+                       follow_imports=False, processes=2)
+        self.assertFalse(result.ok)
+        self.assertEquals(list(result.trees), [self.path("other.kn")])
+        self.assertTrue(isinstance(result.errors[self.path("broken.kn")],
+                                   ParseException))
+        self.assertTrue(isinstance(result.errors[self.path("missing.kn")],
+                                   IOError))
+
+    def test_deep_trees(self):
+        # deep trees are sent back; one too deep to pickle is an error of
+        # its file instead of a hang
+        for name, size in [("deep.kn", 3000), ("deeper.kn", 8000)]:
+            with open(self.path(name), "w") as f:
+                f.write("do %s\n" % " + ".join(["a"] * size))
+        result = build([self.path("deep.kn"), self.path("deeper.kn")],
+                       follow_imports=False, processes=2)
+        self.assertEquals(list(result.trees), [self.path("deep.kn")])
+        self.assertTrue(isinstance(result.errors[self.path("deeper.kn")],
+                                   TransferError))
+
+
+if __name__ == '__main__':
+    main()
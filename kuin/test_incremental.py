@@ -0,0 +1,94 @@
+from unittest import TestCase, main
+
+from pyparsing import ParseException
+
+from kuin.incremental import *
+from kuin.parser import parse_stmt
+
+
+SOURCE = """\
+var a : int :: 1
+if (a > 0)
+  do a :: 2
+end if
+{ comment }
+func f(x : int) : int
+  return x
+end func
+do f(a)
+"""
+
+
+class TestParseSession(TestCase):
+
+    def assertParsed(self, session):
+        self.assertEquals(repr(session.sentences),
+                          repr(parse_stmt(session.text, backend="fast")))
+        _, starts, ends = parse_spans(session.text)
+        self.assertEquals(session.spans(), list(zip(starts, ends)))
+
+    def edit(self, session, old, new, nth=0):
+        offset = session.text.index(old)
+        for i in range(nth):
+            offset = session.text.index(old, offset + 1)
+        session.edit(offset, len(old), new)
+        self.assertParsed(session)
+
+    def test_spans(self):
+        session = ParseSession(SOURCE)
+        self.assertEquals(len(session.sentences), 4)
+        start, end = session.spans()[1]
+        self.assertEquals(SOURCE[start:end],
+                          "if (a > 0)\n  do a :: 2\nend if")
+
+    def test_edit_inside_block(self):
+        session = ParseSession(SOURCE)
+        self.edit(session, "return x", "return x * 2")
+        self.assertEquals(session.reparsed, 1)
+        self.edit(session, "a :: 2", "b")
+        self.assertEquals(session.reparsed, 1)
+
+    def test_scattered_edits(self):
+        session = ParseSession(SOURCE * 3)
+        for old, new, nth in [("a :: 2", "a :: 22", 2), ("return x", "", 0),
+                              ("f(a)", "f(a, a)", 1), ("1\n", "10\n", 2),
+                              ("{ comment }", "", 0), ("end func", "end func\n"
+                              "var b : int", 2)]:
+            self.edit(session, old, new, nth)
+
+    def test_edit_at_boundary(self):
+        session = ParseSession(SOURCE)
+        self.edit(session, "f(a)", "f(ab)")
+        self.edit(session, "\n{ comment }", "\ndo b")
+        self.assertEquals(len(session.sentences), 5)
+
+    def test_extend_previous(self):
+        # the inserted text continues the sentence before it
+        session = ParseSession("do a\ndo c\n")
+        session.edit(5, 0, "+ b\n")
+        self.assertParsed(session)
+        self.assertEquals(repr(session.sentences),
+                          "[<Do <Expr `+`(`a`, `b`)>>, <Do `c`>]")
+        session = ParseSession(SOURCE)
+        self.edit(session, "if (a > 0)", "{ c }\n+ 1\nif (a > 0)")
+        self.assertEquals(len(session.sentences), 4)
+
+    def test_block_end_removed(self):
+        session = ParseSession(SOURCE)
+        offset = SOURCE.index("end if")
+        self.assertRaises(ParseException, session.edit, offset, 6, "")
+        self.assertEquals(session.sentences, None)
+        session.edit(offset, 0, "end if")
+        self.assertParsed(session)
+
+    def test_error(self):
+        session = ParseSession(SOURCE)
+        self.assertRaises(ParseException, session.edit, 0, 0, "{")
+        self.assertEquals(session.sentences, None)
+        session.edit(0, 1, "")
+        self.assertParsed(session)
+        self.assertRaises(ValueError, session.edit, len(SOURCE), 1, "")
+
+
+if __name__ == '__main__':
+    main()
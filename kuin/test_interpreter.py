@@ -0,0 +1,183 @@
+from cStringIO import StringIO
+from unittest import TestCase, main
+
+from kuin.interpreter import *
+from kuin.runtime import ASSERT_FAILED, DIVISION_BY_ZERO, INDEX_OUT_OF_RANGE
+
+
+PROGRAM = """\
+func fib(n : int) : int
+  if (n < 2)
+    return n
+  end if
+  return fib(n - 1) + fib(n - 2)
+end func
+
+func sum_odd(n : int) : int
+  var s : int
+  for i(1, n)
+    if (i % 2 = 0)
+      continue i
+    end if
+    do s :+ i
+  end for
+  return s
+end func
+
+func squares(n : int) : []int
+  var a : []int :: @new [n]int
+  foreach x(a)
+  end foreach
+  for i(0, n - 1)
+    do a[i] :: i * i
+  end for
+  return a
+end func
+
+var count : int :: 0
+"""
+
+
+class TestInterpreter(TestCase):
+
+    run_text = staticmethod(run)
+
+    def run_program(self, text, **options):
+        out = StringIO()
+        interpreter = self.run_text(PROGRAM + text, out=out, **options)
+        return interpreter, out.getvalue()
+
+    def test_functions(self):
+        interpreter, out = self.run_program("")
+        self.assertEquals(interpreter.call("fib", 15), 610)
+        self.assertEquals(interpreter.call("sum_odd", 10), 25)
+        self.assertEquals(interpreter.call("squares", 4), [0, 1, 4, 9])
+
+    def test_backends(self):
+        for backend in ("pyparsing", "fast"):
+            interpreter = self.run_text(PROGRAM + "do count :: fib(10)\n",
+                                   backend=backend)
+            self.assertEquals(interpreter.globals["count"], 55)
+
+    def test_operators(self):
+        interpreter, out = self.run_program("""\
+var a : int :: 7
+var b : int :: -7 / 2
+var c : int :: -7 % 2
+var d : float :: 7 $ float / 2
+var e : bool :: a > 5 & !(a = 3) | false
+var f : int :: a > 5 ?(1, 2)
+var g : []char :: "a" ~ "b" ~ (a $ []char)
+do a :* 2
+do a :- 4
+do count :: a :: a + 1
+""")
+        values = interpreter.globals
+        self.assertEquals([values[name] for name in "abcdefg"],
+                          [11, -3, -1, 3.5, True, 1, "ab7"])
+        self.assertEquals(values["count"], 11)
+
+    def test_named_blocks(self):
+        interpreter, out = self.run_program("""\
+var n : int
+while outer(true)
+  for i(1, 10)
+    do n :+ 1
+    if (i = 3)
+      break outer
+    end if
+  end for
+end while
+block b
+  do n :+ 10
+  break b
+  do n :+ 100
+end block
+var k : int
+while w(k < 0, true)
+  do k :+ 5
+end while
+switch s(n)
+case 1 @to 10
+  do count :: 1
+case 13
+  do count :: 2
+  break s
+  do count :: 3
+default
+  do count :: 4
+end switch
+""")
+        self.assertEquals(interpreter.globals["n"], 13)
+        self.assertEquals(interpreter.globals["k"], 5)
+        self.assertEquals(interpreter.globals["count"], 2)
+
+    def test_throw(self):
+        interpreter, out = self.run_program("""\
+try e()
+  throw 3, "three"
+catch 1, 2 @to 4
+  do print("caught ")
+  do print(e)
+finally
+  do print(" finally")
+end try
+try (5)
+  throw 5, "ignored"
+end try
+try e()
+  do count :: 1 / 0
+catch
+  do count :: e
+end try
+""")
+        self.assertEquals(out, "caught 3 finally")
+        self.assertEquals(interpreter.globals["count"], DIVISION_BY_ZERO)
+        try:
+            self.run_program("throw 7, \"seven\"\n")
+        except KuinError as e:
+            self.assertEquals((e.code, e.message), (7, "seven"))
+        else:
+            self.fail()
+
+    def test_debug(self):
+        text = """\
+ifdef(debug)
+  do count :: 1
+end ifdef
+ifdef(release)
+  do count :: 2
+end ifdef
+assert count = 1
+"""
+        interpreter, out = self.run_program(text)
+        self.assertEquals(interpreter.globals["count"], 1)
+        interpreter, out = self.run_program(text, debug=False)
+        self.assertEquals(interpreter.globals["count"], 2)
+
+    def test_runtime_errors(self):
+        for text, code in [("assert false\n", ASSERT_FAILED),
+                           ("var a : []int :: squares(2)\ndo a[2] :: 1\n",
+                            INDEX_OUT_OF_RANGE),
+                           ("var z : float :: 1.0 / 0.0\n", DIVISION_BY_ZERO),
+                           ("var z : float :: 1.0 % 0.0\n", DIVISION_BY_ZERO),
+                           ("var z : float :: 1.0\ndo z :/ 0.0\n",
+                            DIVISION_BY_ZERO)]:
+            try:
+                self.run_program(text)
+            except KuinError as e:
+                self.assertEquals(e.code, code)
+            else:
+                self.fail(text)
+        for text in ["do x :: 1\n", "do g()\n", "break\n"]:
+            self.assertRaises(InterpreterError, self.run_program, text)
+
+    def test_builtins(self):
+        interpreter, out = self.run_program(
+            "do count :: twice(len(\"abc\"))\n",
+            builtins={"twice": lambda n: n * 2})
+        self.assertEquals(interpreter.globals["count"], 6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+from unittest import TestCase, main
+
+from pyparsing import ParseException, ParseFatalException
+
+from kuin.lexer import *
+
+
+def kinds_values(text):
+    tokens = tokenize(text)
+    return [(kind, value) for kind, value, start, end in tokens][:-1]
+
+
+class TestLexer(TestCase):
+
+    def test_names_and_keywords(self):
+        self.assertEquals(kinds_values("if a.b ifx E#Red"), [
+                (KEYWORD, "if"), (NAME, "a.b"), (NAME, "ifx"),
+                (NAME, "E#Red")])
+
+    def test_numbers(self):
+        self.assertEquals(kinds_values("10 2#0101.11 #FF 6.02e+23"), [
+                (NUMBER, 10), (NUMBER, 5.75), (NUMBER, 255),
+                (NUMBER, 6.02e+23)])
+        self.assertRaises(ParseFatalException, tokenize, "16#FF")
+
+    def test_literals(self):
+        self.assertEquals(kinds_values(r'"a\"b" ' + r"'\n'"), [
+                (STRING, 'a"b'), (CHAR, "\n")])
+
+    def test_operators(self):
+        self.assertEquals(kinds_values("@new @is @to :: :+ <> <= ?( ? ("), [
+                (OP, "@new"), (OP, "@is"), (OP, "@to"), (OP, "::"),
+                (OP, ":+"), (OP, "<>"), (OP, "<="), (OP, "?("), (OP, "?"),
+                (OP, "(")])
+
+    def test_comments(self):
+        self.assertEquals(kinds_values('a { " } " { } } b'), [
+                (NAME, "a"), (NAME, "b")])
+        self.assertRaises(ParseException, tokenize, "a { { }")
+
+    def test_import(self):
+        self.assertEquals(kinds_values("import foo/bar.kn"), [
+                (KEYWORD, "import"), (SOURCE, "foo/bar.kn")])
+
+    def test_offsets(self):
+        tokens = tokenize("ab  {c} cd")
+        self.assertEquals(list(tokens.starts), [0, 8, 10])
+        self.assertEquals(list(tokens.ends), [2, 10, 10])
+        self.assertEquals(tokens.kinds[-1], END)
+
+
+if __name__ == '__main__':
+    main()
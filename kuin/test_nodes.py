@@ -0,0 +1,118 @@
+import pickle
+from unittest import TestCase, main
+
+from kuin.nodes import *
+from kuin.nodes import symbol, type_node
+from kuin.parser import parse_stmt, parse_expr
+from kuin.source import SourceMap
+
+
+TEXT = """\
+class C : P
+  +*func f(x : int) : int
+    if (x > 0)
+      return x ?(1, 2)
+    end if
+  end func
+  -var a : []int
+end class
+"""
+
+
+class TestSlots(TestCase):
+
+    def test_no_dict(self):
+        tree = parse_stmt(TEXT, backend="fast")
+        for obj in [tree[0], tree[0].members[0], tree[0].members[0].member,
+                    symbol("a"), ExprNode(symbol("+"), 1, 2)]:
+            self.assertFalse(hasattr(obj, "__dict__"), obj)
+        self.assertRaises(AttributeError, setattr, symbol("a"), "x", 1)
+
+    def test_pickle(self):
+        tree = parse_stmt(TEXT, backend="fast")
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(tree, protocol))
+            self.assertEquals(repr(copy), repr(tree))
+
+
+class TestSymbols(TestCase):
+
+    def test_interned(self):
+        self.assertTrue(symbol("a") is symbol("a"))
+        for backend in ("pyparsing", "fast"):
+            expr = parse_expr("a + f(a) * a", backend=backend)
+            a = expr.operands[0]
+            self.assertTrue(a is symbol("a"))
+            self.assertTrue(expr.operands[1].operands[0].args[0] is a)
+            self.assertTrue(expr.operator is symbol("+"))
+
+    def test_located(self):
+        for backend in ("pyparsing", "fast"):
+            source_map = SourceMap("a + a")
+            expr = parse_expr(source_map.text, backend=backend,
+                              source_map=source_map)
+            left, right = expr.operands
+            self.assertFalse(left is right)
+            self.assertEquals(left, right)
+            self.assertEquals(hash(left), hash(symbol("a")))
+            self.assertEquals(source_map.span(right), (4, 5))
+
+    def test_pickle(self):
+        a = pickle.loads(pickle.dumps(parse_expr("a + b", backend="fast")))
+        self.assertTrue(a.operands[0] is symbol("a"))
+
+
+TYPES = """\
+var a : list<[]int>
+var b : dict<int, []char> :: @new dict<int, []char>
+var c : func<(int, []char):bool>
+var d : list<[]int> :: @new list<[]int>
+var e : []int :: @new [3]int
+"""
+
+
+class TestTypeNodes(TestCase):
+
+    def test_fields(self):
+        a, b, c, d, e = parse_stmt(TYPES, backend="fast")
+        self.assertEquals(a.typename.kind, "list")
+        self.assertTrue(a.typename.item_type.base_type is symbol("int"))
+        self.assertTrue(b.typename.keytype is symbol("int"))
+        self.assertEquals(c.typename.argtype,
+                          (symbol("int"), b.typename.valtype))
+        self.assertTrue(c.typename.rettype is symbol("bool"))
+        self.assertEquals(repr(c.typename), "func<(`int`, []`char`):`bool`>")
+
+    def test_hash_consed(self):
+        for backend in ("pyparsing", "fast"):
+            a, b, c, d, e = parse_stmt(TYPES, backend=backend)
+            self.assertTrue(a.typename is d.typename)
+            self.assertTrue(a.typename is d.value.type)
+            self.assertTrue(b.typename is b.value.type)
+            self.assertTrue(b.typename.valtype is c.typename.argtype[1])
+            self.assertTrue(e.typename is a.typename.item_type)
+            # array sizes are expressions
+            self.assertFalse(e.value.type is e.typename)
+        self.assertTrue(type_node(CollectionTypeNode, "list",
+                                  e.typename) is a.typename)
+        # a user type depends on the scope
+        self.assertFalse(type_node(ArrayTypeNode, symbol("T"), (None,)) is
+                         type_node(ArrayTypeNode, symbol("T"), (None,)))
+
+    def test_located(self):
+        source_map = SourceMap(TYPES)
+        a, b, c, d, e = parse_stmt(TYPES, backend="fast",
+                                   source_map=source_map)
+        self.assertFalse(a.typename is d.typename)
+        start, end = source_map.span(d.typename)
+        self.assertEquals(TYPES[start - 8:end], "var d : list<[]int>")
+
+    def test_pickle(self):
+        tree = parse_stmt(TYPES, backend="fast")
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            a = pickle.loads(pickle.dumps(tree, protocol))[0]
+            self.assertTrue(a.typename is tree[0].typename)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+from unittest import TestCase, main
+
+from kuin.interpreter import Interpreter
+from kuin.optimize import *
+from kuin.parser import parse_stmt
+from kuin.pycompiler import Runner
+from kuin.runtime import KuinError
+from kuin.test_interpreter import PROGRAM
+from kuin.vm import VM
+
+
+def parse(text):
+    return parse_stmt(text, backend="fast")
+
+
+class TestOptimize(TestCase):
+
+    def test_fold(self):
+        var, = optimize(parse("var a : int :: 2 * 3 + #FF + 1\n"))
+        self.assertEquals(var.value, 262)
+        var, = optimize(parse(
+                "var a : bool :: 7 $ float / 2 = 3.5 & (1 < 2 ?(true, x))\n"))
+        self.assertEquals(var.value, True)
+        var, = optimize(parse("var a : []char :: \"a\" ~ (12 $ []char)\n"))
+        self.assertEquals(var.value, "a12")
+        # kept to fail at run time
+        var, = optimize(parse("var a : int :: x + 1 / 0\n"))
+        self.assertEquals(repr(var.value), "<Expr `+`(`x`, <Expr `/`(1, 0)>)>")
+
+    def test_constants(self):
+        tree = parse("""\
+enum Color
+  red
+  green :: 5
+  blue
+end enum
+const k : int :: 2 * 3
+const m : int :: k * Color#blue
+var a : int :: k + Color#green + m
+func f(k : int) : int
+  return k + m
+end func
+""")
+        enum, k, m, var, func = optimize(tree)
+        self.assertEquals((k.value, m.value, var.value), (6, 36, 47))
+        ret, = func.body
+        self.assertEquals(repr(ret.value), "<Expr `+`(`k`, 36)>")
+        # the given tree is not changed
+        self.assertEquals(repr(tree[2].value), "<Expr `*`(`k`, `Color#blue`)>")
+
+    def test_dead_code(self):
+        text = """\
+ifdef(debug)
+  do f(1)
+end ifdef
+ifdef(release)
+  do f(2)
+end ifdef
+assert g()
+if (1 > 2)
+  do f(3)
+elif (true)
+  do f(4)
+else
+  do f(5)
+end if
+while (false)
+  do f(6)
+end while
+"""
+        self.assertEquals(repr(optimize(parse(text))),
+                          "[<Do <Func `f`(1)>>, <Assert <Func `g`()>>, "
+                          "<Do <Func `f`(4)>>]")
+        self.assertEquals(repr(optimize(parse(text), debug=False)),
+                          "[<Do <Func `f`(2)>>, <Do <Func `f`(4)>>]")
+
+    def test_scopes(self):
+        # bodies that declare something keep their own scope
+        text = """\
+if (true)
+  var a : int :: 1
+end if
+ifdef(debug)
+  const b : int :: 2
+end ifdef
+ifdef(debug)
+  do f(3)
+end ifdef
+"""
+        first, second, third = optimize(parse(text))
+        self.assertEquals(repr(first), "<Block  { <Var (a, int, 1)> }>")
+        self.assertEquals(type(second).__name__, "BlockNode")
+        self.assertEquals(repr(third), "<Do <Func `f`(3)>>")
+
+    def test_deep(self):
+        var, = optimize(parse("var a : int :: %s\n" %
+                              " + ".join(["1"] * 3000)))
+        self.assertEquals(var.value, 3000)
+        do, = optimize(parse("do a :: %s\n" % " + ".join(["a"] * 3000)))
+        self.assertEquals(len(do.expr.operands), 2)
+
+    def test_run(self):
+        text = PROGRAM + """\
+const n : int :: 3 * 4
+var s : []int :: squares(n / 4)
+do count :: fib(n) + s[2]
+"""
+        for debug in (True, False):
+            interpreter = Interpreter(debug=debug)
+            interpreter.run(optimize(parse(text), debug))
+            self.assertEquals(interpreter.globals["count"], 148)
+            self.assertEquals(interpreter.call("sum_odd", 5), 9)
+        self.assertRaises(KuinError, Interpreter().run,
+                          optimize(parse("var a : int :: 1 / 0\n")))
+
+    def test_shadowed_constants(self):
+        # a block name or a variable hides the constant of the same name
+        text = """\
+const i : int :: 5
+var s : int
+for i(1, 3)
+  do s :+ i
+end for
+const k : int :: 10
+var t : int
+if (s > 0)
+  var k : int :: 1
+  do t :: k
+end if
+"""
+        tree = optimize(parse(text))
+        self.assertEquals(repr(tree[2].body), "(<Do <Expr `:+`(`s`, `i`)>>,)")
+        for executor in (Interpreter(), VM(), Runner()):
+            executor.run(tree)
+            self.assertEquals((executor.globals["s"], executor.globals["t"]),
+                              (6, 1))
+
+
+if __name__ == '__main__':
+    main()
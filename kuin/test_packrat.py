@@ -0,0 +1,97 @@
+import threading
+from unittest import TestCase, main
+
+from pyparsing import ParserElement, ParseException
+
+from kuin.nodes import FuncNode
+from kuin.packrat import PackratCache, memoize
+from kuin.parser import parse_stmt, parse_expr, grammar, Parser
+
+
+class TestPackratCache(TestCase):
+
+    def test_lru_eviction(self):
+        cache = PackratCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEquals(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertEquals(len(cache), 2)
+        self.assertEquals(cache.get("a"), 1)
+        self.assertEquals(cache.evictions, 1)
+        stats = cache.stats()
+        self.assertEquals(stats["hits"], 2)
+        self.assertEquals(stats["misses"], 0)
+
+    def test_zero_size(self):
+        cache = PackratCache(0)
+        cache.set("a", 1)
+        self.assertEquals(len(cache), 0)
+
+
+class TestMemoizedParse(TestCase):
+
+    def test_same_result(self):
+        text = "if a(4 > 5)\n  break a\nend if\n"
+        self.assertEquals(repr(parse_stmt(text, packrat=True)),
+                          repr(parse_stmt(text)))
+
+    def test_stats(self):
+        cache = PackratCache()
+        r = parse_expr("f(1, 2)", packrat=cache)
+        self.assertTrue(isinstance(r, FuncNode))
+        self.assertEquals(r.args, (1, 2))
+        self.assertTrue(cache.hits > 0)
+        self.assertTrue(cache.misses > 0)
+        self.assertEquals(len(cache), 0)
+
+    def test_bounded(self):
+        cache = PackratCache(64)
+        parse_stmt("var c : bool :: b @is CB\n", packrat=cache)
+        self.assertTrue(cache.evictions > 0)
+
+    def test_restores_parse_method(self):
+        saved = ParserElement.__dict__["_parse"]
+        expr = grammar().expr
+        with memoize(True, grammar().elements()) as cache:
+            self.assertTrue(isinstance(cache, PackratCache))
+            self.assertTrue("_parse" in expr.__dict__)
+            # only the elements of the grammar are changed
+            self.assertEquals(ParserElement.__dict__["_parse"], saved)
+        self.assertFalse("_parse" in expr.__dict__)
+        self.assertRaises(ParseException, parse_expr, "#fff", packrat=True)
+        self.assertEquals([e for e in grammar().elements()
+                           if "_parse" in e.__dict__], [])
+        self.assertEquals(ParserElement.__dict__["_parse"], saved)
+
+    def test_other_threads(self):
+        # a thread parsing another grammar is not blocked by the cache of
+        # another thread, and does not use it
+        entered = threading.Event()
+        done = threading.Event()
+        results = []
+        own = Parser().grammar
+
+        def work():
+            with memoize(True, own.elements()) as cache:
+                entered.set()
+                done.wait()
+                results.append(cache.stats())
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        entered.wait()
+        try:
+            self.assertTrue("_parse" in own.expr.__dict__)
+            self.assertFalse("_parse" in grammar().expr.__dict__)
+            self.assertEquals(repr(parse_expr("f(1, 2)", packrat=True)),
+                              "<Func `f`(1, 2)>")
+        finally:
+            done.set()
+            thread.join()
+        self.assertEquals(results[0]["misses"], 0)
+        self.assertFalse("_parse" in own.expr.__dict__)
+
+
+if __name__ == '__main__':
+    main()
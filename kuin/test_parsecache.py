@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, main
+
+from kuin.parser import parse_stmt
+from kuin.parsecache import *
+from kuin import parsecache
+
+
+TEXT = "var a : int :: f(1) + b\nif (a)\n  return a\nend if\n"
+
+
+class TestParseCache(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_hit(self):
+        cache = ParseCache(self.dir)
+        tree = parse_stmt(TEXT, cache=cache)
+        self.assertEquals(cache.stats()["misses"], 1)
+        self.assertEquals(cache.stats()["bytes_read"], 0)
+        # a new instance (the next build) reads it too
+        cache = ParseCache(self.dir)
+        self.assertEquals(repr(parse_stmt(TEXT, cache=cache)), repr(tree))
+        stats = cache.stats()
+        self.assertEquals((stats["hits"], stats["misses"]), (1, 0))
+        self.assertEquals(stats["hit_rate"], 1.0)
+        self.assertTrue(stats["bytes_read"] > 0)
+
+    def test_grammar_version(self):
+        cache = ParseCache(self.dir)
+        cache.set(TEXT, parse_stmt(TEXT))
+        saved = parsecache.GRAMMAR_VERSION
+        parsecache.GRAMMAR_VERSION = saved + "-next"
+        try:
+            self.assertEquals(cache.get(TEXT), None)
+        finally:
+            parsecache.GRAMMAR_VERSION = saved
+        self.assertNotEquals(cache.get(TEXT), None)
+
+    def test_corrupted_entry(self):
+        cache = ParseCache(self.dir)
+        cache.set(TEXT, parse_stmt(TEXT))
+        path, size, mtime = cache.entries()[0]
+        with open(path, "wb") as f:
+            f.write("garbage")
+        self.assertEquals(cache.get(TEXT), None)
+        self.assertEquals(cache.stats()["misses"], 1)
+        # the broken entry is removed
+        self.assertEquals(cache.entries(), [])
+
+    def test_decode_errors(self):
+        import struct
+        cache = ParseCache(self.dir)
+        saved = parsecache.loads
+        for error in [AttributeError, IndexError, struct.error]:
+            cache.set(TEXT, parse_stmt(TEXT))
+            def loads(data):
+                raise error("broken")
+            parsecache.loads = loads
+            try:
+                self.assertEquals(cache.get(TEXT), None)
+            finally:
+                parsecache.loads = saved
+            self.assertEquals(cache.entries(), [])
+        self.assertEquals(cache.stats()["misses"], 3)
+
+    def test_unencodable_tree(self):
+        cache = ParseCache(self.dir)
+        cache.set(TEXT, [object()])
+        self.assertEquals(cache.entries(), [])
+        self.assertEquals(cache.total_bytes, 0)
+        self.assertEquals(cache.get(TEXT), None)
+
+    def test_overwrite(self):
+        cache = ParseCache(self.dir)
+        tree = parse_stmt(TEXT)
+        cache.set(TEXT, tree)
+        cache.set(TEXT, tree)
+        self.assertEquals(cache.total_bytes, cache.entries()[0][1])
+
+    def test_eviction(self):
+        cache = ParseCache(self.dir)
+        cache.set(TEXT, parse_stmt(TEXT))
+        size = cache.total_bytes
+        cache = ParseCache(self.dir, max_bytes=size * 3)
+        for i in range(5):
+            text = "do x :: %d\n" % i + TEXT
+            cache.set(text, parse_stmt(text))
+        self.assertTrue(cache.total_bytes <= size * 3)
+        self.assertTrue(len(cache.entries()) < 6)
+        self.assertTrue(cache.stats()["evictions"] > 0)
+        self.assertEquals(cache.total_bytes,
+                          sum([entry[1] for entry in cache.entries()]))
+
+
+if __name__ == '__main__':
+    main()
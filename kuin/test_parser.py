@@ -1,6 +1,10 @@
+import threading
 from unittest import TestCase, main
 
-from kuin.parser import parse_stmt, parse_expr
+from pyparsing import ParseException, ParseFatalException, ParserElement
+
+from kuin.parser import parse_stmt, parse_expr, grammar, Parser, ENGINES
+from kuin.source import SourceMap
 
 
 class TestParser(TestCase):
@@ -150,6 +154,12 @@ do b :: !a
 """)
         print r
 
+    def test_keyword_prefix(self):
+        # names starting with a keyword are not keywords
+        r = parse_stmt("do done :: !dog\n")
+        self.assertEquals(repr(r[0]), "<Do <Expr `::`(`done`, <Expr `!`(`dog`)>)>>")
+        self.assertRaises(ParseException, parse_stmt, "do end\n")
+
     def test_throw(self):
         r = parse_stmt("""\
 throw 5, "hoge"
@@ -203,6 +213,42 @@ var c : bool :: b @is CB
 """)
         print r
 
+    def test_func(self):
+        r = parse_stmt("""\
+func f(a : int, b : []char) : int
+  return a
+end func
+func g()
+end func
+""")
+        self.assertEquals(
+            repr(list(r)),
+            "[<FuncDef `f`(`a` : `int`, `b` : []`char`) : `int` "
+            "{ <Return `a`> }>, <FuncDef `g`() {  }>]")
+
+    def test_class_members(self):
+        r = parse_stmt("""\
+class C : P
+  -var A : int
+  var B : int
+  +*func f()
+  end func
+end class
+""")
+        self.assertEquals(
+            repr(list(r)),
+            "[<Class `C` : `P` { -<Var (A, int, None)>, "
+            "<Var (B, int, None)>, +*<FuncDef `f`() {  }> }>]")
+
+    def test_named_while(self):
+        r = parse_stmt("""\
+while w(a, true)
+  break w
+end while
+""")
+        self.assertEquals(repr(list(r)),
+                          "[<While `w`(`a` True) { <Break `w`> }>]")
+
     def test_cast(self):
         r = parse_stmt("""\
 var a : int :: 3.5 $ int
@@ -210,5 +256,256 @@ var a : int :: 3.5 $ int
         print r
 
 
+class TestExprEngines(TestCase):
+
+    exprs = [
+        "a + b + c", "a :: b :: c", "-a", "- 5", "!!a", "-(5)",
+        "a * b + c * d - e", "(a + b) * c", "4 <= n & n <= 10",
+        "f(1) + g(2) * 3", "x[i + 1]", "@new [5]int", "3.5 $ int",
+        "b @is CB", "a :: b ?(1 + 2, c * 3)", 'a ~ "x" ~ b', "a :+ 2",
+        "1 { comment } + 2",
+        ]
+
+    def assertSameTree(self, parse, text):
+        # the tower grammar is only usable with memoization
+        self.assertEquals(repr(parse(text, engine="climbing")),
+                          repr(parse(text, engine="tower", packrat=True)))
+
+    def test_expr_parity(self):
+        for text in self.exprs:
+            self.assertSameTree(parse_expr, text)
+
+    def test_stmt_parity(self):
+        self.assertSameTree(parse_stmt, """\
+if a(4 > 5)
+  do a :: f(1) + 2
+elif (3 = 2)
+  var c : bool :: b @is CB
+end if
+""")
+
+    def test_ternary_parity(self):
+        # the ternary operator is not associative and is no operand of a
+        # tighter operator
+        for text in ["a + b ?(1, 2)", "a ?(1, 2) :: b", "(a ?(1, 2)) + 3",
+                     "a ?((b ?(1, 2)), 3)"]:
+            self.assertSameTree(parse_expr, text)
+        for text in ["a ?(1, 2) + 3", "a ?(1, 2) ?(3, 4)",
+                     "a ?(b ?(1, 2), 3)"]:
+            for engine in ENGINES:
+                self.assertRaises(ParseException, parse_expr, text,
+                                  engine=engine, packrat=True)
+
+    def test_long_chain(self):
+        r = parse_expr(" + ".join(["a%d" % i for i in range(200)]))
+        for i in reversed(range(1, 200)):
+            self.assertEquals(repr(r.operands[1]), "`a%d`" % i)
+            r = r.operands[0]
+        self.assertEquals(repr(r), "`a0`")
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, parse_expr, "1", engine="lalr")
+
+
+class TestFastBackend(TestCase):
+
+    exprs = TestExprEngines.exprs + [
+        "10", "-0.999", "2#1000", "#FFF", "6.02e+23", "true", "'a'",
+        r'"a\"b\\c\n"', "f()", "f(g(1), 2)", "x $ func<(int):bool>",
+        "@new [2][]char",
+        ]
+
+    def test_expr_parity(self):
+        for text in self.exprs:
+            self.assertEquals(repr(parse_expr(text, backend="fast")),
+                              repr(parse_expr(text)))
+
+    def assertSameResult(self, parse, text):
+        # both backends build the same tree, or both reject the text
+        try:
+            expected = repr(list(parse(text))) if parse is parse_stmt \
+                else repr(parse(text))
+        except ParseException:
+            self.assertRaises(ParseException, parse, text, backend="fast")
+            return
+        result = parse(text, backend="fast")
+        if parse is parse_stmt:
+            result = list(result)
+        self.assertEquals(repr(result), expected)
+
+    def test_name_parity(self):
+        # a.b is a ClassName, a function or a variable; C#E an enum type
+        # and E#X, C#E#X enumerators
+        self.assertEquals(repr(parse_expr("a.b(C#E#X) + E#X")),
+                          "<Expr `+`(<Func `a.b`(`C#E#X`)>, `E#X`)>")
+        for name in ["a", "a.b", "a.b.c", "E#X", "A.B#C", "C#E#X", "a.C#E#X",
+                     "a.E#X", "E#X#Y#Z", "E#X.y", "int#X"]:
+            for text in ["x + %s", "%s(1)", "%s[1]", "b @is %s", "x $ %s",
+                         "@new %s", "%s :: 1"]:
+                self.assertSameResult(parse_expr, text % name)
+            for text in ["var %s : int\n", "var v : %s\n",
+                         "class K : %s\nend class\n",
+                         "func %s()\nend func\n",
+                         "while %s(true)\nend while\n",
+                         "func f(p : %s)\nend func\n", "do %s\n"]:
+                self.assertSameResult(parse_stmt, text % name)
+
+    def test_ternary_parity(self):
+        for text in ["a + b ?(1, 2)", "a ?(1, 2) :: b", "a ?(1, 2) + 3",
+                     "a ?(1, 2) ?(3, 4)", "a ?(b ?(1, 2), 3)"]:
+            self.assertSameResult(parse_expr, text)
+
+    def test_whitespace_parity(self):
+        for text in ["a +\v b", "a\f+ b", "\fa\t*\rb\n"]:
+            self.assertSameResult(parse_expr, text)
+        self.assertSameResult(parse_stmt, "do a\n\f\ndo b\v\n")
+
+    def test_expr_errors(self):
+        for text in ["16#FFF", "10#123", "8#9", "1#0"]:
+            self.assertRaises(ParseFatalException,
+                              parse_expr, text, backend="fast")
+        for text in ["#fff", "2#", "!5", "a +", "f(1"]:
+            self.assertRaises(ParseException,
+                              parse_expr, text, backend="fast")
+
+    def test_stmt_parity(self):
+        text = """\
+func f(a : int, b : char) : int
+  var i : int :: a * 2 + 1 { comment }
+  if x(i > 5 & b = 'c')
+    do i :+ g(i, 2) * 3
+  elif (i < 0)
+    break x
+  else
+    return i ~ "abc"
+  end if
+  switch s(i)
+  case 1, 2, 5 @to 8
+    do i :: i - 1
+  default
+    assert i >= 2
+  end switch
+  for k(1, 10, -2)
+    do a :: b ?(1, 2)
+  end for
+  try e(1)
+    throw 1, "x"
+  catch 2 @to 3
+  finally
+    ifdef(debug)
+    end ifdef
+  end try
+  return a
+end func
+class C : P
+  +const K : int :: 5
+  -var A : int
+  enum E
+    X
+    Y :: 3
+  end enum
+end class
+alias t : [][2]int
+"""
+        self.assertEquals(repr(parse_stmt(text, backend="fast")),
+                          repr(list(parse_stmt(text))))
+
+    def test_sentence_parity(self):
+        # each kind of sentence on its own, well formed or not
+        sentences = [
+            "do f(1)\n", "do a :: b ?(1, 2)\n", "do\n", "do a b\n",
+            "var a : int\n", "var a : []int :: @new [3]int\n",
+            "var a :: 1\n", "const k : int :: 5\n", "const k : int\n",
+            "alias t : list<int>\n", "alias t\n",
+            "import s@lib\n", "import\n",
+            "break\n", "break w\n", "continue w\n", "return\n",
+            "return a + 1\n", "assert a = 1\n", "throw 1, \"e\"\n",
+            "throw\n",
+            "if (a)\nend if\n", "if x(a)\n  break x\nelse\nend if\n",
+            "if (a)\nelse\nelif (b)\nend if\n", "if a\nend if\n",
+            "switch (n)\ncase 1, 2 @to 4\ndefault\nend switch\n",
+            "switch (n)\ndefault\ncase 1\nend switch\n",
+            "while (a)\nend while\n", "while w(a, true)\nend while\n",
+            "for (1, 10)\nend for\n", "for i(1, 10, 2)\nend for\n",
+            "for (1)\nend for\n", "foreach (xs)\nend foreach\n",
+            "try e(1)\ncatch 2\nfinally\nend try\n", "try\nend try\n",
+            "ifdef (debug)\nend ifdef\n", "ifdef (release)\nend ifdef\n",
+            "ifdef (other)\nend ifdef\n", "block b\nend block\n",
+            "func f(a : int) : bool\n  return true\nend func\n",
+            "func f(a)\nend func\n",
+            "enum E\n  X\n  Y :: 2\nend enum\n", "enum E\nend enum\n",
+            "class C : P\n  +var a : int\n  -*func f()\n  end func\n"
+            "end class\n",
+            "class C\n  do f()\nend class\n",
+            "end if\n", "{ comment }\n", "{ {nested} }do a\n",
+            ]
+        for text in sentences:
+            self.assertSameResult(parse_stmt, text)
+
+    def test_stmt_errors(self):
+        for text in ["if (a)\n", "try\nend try\n", "var a int\n",
+                     "class C\n  +\nend class\n", "end if\n"]:
+            self.assertRaises(ParseException,
+                              parse_stmt, text, backend="fast")
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, parse_expr, "1", backend="yacc")
+
+
+class TestParserInstance(TestCase):
+
+    text = """\
+if a(4 > 5)
+  do a :: f(1) + 2 * b
+elif (3 = 2)
+  var c : []int :: @new [2]int
+end if
+"""
+
+    def test_own_grammar(self):
+        parser = Parser()
+        self.assertFalse(parser.grammar is grammar())
+        self.assertFalse(parser.grammar is Parser().grammar)
+        self.assertEquals(repr(list(parser.parse_stmt(self.text))),
+                          repr(list(parse_stmt(self.text))))
+        self.assertEquals(repr(parser.parse_expr("a + b * c")),
+                          "<Expr `+`(`a`, <Expr `*`(`b`, `c`)>)>")
+
+    def test_options(self):
+        parser = Parser(engine="tower", packrat=True)
+        self.assertEquals(repr(list(parser.parse_stmt(self.text))),
+                          repr(list(parse_stmt(self.text))))
+        self.assertTrue(parser.packrat.hits > 0)
+        self.assertEquals(repr(Parser(backend="fast").parse_stmt(self.text)),
+                          repr(list(parse_stmt(self.text))))
+        self.assertRaises(ValueError, Parser, engine="lalr")
+        self.assertRaises(ValueError, Parser, backend="yacc")
+
+    def test_threads(self):
+        expected = repr(list(parse_stmt(self.text)))
+        saved = ParserElement.__dict__["_parse"]
+        shared = Parser()
+        parsers = [Parser(), Parser(engine="tower", packrat=True),
+                   Parser(backend="fast"), shared, shared]
+        results = [[] for parser in parsers]
+
+        def work(parser, result, locate):
+            for i in range(5):
+                source_map = SourceMap(self.text) if locate else None
+                tree = parser.parse_stmt(self.text, source_map=source_map)
+                result.append(repr(list(tree)))
+
+        threads = [threading.Thread(target=work,
+                                    args=(parser, result, i == 0))
+                   for i, (parser, result) in enumerate(zip(parsers,
+                                                            results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(results, [[expected] * 5] * len(parsers))
+        self.assertEquals(ParserElement.__dict__["_parse"], saved)
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+from unittest import main
+
+from kuin import interpreter, test_interpreter
+from kuin.pycompiler import *
+from kuin.pycompiler import run
+from kuin.runtime import InterpreterError
+
+
+class TestPyCompiler(test_interpreter.TestInterpreter):
+    # the programs of the interpreter tests, translated to Python
+
+    run_text = staticmethod(run)
+
+    def test_jumps(self):
+        runner = run("""\
+var log : []char :: ""
+func f() : int
+  var n : int
+  for i(1, 3)
+    try ()
+      for j(1, 3)
+        if (j = 2)
+          continue i
+        end if
+        block b
+          if (i = 3)
+            break b
+          end if
+          do log :~ (i $ []char)
+        end block
+        do n :+ 1
+      end for
+    finally
+      do log :~ "f"
+    end try
+  end for
+  while w(n < 100)
+    foreach x(log)
+      if (x = "f")
+        do n :+ 10
+        continue w
+      end if
+    end foreach
+  end while
+  return n
+end func
+""")
+        self.assertEquals(runner.call("f"), 103)
+        self.assertEquals(runner.globals["log"], "1f2ff")
+
+    def test_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            text = test_interpreter.PROGRAM + "do count :: fib(12)\n"
+            cache = CodeCache(directory)
+            first = compile_text(text, cache=cache)
+            self.assertTrue(compile_text(text, cache=cache) is first)
+            self.assertEquals((cache.hits, cache.misses), (1, 1))
+            self.assertFalse(compile_text(text, False, cache=cache) is first)
+            # another process loads the marshalled code
+            cache = CodeCache(directory)
+            runner = run(text, cache=cache)
+            self.assertEquals((cache.hits, cache.misses), (1, 0))
+            self.assertEquals(runner.globals["count"], 144)
+            self.assertEquals(len(os.listdir(directory)), 2)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_cache_size(self):
+        cache = CodeCache(size=2)
+        texts = ["do count :: %d\n" % i for i in range(3)]
+        first = compile_text(texts[0], cache=cache)
+        compile_text(texts[1], cache=cache)
+        self.assertTrue(compile_text(texts[0], cache=cache) is first)
+        compile_text(texts[2], cache=cache)
+        # the least recently used one was dropped
+        self.assertEquals((len(cache.codes), cache.evictions), (2, 1))
+        self.assertTrue(cache.get(texts[0]) is first)
+        self.assertEquals(cache.get(texts[1]), None)
+        self.assertEquals(len(CodeCache(size=0).codes), 0)
+        self.assertRaises(ValueError, CodeCache, size=-1)
+
+    def test_name_errors(self):
+        text = "func f() : int\n  return late\nend func\n"
+        try:
+            run(text + "var late : int :: f()\n")
+        except InterpreterError as e:
+            self.assertEquals(str(e), "undefined variable: late")
+        else:
+            self.fail()
+        # other NameErrors are not Kuin variables
+        def boom():
+            return undefined_python_name
+        runner = run("func g() : int\n  return boom()\nend func\n",
+                     builtins={"boom": boom})
+        self.assertRaises(NameError, runner.call, "g")
+
+    def test_qualified_name_errors(self):
+        # the same errors as the interpreter for enum and qualified names
+        for text, name in [
+                ("do x :: E#C\n", "E#C"),
+                ("do x :: A#E#a\n", "A#E#a"),
+                ("func f() : int\n  return E#C\nend func\ndo f()\n", "E#C")]:
+            errors = []
+            for execute in [interpreter.run, run]:
+                try:
+                    execute(text)
+                except InterpreterError as e:
+                    errors.append(str(e))
+            self.assertEquals(errors, ["undefined variable: " + name] * 2)
+
+
+if __name__ == '__main__':
+    main()
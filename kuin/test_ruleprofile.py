@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase, main
+
+from pyparsing import ParserElement
+
+from kuin.parser import parse_stmt, parse_expr, PrecedenceExpr
+from kuin.ruleprofile import RuleProfile, LEVEL_NAME, main as profile_main
+
+
+TEXT = """\
+{ a comment }
+if (a = 1)
+  do b :: f(a) + 2
+end if
+var c : int :: 3
+"""
+
+
+class TestRuleProfile(TestCase):
+
+    def test_counts(self):
+        with RuleProfile() as profile:
+            parse_stmt(TEXT)
+        stats = profile.stats
+        self.assertEquals((stats["If"].attempts, stats["If"].successes), (
+                stats["If"].failures + 1, 1))
+        self.assertEquals(stats["Var"].successes, 1)
+        self.assertEquals(stats["Do"].successes, 1)
+        self.assertEquals(stats["Type"].successes, 1)
+        self.assertTrue(stats["Expr"].successes >= 3)
+        self.assertTrue(stats[LEVEL_NAME % 14].successes >= 3)
+        self.assertTrue(stats["Comment"].attempts > 0)
+        for name in ("If", "Expr", "Comment"):
+            self.assertTrue(stats[name].seconds > 0, name)
+
+    def test_restored(self):
+        saved = (ParserElement.__dict__["_parse"],
+                 ParserElement.__dict__["_parseNoCache"],
+                 PrecedenceExpr.__dict__["parse_level"])
+        with RuleProfile():
+            self.assertNotEqual(ParserElement.__dict__["_parse"], saved[0])
+        self.assertEquals((ParserElement.__dict__["_parse"],
+                           ParserElement.__dict__["_parseNoCache"],
+                           PrecedenceExpr.__dict__["parse_level"]), saved)
+
+    def test_tower_levels(self):
+        with RuleProfile() as profile:
+            parse_expr("a + b * c", engine="tower")
+        for level in (3, 7, 8, 14):
+            self.assertTrue(profile.stats[LEVEL_NAME % level].successes,
+                            level)
+        # every level parses the level below it again
+        self.assertTrue(profile.stats[LEVEL_NAME % 3].backtracks > 0)
+
+    def test_packrat(self):
+        with RuleProfile() as profile:
+            parse_stmt(TEXT, packrat=True)
+        self.assertEquals(profile.stats["If"].successes, 1)
+        self.assertEquals(profile.stats["If"].backtracks, 0)
+
+    def test_report(self):
+        with RuleProfile() as profile:
+            parse_stmt(TEXT)
+        results = profile.results("attempts")
+        attempts = [stats.attempts for stats in results]
+        self.assertEquals(attempts, sorted(attempts, reverse=True))
+        self.assertTrue(all(attempts))
+        data = json.loads(json.dumps(profile.as_dict()))
+        self.assertEquals(data["Var"]["successes"], 1)
+        self.assertEquals(sorted(data["Var"]), [
+                "attempts", "backtracks", "failures", "seconds",
+                "successes"])
+        lines = profile.table(limit=3).splitlines()
+        self.assertEquals(len(lines), 4)
+        self.assertTrue(lines[0].startswith("rule"))
+        self.assertRaises(ValueError, profile.table, "speed")
+
+    def test_main(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmp, "a.kn")
+            output = os.path.join(tmp, "profile.json")
+            with open(source, "w") as f:
+                f.write(TEXT)
+            saved = sys.stdout
+            sys.stdout = StringIO()
+            try:
+                profile_main(["ruleprofile", "--json", output, source])
+                table = sys.stdout.getvalue()
+            finally:
+                sys.stdout = saved
+            self.assertTrue("If" in table)
+            with open(output) as f:
+                self.assertEquals(json.load(f)["If"]["successes"], 1)
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
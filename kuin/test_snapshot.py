@@ -0,0 +1,94 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase, main
+
+from kuin import parser
+from kuin.parser import grammar, load_grammar, parse_stmt
+from kuin.snapshot import dumps, loads, load_snapshot, save_snapshot
+
+
+TEXT = """\
+{ a comment }
+if (a = 1)
+  do b :: f(a) + 2 * -3.5
+elif (a <> 2)
+  var c : []int :: @new [2]int
+else
+  do d :: @new dict<int, []char>
+end if
+switch s(a)
+case 1, 2 @to 5
+  do e :: 'x'
+default
+  do e :: "y\\n"
+end switch
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestSnapshot(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = parser._grammar
+
+    def tearDown(self):
+        parser._grammar = self.saved
+        shutil.rmtree(self.dir)
+
+    def parse(self, g, text=TEXT, engine="climbing"):
+        with g.use_engine(engine):
+            return repr(g.sentences.parseString(text, parseAll=True).asList())
+
+    def test_round_trip(self):
+        copy = loads(dumps(grammar()))
+        self.assertFalse(copy.sentences is grammar().sentences)
+        self.assertEquals(self.parse(copy), self.parse(grammar()))
+        self.assertEquals(self.parse(copy, "do a + b * c", "tower"),
+                          self.parse(grammar(), "do a + b * c", "tower"))
+        self.assertEquals(sorted(copy.engines), sorted(grammar().engines))
+
+    def test_unusable(self):
+        path = os.path.join(self.dir, "grammar.snapshot")
+        self.assertEquals(load_snapshot(path), None)
+        save_snapshot(grammar(), path)
+        with open(path, "rb") as f:
+            data = f.read()
+        self.assertFalse(load_snapshot(path) is None)
+        for broken in ("garbage", data.replace("KNGS1", "KNGS0", 1),
+                       data[:len(data) // 2]):
+            with open(path, "wb") as f:
+                f.write(broken)
+            self.assertEquals(load_snapshot(path), None)
+        self.assertRaises(ValueError, loads, "garbage")
+
+    def test_load_grammar(self):
+        path = os.path.join(self.dir, "grammar.snapshot")
+        first = load_grammar(path)
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(grammar() is first)
+        self.assertEquals(repr(list(parse_stmt("var a : int :: 1"))),
+                          "[<Var (a, int, 1)>]")
+        second = load_grammar(path)
+        self.assertFalse(second is first)
+        self.assertEquals(self.parse(second), self.parse(first))
+
+    def test_deferred(self):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [ROOT] + filter(None, [env.get("PYTHONPATH")]))
+        output = subprocess.check_output([
+                sys.executable, "-c",
+                "import sys, kuin.parser; "
+                "print 'kuin.grammar' in sys.modules; "
+                "kuin.parser.parse_stmt('do 1'); "
+                "print 'kuin.grammar' in sys.modules"], env=env)
+        self.assertEquals(output.split(), ["False", "True"])
+
+
+if __name__ == '__main__':
+    main()
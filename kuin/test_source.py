@@ -0,0 +1,86 @@
+from unittest import TestCase, main
+
+from kuin.nodes import Node
+from kuin.nodes import IfdefNode
+from kuin.parser import parse_stmt, parse_expr
+from kuin.source import *
+
+
+TEXT = """\
+var a : int :: 1 + 2 * b
+if (a > 0)
+\tdo f(a, -b) { c }
+end if
+"""
+
+
+def spans(source_map, node):
+    """Return the located text of `node` and of its nested nodes."""
+    found = []
+    def walk(node):
+        if isinstance(node, (list, tuple)):
+            for item in node:
+                walk(item)
+            return
+        span = source_map.span(node)
+        if span is not None:
+            found.append(source_map.text[span[0]:span[1]])
+        if isinstance(node, Node):
+            state = node.__getstate__()
+            state.pop("span_index", None)
+            for name in sorted(state):
+                walk(state[name])
+    walk(node)
+    return found
+
+
+class TestSourceMap(TestCase):
+
+    def test_position(self):
+        source_map = SourceMap("ab\ncd\n\ne")
+        self.assertEquals(source_map.position(0), (1, 1))
+        self.assertEquals(source_map.position(2), (1, 3))
+        self.assertEquals(source_map.position(3), (2, 1))
+        self.assertEquals(source_map.position(7), (4, 1))
+
+    def test_fast_backend(self):
+        source_map = SourceMap(TEXT)
+        tree = parse_stmt(TEXT, backend="fast", source_map=source_map)
+        self.assertEquals(spans(source_map, tree[0]), [
+                "var a : int :: 1 + 2 * b", "int", "1 + 2 * b",
+                "2 * b", "b", "*", "+", "a"])
+        do = tree[1].clauses[0][1][0]
+        self.assertEquals(spans(source_map, do), [
+                "do f(a, -b)", "f(a, -b)", "a", "-b", "b", "-", "f"])
+        self.assertEquals(source_map.location(do), (3, 2))
+
+    def test_backends_agree(self):
+        results = []
+        for backend in ("pyparsing", "fast"):
+            source_map = SourceMap(TEXT)
+            tree = parse_stmt(TEXT, backend=backend, source_map=source_map)
+            results.append(spans(source_map, list(tree)))
+        self.assertEquals(results[0], results[1])
+
+    def test_expr(self):
+        source_map = SourceMap("x ?(f(1), y)")
+        expr = parse_expr(source_map.text, source_map=source_map)
+        self.assertEquals(source_map.span(expr), (0, 12))
+        self.assertEquals(source_map.span(expr.operands[0]), (0, 1))
+
+    def test_shared_nodes(self):
+        # IfdefNode.debug is shared by every tree, so it gets no span
+        text = "ifdef (debug)\n  do a\nend ifdef\n"
+        source_map = SourceMap(text)
+        tree = parse_stmt(text, source_map=source_map)
+        self.assertTrue(tree[0].mode is IfdefNode.debug)
+        self.assertEquals(source_map.span(IfdefNode.debug), None)
+        self.assertEquals(source_map.span(tree[0]), (0, len(text) - 1))
+
+    def test_not_located(self):
+        expr = parse_expr("a + b")
+        self.assertEquals(SourceMap("a + b").span(expr), None)
+
+
+if __name__ == '__main__':
+    main()
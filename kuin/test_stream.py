@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase, main
+
+from pyparsing import ParseBaseException
+
+from kuin.bench_memory import generate_corpus
+from kuin.parser import parse_stmt, parse_expr, iter_stmts
+from kuin.stream import mapped_source
+
+
+TEXT = """\
+var a : int :: 1
+{ a comment { nested "}" }
+  over lines }
+func f(x : int) : int
+  return x +
+    a
+end func
+do print("a string
+over lines")
+do a :: f(a)
+  + 2
+"""
+
+
+class Reader(StringIO):
+
+    def __init__(self, text):
+        StringIO.__init__(self, text)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return StringIO.read(self, size)
+
+
+class TestStream(TestCase):
+
+    def test_text(self):
+        self.assertEquals(repr(list(iter_stmts(TEXT))),
+                          repr(parse_stmt(TEXT, backend="fast")))
+
+    def test_chunks(self):
+        expected = repr(parse_stmt(TEXT, backend="fast"))
+        for chunk_size in (1, 3, 7, 16, 1000):
+            self.assertEquals(
+                repr(list(iter_stmts(StringIO(TEXT), chunk_size))),
+                expected, chunk_size)
+
+    def test_lazy(self):
+        text = generate_corpus(50)
+        reader = Reader(text)
+        sentences = iter_stmts(reader, 1024)
+        first = next(sentences)
+        self.assertEquals(repr(first),
+                          repr(parse_stmt(generate_corpus(1),
+                                          backend="fast")[0]))
+        self.assertTrue(reader.tell() < len(text) / 10)
+        self.assertEquals(len(list(sentences)), 49)
+
+    def test_error(self):
+        text = "var a : int\n" * 20 + "do (\nvar b : int\n"
+        try:
+            list(iter_stmts(StringIO(text), 16))
+        except ParseBaseException as e:
+            self.assertEquals(e.lineno, 22)
+        else:
+            self.fail()
+
+    def test_error_offset(self):
+        # the offsets are those of parse_stmt, after sentences cut
+        # in the middle of a line too
+        text = "var a : int\n" * 20 + "var b : int  do ) \nvar c : int\n"
+        errors = []
+        for parse in (lambda: list(iter_stmts(StringIO(text), 16)),
+                      lambda: parse_stmt(text, backend="fast")):
+            try:
+                parse()
+            except ParseBaseException as e:
+                errors.append((e.loc, e.lineno, e.col, len(e.pstr)))
+        self.assertEquals(errors, [(256, 21, 17, len(text))] * 2)
+
+
+class TestPath(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(text)
+        return path
+
+    def test_parse_stmt(self):
+        path = self.write("a.kn", TEXT)
+        expected = repr(parse_stmt(TEXT, backend="fast"))
+        for backend in ("fast", "pyparsing"):
+            self.assertEquals(repr(list(parse_stmt(path=path,
+                                                   backend=backend))),
+                              expected)
+        self.assertRaises(ValueError, parse_stmt, TEXT, path=path)
+
+    def test_parse_expr(self):
+        path = self.write("e.kn", "f(a) * 2")
+        self.assertEquals(repr(parse_expr(path=path, backend="fast")),
+                          repr(parse_expr("f(a) * 2")))
+
+    def test_empty(self):
+        path = self.write("empty.kn", "")
+        self.assertEquals(parse_stmt(path=path, backend="fast"), [])
+
+    def test_error(self):
+        path = self.write("bad.kn", "var a : int\ndo (\n")
+        try:
+            parse_stmt(path=path, backend="fast")
+        except ParseBaseException as e:
+            self.assertEquals(e.lineno, 3)
+            self.assertEquals(e.pstr, "var a : int\ndo (\n")
+        else:
+            self.fail()
+
+    def test_iter_mapped(self):
+        path = self.write("a.kn", TEXT)
+        with mapped_source(path) as data:
+            self.assertEquals(repr(list(iter_stmts(data, 16))),
+                              repr(parse_stmt(TEXT, backend="fast")))
+
+
+if __name__ == '__main__':
+    main()
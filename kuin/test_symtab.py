@@ -0,0 +1,175 @@
+from unittest import TestCase, main
+
+from kuin.nodes import fresh_symbols
+from kuin.parser import parse_stmt
+from kuin.symtab import *
+
+
+CLASS_TEXT = """\
+class A : B
+  +var x : int
+  -func f(n : int) : int
+    return n + x
+  end func
+  +*func g() : int
+    return A.x
+  end func
+  enum E
+    a
+    b
+  end enum
+  const c : int :: 3
+end class
+class B
+  +var y : int
+end class
+alias T : []int
+var v : T :: @new [3]int
+do v[0] :: A#E#a + A.c + A.y
+"""
+
+
+def parse(text):
+    return parse_stmt(text, backend="fast")
+
+
+def resolved(table, name):
+    return [reference.declaration for reference in table.references
+            if reference.name == name]
+
+
+class TestSymbolTable(TestCase):
+
+    def test_class_members(self):
+        table = resolve(parse(CLASS_TEXT))
+        a, = table.definitions("A")
+        self.assertEquals(a.kind, "class")
+        self.assertEquals(sorted(a.members.names), ["E", "c", "f", "g", "x"])
+        self.assertEquals(resolved(table, "A.x"), [a.members.names["x"]])
+        self.assertEquals(resolved(table, "A.c"), [a.members.names["c"]])
+        self.assertEquals(resolved(table, "A#E#a"),
+                          table.definitions("a"))
+        self.assertEquals(table.definitions("a")[0].kind, "enum_member")
+        # x in a method is the member
+        self.assertEquals(resolved(table, "x"), table.definitions("x"))
+        self.assertEquals(resolved(table, "n"), table.definitions("n"))
+        self.assertEquals(table.definitions("n")[0].kind, "param")
+
+    def test_inherited_members(self):
+        table = resolve(parse(CLASS_TEXT))
+        self.assertEquals(resolved(table, "A.y"), table.definitions("y"))
+        self.assertEquals(resolved(table, "B"), table.definitions("B"))
+
+    def test_types(self):
+        table = resolve(parse(CLASS_TEXT))
+        t, = table.definitions("T")
+        self.assertEquals(t.kind, "alias")
+        self.assertEquals(resolved(table, "T"), [t])
+        self.assertEquals(set(d.kind for d in resolved(table, "int")),
+                          set(["type"]))
+        self.assertEquals(table.unresolved(), [])
+
+    def test_shadowing(self):
+        table = resolve(parse("""\
+var x : int :: 1
+func f() : int
+  do g(x)
+  var x : int :: 2
+  return x
+end func
+func g(n : int) : int
+  return n
+end func
+"""))
+        outer, inner = table.definitions("x")
+        self.assertEquals(outer.scope, table.globals)
+        self.assertEquals(inner.scope.kind, "function")
+        # used before the local declaration, x is the global
+        self.assertEquals(resolved(table, "x"), [outer, inner])
+        call = table.references_to(outer)[0].context
+        self.assertEquals(call.funcname.symbol, "g")
+        g, = table.definitions("g")
+        self.assertEquals(len(table.references_to(g)), 1)
+
+    def test_loops(self):
+        table = resolve(parse("""\
+for i (1, 10)
+  if (i = 5)
+    break i
+  end if
+  do print(i)
+end for
+do print(i)
+"""))
+        i, = table.definitions("i")
+        self.assertEquals(i.kind, "var")
+        self.assertEquals(resolved(table, "i"), [i, i, i, None])
+        self.assertEquals([r.name for r in table.unresolved()],
+                          ["print", "print", "i"])
+
+    def test_declaration_of(self):
+        with fresh_symbols():
+            tree = parse("var a : int :: 1\ndo a :: a + 1\n")
+        table = resolve(tree)
+        a, = table.definitions("a")
+        target, expr = tree[1].expr.operands
+        self.assertEquals(table.declaration_of(target), a)
+        self.assertEquals(table.declaration_of(expr.operands[0]), a)
+        self.assertEquals(len(table.references_to(a)), 2)
+
+    def test_duplicates(self):
+        table = resolve(parse("var a : int\nvar a : int\n"))
+        self.assertEquals(len(table.definitions("a")), 2)
+        self.assertEquals(table.duplicates, table.definitions("a")[1:])
+
+    def test_duplicate_classes(self):
+        table = resolve(parse("""\
+func A()
+end func
+class A
+  var x : int
+end class
+"""))
+        func, cls = table.definitions("A")
+        self.assertEquals(table.duplicates, [cls])
+        self.assertEquals(sorted(cls.members.names), ["x"])
+        # each class keeps its members
+        table = resolve(parse("""\
+class B
+  var x : int
+end class
+class B
+  var y : int
+end class
+"""))
+        first, second = table.definitions("B")
+        self.assertEquals(table.duplicates, [second])
+        self.assertEquals(sorted(first.members.names), ["x"])
+        self.assertEquals(sorted(second.members.names), ["y"])
+
+    def test_cyclic_inheritance(self):
+        table = resolve(parse("""\
+class A : B
+end class
+class B : A
+end class
+class C : C
+end class
+do A.z :: 1
+"""))
+        a, = table.definitions("A")
+        b, = table.definitions("B")
+        c, = table.definitions("C")
+        self.assertEquals(table.cycles, [b, c])
+        self.assertEquals(a.members.base, b.members)
+        self.assertEquals(b.members.base, None)
+        self.assertEquals(resolved(table, "A.z"), [None])
+
+    def test_external(self):
+        table = resolve(parse("do f(1)\n"))
+        self.assertEquals(table.lookup("src@A"), None)
+        self.assertEquals(table.lookup("int").kind, "type")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+from unittest import TestCase, main
+
+from kuin.parser import parse_stmt
+from kuin.typecheck import *
+
+
+def parse(text):
+    return parse_stmt(text, backend="fast")
+
+
+def messages(text):
+    return [error.message for error in check(parse(text))]
+
+
+class TestTypes(TestCase):
+
+    def test_interned(self):
+        self.assertTrue(array_type(primitive_type("int")) is
+                        array_type(INT))
+        self.assertTrue(func_type([INT], BOOL) is func_type((INT,), BOOL))
+        self.assertTrue(dict_type(INT, STRING) is not dict_type(STRING, INT))
+        self.assertEquals(repr(func_type([INT, STRING], BOOL)),
+                          "func<(int, []char):bool>")
+        self.assertEquals(repr(collection_type("list", INT)), "list<int>")
+
+
+class TestTypeChecker(TestCase):
+
+    def test_valid(self):
+        self.assertEquals(messages("""\
+enum Color
+  red
+  green
+end enum
+alias T : []int
+func f(n : int, s : []char) : bool
+  var a : T :: @new [3]int
+  do a[0] :: n + 1
+  var c : Color :: Color#green
+  for i (1, n)
+    do a[1] :+ i
+  end for
+  while (n < 3 & c <> Color#red)
+    do n :+ 1
+  end while
+  do print(s ~ "abc" ~ (n $ []char))
+  return n = 3 | s = "x"
+end func
+do f(1, "ab")
+"""), [])
+
+    def test_conditions(self):
+        self.assertEquals(messages("""\
+var n : int
+if (n)
+end if
+while (n + 1)
+end while
+assert n = 1
+"""), ["condition of type int where bool is expected"] * 2)
+
+    def test_no_implicit_conversion(self):
+        self.assertEquals(messages("""\
+var n : int :: 1.5
+var x : float :: n
+var y : float :: n $ float
+do x :: x + n
+"""), ["value of type float where int is expected",
+       "value of type int where float is expected",
+       "float + int"])
+
+    def test_calls(self):
+        self.assertEquals(messages("""\
+func f(n : int) : bool
+  return 3
+end func
+do f("ab")
+do f(1, 2)
+var b : bool :: f(1)
+"""), ["return value of type int where bool is expected",
+       "argument of type []char where int is expected",
+       "2 arguments where 1 are expected"])
+
+    def test_enum(self):
+        self.assertEquals(messages("""\
+enum Color
+  red
+end enum
+var c : Color :: Color#red
+var d : bool :: c = 0
+var e : int :: c $ int
+"""), ["Color = int"])
+
+    def test_type_nodes(self):
+        tree = parse("""\
+var a : list<[]int>
+var d : dict<int, []char>
+var f : func<(int, []char):bool>
+do d[1] :: "x"
+do d["xy"] :: "y"
+do a :: @new list<[]int>
+var b : bool :: f(1, d[2])
+var c : int :: f(1, "a")
+""")
+        checker = TypeChecker()
+        self.assertEquals([error.message for error in checker.check(tree)],
+                          ["key of type []char where int is expected",
+                           "value of type bool where int is expected"])
+        self.assertTrue(checker.types[id(tree[0].typename)] is
+                        collection_type("list", array_type(INT)))
+        self.assertTrue(checker.types[id(tree[2].typename)] is
+                        func_type([INT, STRING], BOOL))
+
+    def test_one_char_strings(self):
+        # "a" is a char or a []char
+        self.assertEquals(messages("""\
+func f(s : []char) : char
+  return "c"
+end func
+var b : bool
+var s : []char :: "a" ~ "b"
+do s :~ "c"
+var t : []char :: b ?("a", "b")
+var c : char :: b ?("a", "b")
+do f("x")
+var d : char :: b ?("a", "bc")
+"""), ["value of type []char where char is expected"])
+
+    def test_type_nodes_in_scopes(self):
+        # []T is a different type in each function
+        self.assertEquals(messages("""\
+func f()
+  alias T : int
+  var a : []T :: @new [1]T
+  var y : int :: a[0]
+end func
+func g()
+  alias T : float
+  var b : []T :: @new [1]T
+  var z : float :: b[0]
+end func
+"""), [])
+
+    def test_memoized(self):
+        tree = parse("var n : int :: 1 + 2 * 3\n")
+        checker = TypeChecker()
+        checker.check(tree)
+        expr = tree[0].value
+        self.assertTrue(checker.types[id(expr)] is INT)
+        self.assertTrue(checker.types[id(expr.operands[1])] is INT)
+
+
+if __name__ == '__main__':
+    main()
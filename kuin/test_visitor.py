@@ -0,0 +1,143 @@
+from unittest import TestCase, main
+
+from kuin import nodes
+from kuin.nodes import *
+from kuin.nodes import symbol
+from kuin.parser import parse_stmt
+from kuin.visitor import *
+
+
+TEXT = """\
+func f(n : int) : int
+  if (n < 2)
+    return n
+  elif (n = 2)
+    do g(n)
+  end if
+  switch(n)
+  case 1, 3 @to 4
+    do x :: n + 1
+  end switch
+  return x * 2
+end func
+do f(3)
+"""
+
+
+def parse(text):
+    return parse_stmt(text, backend="fast")
+
+
+def names(tree):
+    return [type(node).__name__.replace("Node", "") for node in walk(tree)]
+
+
+class TestVisitor(TestCase):
+
+    def test_child_fields(self):
+        for name in nodes.__all__:
+            cls = getattr(nodes, name)
+            for field, shape in cls.child_fields:
+                self.assertTrue(field in cls.slot_names(), (name, field))
+
+    def test_walk(self):
+        self.assertEquals(names(parse(TEXT)), [
+                "FuncDef", "Symbol", "Symbol",
+                "If", "Expr", "Symbol", "Return", "Symbol",
+                "Expr", "Symbol", "Do", "Func", "Symbol",
+                "Switch", "Symbol", "Value", "Do", "Expr", "Symbol", "Expr",
+                "Symbol",
+                "Return", "Expr", "Symbol",
+                "Do", "Func"])
+        tree = parse("var a : []int :: @new [2 + 3]int\n")
+        self.assertEquals(names(tree), [
+                "Var", "ArrayType", "Symbol", "New", "ArrayType", "Expr",
+                "Symbol"])
+
+    def test_declared_names(self):
+        tree = parse("""\
+var a : int
+for i(1, 3)
+  const b : int :: 1
+  try t()
+    var c : int
+  catch
+    func g() : int
+      var d : int
+    end func
+  end try
+end for
+""")
+        self.assertEquals(list(declared_names(tree)), ["a", "i", "b", "t", "c"])
+
+    def test_visitor(self):
+        events = []
+
+        class Visitor(NodeVisitor):
+            def visit_FuncDefNode(self, node):
+                events.append("def")
+
+            def leave_FuncDefNode(self, node):
+                events.append("end")
+
+            def visit_FuncNode(self, node):
+                events.append(node.funcname.symbol)
+
+            def visit_SwitchNode(self, node):
+                return SKIP
+
+        Visitor().visit(parse(TEXT))
+        self.assertEquals(events, ["def", "g", "end", "f"])
+
+    def test_transformer(self):
+        class Transformer(NodeTransformer):
+            def transform_SymbolNode(self, node):
+                return symbol("m") if node.symbol == "n" else node
+
+            def transform_ExprNode(self, node):
+                if node.operator.symbol == "*":
+                    return node.operands[0]
+                return node
+
+            def transform_DoNode(self, node):
+                if type(node.expr) is FuncNode:
+                    return [node, node]
+                return None
+
+        tree = parse(TEXT)
+        before = repr(tree)
+        result = Transformer().transform(tree)
+        self.assertEquals(repr(tree), before)
+        func, do1, do2 = result
+        self.assertTrue(do1 is do2 is tree[1])
+        self.assertEquals(func.params[0][0], symbol("n"))
+        expected = parse("""\
+if (m < 2)
+  return m
+elif (m = 2)
+  do g(m)
+  do g(m)
+end if
+switch(m)
+case 1, 3 @to 4
+end switch
+return x
+""")
+        self.assertEquals(repr(func.body), repr(tuple(expected)))
+
+    def test_deep_tree(self):
+        tree = 0
+        for i in range(20000):
+            tree = ExprNode(symbol("+"), tree, i)
+        self.assertEquals(len(list(walk(tree))), 20000)
+
+        class Fold(NodeTransformer):
+            def transform_ExprNode(self, node):
+                left, right = node.operands
+                return left + right
+
+        self.assertEquals(Fold().transform(tree), sum(range(20000)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+from unittest import main
+
+from kuin import test_interpreter
+from kuin.bytecode import *
+from kuin.parser import parse_stmt
+from kuin.vm import *
+from kuin.vm import run
+
+
+class TestVM(test_interpreter.TestInterpreter):
+    # the programs of the interpreter tests, compiled
+
+    run_text = staticmethod(run)
+
+    def test_globals_in_functions(self):
+        vm = run("var n : int :: 1\n"
+                 "func f() : int\n  do n :+ 1\n  return n\nend func\n")
+        self.assertEquals(vm.call("f"), 2)
+        self.assertEquals(vm.globals["n"], 2)
+        self.assertRaises(InterpreterError, vm.call, "f", 1)
+
+    def test_jump_out_of_try(self):
+        vm = run("""\
+var log : []char :: ""
+func f() : int
+  for i(1, 3)
+    try ()
+      try (1)
+        if (i = 2)
+          continue i
+        end if
+        if (i = 3)
+          return i
+        end if
+      finally
+        do log :~ "f" ~ (i $ []char)
+      end try
+    finally
+      do log :~ "g"
+    end try
+  end for
+  return 0
+end func
+""")
+        self.assertEquals(vm.call("f"), 3)
+        self.assertEquals(vm.globals["log"], "f1gf2gf3g")
+
+    def test_step_direction(self):
+        vm = run("var s : int\nvar k : int :: 0 - 2\n"
+                 "for i(10, 1, k)\n  do s :+ i\nend for\n")
+        self.assertEquals(vm.globals["s"], 10 + 8 + 6 + 4 + 2)
+        code = Compiler().compile_program(
+            parse_stmt("for i(10, 1, -2)\nend for\n", backend="fast"))
+        listing = disassemble(code)
+        self.assertTrue("FOR_DOWN" in listing, listing)
+        self.assertFalse("CHECK_STEP" in listing, listing)
+
+
+if __name__ == '__main__':
+    main()
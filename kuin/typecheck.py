@@ -0,0 +1,626 @@
+# -*- coding: utf-8 -*-
+
+"""Static type checking of parsed Kuin programs.
+
+Kuin has no implicit conversion: the operands of an operator have the
+same type, a value is assigned to a variable of its own type and the
+conditions of ``if``, ``while`` and ``assert`` are ``bool``; other
+conversions are written with ``$``.  :func:`check` returns the
+violations of these rules::
+
+    for error in check(parse_stmt(text, backend="fast")):
+        print error
+
+Types are interned :class:`Type` objects, so that they are compared by
+identity, and the type of each expression node is computed once.  Names
+are resolved with kuin.symtab; the types of the names that are not
+resolved (the builtin functions, the members of instances) are unknown
+and not checked.
+"""
+
+from weakref import WeakValueDictionary
+
+from kuin.nodes import *
+from kuin.symtab import SymbolTable, PRIMITIVE_TYPES
+from kuin.visitor import iter_children
+
+__all__ = ['Type', 'TypeCheckError', 'TypeChecker', 'check',
+           'primitive_type', 'array_type', 'collection_type', 'dict_type',
+           'func_type', 'named_type',
+           'INT', 'FLOAT', 'CHAR', 'BOOL', 'STRING', 'UNKNOWN', 'NO_VALUE']
+
+
+######################################################################
+# 型
+######################################################################
+
+# (kind, args) -> Type; an entry lives as long as some checker uses it
+_types = WeakValueDictionary()
+
+
+class Type(object):
+    """
+    A Kuin type.  `kind` is "primitive", "array", "list", "stack",
+    "queue", "dict", "func", "class", "enum", "unknown" or "none" (the
+    result of a function without value); `args` the names or types it
+    is made of.
+    """
+
+    __slots__ = ("kind", "args", "__weakref__")
+
+    def __init__(self, kind, args):
+        self.kind = kind
+        self.args = args
+
+    def __repr__(self):
+        kind, args = self.kind, self.args
+        if kind == "primitive":
+            return args[0]
+        if kind == "array":
+            return "[]%r" % args[0]
+        if kind == "dict":
+            return "dict<%r, %r>" % args
+        if kind == "func":
+            return "func<(%s):%r>" % (
+                ", ".join(map(repr, args[:-1])), args[-1])
+        if kind in ("list", "stack", "queue"):
+            return "%s<%r>" % (kind, args[0])
+        if kind in ("class", "enum"):
+            return str(args[0].name)
+        return kind
+
+
+def _intern(kind, args):
+    key = (kind, args)
+    type_ = _types.get(key)
+    if type_ is None:
+        type_ = _types[key] = Type(kind, args)
+    return type_
+
+
+def primitive_type(name):
+    """Return the type of the primitive `name` ("int", "char"...)."""
+    return _intern("primitive", (name,))
+
+
+def array_type(item_type):
+    return _intern("array", (item_type,))
+
+
+def collection_type(kind, item_type):
+    """Return the type ``kind<item_type>`` (kind: list, stack or queue)."""
+    return _intern(kind, (item_type,))
+
+
+def dict_type(key_type, value_type):
+    return _intern("dict", (key_type, value_type))
+
+
+def func_type(arg_types, return_type):
+    return _intern("func", tuple(arg_types) + (return_type,))
+
+
+def named_type(node):
+    """Return the type declared by a ClassNode or an EnumNode."""
+    return _intern("class" if type(node) is ClassNode else "enum", (node,))
+
+
+INT = primitive_type("int")
+FLOAT = primitive_type("float")
+CHAR = primitive_type("char")
+BOOL = primitive_type("bool")
+STRING = array_type(CHAR)
+UNKNOWN = _intern("unknown", ())
+NO_VALUE = _intern("none", ())
+
+INTEGER_TYPES = frozenset([primitive_type(name) for name in PRIMITIVE_TYPES
+                           if name == "int" or "byte" in name])
+NUMBER_TYPES = INTEGER_TYPES | frozenset([FLOAT])
+
+# 数値にだけ適用する演算子
+ARITHMETIC_OPERATORS = frozenset(["+", "-", "*", "/", "%", "^"])
+COMPARISON_OPERATORS = frozenset(["=", "<>", "<", ">", "<=", ">="])
+
+
+class TypeCheckError(Exception):
+    """A violation of the typing rules by `node`."""
+
+    def __init__(self, node, message):
+        Exception.__init__(self, node, message)
+        self.node = node
+        self.message = message
+
+    def __str__(self):
+        return "%s: %r" % (self.message, self.node)
+
+
+######################################################################
+# 検査
+######################################################################
+
+class TypeChecker(object):
+    """
+    Check the types of a program.
+
+    ``errors`` lists the TypeCheckErrors found by :meth:`check`;
+    ``types`` maps the id of the expression nodes to their Type.
+    """
+
+    def __init__(self, table=None):
+        self.table = table
+        self.types = {}
+        self.declaration_types = {}
+        self.errors = []
+        self.return_type = None
+
+    def check(self, sentences):
+        """Check the top-level `sentences` and return the errors."""
+        sentences = list(sentences)
+        if self.table is None:
+            self.table = SymbolTable().resolve(sentences)
+        self.check_body(sentences)
+        return self.errors
+
+    def error(self, node, message, *args):
+        self.errors.append(TypeCheckError(node, message % args))
+        return UNKNOWN
+
+    def expect(self, expected, actual, node, what="value"):
+        """Report `node` of type `actual` where `expected` is required."""
+        if not self.accepts(expected, actual, node):
+            self.error(node, "%s of type %r where %r is expected",
+                       what, actual, expected)
+
+    def accepts(self, expected, actual, node):
+        if expected is actual or expected is UNKNOWN or actual is UNKNOWN:
+            return True
+        # 整数と文字のリテラルは型を持たない
+        if type(node) in (int, long) and expected in INTEGER_TYPES:
+            return True
+        if type(node) is str:
+            # 一文字の文字列は char とも []char とも区別できない
+            return expected is STRING
+        if type(node) is ExprNode and node.operator.symbol == "?()":
+            # 両方の値が受け入れられればよい
+            for value in node.operands[1:]:
+                if not self.accepts(expected, self.type_of(value, node),
+                                    value):
+                    return False
+            return True
+        return False
+
+    ##################################################################
+    # 名前
+    ##################################################################
+
+    def declaration(self, symbol, context):
+        reference = self.table.reference_in(context, symbol)
+        return reference and reference.declaration
+
+    def denote(self, node, context):
+        """Return the Type written `node` in the node `context`."""
+        cls = type(node)
+        if node is None:
+            return NO_VALUE
+        if cls is SymbolNode:
+            declaration = self.declaration(node, context)
+            if declaration is None:
+                return UNKNOWN
+            if declaration.kind not in ("type", "alias", "class", "enum"):
+                return self.error(node, "%s is not a type", node.symbol)
+            return self.declaration_type(declaration)
+        type_ = self.types.get(id(node))
+        if type_ is None:
+            type_ = self.types[id(node)] = self.denoters[cls](self, node)
+        return type_
+
+    def denote_array(self, node):
+        type_ = self.denote(node.base_type, node)
+        for size in node.size:
+            type_ = array_type(type_)
+        return type_
+
+    def denote_collection(self, node):
+        return collection_type(node.kind, self.denote(node.item_type, node))
+
+    def denote_dict(self, node):
+        return dict_type(self.denote(node.keytype, node),
+                         self.denote(node.valtype, node))
+
+    def denote_func(self, node):
+        return func_type([self.denote(argtype, node)
+                          for argtype in node.argtype],
+                         self.denote(node.rettype, node))
+
+    denoters = {
+        ArrayTypeNode: denote_array,
+        CollectionTypeNode: denote_collection,
+        DictTypeNode: denote_dict,
+        FuncTypeNode: denote_func,
+        }
+
+    def declaration_type(self, declaration):
+        key = id(declaration)
+        type_ = self.declaration_types.get(key)
+        if type_ is None:
+            # 循環する alias は UNKNOWN になる
+            self.declaration_types[key] = UNKNOWN
+            type_ = self.declaration_types[key] = \
+                self.declaration_typers[declaration.kind](self, declaration)
+        return type_
+
+    def type_of_primitive(self, declaration):
+        return primitive_type(declaration.name)
+
+    def type_of_alias(self, declaration):
+        return self.denote(declaration.node.typename, declaration.node)
+
+    def type_of_named(self, declaration):
+        return named_type(declaration.node)
+
+    def type_of_variable(self, declaration):
+        node = declaration.node
+        cls = type(node)
+        if cls is ForNode:
+            return self.type_of(node.start, node)
+        if cls is ForeachNode:
+            return self.item_type(self.type_of(node.items, node), node)
+        if cls is TryNode:
+            return INT
+        if node.typename is None:
+            return self.type_of(node.value, node)
+        return self.denote(node.typename, node)
+
+    def type_of_param(self, declaration):
+        node = declaration.node
+        for name, typename in node.params:
+            if name.symbol == declaration.name:
+                return self.denote(typename, node)
+        return UNKNOWN
+
+    def type_of_func(self, declaration):
+        node = declaration.node
+        return func_type([self.denote(typename, node)
+                          for name, typename in node.params],
+                         self.denote(node.rettype, node))
+
+    def type_of_block(self, declaration):
+        return UNKNOWN
+
+    declaration_typers = {
+        "type": type_of_primitive,
+        "alias": type_of_alias,
+        "class": type_of_named,
+        "enum": type_of_named,
+        "enum_member": type_of_named,
+        "var": type_of_variable,
+        "const": type_of_variable,
+        "param": type_of_param,
+        "func": type_of_func,
+        "block": type_of_block,
+        }
+
+    ##################################################################
+    # 式
+    ##################################################################
+
+    def type_of(self, expr, context):
+        """Return the Type of `expr`, a child of the node `context`."""
+        cls = type(expr)
+        if cls is SymbolNode:
+            declaration = self.declaration(expr, context)
+            if declaration is None:
+                return UNKNOWN
+            return self.declaration_type(declaration)
+        literal = LITERAL_TYPES.get(cls)
+        if literal is not None:
+            if cls is str and len(expr) == 1:
+                return CHAR
+            return literal
+        if expr is None:
+            return NO_VALUE
+        types = self.types
+        type_ = types.get(id(expr))
+        if type_ is not None:
+            return type_
+        # 子から順に型を決める (深い式でも再帰しない)
+        typers = self.typers
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            if ready:
+                types[id(node)] = typers[type(node)](self, node)
+                continue
+            stack.append((node, True))
+            for child in iter_children(node):
+                if type(child) is not SymbolNode and \
+                        id(child) not in types:
+                    stack.append((child, False))
+        return types[id(expr)]
+
+    def item_type(self, container, node):
+        if container.kind in ("array", "list", "stack", "queue"):
+            return container.args[0]
+        if container is not UNKNOWN:
+            self.error(node, "%r has no items", container)
+        return UNKNOWN
+
+    def unify(self, left, right, left_node, right_node):
+        """Return the common type of two operands, or None."""
+        if left is UNKNOWN or right is UNKNOWN:
+            return UNKNOWN
+        if self.accepts(left, right, right_node):
+            return left
+        if self.accepts(right, left, left_node):
+            return right
+        return None
+
+    def type_expr(self, node):
+        op = node.operator.symbol
+        operands = node.operands
+        if op == "$":
+            value, typename = operands
+            self.type_of(value, node)
+            return self.denote(typename, node)
+        if op == "@is" or op == "@nis":
+            self.type_of(operands[0], node)
+            return BOOL
+        types = [self.type_of(operand, node) for operand in operands]
+        if op == "?()":
+            self.expect(BOOL, types[0], operands[0], "condition")
+            type_ = self.unify(types[1], types[2], operands[1], operands[2])
+            if type_ is None:
+                return self.error(node, "%r and %r in ?()", types[1],
+                                  types[2])
+            return type_
+        if len(operands) == 1:
+            type_ = types[0]
+            if op == "!":
+                self.expect(BOOL, type_, operands[0], "operand")
+                return BOOL
+            if type_ not in NUMBER_TYPES and type_ is not UNKNOWN:
+                return self.error(node, "%s of %r", op, type_)
+            return type_
+        left, right = operands
+        if op == "::":
+            self.expect(types[0], types[1], right)
+            return types[0]
+        if op[0] == ":":
+            # 複合代入は演算の結果を代入する
+            op = op[1:]
+            self.expect(types[0], types[1], right, "operand")
+        if op == "&" or op == "|":
+            self.expect(BOOL, types[0], left, "operand")
+            self.expect(BOOL, types[1], right, "operand")
+            return BOOL
+        if op == "~":
+            # 連結される一文字のリテラルは []char
+            types = [STRING if type(operand) is str else type_
+                     for operand, type_ in zip(operands, types)]
+        type_ = self.unify(types[0], types[1], left, right)
+        if type_ is None:
+            return self.error(node, "%r %s %r", types[0], op, types[1])
+        if op in COMPARISON_OPERATORS:
+            return BOOL
+        if type_ is UNKNOWN:
+            return UNKNOWN
+        if op in ARITHMETIC_OPERATORS:
+            if type_ not in NUMBER_TYPES:
+                return self.error(node, "%r %s %r", types[0], op, types[1])
+        elif op == "~" and type_.kind != "array":
+            return self.error(node, "%r ~ %r", types[0], types[1])
+        return type_
+
+    def type_call(self, node):
+        callee = self.type_of(node.funcname, node)
+        types = [self.type_of(arg, node) for arg in node.args]
+        if callee is UNKNOWN:
+            return UNKNOWN
+        if callee.kind != "func":
+            return self.error(node, "%r is not a function", callee)
+        params = callee.args[:-1]
+        if len(params) != len(types):
+            return self.error(node, "%d arguments where %d are expected",
+                              len(types), len(params))
+        for param, arg, type_ in zip(params, node.args, types):
+            self.expect(param, type_, arg, "argument")
+        return callee.args[-1]
+
+    def type_index(self, node):
+        container = self.type_of(node.array, node)
+        index = self.type_of(node.index, node)
+        if container.kind == "dict":
+            self.expect(container.args[0], index, node.index, "key")
+            return container.args[1]
+        self.expect(INT, index, node.index, "index")
+        return self.item_type(container, node)
+
+    def type_new(self, node):
+        return self.denote(node.type, node)
+
+    def type_array_type(self, node):
+        for size in node.size:
+            if size is not None:
+                self.expect(INT, self.type_of(size, node), size, "size")
+        return self.denote(node, None)
+
+    def type_value(self, node):
+        # switch の case (外側で検査する)
+        for start, end in node.range:
+            self.type_of(start, node)
+            if end is not None:
+                self.type_of(end, node)
+        return UNKNOWN
+
+    def type_denoted(self, node):
+        return self.denote(node, None)
+
+    typers = {
+        ExprNode: type_expr,
+        FuncNode: type_call,
+        ArrayNode: type_index,
+        NewNode: type_new,
+        ArrayTypeNode: type_array_type,
+        CollectionTypeNode: type_denoted,
+        DictTypeNode: type_denoted,
+        FuncTypeNode: type_denoted,
+        ValueNode: type_value,
+        }
+
+    ##################################################################
+    # 文
+    ##################################################################
+
+    def check_body(self, body):
+        checkers = self.checkers
+        for sentence in body:
+            checkers[type(sentence)](self, sentence)
+
+    def check_condition(self, expr, node):
+        self.expect(BOOL, self.type_of(expr, node), expr, "condition")
+
+    def check_if(self, node):
+        for cond, body in node.clauses:
+            if cond is not None:
+                self.check_condition(cond, node)
+            self.check_body(body)
+
+    def check_switch(self, node):
+        target = self.type_of(node.target, node)
+        for value, body in node.case:
+            if value is not None:
+                self.type_of(value, node)
+                for start, end in value.range:
+                    for expr in (start, end):
+                        if expr is not None:
+                            self.expect(target, self.type_of(expr, value),
+                                        expr, "case")
+            self.check_body(body)
+
+    def check_while(self, node):
+        self.check_condition(node.cond, node)
+        if node.skip is not None:
+            self.check_condition(node.skip, node)
+        self.check_body(node.body)
+
+    def check_for(self, node):
+        type_ = self.type_of(node.start, node)
+        if type_ not in NUMBER_TYPES and type_ is not UNKNOWN:
+            self.error(node.start, "for over %r", type_)
+            type_ = UNKNOWN
+        for expr in (node.end, node.step):
+            if expr is not None:
+                self.expect(type_, self.type_of(expr, node), expr, "bound")
+        self.check_body(node.body)
+
+    def check_foreach(self, node):
+        self.item_type(self.type_of(node.items, node), node.items)
+        self.check_body(node.body)
+
+    def check_try(self, node):
+        for value in (node.ignore_value, node.catch_value):
+            if value is not None:
+                for start, end in value.range:
+                    for expr in (start, end):
+                        if expr is not None:
+                            self.expect(INT, self.type_of(expr, value),
+                                        expr, "exception code")
+        for body in (node.body, node.catch_body, node.finally_body):
+            self.check_body(body)
+
+    def check_block(self, node):
+        self.check_body(node.body)
+
+    def check_do(self, node):
+        self.type_of(node.expr, node)
+
+    def check_return(self, node):
+        expected = self.return_type
+        if node.value is None:
+            if expected not in (None, NO_VALUE, UNKNOWN):
+                self.error(node, "return without a value of type %r",
+                           expected)
+            return
+        type_ = self.type_of(node.value, node)
+        if expected is None or expected is NO_VALUE:
+            self.error(node, "return with a value of type %r", type_)
+        else:
+            self.expect(expected, type_, node.value, "return value")
+
+    def check_assert(self, node):
+        self.check_condition(node.expr, node)
+
+    def check_throw(self, node):
+        self.expect(INT, self.type_of(node.code, node), node.code,
+                    "exception code")
+        if node.message is not None:
+            self.expect(STRING, self.type_of(node.message, node),
+                        node.message, "message")
+
+    def check_var(self, node):
+        if node.typename is None or node.value is None:
+            if node.typename is not None:
+                self.denote(node.typename, node)
+            return
+        self.expect(self.denote(node.typename, node),
+                    self.type_of(node.value, node), node.value)
+
+    def check_funcdef(self, node):
+        outer = self.return_type
+        self.return_type = self.denote(node.rettype, node)
+        for name, typename in node.params:
+            self.denote(typename, node)
+        self.check_body(node.body)
+        self.return_type = outer
+
+    def check_class(self, node):
+        outer = self.return_type
+        self.return_type = None
+        self.check_body([member.member for member in node.members])
+        self.return_type = outer
+
+    def check_alias(self, node):
+        self.denote(node.typename, node)
+
+    def check_nothing(self, node):
+        pass
+
+    checkers = {
+        IfNode: check_if,
+        SwitchNode: check_switch,
+        WhileNode: check_while,
+        ForNode: check_for,
+        ForeachNode: check_foreach,
+        TryNode: check_try,
+        IfdefNode: check_block,
+        BlockNode: check_block,
+        DoNode: check_do,
+        BreakNode: check_nothing,
+        ContinueNode: check_nothing,
+        ReturnNode: check_return,
+        AssertNode: check_assert,
+        ThrowNode: check_throw,
+        VarNode: check_var,
+        ConstNode: check_var,
+        FuncDefNode: check_funcdef,
+        AliasNode: check_alias,
+        EnumNode: check_nothing,
+        ClassNode: check_class,
+        str: check_nothing,
+        unicode: check_nothing,
+        }
+
+
+LITERAL_TYPES = {
+    int: INT,
+    long: INT,
+    float: FLOAT,
+    bool: BOOL,
+    str: STRING,
+    unicode: STRING,
+    }
+
+
+def check(sentences):
+    """Return the TypeCheckErrors of the program `sentences`."""
+    return TypeChecker().check(sentences)
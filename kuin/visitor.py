@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""Generic traversal of parse trees.
+
+Each node class lists the attributes holding its children in
+``child_fields``, as ``(name, shape)`` pairs.  The shape is one of:
+
+``"node"``
+    a single child (a node, a literal or None);
+``"nodes"``
+    a sequence of children in fixed positions (operands, arguments);
+``"body"``
+    a sequence of sentences;
+a tuple of shapes
+    a sequence of tuples, whose items have those shapes, None for the
+    items that are not children (``IfNode.clauses`` is a sequence of
+    ``(cond, body)``).
+
+The accessors of each class are built once from these declarations, and
+the walkers use an explicit stack instead of recursion, so that a tree
+of any depth can be traversed::
+
+    for node in walk(tree):
+        ...
+
+    class Calls(NodeVisitor):
+        def visit_FuncNode(self, node):
+            print node.funcname
+
+    tree = Renamer().transform(tree)    # a NodeTransformer
+"""
+
+from itertools import chain
+from operator import attrgetter
+
+from kuin.nodes import _Slots, _unset
+from kuin.nodes import (VarNode, ConstNode, ForNode, ForeachNode, TryNode,
+                        FuncDefNode)
+
+__all__ = ['iter_children', 'walk', 'declared_names', 'copy_node',
+           'NodeVisitor', 'NodeTransformer', 'SKIP']
+
+# visit_* が返すと子を訪れない
+SKIP = False
+
+# class -> [(属性名, 属性を取り出す関数, 形)]
+_accessors = {}
+
+
+def _class_accessors(cls):
+    accessors = _accessors.get(cls)
+    if accessors is None:
+        accessors = _accessors[cls] = [
+            (name, attrgetter(name), shape)
+            for name, shape in getattr(cls, "child_fields", ())]
+    return accessors
+
+
+def _is_node(value):
+    return isinstance(value, _Slots)
+
+
+def _children_of(value, shape, out):
+    if value is None:
+        return
+    if shape == "node":
+        if isinstance(value, _Slots):
+            out.append(value)
+    elif shape == "nodes" or shape == "body":
+        for item in value:
+            if isinstance(item, _Slots):
+                out.append(item)
+    else:
+        for item in value:
+            for sub, sub_shape in zip(item, shape):
+                if sub_shape is not None:
+                    _children_of(sub, sub_shape, out)
+
+
+def iter_children(node):
+    """Return the list of the child nodes of `node`, in source order."""
+    children = []
+    for name, get, shape in _class_accessors(type(node)):
+        try:
+            value = get(node)
+        except AttributeError:
+            continue
+        # よく使う形はここで展開する
+        if shape == "node":
+            if isinstance(value, _Slots):
+                children.append(value)
+        elif shape == "body" or shape == "nodes":
+            children.extend([item for item in value
+                             if isinstance(item, _Slots)])
+        elif value is not None:
+            _children_of(value, shape, children)
+    return children
+
+
+def walk(tree):
+    """
+    Yield the nodes of `tree` (a node or a sequence of sentences) in
+    depth-first order, parents before their children.
+    """
+    if isinstance(tree, _Slots):
+        stack = [tree]
+    else:
+        stack = [node for node in tree if isinstance(node, _Slots)]
+        stack.reverse()
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        node = pop()
+        yield node
+        children = iter_children(node)
+        if children:
+            children.reverse()
+            extend(children)
+
+
+def _sentence_bodies(node):
+    bodies = []
+    for name, get, shape in _class_accessors(type(node)):
+        value = getattr(node, name, None)
+        if not value:
+            continue
+        if shape == "body":
+            bodies.append(value)
+        elif type(shape) is tuple and "body" in shape:
+            index = shape.index("body")
+            bodies.extend([item[index] for item in value])
+    return bodies
+
+
+def declared_names(body):
+    """
+    Yield the names declared by the sentences of `body` and of the
+    bodies in them, in source order: the variables and constants, and
+    the block names of ``for``, ``foreach`` and ``try``.  The nested
+    functions are skipped.
+    """
+    stack = [iter(body)]
+    while stack:
+        for node in stack[-1]:
+            cls = type(node)
+            if cls is FuncDefNode:
+                continue
+            if cls is VarNode or cls is ConstNode:
+                yield node.varname.symbol
+            elif cls in (ForNode, ForeachNode, TryNode) and node.block_name:
+                yield node.block_name.symbol
+            bodies = _sentence_bodies(node)
+            if bodies:
+                stack.append(chain(*bodies))
+                break
+        else:
+            stack.pop()
+
+
+def copy_node(node, **changes):
+    """Return a copy of `node` with the attributes in `changes` replaced."""
+    cls = type(node)
+    copy = cls.__new__(cls)
+    for name in node.slot_names():
+        value = changes.get(name, _unset)
+        if value is _unset:
+            value = getattr(node, name, _unset)
+        if value is not _unset:
+            setattr(copy, name, value)
+    return copy
+
+
+class NodeVisitor(object):
+    """
+    Call ``visit_<class name>(node)`` on the nodes of a tree, parents
+    first, and ``leave_<class name>(node)`` after their children.
+
+    A visit method returning SKIP prevents the visit of the children.
+    Nodes without a method are passed to ``generic_visit``.
+    """
+
+    def visit(self, tree):
+        methods = {}
+        if isinstance(tree, _Slots):
+            stack = [(tree, False)]
+        else:
+            stack = [(node, False) for node in reversed(tree)
+                     if isinstance(node, _Slots)]
+        pop = stack.pop
+        while stack:
+            node, leaving = pop()
+            cls = type(node)
+            pair = methods.get(cls)
+            if pair is None:
+                name = cls.__name__
+                pair = methods[cls] = (
+                    getattr(self, "visit_" + name, self.generic_visit),
+                    getattr(self, "leave_" + name, None))
+            visit, leave = pair
+            if leaving:
+                leave(node)
+                continue
+            if visit(node) is SKIP:
+                continue
+            if leave is not None:
+                stack.append((node, True))
+            children = iter_children(node)
+            for child in reversed(children):
+                stack.append((child, False))
+
+    def generic_visit(self, node):
+        pass
+
+
+class NodeTransformer(object):
+    """
+    Rebuild a tree bottom-up with ``transform_<class name>(node)``.
+
+    The method is called on a node whose children were already
+    transformed, and returns its replacement: a node, a literal or None.
+    In a body, None removes the sentence and a list is spliced.  Nodes
+    are copied only when a child changed; a node shared by several
+    parents (like the interned SymbolNodes) is transformed once.
+    """
+
+    def transform(self, tree):
+        methods = {}
+        # 子を親より先に処理する (共有された節は一度だけ)
+        if isinstance(tree, _Slots):
+            roots = [tree]
+        else:
+            roots = list(tree)
+        order = []
+        seen = set()
+        stack = [(node, False) for node in reversed(roots) if _is_node(node)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            stack.append((node, True))
+            for child in reversed(iter_children(node)):
+                if id(child) not in seen:
+                    stack.append((child, False))
+        results = {}
+        for original in order:
+            node = original
+            changes = {}
+            for name, get, shape in _class_accessors(type(node)):
+                try:
+                    value = get(node)
+                except AttributeError:
+                    continue
+                new = _rebuild(value, shape, results)
+                if new is not value:
+                    changes[name] = new
+            if changes:
+                node = copy_node(node, **changes)
+            cls = type(node)
+            method = methods.get(cls)
+            if method is None:
+                method = methods[cls] = getattr(
+                    self, "transform_" + cls.__name__, self.generic_transform)
+            results[id(original)] = method(node)
+        if isinstance(tree, _Slots):
+            return results[id(tree)]
+        return _rebuild(roots, "body", results)
+
+    def generic_transform(self, node):
+        return node
+
+
+def _rebuild(value, shape, results):
+    # 子の結果で value を組み立て直す (変わらなければ value を返す)
+    if value is None:
+        return None
+    if shape == "node":
+        if _is_node(value):
+            return results[id(value)]
+        return value
+    changed = False
+    items = []
+    if shape == "nodes" or shape == "body":
+        for item in value:
+            new = results[id(item)] if _is_node(item) else item
+            if new is not item:
+                changed = True
+            if shape == "body" and type(new) is list:
+                items.extend(new)
+            elif shape != "body" or new is not None:
+                items.append(new)
+    else:
+        for item in value:
+            new = tuple([sub if sub_shape is None
+                         else _rebuild(sub, sub_shape, results)
+                         for sub, sub_shape in zip(item, shape)])
+            if [a for a, b in zip(new, item) if a is not b]:
+                changed = True
+                items.append(new)
+            else:
+                items.append(item)
+    if not changed:
+        return value
+    return items if type(value) is list else tuple(items)
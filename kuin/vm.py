@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+"""Register machine running the bytecode of kuin.bytecode.
+
+:class:`VM` has the interface of kuin.interpreter.Interpreter::
+
+    vm = VM()
+    vm.run(parse_stmt(text, backend="fast"))
+    print vm.call("main")
+
+Each call runs :meth:`VM.execute` on the Code of the function with a
+frame: a list of its registers, the constants at the end.  The loop
+dispatches on the opcode with a chain of comparisons, the most frequent
+instructions first.
+KuinError raised by an instruction goes to the innermost ``SETUP_TRY``
+handler of the frame, or to the caller.
+"""
+
+import sys
+
+from kuin.bytecode import *
+from kuin.bytecode import (
+    MOVE, LOAD_GLOBAL, STORE_GLOBAL, DEFINE_GLOBAL, LOAD_INDEX, STORE_INDEX,
+    ADD, SUB, MUL, DIV, MOD, EQ, NE, LT, LE, GT, GE, NEG, NOT, UNARY, BINARY,
+    JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, JUMP_UNLESS_EQ, JUMP_UNLESS_NE,
+    JUMP_UNLESS_LT, JUMP_UNLESS_LE, JUMP_UNLESS_GT, JUMP_UNLESS_GE,
+    CALL, CALL_BUILTIN, RETURN,
+    FOR_UP, FOR_DOWN, FOR_STEP, STEP_JUMP, FOREACH_NEXT, CHECK_STEP,
+    NEW_ARRAY, CAST, THROW, SETUP_TRY, POP_TRY, RERAISE, EXC_CODE, ERROR)
+from kuin.runtime import *
+from kuin.runtime import check_index, divide, modulo
+
+__all__ = ['VM', 'KuinError', 'InterpreterError', 'run']
+
+# 宣言前のグローバル変数
+_undefined = object()
+
+
+class VM(object):
+    """
+    Compile and run Kuin sentences.
+
+    The options are those of kuin.interpreter.Interpreter; `debug` is
+    applied when compiling.
+    """
+
+    def __init__(self, builtins=None, debug=True, out=None):
+        self.debug = debug
+        self.out = out or sys.stdout
+        self.compiler = Compiler(debug)
+        self.functions = self.compiler.functions
+        self.global_values = []
+        self.builtins = {"print": self.print_value, "len": len}
+        if builtins:
+            self.builtins.update(builtins)
+
+    def print_value(self, value):
+        self.out.write(to_str(value))
+
+    @property
+    def globals(self):
+        """The global variables, by name."""
+        return dict([(name, value) for name, value in
+                     zip(self.compiler.global_names, self.global_values)
+                     if value is not _undefined])
+
+    def run(self, sentences):
+        """Execute the top-level `sentences`; return the value returned."""
+        code = self.compiler.compile_program(sentences)
+        missing = len(self.compiler.global_names) - len(self.global_values)
+        self.global_values.extend([_undefined] * missing)
+        return self.execute(code, code.new_frame())
+
+    def call(self, name, *args):
+        """Call the function `name` of the program."""
+        index = self.compiler.function_index.get(name)
+        if index is None:
+            raise InterpreterError("undefined function: %s" % name)
+        return self.call_function(self.functions[index], list(args))
+
+    def call_function(self, func, args):
+        if len(args) != func.nparams:
+            raise InterpreterError("%s() takes %d arguments (%d given)" % (
+                    func.name, func.nparams, len(args)))
+        return self.execute(func, args + func.padding)
+
+    def execute(self, func, frame):
+        code = func.words
+        globals_ = self.global_values
+        # (ハンドラの位置, 例外を置くレジスタ)
+        handlers = []
+        pc = 0
+        while True:
+            try:
+                while True:
+                    op = code[pc]
+                    if op == MOVE:
+                        frame[code[pc + 1]] = frame[code[pc + 2]]
+                        pc += 3
+                    elif op == JUMP_UNLESS_LT:
+                        if frame[code[pc + 1]] < frame[code[pc + 2]]:
+                            pc += 4
+                        else:
+                            pc = code[pc + 3]
+                    elif op == ADD:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]] + frame[code[pc + 3]]
+                        pc += 4
+                    elif op == SUB:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]] - frame[code[pc + 3]]
+                        pc += 4
+                    elif op == MOD:
+                        left = frame[code[pc + 2]]
+                        right = frame[code[pc + 3]]
+                        # 非負の整数なら Python の演算と同じ
+                        if type(left) is int and type(right) is int and \
+                                left >= 0 and right > 0:
+                            frame[code[pc + 1]] = left % right
+                        else:
+                            frame[code[pc + 1]] = modulo(left, right)
+                        pc += 4
+                    elif op == BINARY:
+                        frame[code[pc + 1]] = frame[code[pc + 2]](
+                            frame[code[pc + 3]], frame[code[pc + 4]])
+                        pc += 5
+                    elif op == FOR_UP:
+                        i = frame[code[pc + 1]]
+                        if i > frame[code[pc + 2]]:
+                            pc = code[pc + 4]
+                        else:
+                            frame[code[pc + 3]] = i
+                            pc += 5
+                    elif op == STEP_JUMP:
+                        frame[code[pc + 1]] += frame[code[pc + 2]]
+                        pc = code[pc + 3]
+                    elif op == CALL:
+                        base = code[pc + 3]
+                        frame[code[pc + 1]] = self.call_function(
+                            self.functions[code[pc + 2]],
+                            frame[base:base + code[pc + 4]])
+                        pc += 5
+                    elif op == RETURN:
+                        return frame[code[pc + 1]]
+                    elif op == JUMP:
+                        pc = code[pc + 1]
+                    elif op == JUMP_UNLESS_EQ:
+                        if frame[code[pc + 1]] == frame[code[pc + 2]]:
+                            pc += 4
+                        else:
+                            pc = code[pc + 3]
+                    elif op == JUMP_UNLESS_NE:
+                        if frame[code[pc + 1]] != frame[code[pc + 2]]:
+                            pc += 4
+                        else:
+                            pc = code[pc + 3]
+                    elif op == JUMP_UNLESS_LE:
+                        if frame[code[pc + 1]] <= frame[code[pc + 2]]:
+                            pc += 4
+                        else:
+                            pc = code[pc + 3]
+                    elif op == JUMP_UNLESS_GT:
+                        if frame[code[pc + 1]] > frame[code[pc + 2]]:
+                            pc += 4
+                        else:
+                            pc = code[pc + 3]
+                    elif op == JUMP_UNLESS_GE:
+                        if frame[code[pc + 1]] >= frame[code[pc + 2]]:
+                            pc += 4
+                        else:
+                            pc = code[pc + 3]
+                    elif op == LOAD_INDEX:
+                        array = frame[code[pc + 2]]
+                        index = frame[code[pc + 3]]
+                        if not 0 <= index < len(array):
+                            check_index(array, index)
+                        frame[code[pc + 1]] = array[index]
+                        pc += 4
+                    elif op == STORE_INDEX:
+                        array = frame[code[pc + 1]]
+                        index = frame[code[pc + 2]]
+                        if not 0 <= index < len(array):
+                            check_index(array, index)
+                        array[index] = frame[code[pc + 3]]
+                        pc += 4
+                    elif op == MUL:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]] * frame[code[pc + 3]]
+                        pc += 4
+                    elif op == DIV:
+                        left = frame[code[pc + 2]]
+                        right = frame[code[pc + 3]]
+                        if type(left) is int and type(right) is int and \
+                                left >= 0 and right > 0:
+                            frame[code[pc + 1]] = left // right
+                        else:
+                            frame[code[pc + 1]] = divide(left, right)
+                        pc += 4
+                    elif op == JUMP_IF_FALSE:
+                        if frame[code[pc + 1]]:
+                            pc += 3
+                        else:
+                            pc = code[pc + 2]
+                    elif op == JUMP_IF_TRUE:
+                        if frame[code[pc + 1]]:
+                            pc = code[pc + 2]
+                        else:
+                            pc += 3
+                    elif op == LOAD_GLOBAL:
+                        value = globals_[code[pc + 2]]
+                        if value is _undefined:
+                            raise InterpreterError(
+                                "undefined variable: %s" %
+                                self.compiler.global_names[code[pc + 2]])
+                        frame[code[pc + 1]] = value
+                        pc += 3
+                    elif op == STORE_GLOBAL:
+                        slot = code[pc + 1]
+                        if globals_[slot] is _undefined:
+                            raise InterpreterError(
+                                "undefined variable: %s" %
+                                self.compiler.global_names[slot])
+                        globals_[slot] = frame[code[pc + 2]]
+                        pc += 3
+                    elif op == EQ:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]] == frame[code[pc + 3]]
+                        pc += 4
+                    elif op == NE:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]] != frame[code[pc + 3]]
+                        pc += 4
+                    elif op == LT:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]] < frame[code[pc + 3]]
+                        pc += 4
+                    elif op == LE:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]] <= frame[code[pc + 3]]
+                        pc += 4
+                    elif op == GT:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]] > frame[code[pc + 3]]
+                        pc += 4
+                    elif op == GE:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]] >= frame[code[pc + 3]]
+                        pc += 4
+                    elif op == FOREACH_NEXT:
+                        items = frame[code[pc + 1]]
+                        index = frame[code[pc + 2]]
+                        if index < len(items):
+                            frame[code[pc + 3]] = items[index]
+                            frame[code[pc + 2]] = index + 1
+                            pc += 5
+                        else:
+                            pc = code[pc + 4]
+                    elif op == FOR_DOWN:
+                        i = frame[code[pc + 1]]
+                        if i < frame[code[pc + 2]]:
+                            pc = code[pc + 4]
+                        else:
+                            frame[code[pc + 3]] = i
+                            pc += 5
+                    elif op == FOR_STEP:
+                        i = frame[code[pc + 1]]
+                        end = frame[code[pc + 2]]
+                        if (i > end) if frame[code[pc + 3]] > 0 \
+                                else (i < end):
+                            pc = code[pc + 5]
+                        else:
+                            frame[code[pc + 4]] = i
+                            pc += 6
+                    elif op == DEFINE_GLOBAL:
+                        globals_[code[pc + 1]] = frame[code[pc + 2]]
+                        pc += 3
+                    elif op == NEG:
+                        frame[code[pc + 1]] = -frame[code[pc + 2]]
+                        pc += 3
+                    elif op == NOT:
+                        frame[code[pc + 1]] = not frame[code[pc + 2]]
+                        pc += 3
+                    elif op == UNARY:
+                        frame[code[pc + 1]] = \
+                            frame[code[pc + 2]](frame[code[pc + 3]])
+                        pc += 4
+                    elif op == CALL_BUILTIN:
+                        name = frame[code[pc + 2]]
+                        builtin = self.builtins.get(name)
+                        if builtin is None:
+                            raise InterpreterError(
+                                "undefined function: %s" % name)
+                        base = code[pc + 3]
+                        frame[code[pc + 1]] = builtin(
+                            *frame[base:base + code[pc + 4]])
+                        pc += 5
+                    elif op == SETUP_TRY:
+                        handlers.append((code[pc + 1], code[pc + 2]))
+                        pc += 3
+                    elif op == POP_TRY:
+                        handlers.pop()
+                        pc += 1
+                    elif op == EXC_CODE:
+                        frame[code[pc + 1]] = frame[code[pc + 2]].code
+                        pc += 3
+                    elif op == THROW:
+                        raise KuinError(frame[code[pc + 1]],
+                                        frame[code[pc + 2]])
+                    elif op == RERAISE:
+                        raise frame[code[pc + 1]]
+                    elif op == CHECK_STEP:
+                        if frame[code[pc + 1]] == 0:
+                            raise InterpreterError("step of for is 0")
+                        pc += 2
+                    elif op == NEW_ARRAY:
+                        base = code[pc + 2]
+                        frame[code[pc + 1]] = new_array(
+                            frame[base:base + code[pc + 3]],
+                            frame[code[pc + 4]])
+                        pc += 5
+                    elif op == CAST:
+                        frame[code[pc + 1]] = cast(frame[code[pc + 2]],
+                                                   frame[code[pc + 3]])
+                        pc += 4
+                    elif op == ERROR:
+                        raise InterpreterError(frame[code[pc + 1]])
+                    else:
+                        raise InterpreterError("invalid opcode %d" % op)
+            except KuinError as e:
+                if not handlers:
+                    raise
+                pc, slot = handlers.pop()
+                frame[slot] = e
+
+
+def run(text, backend="fast", **options):
+    """Parse and run `text`; return the VM (see its options)."""
+    from kuin.parser import parse_stmt
+    vm = VM(**options)
+    vm.run(parse_stmt(text, backend=backend))
+    return vm